@@ -0,0 +1,106 @@
+"""
+Reports how much memory the frontiers of a checkpoint take.
+
+    python bin/benchmarkMemory.py experimentOutputs/<checkpoint>.pickle [--intern]
+
+The checkpoint is loaded under tracemalloc. Then the frontiers in
+allFrontiers and frontiersOverTime are walked, and the script counts the
+objects of each class reachable from them together with their shallow sizes,
+including any per-instance __dict__. With --intern the programs are also
+hash-consed, to show how much of the remaining memory is duplicated subtrees.
+"""
+
+try:
+    import binutil  # required to import from dreamcoder modules
+except ModuleNotFoundError:
+    import bin.binutil  # alt import if called as module
+
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+import dill
+
+from dreamcoder.frontier import Frontier, FrontierEntry
+from dreamcoder.grammar import LikelihoodSummary
+from dreamcoder.program import Program
+from dreamcoder.type import Type
+
+WALKED = (Frontier, FrontierEntry, LikelihoodSummary, Program, Type, list, tuple, dict)
+
+
+def census(roots):
+    """Counts and sizes of the objects reachable from roots"""
+    counts = Counter()
+    sizes = Counter()
+    seen = set()
+    stack = list(roots)
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or not isinstance(o, WALKED):
+            continue
+        seen.add(id(o))
+        name = type(o).__name__
+        counts[name] += 1
+        sizes[name] += sys.getsizeof(o)
+        d = getattr(o, "__dict__", None)
+        if isinstance(d, dict):
+            # Per-instance attributes are charged to their owner
+            seen.add(id(d))
+            sizes[name] += sys.getsizeof(d)
+            stack.extend(d.values())
+        stack.extend(gc.get_referents(o))
+    return counts, sizes
+
+
+def frontiersOf(result):
+    frontiers = list(getattr(result, "allFrontiers", {}).values())
+    for fs in getattr(result, "frontiersOverTime", {}).values():
+        frontiers.extend(fs)
+    return frontiers
+
+
+def internFrontiers(frontiers):
+    for frontier in frontiers:
+        for entry in frontier.entries:
+            entry.program = entry.program.intern()
+
+
+def report(title, counts, sizes):
+    print(title)
+    for name, size in sizes.most_common():
+        print(f"  {name:<24} {counts[name]:>10} objects {size / 2**20:>10.2f} MiB")
+    print(f"  {'total':<24} {sum(counts.values()):>10} objects {sum(sizes.values()) / 2**20:>10.2f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("checkpoint")
+    parser.add_argument("--intern", action="store_true", help="also report sizes after interning programs")
+    arguments = parser.parse_args()
+
+    gc.collect()
+    tracemalloc.start()
+    startTime = time.time()
+    with open(arguments.checkpoint, "rb") as handle:
+        result = dill.load(handle)
+    loadTime = time.time() - startTime
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"Loaded {arguments.checkpoint} in {loadTime:.2f}s: {current / 2**20:.2f} MiB, peak {peak / 2**20:.2f} MiB")
+
+    frontiers = frontiersOf(result)
+    report(f"Reachable from {len(frontiers)} frontiers:", *census(frontiers))
+
+    if arguments.intern:
+        internFrontiers(frontiers)
+        gc.collect()
+        report("After interning the programs:", *census(frontiers))
+
+
+if __name__ == "__main__":
+    main()
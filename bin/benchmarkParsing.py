@@ -0,0 +1,92 @@
+"""
+Times Program.parse on the programs of compression responses.
+
+    python bin/benchmarkParsing.py [response.json ...]
+
+Each response is the JSON returned by the compressor: the programs of its
+"frontiers" and its "DSL" productions are parsed. Their primitives must be
+registered, so by default the list primitives are loaded; use --domain to
+load another primitive set. Without any response, a synthetic one of
+40000 list programs is enumerated, half of them rewritten in terms of an
+invented primitive as a compressor would. The programs are also decoded from
+their binary encoding (see ProgramTable) for comparison.
+"""
+
+try:
+    import binutil  # required to import from dreamcoder modules
+except ModuleNotFoundError:
+    import bin.binutil  # alt import if called as module
+
+import argparse
+import importlib
+import json
+import time
+
+from dreamcoder.grammar import Grammar
+from dreamcoder.program import Primitive, ProgramParser, ProgramTable
+from dreamcoder.type import Context, arrow, tint, tlist
+
+
+def responsePrograms(path):
+    with open(path, "r") as handle:
+        response = json.load(handle)
+    programs = [p["expression"] for p in response.get("DSL", {}).get("productions", [])]
+    for frontier in response.get("frontiers", []):
+        programs.extend(e["program"] for e in frontier["programs"])
+    return programs
+
+
+def syntheticPrograms(size):
+    from dreamcoder.domains.list.listPrimitives import basePrimitives
+
+    g = Grammar.uniform(basePrimitives())
+    request = arrow(tlist(tint), tlist(tint))
+    programs = [str(p) for _, _, p in g.enumeration(Context.EMPTY, [], request, upperBound=12.5)]
+    invention = "#(lambda (lambda (cons (+ $1 1) $0)))"
+    programs = [f"(lambda ({invention} 1 {p}))" if i % 2 else p for i, p in enumerate(programs)]
+    return (programs * (size // len(programs) + 1))[:size]
+
+
+def timed(f):
+    startTime = time.time()
+    f()
+    return time.time() - startTime
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("responses", nargs="*")
+    parser.add_argument("--domain", default="dreamcoder.domains.list.listPrimitives")
+    parser.add_argument("--size", type=int, default=40000)
+    arguments = parser.parse_args()
+
+    domain = importlib.import_module(arguments.domain)
+    for name in ("basePrimitives", "primitives", "bootstrapTarget_extra", "julia"):
+        if hasattr(domain, name):
+            getattr(domain, name)()
+
+    if arguments.responses:
+        programs = [s for path in arguments.responses for s in responsePrograms(path)]
+    else:
+        programs = syntheticPrograms(arguments.size)
+    print(f"{len(programs)} programs, {len(set(programs))} distinct")
+
+    uncached = ProgramParser()
+    t = timed(lambda: [uncached._parse(s) for s in programs])
+    print(f"parse without the string cache: {t:.3f}s")
+
+    cold = ProgramParser()
+    t = timed(lambda: cold.parse_many(programs))
+    print(f"parse_many, empty cache: {t:.3f}s")
+    t = timed(lambda: cold.parse_many(programs))
+    print(f"parse_many, warm cache: {t:.3f}s")
+
+    table = ProgramTable(Primitive.GLOBALS.values())
+    encodings = [table._encode(p) for p in cold.parse_many(programs)]
+    print(f"{sum(map(len, programs))} bytes of text, {sum(map(len, encodings))} bytes encoded")
+    t = timed(lambda: [table._decode(data) for data in encodings])
+    print(f"decode without the cache: {t:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
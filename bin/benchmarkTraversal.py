@@ -0,0 +1,291 @@
+"""
+Times traversals of programs: show, size, walk, shift, substitute, beta
+normal form, hashing, equality and conversion to eta-long form.
+
+    python bin/benchmarkTraversal.py [response.json ...]
+    python bin/benchmarkTraversal.py --ordinary 300 [--against CHECKOUT]
+
+Each response is the JSON returned by the compressor: the deepest programs
+of its "frontiers" and its "DSL" productions are traversed. Their primitives
+must be registered, so by default the list primitives are loaded; use
+--domain to load another primitive set. Without any response, synthetic
+programs of --depth nested applications are made, as found in Helmholtz
+samples and in frontiers rewritten by compression: a list built by cons,
+and a chain of calls of an invented primitive, whose beta normal form
+inlines it. Traversals recurse until they run out of stack, and finish the
+part of the program they could not reach as generators run by trampoline,
+so each is timed under the default recursion limit, however deep the
+program.
+
+With --ordinary, programs of the size enumeration finds, sampled from the
+list primitives, are traversed instead, and the time per program is
+printed. --against times them with the dreamcoder package of another
+checkout too, such as one of the commit before a change to traversals.
+The two take turns at each timing, each in --interpreters interpreters,
+and the best of --repeat timings of each traversal in any of them is
+printed.
+"""
+
+try:
+    import binutil  # required to import from dreamcoder modules
+except ModuleNotFoundError:
+    import bin.binutil  # alt import if called as module
+
+import argparse
+import importlib
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import timeit
+
+from dreamcoder.grammar import Grammar
+from dreamcoder.program import (
+    Application,
+    Abstraction,
+    EtaLongVisitor,
+    Index,
+    Primitive,
+    Program,
+    strip_primitive_values,
+)
+from dreamcoder.type import arrow, tint, tlist
+
+
+def responsePrograms(path, count):
+    from dreamcoder.program import ProgramParser
+
+    with open(path, "r") as handle:
+        response = json.load(handle)
+    programs = [p["expression"] for p in response.get("DSL", {}).get("productions", [])]
+    for frontier in response.get("frontiers", []):
+        programs.extend(e["program"] for e in frontier["programs"])
+    programs = sorted(set(programs), key=len, reverse=True)[:count]
+    return [(None, ProgramParser()._parse(s)) for s in programs]
+
+
+def syntheticPrograms(depth):
+    cons = Primitive.GLOBALS["cons"]
+    zero = Primitive.GLOBALS["0"]
+    literal = Primitive.GLOBALS["empty"]
+    for _ in range(depth):
+        literal = Application(Application(cons, zero), literal)
+
+    increment = Program.parse("#(lambda (lambda (cons (+ $1 1) $0)))")
+    calls = Index(0)
+    for _ in range(depth):
+        calls = Application(Application(increment, zero), calls)
+
+    request = arrow(tlist(tint), tlist(tint))
+    return [(request, Abstraction(literal)), (request, Abstraction(calls))]
+
+
+def fresh(e):
+    """A copy of e sharing none of its nodes, whose hashes are not cached yet"""
+    from dreamcoder.program import ProgramParser
+
+    return ProgramParser()._parse(str(e))
+
+
+def traversals(e, request):
+    a, b = fresh(e), fresh(e)
+    yield "show", lambda: str(e)
+    yield "size", e.size
+    yield "walk", lambda: sum(1 for _ in e.walk())
+    yield "freeVariables", e.freeVariables
+    yield "shift", lambda: e.shift(1)
+    yield "substitute", lambda: e.substitute(Index(0), Index(1))
+    yield "betaNormalForm", e.betaNormalForm
+    yield "hash", lambda: hash(a)
+    yield "equality", lambda: a == b
+    if request is not None:
+        normal = e.betaNormalForm()
+        yield "etaLong", lambda: EtaLongVisitor(request).execute(normal)
+
+
+def timed(f):
+    startTime = time.time()
+    try:
+        f()
+    except RecursionError:
+        return "RecursionError"
+    return "%.3fs" % (time.time() - startTime)
+
+
+def ordinaryPrograms(count, request):
+    """Sampled programs of 12 to 25 nodes, rebuilt node by node so that
+    they share nothing with the grammar"""
+
+    def copy(e):
+        if isinstance(e, Application):
+            return Application(copy(e.f), copy(e.x))
+        if isinstance(e, Abstraction):
+            return Abstraction(copy(e.body))
+        return e
+
+    grammar = Grammar.uniform(list(Primitive.GLOBALS.values()))
+    random.seed(0)
+    programs = []
+    while len(programs) < count:
+        try:
+            e = grammar.sample(request, maximumDepth=5)
+        except Exception:
+            continue
+        if e is not None and 12 <= e.size() <= 25:
+            programs.append(copy(e))
+    return programs, copy
+
+
+def ordinaryTimers(count):
+    """For each traversal, a function timing it on ordinary programs, over
+    and over for at least 20ms, which gives the microseconds per program"""
+    request = arrow(tlist(tint), tlist(tint))
+    programs, copy = ordinaryPrograms(count, request)
+
+    def timer(f, fresh=False):
+        # With fresh, f is timed on new copies of the programs each time,
+        # since hashes are cached
+        def setup():
+            if fresh:
+                es[:] = [copy(e) for _ in range(number) for e in programs]
+            else:
+                es[:] = programs * number
+
+        def timing():
+            nonlocal number
+            if number is None:
+                number = 1
+                setup()
+                number = max(1, int(0.02 / timeit.timeit(lambda: f(es), number=1)))
+            setup()
+            return timeit.timeit(lambda: f(es), number=1) / (count * number) * 1e6
+
+        es = []
+        number = None
+        return timing
+
+    def each(f):
+        return lambda es: [f(e) for e in es]
+
+    return {
+        "show": timer(each(str)),
+        "size": timer(each(lambda e: e.size())),
+        "freeVariables": timer(each(lambda e: e.freeVariables())),
+        "shift": timer(each(lambda e: e.shift(1))),
+        "substitute": timer(each(lambda e: e.substitute(Index(0), Index(1)))),
+        "betaNormalForm": timer(each(lambda e: e.betaNormalForm())),
+        "hash": timer(each(hash), fresh=True),
+        "equality": timer(lambda es: [a == b for a, b in zip(itertools.cycle(programs), es)], fresh=True),
+        "etaLong": timer(each(lambda e: EtaLongVisitor(request).execute(e))),
+        "strip": timer(each(strip_primitive_values)),
+    }
+
+
+def serveTimers(count):
+    """Answers each name of a traversal read from the standard input with a
+    timing of it"""
+    timers = ordinaryTimers(count)
+    for timer in timers.values():
+        timer()
+    print(" ".join(timers), flush=True)
+    for line in sys.stdin:
+        print(timers[line.strip()](), flush=True)
+
+
+class CheckoutTimer(object):
+    """serveTimers with the dreamcoder package of a checkout, which comes
+    first on the path of an interpreter of its own"""
+
+    def __init__(self, checkout, arguments):
+        environment = dict(os.environ)
+        environment["PYTHONPATH"] = os.pathsep.join(
+            [os.path.abspath(checkout), os.path.join(os.path.abspath(checkout), "pregex")]
+        )
+        command = [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--ordinary",
+            str(arguments.ordinary),
+            "--domain",
+            arguments.domain,
+            "--serve",
+        ]
+        self.process = subprocess.Popen(
+            command, env=environment, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+        self.names = self.process.stdout.readline().split()
+
+    def __call__(self, name):
+        self.process.stdin.write(name + "\n")
+        self.process.stdin.flush()
+        return float(self.process.stdout.readline())
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("responses", nargs="*")
+    parser.add_argument("--domain", default="dreamcoder.domains.list.listPrimitives")
+    parser.add_argument("--depth", type=int, default=20000)
+    parser.add_argument("--count", type=int, default=10, help="programs traversed per response")
+    parser.add_argument("--ordinary", type=int, default=0, help="number of ordinary programs to traverse")
+    parser.add_argument("--against", help="checkout whose traversals are timed too, with --ordinary")
+    parser.add_argument("--repeat", type=int, default=15, help="timings of each traversal, with --ordinary")
+    parser.add_argument("--interpreters", type=int, default=3, help="interpreters timing each checkout, with --against")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    domain = importlib.import_module(arguments.domain)
+    for name in ("basePrimitives", "primitives", "bootstrapTarget_extra", "julia"):
+        if hasattr(domain, name):
+            getattr(domain, name)()
+
+    if arguments.serve:
+        serveTimers(arguments.ordinary)
+        return
+    if arguments.ordinary and arguments.against:
+        # The checkouts take turns at each timing, so that slower spells of
+        # the machine fall on both. An interpreter can be slower than another
+        # one running the same code, as their hashes of strings differ, so
+        # each checkout is timed in several.
+        checkouts = [arguments.against, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)]
+        timers = [[CheckoutTimer(checkout, arguments) for _ in range(arguments.interpreters)] for checkout in checkouts]
+        print(f"µs per program of {arguments.ordinary}   {'against':>8s} {'this':>8s}")
+        for name in timers[1][0].names:
+            best = [float("inf"), float("inf")]
+            for _ in range(arguments.repeat):
+                for interpreters in zip(*timers):
+                    for k, timer in enumerate(interpreters):
+                        best[k] = min(best[k], timer(name))
+            o, t = best
+            print(f"  {name:15s} {o:20.2f} {t:8.2f}  x{t / o:.2f}")
+        for timer in timers[0] + timers[1]:
+            timer.close()
+        return
+    if arguments.ordinary:
+        timers = ordinaryTimers(arguments.ordinary)
+        print(f"µs per program of {arguments.ordinary}")
+        for name, timer in timers.items():
+            print(f"  {name:15s} {min(timer() for _ in range(arguments.repeat)):8.2f}")
+        return
+
+    if arguments.responses:
+        programs = [p for path in arguments.responses for p in responsePrograms(path, arguments.count)]
+    else:
+        programs = syntheticPrograms(arguments.depth)
+
+    print(f"recursion limit {sys.getrecursionlimit()}")
+    for request, e in programs:
+        print(f"{str(e)[:60]}... of size {e.size()}")
+        for name, f in traversals(e, request):
+            print(f"  {name:15s} {timed(f):>15s}")
+
+
+if __name__ == "__main__":
+    main()
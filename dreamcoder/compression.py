@@ -1,3 +1,4 @@
+import base64
 import datetime
 import json
 import os
@@ -11,7 +12,16 @@ from dreamcoder.fragmentGrammar import FragmentGrammar
 from dreamcoder.frontier import Frontier, FrontierEntry
 from dreamcoder.grammar import Grammar
 from dreamcoder.task import Task
-from dreamcoder.program import Program, Invented, EtaLongVisitor, EtaExpandFailure
+from dreamcoder.program import (
+    Abstraction,
+    Application,
+    EtaExpandFailure,
+    EtaLongVisitor,
+    Index,
+    Invented,
+    Program,
+    ProgramTable,
+)
 from dreamcoder.utilities import eprint, timing, callCompiled, get_root_dir
 from dreamcoder.vs import induceGrammar_Beta, RewriteWithInventionVisitor
 from dreamcoder.type import Type
@@ -22,6 +32,8 @@ def induceGrammar(*args, **kwargs):
         eprint("No nonempty frontiers, exiting grammar induction early.")
         return args[0], args[1]
     backend = kwargs.pop("backend", "pypy")
+    # Only the rust compressor reads programs in their binary encoding
+    binaryPrograms = kwargs.pop("binaryPrograms", False)
     if "pypy" in backend:
         # pypy might not like some of the imports needed for the primitives
         # but the primitive values are irrelevant for compression
@@ -43,9 +55,11 @@ def induceGrammar(*args, **kwargs):
         elif backend == "python":
             g, newFrontiers = pypyInduce(*args, **kwargs)
         elif backend == "rust":
-            g, newFrontiers = rustInduce(*args, **kwargs)
+            g, newFrontiers = rustInduce(*args, binaryPrograms=binaryPrograms, **kwargs)
         elif backend == "vs":
-            g, newFrontiers = rustInduce(*args, vs=True, **kwargs)
+            g, newFrontiers = rustInduce(
+                *args, vs=True, binaryPrograms=binaryPrograms, **kwargs
+            )
         elif backend == "pypy_vs":
             kwargs.pop("iteration")
             kwargs.pop("topk_use_only_likelihood")
@@ -215,8 +229,10 @@ def ocamlInduce(
                         logLikelihood=e["logLikelihood"],
                         logPrior=g.logLikelihood(original.task.request, p),
                     )
-                    for e in new["programs"]
-                    for p in [Program.parse(e["program"])]
+                    for e, p in zip(
+                        new["programs"],
+                        Program.parse_many(e["program"] for e in new["programs"]),
+                    )
                 ],
                 task=original.task,
             )
@@ -231,23 +247,40 @@ def ocamlInduce(
             return g, frontiers
 
 
-def rustInduce(
+def rustCompressionMessage(
     g0,
     frontiers,
-    _=None,
     topK=1,
     pseudoCounts=1.0,
     aic=1.0,
     structurePenalty=0.001,
     a=0,
-    CPUs=1,
-    iteration=-1,
     topk_use_only_likelihood=False,
     vs=False,
+    binaryPrograms=False,
 ):
+    """
+    The request to the rust compressor. With binaryPrograms, the programs of
+    the frontiers are sent in the binary encoding of the ProgramTable of g0,
+    in base64, rather than as text. The message then carries the table: for
+    each of its ids, the position of the production among the primitives
+    followed by the inventions of the message. Programs that use anything
+    outside of the table are still sent as text.
+    """
+
     def finite_logp(l):
         return l if l != float("-inf") else -1000
 
+    table = ProgramTable.fromGrammar(g0) if binaryPrograms else None
+
+    def program(p):
+        if table is not None and all(
+            isinstance(c, (Application, Abstraction, Index)) or c in table.ids
+            for _, c in p.walk()
+        ):
+            return {"program": base64.b64encode(table.encode(p)).decode("ascii")}
+        return {"expression": str(p)}
+
     message = {
         "strategy": (
             {"version-spaces": {"top_i": 50}} if vs else {"fragment-grammars": {}}
@@ -276,7 +309,7 @@ def rustInduce(
                 "task_tp": str(f.task.request),
                 "solutions": [
                     {
-                        "expression": str(e.program),
+                        **program(e.program),
                         "logprior": finite_logp(e.logPrior),
                         "loglikelihood": e.logLikelihood,
                     }
@@ -286,6 +319,44 @@ def rustInduce(
             for f in frontiers
         ],
     }
+    if table is not None:
+        order = [p for _, _, p in g0.productions if p.isPrimitive] + [
+            p for _, _, p in g0.productions if p.isInvented
+        ]
+        positions = {}
+        for i, p in enumerate(order):
+            positions.setdefault(p, i)
+        message["table"] = [positions[p] for p in table.productions]
+    return message
+
+
+def rustInduce(
+    g0,
+    frontiers,
+    _=None,
+    topK=1,
+    pseudoCounts=1.0,
+    aic=1.0,
+    structurePenalty=0.001,
+    a=0,
+    CPUs=1,
+    iteration=-1,
+    topk_use_only_likelihood=False,
+    vs=False,
+    binaryPrograms=False,
+):
+    message = rustCompressionMessage(
+        g0,
+        frontiers,
+        topK=topK,
+        pseudoCounts=pseudoCounts,
+        aic=aic,
+        structurePenalty=structurePenalty,
+        a=a,
+        topk_use_only_likelihood=topk_use_only_likelihood,
+        vs=vs,
+        binaryPrograms=binaryPrograms,
+    )
 
     eprint("running rust compressor")
 
@@ -347,11 +418,14 @@ def rustInduce(
         Frontier(
             [
                 FrontierEntry(
-                    Program.parse(s["expression"]),
+                    p,
                     logPrior=s["logprior"],
                     logLikelihood=s["loglikelihood"],
                 )
-                for s in r["solutions"]
+                for s, p in zip(
+                    r["solutions"],
+                    Program.parse_many(s["expression"] for s in r["solutions"]),
+                )
             ],
             f.task,
         )
@@ -434,9 +508,8 @@ def stitchInduce(
     new_grammar = grammar_from_json(dreamcoder_json)
 
     # Rescore the frontiers.
-    new_frontiers = [
-        new_grammar.rescoreFrontier(frontier)
-        for frontier in task_to_unscored_frontier.values()
-    ]
+    new_frontiers = new_grammar.rescoreFrontiers(
+        list(task_to_unscored_frontier.values())
+    )
 
     return new_grammar, new_frontiers
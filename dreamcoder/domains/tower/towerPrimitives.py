@@ -172,7 +172,7 @@ new_primitives = common_primitives + [
 def executeTower(p, timeout=None):
     try:
         return runWithTimeout(
-            lambda: p.evaluate([])(_empty_tower)(TowerState())[1], timeout=timeout
+            lambda: p.evaluateCompiled()(_empty_tower)(TowerState())[1], timeout=timeout
         )
     except RunWithTimeout:
         return None
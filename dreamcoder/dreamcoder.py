@@ -148,11 +148,25 @@ def manage_enumerator_service(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
         if kwargs.get("solver") == "julia":
-            import redis
             from subprocess import TimeoutExpired
+            from dreamcoder.transport import (
+                RedisTransport,
+                UnixSocketBroker,
+                UnixSocketTransport,
+                set_enumerator_transport,
+            )
 
-            r = redis.Redis(host="localhost", port=6379, db=0)
-            r.flushdb()
+            broker = None
+            transportArguments = []
+            if kwargs.get("enumeratorTransport", "redis") == "socket":
+                broker = UnixSocketBroker().start()
+                transport = UnixSocketTransport(broker.path)
+                transportArguments = ["--socket", broker.path]
+            else:
+                transport = RedisTransport()
+            # Only the queues and keys of the service are cleared
+            transport.reset()
+            set_enumerator_transport(transport)
             solver_file = os.path.join(
                 get_root_dir(), "julia_enumerator", "src", "main.jl"
             )
@@ -160,7 +174,8 @@ def manage_enumerator_service(f):
             env.update(os.environ)
             eprint("Starting julia enumerator service")
             solver_process = subprocess.Popen(
-                ["julia", "--", solver_file, "-c", str(kwargs.get("CPUs", 1))],
+                ["julia", "--", solver_file, "-c", str(kwargs.get("CPUs", 1))]
+                + transportArguments,
                 stdin=subprocess.PIPE,
                 env=env,
             )
@@ -168,11 +183,27 @@ def manage_enumerator_service(f):
                 yield from f(*args, **kwargs)
             finally:
                 eprint("Stopping julia enumerator service")
-                r.rpush("commands", "stop")
+                transport.rpush("commands", "stop")
                 try:
                     solver_process.wait(10)
                 except TimeoutExpired:
                     solver_process.kill()
+                set_enumerator_transport(None)
+                transport.close()
+                if broker is not None:
+                    broker.close()
+        elif kwargs.get("solver", "ocaml") == "ocaml" and kwargs.get("solverPool"):
+            from dreamcoder.solverPool import SolverPool, set_active_solver_pool
+
+            eprint("Starting persistent solver pool")
+            pool = SolverPool(maximumWorkers=kwargs.get("CPUs", 1))
+            set_active_solver_pool(pool)
+            try:
+                yield from f(*args, **kwargs)
+            finally:
+                eprint("Stopping persistent solver pool")
+                set_active_solver_pool(None)
+                pool.close()
         else:
             yield from f(*args, **kwargs)
 
@@ -191,6 +222,13 @@ def ecIterator(
     addFullTaskMetrics=False,
     matrixRank=None,
     solver="ocaml",
+    solverPool=False,
+    schedulingPolicy="mdl",
+    observationalEquivalence=False,
+    sandboxedEvaluation=False,
+    enumeratorTransport="redis",
+    binaryCheckpoints=False,
+    binaryCompressorMessages=False,
     compressor="rust",
     biasOptimal=False,
     contextual=False,
@@ -300,6 +338,13 @@ def ecIterator(
             "evaluationTimeout",
             "testingTasks",
             "compressor",
+            "solverPool",
+            "schedulingPolicy",
+            "observationalEquivalence",
+            "sandboxedEvaluation",
+            "enumeratorTransport",
+            "binaryCheckpoints",
+            "binaryCompressorMessages",
             "custom_wake_generative",
             "manualSolutions",
         }
@@ -385,7 +430,7 @@ def ecIterator(
 
             manual_solutions = {}
             for t_name, solutions in manual_solutions_raw.items():
-                parsed_solutions = [Program.parse(s) for s in solutions]
+                parsed_solutions = Program.parse_many(solutions)
                 manual_solutions[t_name] = parsed_solutions
         else:
             manual_solutions = None
@@ -475,6 +520,9 @@ def ecIterator(
             evaluationTimeout=evaluationTimeout,
             solver=solver,
             type_weights=type_weights,
+            schedulingPolicy=schedulingPolicy,
+            observationalEquivalence=observationalEquivalence,
+            sandboxedEvaluation=sandboxedEvaluation,
             **kw,
         )
         trainFrontiers, _, trainingTimes = enumerator(
@@ -558,6 +606,9 @@ def ecIterator(
                 enumerationTimeout=testingTimeout,
                 evaluationTimeout=evaluationTimeout,
                 type_weights=type_weights,
+                schedulingPolicy=schedulingPolicy,
+                observationalEquivalence=observationalEquivalence,
+                sandboxedEvaluation=sandboxedEvaluation,
             )
         # If we have to also enumerate Helmholtz frontiers,
         # do this extra sneaky in the background
@@ -596,6 +647,17 @@ def ecIterator(
                 if custom_wake_generative is not None
                 else default_wake_generative
             )
+            # Search options are only passed when set, so that hooks written
+            # before they existed keep working
+            searchOptions = {
+                k: v
+                for k, v in [
+                    ("schedulingPolicy", schedulingPolicy),
+                    ("observationalEquivalence", observationalEquivalence),
+                    ("sandboxedEvaluation", sandboxedEvaluation),
+                ]
+                if v != WAKE_GENERATIVE_DEFAULTS[k]
+            }
             topDownFrontiers, times = wake_generative(
                 grammar,
                 wakingTaskBatch,
@@ -605,6 +667,7 @@ def ecIterator(
                 CPUs=CPUs,
                 evaluationTimeout=evaluationTimeout,
                 type_weights=type_weights,
+                **searchOptions,
             )
             result.trainSearchTime = {
                 t: tm for t, tm in times.items() if tm is not None
@@ -673,6 +736,9 @@ def ecIterator(
                 recognitionSteps=recognitionSteps,
                 maximumFrontier=maximumFrontier,
                 type_weights=type_weights,
+                schedulingPolicy=schedulingPolicy,
+                observationalEquivalence=observationalEquivalence,
+                sandboxedEvaluation=sandboxedEvaluation,
             )
 
             showHitMatrix(tasksHitTopDown, tasksHitBottomUp, wakingTaskBatch)
@@ -704,6 +770,7 @@ def ecIterator(
                 aic=aic,
                 structurePenalty=structurePenalty,
                 compressor=compressor,
+                binaryPrograms=binaryCompressorMessages,
                 CPUs=CPUs,
                 iteration=j,
             )
@@ -714,7 +781,8 @@ def ecIterator(
 
         if outputPrefix is not None:
             path = checkpointPath(j + 1)
-            with open(path, "wb") as handle:
+            table = ProgramTable.fromGrammar(grammar) if binaryCheckpoints else None
+            with open(path, "wb") as handle, binaryPrograms(table):
                 try:
                     dill.dump(result, handle)
                 except TypeError as e:
@@ -761,6 +829,9 @@ def evaluateOnTestingTasks(
     enumerationTimeout=None,
     evaluationTimeout=None,
     type_weights=None,
+    schedulingPolicy="mdl",
+    observationalEquivalence=False,
+    sandboxedEvaluation=False,
 ):
     if result.recognitionModel is not None:
         recognizer = result.recognitionModel
@@ -773,6 +844,9 @@ def evaluateOnTestingTasks(
             evaluationTimeout=evaluationTimeout,
             testing=True,
             type_weights=type_weights,
+            schedulingPolicy=schedulingPolicy,
+            observationalEquivalence=observationalEquivalence,
+            sandboxedEvaluation=sandboxedEvaluation,
         )
         updateTaskSummaryMetrics(
             result.recognitionTaskMetrics,
@@ -800,6 +874,9 @@ def evaluateOnTestingTasks(
             evaluationTimeout=evaluationTimeout,
             testing=True,
             type_weights=type_weights,
+            schedulingPolicy=schedulingPolicy,
+            observationalEquivalence=observationalEquivalence,
+            sandboxedEvaluation=sandboxedEvaluation,
         )
     updateTaskSummaryMetrics(
         result.recognitionTaskMetrics, times, "heldoutTestingTimes"
@@ -819,6 +896,15 @@ def evaluateOnTestingTasks(
     result.testingSearchTime.append(times)
 
 
+# Search options of wake_generative, which are only passed to it when they
+# differ from these
+WAKE_GENERATIVE_DEFAULTS = {
+    "schedulingPolicy": "mdl",
+    "observationalEquivalence": False,
+    "sandboxedEvaluation": False,
+}
+
+
 def default_wake_generative(
     grammar,
     tasks,
@@ -828,7 +914,19 @@ def default_wake_generative(
     solver=None,
     evaluationTimeout=None,
     type_weights=None,
+    schedulingPolicy="mdl",
+    observationalEquivalence=False,
+    sandboxedEvaluation=False,
 ):
+    """Enumerates programs for the tasks from the grammar; returns their
+    frontiers and the time each task took to be solved.
+    A custom_wake_generative hook of ecIterator is called in the same way:
+    with the grammar and the tasks, and the keywords solver, maximumFrontier,
+    enumerationTimeout, CPUs, evaluationTimeout and type_weights. The
+    keywords schedulingPolicy, observationalEquivalence and
+    sandboxedEvaluation are only passed when they differ from
+    WAKE_GENERATIVE_DEFAULTS, so a hook only needs to accept those it is
+    used with."""
     topDownFrontiers, times = multicoreEnumeration(
         grammar,
         tasks,
@@ -838,6 +936,9 @@ def default_wake_generative(
         solver=solver,
         evaluationTimeout=evaluationTimeout,
         type_weights=type_weights,
+        schedulingPolicy=schedulingPolicy,
+        observationalEquivalence=observationalEquivalence,
+        sandboxedEvaluation=sandboxedEvaluation,
     )
     eprint("Generative model enumeration results:")
     eprint(Frontier.describe(topDownFrontiers))
@@ -873,6 +974,9 @@ def sleep_recognition(
     CPUs=None,
     solver=None,
     type_weights=None,
+    schedulingPolicy="mdl",
+    observationalEquivalence=False,
+    sandboxedEvaluation=False,
 ):
     eprint(
         "Using an ensemble size of %d. Note that we will only store and test on the best recognition model."
@@ -938,6 +1042,9 @@ def sleep_recognition(
             evaluationTimeout=evaluationTimeout,
             solver=solver,
             type_weights=type_weights,
+            schedulingPolicy=schedulingPolicy,
+            observationalEquivalence=observationalEquivalence,
+            sandboxedEvaluation=sandboxedEvaluation,
         )
         ensembleFrontiers.append(bottomupFrontiers)
         ensembleTimes.append([t for t in allRecognitionTimes.values() if t is not None])
@@ -1048,6 +1155,7 @@ def consolidate(
     aic=None,
     structurePenalty=None,
     compressor=None,
+    binaryPrograms=False,
     CPUs=None,
     iteration=None,
 ):
@@ -1084,6 +1192,7 @@ def consolidate(
             structurePenalty=structurePenalty,
             topk_use_only_likelihood=False,
             backend=compressor,
+            binaryPrograms=binaryPrograms,
             CPUs=CPUs,
             iteration=iteration,
         )
@@ -1294,6 +1403,50 @@ def commandlineArguments(
                         Default: %s"""
         % solver,
     )
+    parser.add_argument(
+        "--schedulingPolicy",
+        choices=["mdl", "hits", "entropy"],
+        default="mdl",
+        help="""Which enumeration jobs get idle CPUs first: lowest MDL bound, fewest hits, or lowest recognition model entropy.
+                        Default: mdl""",
+    )
+    parser.add_argument(
+        "--observationalEquivalence",
+        action="store_true",
+        default=False,
+        help="With the bottom-up solver, drop expressions that compute the same outputs on the task inputs as a cheaper expression.",
+    )
+    parser.add_argument(
+        "--sandboxedEvaluation",
+        action="store_true",
+        default=False,
+        help="With the python solver, check programs in forked worker processes, so that a program which crashes or exhausts memory only loses itself.",
+    )
+    parser.add_argument(
+        "--solverPool",
+        action="store_true",
+        default=False,
+        help="Keep OCaml solver processes alive across enumeration jobs and iterations instead of starting one per budget window.",
+    )
+    parser.add_argument(
+        "--enumeratorTransport",
+        choices=["redis", "socket"],
+        default="redis",
+        help="""How to talk to the julia enumerator service: through a redis server on localhost, or through a Unix socket broker run by this process.
+                        Default: redis""",
+    )
+    parser.add_argument(
+        "--binaryCheckpoints",
+        action="store_true",
+        default=False,
+        help="Store the programs of the frontiers in checkpoints in a compact binary encoding. Such checkpoints load like any other.",
+    )
+    parser.add_argument(
+        "--binaryCompressorMessages",
+        action="store_true",
+        default=False,
+        help="Send the programs of the frontiers to the rust compressor in a compact binary encoding rather than as text. Other compressors ignore this.",
+    )
     parser.add_argument(
         "-r",
         "--Helmholtz",
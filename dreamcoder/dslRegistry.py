@@ -0,0 +1,71 @@
+"""
+Content-addressed registry of serialized grammars.
+
+Messages to the solvers used to embed `g.json()` for every job, and for every
+Helmholtz sample. Instead, each grammar is serialized once and named by a hash
+of its serialization. The payload is shipped to a consumer once (a solver
+worker, or the `dsl:<hash>` key of the enumerator service) and messages only
+carry the "DSLHash".
+"""
+
+import hashlib
+import json
+import weakref
+
+
+def dsl_key(h):
+    """Key under which the enumerator service finds the DSL with hash `h`"""
+    return "dsl:" + h
+
+
+class DSLRegistry:
+    def __init__(self):
+        # id(grammar) -> (hash, serialized grammar)
+        # Entries are dropped when the grammar is garbage collected
+        self.entries = {}
+        self.serializations = 0
+
+    def _forget(self, i):
+        self.entries.pop(i, None)
+
+    def entry(self, g):
+        i = id(g)
+        if i not in self.entries:
+            payload = json.dumps(g.json(), sort_keys=True)
+            h = hashlib.sha1(payload.encode("utf-8")).hexdigest()
+            self.entries[i] = (h, payload)
+            self.serializations += 1
+            weakref.finalize(g, self._forget, i)
+        return self.entries[i]
+
+    def hash(self, g):
+        return self.entry(g)[0]
+
+    def payload(self, g):
+        """The JSON serialization of the grammar, as a string"""
+        return self.entry(g)[1]
+
+    def upload(self, conn, grammars):
+        """Stores each distinct grammar under its key on a redis-like connection.
+        Returns a map from grammar to hash."""
+        hashes = {}
+        uploaded = set()
+        for g in grammars:
+            h = self.hash(g)
+            hashes[g] = h
+            if h not in uploaded:
+                conn.set(dsl_key(h), self.payload(g))
+                uploaded.add(h)
+        return hashes
+
+
+def json_with_dsl(message, dsl):
+    """Serializes `message` with the already serialized `dsl` spliced in as
+    its "DSL" field, so that the grammar is not serialized again"""
+    rest = json.dumps(message)
+    if rest == "{}":
+        return '{"DSL": %s}' % dsl
+    return '{"DSL": %s, %s' % (dsl, rest[1:])
+
+
+DSL_REGISTRY = DSLRegistry()
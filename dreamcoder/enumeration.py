@@ -1,8 +1,23 @@
 from pickle import NONE
 from dreamcoder.likelihoodModel import AllOrNothingLikelihoodModel
 from dreamcoder.grammar import *
+from dreamcoder.frontier import binaryPrograms
+from dreamcoder.scheduler import EnumerationScheduler
+from dreamcoder.dslRegistry import DSL_REGISTRY, json_with_dsl
+from dreamcoder.priorScoring import PRIOR_SCORER
+from dreamcoder.task import TaskBatch
+from dreamcoder.evaluationCache import EVALUATION_CACHE
+from dreamcoder.evaluationDeadline import EVALUATION_DEADLINE
+from dreamcoder.evaluationPool import EvaluationPool
+from dreamcoder.solverPool import (
+    DSL_CACHE_SIZE,
+    SolverPool,
+    SolverWorkerError,
+    active_solver_pool,
+)
 from dreamcoder.utilities import get_root_dir
 
+from collections import deque
 import os
 import traceback
 import subprocess
@@ -20,8 +35,21 @@ def multicoreEnumeration(
     evaluationTimeout=None,
     testing=False,
     type_weights=None,
+    streamResults=None,
+    schedulingPolicy="mdl",
+    observationalEquivalence=False,
+    sandboxedEvaluation=False,
 ):
     """g: Either a Grammar, or a map from task to grammar.
+    schedulingPolicy: which jobs get CPUs first, see dreamcoder.scheduler.
+    observationalEquivalence: have the bottom-up solver prune expressions that
+    are observationally equivalent on the task inputs.
+    sandboxedEvaluation: have the python solver check programs in forked
+    processes under resource limits, see dreamcoder.evaluationPool. A dict
+    gives the arguments of the EvaluationPool.
+    streamResults: have the OCaml solver report each hit as soon as it is found,
+    and cancel jobs whose tasks all reached maximumFrontier. Defaults to
+    streaming whenever a persistent solver pool is active.
     Returns (list-of-frontiers, map-from-task-to-search-time)"""
 
     if solver == "julia":
@@ -74,6 +102,16 @@ def multicoreEnumeration(
     solver_str = solver
     solver = solvers[solver]
 
+    # Persistent solver processes, if the caller set up a pool
+    solverPool = active_solver_pool() if solver_str == "ocaml" else None
+    if streamResults is None:
+        streamResults = solverPool is not None
+    streamResults = streamResults and solver_str == "ocaml"
+    # Streaming needs framed solver workers, so borrow some just for this call
+    temporaryPool = None
+    if streamResults and solverPool is None:
+        solverPool = temporaryPool = SolverPool(maximumWorkers=CPUs)
+
     # If we are not evaluating on held out testing tasks:
     # Bin the tasks by request type and grammar
     # If these are the same then we can enumerate for multiple tasks simultaneously
@@ -96,23 +134,41 @@ def multicoreEnumeration(
     if disableParallelism:
         eprint("Disabling parallelism on the Python side because we only have one job.")
         eprint("If you are using ocaml or bottom, there could still be parallelism.")
+    elif solver_str == "python" and any(getattr(t, "cache", False) for t in tasks):
+        # Forked jobs reuse each other's verdicts on cached tasks
+        EVALUATION_CACHE.share()
 
     # Map from task to the shortest time to find a program solving it
     bestSearchTime = {t: None for t in task2grammar}
 
-    lowerBounds = {k: 0.0 for k in jobs}
-
     frontiers = {t: Frontier([], task=t) for t in task2grammar}
 
-    # For each job we keep track of how long we have been working on it
-    stopwatches = {t: Stopwatch() for t in jobs}
-
     # Map from task to how many programs we enumerated for that task
     taskToNumberOfPrograms = {t: 0 for t in tasks}
 
     def numberOfHits(f):
         return sum(e.logLikelihood > -0.01 for e in f)
 
+    def recordFrontier(t, f, dt):
+        oldBest = None if len(frontiers[t]) == 0 else frontiers[t].bestPosterior
+        frontiers[t] = frontiers[t].combine(f)
+        newBest = None if len(frontiers[t]) == 0 else frontiers[t].bestPosterior
+
+        if dt is not None:
+            if bestSearchTime[t] is None:
+                bestSearchTime[t] = dt
+            else:
+                # newBest & oldBest should both be defined
+                assert oldBest is not None
+                assert newBest is not None
+                newScore = newBest.logPrior + newBest.logLikelihood
+                oldScore = oldBest.logPrior + oldBest.logLikelihood
+
+                if newScore > oldScore:
+                    bestSearchTime[t] = dt
+                elif newScore == oldScore:
+                    bestSearchTime[t] = min(bestSearchTime[t], dt)
+
     def budgetIncrement(lb):
         nonlocal solver_str
         if solver_str == "bottom":
@@ -120,111 +176,89 @@ def multicoreEnumeration(
         else:
             return 1.5
 
-    def maximumFrontiers(j):
-        tasks = jobs[j]
+    def maximumFrontiers(tasks):
         return {t: maximumFrontier - numberOfHits(frontiers[t]) for t in tasks}
 
-    def allocateCPUs(n, tasks):
-        allocation = {t: 0 for t in tasks}
-        while n > 0:
-            for t in tasks:
-                # During testing we use exactly one CPU per task
-                if testing and allocation[t] > 0:
-                    return allocation
-                allocation[t] += 1
-                n -= 1
-                if n == 0:
-                    break
-        return allocation
-
-    def refreshJobs():
-        for k in list(jobs.keys()):
-            v = [
-                t
-                for t in jobs[k]
-                if numberOfHits(frontiers[t]) < maximumFrontier
-                and stopwatches[k].elapsed <= enumerationTimeout
-            ]
-            if v:
-                jobs[k] = v
-            else:
-                del jobs[k]
+    scheduler = EnumerationScheduler(
+        jobs,
+        CPUs,
+        enumerationTimeout,
+        budgetIncrement,
+        policy=schedulingPolicy,
+        numberOfHits=lambda t: numberOfHits(frontiers[t]),
+        maximumFrontier=maximumFrontier,
+        testing=testing,
+        # Stolen slices only pay off if they can run alongside the others
+        stealing=not disableParallelism,
+        # These keep their enumerator from one budget window to the next
+        resumable=solver_str in ("python", "pypy"),
+    )
 
     # Workers put their messages in here
     q = Queue()
 
-    # How many CPUs are we using?
-    activeCPUs = 0
-
-    # How many CPUs was each job allocated?
-    id2CPUs = {}
-    # What job was each ID working on?
-    id2job = {}
-    nextID = 0
+    # Which pooled solver worker was leased to each ID, and its CPU time then?
+    id2worker = {}
+    id2workerCPU = {}
+    # Which tasks was each ID solving?
+    id2tasks = {}
+    # IDs whose tasks are all solved and which we asked to stop early
+    cancelledIDs = set()
+    tasksByName = {t.name: t for t in task2grammar}
 
     while True:
-        refreshJobs()
-        # Don't launch a job that we are already working on
-        # We run the stopwatch whenever the job is being worked on
-        # freeJobs are things that we are not working on but could be
-        freeJobs = [
-            j
-            for j in jobs
-            if not stopwatches[j].running
-            and stopwatches[j].elapsed < enumerationTimeout - 0.5
-        ]
-        if freeJobs and activeCPUs < CPUs:
-            # Allocate a CPU to each of the jobs that we have made the least
-            # progress on
-            freeJobs.sort(key=lambda j: lowerBounds[j])
-            # Launch some more jobs until all of the CPUs are being used
-            availableCPUs = CPUs - activeCPUs
-            allocation = allocateCPUs(availableCPUs, freeJobs)
-            for j in freeJobs:
-                if allocation[j] == 0:
-                    continue
-                g, request = j[:2]
-                bi = budgetIncrement(lowerBounds[j])
-                thisTimeout = enumerationTimeout - stopwatches[j].elapsed
-                eprint(
-                    "(frontend) Launching %s (%d tasks) w/ %d CPUs. %f <= MDL < %f. Timeout %f."
-                    % (
-                        request,
-                        len(jobs[j]),
-                        allocation[j],
-                        lowerBounds[j],
-                        lowerBounds[j] + bi,
-                        thisTimeout,
-                    )
-                )
-                stopwatches[j].start()
-                parallelCallback(
-                    wrapInThread(solver),
-                    q=q,
-                    g=g,
-                    ID=nextID,
-                    elapsedTime=stopwatches[j].elapsed,
-                    CPUs=allocation[j],
-                    tasks=jobs[j],
-                    lowerBound=lowerBounds[j],
-                    upperBound=lowerBounds[j] + bi,
-                    budgetIncrement=bi,
-                    timeout=thisTimeout,
-                    evaluationTimeout=evaluationTimeout,
-                    maximumFrontiers=maximumFrontiers(j),
-                    testing=testing,
-                    likelihoodModel=likelihoodModel,
+        for s in scheduler.schedule():
+            j = s.job
+            eprint(
+                "(frontend) Launching %s (%d tasks) w/ %d CPUs. %f <= MDL < %f. Timeout %f.%s"
+                % (
+                    j.request,
+                    len(j.tasks),
+                    s.CPUs,
+                    s.lowerBound,
+                    s.upperBound,
+                    s.timeout,
+                    " (stolen)" if s.stolen else "",
                 )
-                id2CPUs[nextID] = allocation[j]
-                id2job[nextID] = j
-                nextID += 1
-
-                activeCPUs += allocation[j]
-                lowerBounds[j] += bi
+            )
+            extraArguments = {}
+            if solverPool is not None:
+                id2worker[s.ID] = solverPool.lease()
+                id2workerCPU[s.ID] = id2worker[s.ID].cpuTime()
+                extraArguments["solverWorker"] = id2worker[s.ID]
+            if streamResults or solver_str == "python":
+                # The python solver reports the hits of each budget window
+                extraArguments["stream"] = True
+            if observationalEquivalence and solver_str == "bottom":
+                extraArguments["observationalEquivalence"] = True
+            if sandboxedEvaluation and solver_str == "python":
+                extraArguments["sandboxedEvaluation"] = sandboxedEvaluation
+            id2tasks[s.ID] = list(j.tasks)
+            if solver_str == "ocaml":
+                # Serialize the grammar here, so that forked jobs inherit it
+                DSL_REGISTRY.entry(j.grammar)
+            parallelCallback(
+                wrapInThread(solver),
+                q=q,
+                g=j.grammar,
+                ID=s.ID,
+                elapsedTime=j.stopwatch.elapsed,
+                CPUs=s.CPUs,
+                tasks=j.tasks,
+                lowerBound=s.lowerBound,
+                upperBound=s.upperBound,
+                budgetIncrement=s.budgetIncrement,
+                timeout=s.timeout,
+                evaluationTimeout=evaluationTimeout,
+                maximumFrontiers=maximumFrontiers(j.tasks),
+                testing=testing,
+                likelihoodModel=likelihoodModel,
+                **extraArguments,
+            )
 
         # If nothing is running, and we just tried to launch jobs,
         # then that means we are finished
-        if all(not s.running for s in stopwatches.values()):
+        if not scheduler.running:
             break
 
         # Wait to get a response
@@ -234,38 +268,48 @@ def multicoreEnumeration(
             eprint("PANIC! Exception in child worker:", message.exception)
             eprint(message.stacktrace)
             assert False
+        elif message.result == "hit":
+            taskName, entry, dt = message.value
+            t = tasksByName[taskName]
+            recordFrontier(t, Frontier([entry], task=t), dt)
+            if (
+                message.ID in id2worker
+                and message.ID not in cancelledIDs
+                and all(
+                    numberOfHits(frontiers[t]) >= maximumFrontier
+                    for t in id2tasks[message.ID]
+                )
+            ):
+                eprint(
+                    "(frontend) Cancelling job %d: all of its tasks have %d hits"
+                    % (message.ID, maximumFrontier)
+                )
+                cancelledIDs.add(message.ID)
+                id2worker[message.ID].cancel()
         elif message.result == "success":
             # Mark the CPUs is no longer being used and pause the stopwatch
-            activeCPUs -= id2CPUs[message.ID]
-            stopwatches[id2job[message.ID]].stop()
+            cpuSeconds = message.cpuTime
+            if message.ID in id2worker:
+                worker = id2worker.pop(message.ID)
+                cpuSeconds += worker.cpuTime() - id2workerCPU.pop(message.ID)
+                s = scheduler.finished(message.ID, cpuSeconds)
+                solverPool.release(worker, dslHash=DSL_REGISTRY.hash(s.job.grammar))
+            else:
+                scheduler.finished(message.ID, cpuSeconds)
 
             newFrontiers, searchTimes, pc = message.value
             for t, f in newFrontiers.items():
-                oldBest = None if len(frontiers[t]) == 0 else frontiers[t].bestPosterior
-                frontiers[t] = frontiers[t].combine(f)
-                newBest = None if len(frontiers[t]) == 0 else frontiers[t].bestPosterior
-
                 taskToNumberOfPrograms[t] += pc
-
-                dt = searchTimes[t]
-                if dt is not None:
-                    if bestSearchTime[t] is None:
-                        bestSearchTime[t] = dt
-                    else:
-                        # newBest & oldBest should both be defined
-                        assert oldBest is not None
-                        assert newBest is not None
-                        newScore = newBest.logPrior + newBest.logLikelihood
-                        oldScore = oldBest.logPrior + oldBest.logLikelihood
-
-                        if newScore > oldScore:
-                            bestSearchTime[t] = dt
-                        elif newScore == oldScore:
-                            bestSearchTime[t] = min(bestSearchTime[t], dt)
+                recordFrontier(t, f, searchTimes[t])
         else:
             eprint("Unknown message result:", message.result)
             assert False
 
+    if temporaryPool is not None:
+        temporaryPool.close()
+
+    scheduler.reportCPUTime()
+
     eprint(
         "We enumerated this many programs, for each task:\n\t",
         list(taskToNumberOfPrograms.values()),
@@ -277,6 +321,11 @@ def multicoreEnumeration(
 class WorkerError(Exception):
     def __init__(self, message) -> None:
         super().__init__("Got error in enumeration worker:\n" + message)
+        self.message = message
+
+    def __reduce__(self):
+        # Raised in scoring workers and re-raised by the frontend
+        return (WorkerError, (self.message,))
 
 
 def multicore_enumeration_with_data(
@@ -290,8 +339,12 @@ def multicore_enumeration_with_data(
     maximumFrontier=None,
     verbose=True,
     testing=False,
+    connection=None,
+    scoringWorkers=None,
 ):
     """g: Either a Grammar, or a map from task to grammar.
+    connection: transport to the enumerator service, by default the active one.
+    scoringWorkers: processes used to score responses, by default one per 8 CPUs.
     Returns (list-of-frontiers, map-from-task-to-search-time)"""
 
     # We don't use actual threads but instead use the multiprocessing
@@ -322,11 +375,15 @@ def multicore_enumeration_with_data(
 
     tasks_by_name = {t.name: t for t in tasks}
 
-    import redis
+    from dreamcoder.enumeratorClient import EnumeratorClient
+    from dreamcoder.transport import enumerator_transport
 
-    r = redis.Redis(host="localhost", port=6379, db=0)
-    for task in tasks:
-        m = get_task_message(
+    if connection is None:
+        connection = enumerator_transport()
+    # Each distinct grammar is uploaded once, task messages refer to it by hash
+    DSL_REGISTRY.upload(connection, set(task2grammar[t] for t in tasks))
+    messages = [
+        get_task_message(
             task,
             task2grammar[task],
             enumerationTimeout,
@@ -334,40 +391,41 @@ def multicore_enumeration_with_data(
             maximumFrontier,
             type_weights,
         )
-        r.rpush("tasks", m)
+        for task in tasks
+    ]
 
-    for _ in range(len(tasks)):
-        response = r.blpop("results")[1]
-        try:
-            t, frontier_entries, dt, pc = parse_result_message(
-                response, tasks_by_name, task2grammar
-            )
-            f = Frontier(frontier_entries, t)
-            oldBest = None if len(frontiers[t]) == 0 else frontiers[t].bestPosterior
-            frontiers[t] = frontiers[t].combine(f)
-            newBest = None if len(frontiers[t]) == 0 else frontiers[t].bestPosterior
+    def recordResult(t, frontier_entries, dt, pc):
+        f = Frontier(frontier_entries, t)
+        oldBest = None if len(frontiers[t]) == 0 else frontiers[t].bestPosterior
+        frontiers[t] = frontiers[t].combine(f)
+        newBest = None if len(frontiers[t]) == 0 else frontiers[t].bestPosterior
+
+        taskToNumberOfPrograms[t] += pc
 
-            taskToNumberOfPrograms[t] += pc
+        if dt is not None:
+            if bestSearchTime[t] is None:
+                bestSearchTime[t] = dt
+            else:
+                # newBest & oldBest should both be defined
+                assert oldBest is not None
+                assert newBest is not None
+                newScore = newBest.logPrior + newBest.logLikelihood
+                oldScore = oldBest.logPrior + oldBest.logLikelihood
 
-            if dt is not None:
-                if bestSearchTime[t] is None:
+                if newScore > oldScore:
                     bestSearchTime[t] = dt
-                else:
-                    # newBest & oldBest should both be defined
-                    assert oldBest is not None
-                    assert newBest is not None
-                    newScore = newBest.logPrior + newBest.logLikelihood
-                    oldScore = oldBest.logPrior + oldBest.logLikelihood
-
-                    if newScore > oldScore:
-                        bestSearchTime[t] = dt
-                    elif newScore == oldScore:
-                        bestSearchTime[t] = min(bestSearchTime[t], dt)
-        except WorkerError as e:
-            raise
-        except:
-            eprint("Failure processing response: ", response)
-            raise
+                elif newScore == oldScore:
+                    bestSearchTime[t] = min(bestSearchTime[t], dt)
+
+    client = EnumeratorClient(
+        connection,
+        tasks_by_name,
+        task2grammar,
+        scoringWorkers=scoringWorkers
+        if scoringWorkers is not None
+        else max(1, CPUs // 8),
+    )
+    client.run(messages, recordResult)
 
     eprint(
         "We enumerated this many programs, for each task:\n\t",
@@ -387,10 +445,29 @@ def wrapInThread(f):
     def _f(*a, **k):
         q = k.pop("q")
         ID = k.pop("ID")
+        # Programs of the frontiers are sent in the binary encoding of the
+        # DSL they were enumerated from
+        table = ProgramTable.fromGrammar(k["g"]) if k.get("g") is not None else None
+
+        def put(message):
+            with binaryPrograms(table):
+                q.put(dill.dumps(message))
+
+        if k.pop("stream", False):
+            # Hits are forwarded to the frontend as soon as they are found
+            k["onHit"] = lambda *hit: put({"result": "hit", "ID": ID, "value": hit})
+        startTime = cpuTime()
 
         try:
             r = f(*a, **k)
-            q.put(dill.dumps({"result": "success", "ID": ID, "value": r}))
+            put(
+                {
+                    "result": "success",
+                    "ID": ID,
+                    "value": r,
+                    "cpuTime": cpuTime() - startTime,
+                }
+            )
         except Exception as e:
             q.put(
                 dill.dumps(
@@ -421,6 +498,8 @@ def solveForTask_ocaml(
     likelihoodModel=None,
     evaluationTimeout=None,
     maximumFrontiers=None,
+    solverWorker=None,
+    onHit=None,
 ):
     import json
 
@@ -437,8 +516,9 @@ def solveForTask_ocaml(
             m["extras"] = extra
         return m
 
+    dslHash, dsl = DSL_REGISTRY.entry(g)
     message = {
-        "DSL": g.json(),
+        "DSLHash": dslHash,
         "tasks": [taskMessage(t) for t in tasks],
         "programTimeout": evaluationTimeout,
         "nc": CPUs,
@@ -456,48 +536,85 @@ def solveForTask_ocaml(
     if hasattr(tasks[0], "maxParameters") and tasks[0].maxParameters is not None:
         message["maxParameters"] = tasks[0].maxParameters
 
-    message = json.dumps(message)
+    streaming = onHit is not None and solverWorker is not None
+    if streaming:
+        message["stream"] = True
+
     # uncomment this if you want to save the messages being sent to the solver
 
-    try:
-        solver_file = os.path.join(get_root_dir(), "solver")
-        process = subprocess.Popen(
-            solver_file, stdin=subprocess.PIPE, stdout=subprocess.PIPE
+    def streamedHit(hit):
+        t = next(t for t in tasks if t.name == hit["task"])
+        job = (t.request, hit["program"])
+        p, logPrior = PRIOR_SCORER.score(g, [job])[job]
+        entry = FrontierEntry(
+            program=p, logLikelihood=hit["logLikelihood"], logPrior=logPrior
         )
-        response, error = process.communicate(bytes(message, encoding="utf-8"))
-        response = json.loads(response.decode("utf-8"))
-    except OSError as exc:
-        raise exc
-
-    except:
-        print("response:", response)
-        print("error:", error)
-        print("return code: ", process.returncode)
-        with open("message", "w") as f:
-            f.write(message)
-        eprint("message,", message)
-        assert False, "MAX RAISE"
+        onHit(t.name, entry, hit["time"] + elapsedTime)
+
+    if solverWorker is not None:
+        message["DSLCacheSize"] = DSL_CACHE_SIZE
+        if solverWorker.knowsDSL(dslHash):
+            request = json.dumps(message)
+        else:
+            request = json_with_dsl(message, dsl)
+        try:
+            response = solverWorker.request(
+                request, onHit=streamedHit if streaming else None
+            )
+        except SolverWorkerError as e:
+            if solverWorker.cancelled:
+                # Everything worth keeping was already streamed to the frontend
+                response = {t.name: [] for t in tasks}
+            else:
+                eprint(
+                    "(frontend) Solver worker failed (%s), falling back to a fresh solver process"
+                    % e
+                )
+                solverWorker = None
+
+    if solverWorker is None:
+        message = json_with_dsl(message, dsl)
+        try:
+            solver_file = os.path.join(get_root_dir(), "solver")
+            process = subprocess.Popen(
+                solver_file, stdin=subprocess.PIPE, stdout=subprocess.PIPE
+            )
+            response, error = process.communicate(bytes(message, encoding="utf-8"))
+            response = json.loads(response.decode("utf-8"))
+        except OSError as exc:
+            raise exc
+
+        except:
+            print("response:", response)
+            print("error:", error)
+            print("return code: ", process.returncode)
+            with open("message", "w") as f:
+                f.write(message)
+            eprint("message,", message)
+            assert False, "MAX RAISE"
 
     pc = response.get("number_enumerated", 0)  # TODO
+    # The whole response is scored in one pass
+    priors = PRIOR_SCORER.score(
+        g,
+        [(t.request, e["program"]) for t in tasks for e in response[t.name]],
+        onFailure=lambda request, p: eprint(
+            next(t for t in tasks if t.request == request), p, "TYPING ERROR"
+        ),
+    )
     frontiers = {}
     searchTimes = {}
     for t in tasks:
         solutions = response[t.name]
-        for e in solutions:
-            p = Program.parse(e["program"])
-            try:
-                g.logLikelihood(t.request, p)
-            except:
-                eprint(t, p, "TYPING ERROR")
         frontier = Frontier(
             [
                 FrontierEntry(
                     program=p,
                     logLikelihood=e["logLikelihood"],
-                    logPrior=g.logLikelihood(t.request, p),
+                    logPrior=logPrior,
                 )
                 for e in solutions
-                for p in [Program.parse(e["program"])]
+                for p, logPrior in [priors[(t.request, e["program"])]]
             ],
             task=t,
         )
@@ -543,7 +660,7 @@ def get_task_message(
         m["extras"] = extra
 
     message = {
-        "DSL": g.json(),
+        "DSLHash": DSL_REGISTRY.hash(g),
         "type_weights": type_weights.json(),
         "task": m,
         "name": task.name,
@@ -560,10 +677,13 @@ def get_task_message(
     return json.dumps(message)
 
 
-def parse_result_message(response, tasks_by_name, task2grammar):
+def score_result_message(response, tasks_by_name, task2grammar):
+    """Decodes a response of the enumerator service and scores its programs
+    under the task's grammar. Programs are returned as strings so that this
+    can run in a worker process.
+    Returns (task name, [(program, logLikelihood, logPrior)], searchTime, pc)"""
     import json
 
-    print(response)
     response = json.loads(response.decode("utf-8"))
 
     task_name = response["name"]
@@ -576,24 +696,20 @@ def parse_result_message(response, tasks_by_name, task2grammar):
     pc = response.get("number_enumerated", 0)  # TODO
 
     solutions = response["solutions"]
-    request = task.request
     g = task2grammar[task]
-    frontier_entries = []
-    for e in solutions:
-        p = Program.parse(e["program"])
-        try:
-            frontier_entries.append(
-                FrontierEntry(
-                    program=p,
-                    logLikelihood=e["logLikelihood"],
-                    logPrior=g.logLikelihood(task.request, p),
-                )
-            )
-        except:
-            eprint(p)
-            eprint(request)
-            raise
-    if not frontier_entries:
+
+    def failure(request, p):
+        eprint(p)
+        eprint(request)
+
+    priors = PRIOR_SCORER.score(
+        g, [(task.request, e["program"]) for e in solutions], onFailure=failure
+    )
+    scored = [
+        (e["program"], e["logLikelihood"], priors[(task.request, e["program"])][1])
+        for e in solutions
+    ]
+    if not scored:
         searchTime = None
     # This is subtle:
     # The search time we report is actually not be minimum time to find any solution
@@ -606,7 +722,28 @@ def parse_result_message(response, tasks_by_name, task2grammar):
             (e["logLikelihood"] + e["logPrior"], e["time"]) for e in solutions
         )[1]
 
-    return task, frontier_entries, searchTime, pc
+    return task_name, scored, searchTime, pc
+
+
+def rebuild_scored_result(result, tasks_by_name):
+    """Turns the output of score_result_message into
+    (task, frontier entries, searchTime, pc)"""
+    task_name, scored, searchTime, pc = result
+    frontier_entries = [
+        FrontierEntry(
+            program=PRIOR_SCORER.parse(p),
+            logLikelihood=logLikelihood,
+            logPrior=logPrior,
+        )
+        for p, logLikelihood, logPrior in scored
+    ]
+    return tasks_by_name[task_name], frontier_entries, searchTime, pc
+
+
+def parse_result_message(response, tasks_by_name, task2grammar):
+    return rebuild_scored_result(
+        score_result_message(response, tasks_by_name, task2grammar), tasks_by_name
+    )
 
 
 def solveForTask_pypy(
@@ -653,6 +790,8 @@ def solveForTask_python(
     evaluationTimeout=None,
     maximumFrontiers=None,
     testing=False,
+    sandboxedEvaluation=False,
+    onHit=None,
 ):
     return enumerateForTasks(
         g,
@@ -661,11 +800,14 @@ def solveForTask_python(
         timeout=timeout,
         testing=testing,
         elapsedTime=elapsedTime,
+        CPUs=CPUs,
         evaluationTimeout=evaluationTimeout,
         maximumFrontiers=maximumFrontiers,
         budgetIncrement=budgetIncrement,
         lowerBound=lowerBound,
         upperBound=upperBound,
+        sandboxedEvaluation=sandboxedEvaluation,
+        onHit=onHit,
     )
 
 
@@ -684,7 +826,11 @@ def solveForTask_bottom(
     maximumFrontiers=None,
     testing=False,
     compile_me=True,
+    observationalEquivalence=False,
+    maximumFingerprints=10**6,
 ):
+    """observationalEquivalence: drop expressions computing the same outputs
+    on the task inputs as a cheaper one, see ObservationalEquivalence"""
     if compile_me:
         return callCompiled(
             solveForTask_bottom,
@@ -701,16 +847,17 @@ def solveForTask_bottom(
             maximumFrontiers=maximumFrontiers,
             testing=testing,
             compile_me=False,
+            observationalEquivalence=observationalEquivalence,
+            maximumFingerprints=maximumFingerprints,
             # profile="tower_profile"
         )
 
     # this is some benchmarking code that I want to keep around
     # from dreamcoder.domains.tower.towerPrimitives import ttower, executeTower, _empty_tower, TowerState
     # program=tasks[0].original
-    # program=to_fast_program(program)
     # t0=time.time()
     # for _ in range(1000000):
-    #     program.evaluate([])(_empty_tower)(TowerState())
+    #     program.evaluateCompiled()(_empty_tower)(TowerState())
     # eprint("Time", time.time()-t0)
     # return
 
@@ -733,6 +880,8 @@ def solveForTask_bottom(
             timeout,
             maximumFrontiers,
             evaluationTimeout=evaluationTimeout,
+            observationalEquivalence=observationalEquivalence,
+            maximumFingerprints=maximumFingerprints,
         ),
         splits,
     )
@@ -755,211 +904,72 @@ def solveForTask_bottom(
 
 
 def bottom_up_parallel_worker(
-    g, pcfg, pps, tasks, timeout, maximumFrontiers, evaluationTimeout=None
+    g,
+    pcfg,
+    pps,
+    tasks,
+    timeout,
+    maximumFrontiers,
+    evaluationTimeout=None,
+    observationalEquivalence=False,
+    maximumFingerprints=10**6,
 ):
     from time import time
 
-    maximumFrontiers = [maximumFrontiers[t] for t in tasks]
-    # store all of the hits in a priority queue
-    # we will never maintain maximumFrontier best solutions
-    hits = [PQ() for _ in tasks]
-
-    starting = time()
-
-    totalNumberOfPrograms = 0
-
-    for e in pcfg.quantized_enumeration(skeletons=pps):
-        totalNumberOfPrograms += 1
-
-        if time() - starting > timeout:
-            break
-
-        prior = None
-
-        for n in range(len(tasks)):
-            task = tasks[n]
-
-            likelihood = task.logLikelihood(e, evaluationTimeout)
-            if invalid(likelihood):
-                continue
-
-            if prior is None:
-                prior = g.logLikelihood(tasks[0].request, e)
-
-            dt = time() - starting
-            priority = -(likelihood + prior)
-            hits[n].push(
-                priority,
-                (
-                    dt,
-                    FrontierEntry(program=e, logLikelihood=likelihood, logPrior=prior),
-                ),
-            )
-            if len(hits[n]) > maximumFrontiers[n]:
-                hits[n].popMaximum()
-
-            if time() - starting > timeout:
-                break
-
-    # incorporate search time in frontier entry
-    for n in range(len(tasks)):
-        for search_time, entry in hits[n]:
-            entry.search_time = search_time
-
-    frontiers = {
-        tasks[n]: Frontier([e for _, e in hits[n]], task=tasks[n])
-        for n in range(len(tasks))
-    }
-    # This is subtle:
-    # The search time we report is actually not be minimum time to find any solution
-    # Rather it is the time to find the MAP solution
-    # This is important for regression problems,
-    # where we might find something with a good prior but bad likelihood early on,
-    # and only later discover the good high likelihood program
-
-    searchTimes = {
-        tasks[n]: (
-            None
-            if len(hits[n]) == 0
-            else min((-f.logPrior - f.logLikelihood, t) for t, f in hits[n])[1]
-        )
-        for n in range(len(tasks))
-    }
-
-    return frontiers, totalNumberOfPrograms
-
-
-def solveForTask_bottom(
-    _=None,
-    elapsedTime=0.0,
-    g=None,
-    tasks=None,
-    lowerBound=None,
-    upperBound=None,
-    budgetIncrement=None,
-    timeout=None,
-    CPUs=1,
-    likelihoodModel=None,
-    evaluationTimeout=None,
-    maximumFrontiers=None,
-    testing=False,
-    compile_me=True,
-):
-    if compile_me:
-        return callCompiled(
-            solveForTask_bottom,
-            elapsedTime=elapsedTime,
-            g=g,
-            tasks=tasks,
-            lowerBound=None,
-            upperBound=None,
-            budgetIncrement=None,
-            timeout=timeout,
-            CPUs=CPUs,
-            likelihoodModel=None,
+    equivalence = None
+    if observationalEquivalence:
+        equivalence = ObservationalEquivalence(
+            [xs for t in tasks for xs, _ in t.examples],
+            pcfg.number_of_arguments,
+            maximumFingerprints=maximumFingerprints,
             evaluationTimeout=evaluationTimeout,
-            maximumFrontiers=maximumFrontiers,
-            testing=testing,
-            compile_me=False,
-            # profile="tower_profile"
         )
 
-    # this is some benchmarking code that I want to keep around
-    # from dreamcoder.domains.tower.towerPrimitives import ttower, executeTower, _empty_tower, TowerState
-    # program=tasks[0].original
-    # program=to_fast_program(program)
-    # t0=time.time()
-    # for _ in range(1000000):
-    #     program.evaluate([])(_empty_tower)(TowerState())
-    # eprint("Time", time.time()-t0)
-    # return
-
-    request = tasks[0].request
-    assert all(
-        t.request == request for t in tasks
-    ), "Expected tasks to all have the same type"
-
-    pcfg = PCFG.from_grammar(g, request).number_rules()  # a pcfg
-
-    splits = pcfg.split(CPUs)
-
-    results = parallelMap(
-        CPUs,
-        lambda pps: bottom_up_parallel_worker(
-            g,
-            pcfg,
-            pps,
-            tasks,
-            timeout,
-            maximumFrontiers,
-            evaluationTimeout=evaluationTimeout,
-        ),
-        splits,
-    )
-    number_of_programs = sum(np for _, np in results)
-    eprint("Enumerated", number_of_programs, "programs")
-
-    frontiers = {
-        t: Frontier.combineMany([fs[t] for fs, _ in results]).topK(maximumFrontiers[t])
-        for t in tasks
-    }
-
-    searchTimes = {}
-    for t in tasks:
-        if len(frontiers[t]) == 0:
-            searchTimes[t] = None
-        else:
-            searchTimes[t] = frontiers[t].bestPosterior.search_time
-
-    return frontiers, searchTimes, number_of_programs
-
-
-def bottom_up_parallel_worker(
-    g, pcfg, pps, tasks, timeout, maximumFrontiers, evaluationTimeout=None
-):
-    from time import time
-
     maximumFrontiers = [maximumFrontiers[t] for t in tasks]
     # store all of the hits in a priority queue
     # we will never maintain maximumFrontier best solutions
     hits = [PQ() for _ in tasks]
+    batch = TaskBatch(tasks)
 
     starting = time()
 
     totalNumberOfPrograms = 0
 
-    for e in pcfg.quantized_enumeration(skeletons=pps):
-        totalNumberOfPrograms += 1
+    with EVALUATION_DEADLINE.batch(evaluationTimeout):
+        for e in pcfg.quantized_enumeration(skeletons=pps, equivalence=equivalence):
+            totalNumberOfPrograms += 1
 
-        if time() - starting > timeout:
-            break
+            if time() - starting > timeout:
+                break
 
-        prior = None
+            prior = None
+            likelihoods = batch.logLikelihoods(e, evaluationTimeout)
 
-        for n in range(len(tasks)):
-            task = tasks[n]
-
-            likelihood = task.logLikelihood(e, evaluationTimeout)
-            if invalid(likelihood):
-                continue
+            for n in range(len(tasks)):
+                likelihood = likelihoods[n]
+                if invalid(likelihood):
+                    continue
 
-            if prior is None:
-                prior = g.logLikelihood(tasks[0].request, e)
+                if prior is None:
+                    prior = g.logLikelihood(tasks[0].request, e)
+
+                dt = time() - starting
+                priority = -(likelihood + prior)
+                hits[n].push(
+                    priority,
+                    (
+                        dt,
+                        FrontierEntry(program=e, logLikelihood=likelihood, logPrior=prior),
+                    ),
+                )
+                if len(hits[n]) > maximumFrontiers[n]:
+                    hits[n].popMaximum()
 
-            dt = time() - starting
-            priority = -(likelihood + prior)
-            hits[n].push(
-                priority,
-                (
-                    dt,
-                    FrontierEntry(program=e, logLikelihood=likelihood, logPrior=prior),
-                ),
-            )
-            if len(hits[n]) > maximumFrontiers[n]:
-                hits[n].popMaximum()
+                if time() - starting > timeout:
+                    break
 
-            if time() - starting > timeout:
-                break
+    if equivalence is not None:
+        equivalence.report()
 
     # incorporate search time in frontier entry
     for n in range(len(tasks)):
@@ -1008,7 +1018,19 @@ def enumerateForTasks(
     upperBound=100.0,
     budgetIncrement=1.0,
     maximumFrontiers=None,
+    sandboxedEvaluation=False,
+    onHit=None,
 ):
+    """Enumerates the budget windows from lowerBound up to upperBound, which
+    may be infinite, with one enumerator which resumes where the previous
+    window stopped.
+    sandboxedEvaluation: check programs in a pool of CPUs - 1 forked
+    processes, or one, while the enumeration goes on (see
+    dreamcoder.evaluationPool), when the likelihood model is all or nothing.
+    A dict gives the other arguments of the EvaluationPool. When the time is
+    up, the programs the pool has not checked yet are dropped.
+    onHit: called with (task name, frontier entry, search time) at the end of
+    each window, for the hits found in it which are still in the frontier."""
     assert timeout is not None, "enumerateForTasks: You must provide a timeout."
 
     from time import time
@@ -1023,70 +1045,157 @@ def enumerateForTasks(
     # we will never maintain maximumFrontier best solutions
     hits = [PQ() for _ in tasks]
 
+    # All-or-nothing likelihoods only depend on the outputs of the program,
+    # which are computed once for every task
+    batch = None
+    if type(likelihoodModel) is AllOrNothingLikelihoodModel:
+        batch = TaskBatch(tasks)
+
+    # Each budget window resumes the search where the previous one stopped
+    enumerator = g.bestFirstEnumeration(
+        Context.EMPTY, [], request, maximumDepth=99, upperBound=upperBound
+    )
+    # Programs below the lower bound are skipped, not yielded
+    for _ in enumerator.enumerate(lowerBound):
+        pass
+
+    # Programs waiting to be sent to the evaluation pool, with their priors,
+    # and the chunks in the pool with their Evaluations, oldest first
+    pool = None
+    pending = []
+    submitted = deque()
+    if sandboxedEvaluation and batch is not None:
+        # One of the CPUs of the job runs the enumerator
+        pool = EvaluationPool(
+            workers=max(1, CPUs - 1),
+            **(sandboxedEvaluation if isinstance(sandboxedEvaluation, dict) else {}),
+        )
+        table = ProgramTable.fromGrammar(g)
+        # Enough chunks for every worker to have one in hand and one waiting,
+        # so that none of them waits for the enumerator
+        maximumInFlight = 2 * len(pool.workers)
+
+    def record(prior, p, likelihoods):
+        for n in range(len(tasks)):
+            task = tasks[n]
+
+            # Warning:changed to max's new likelihood model situation
+            # likelihood = task.logLikelihood(p, evaluationTimeout)
+            # if invalid(likelihood):
+            # continue
+            if likelihoods is None:
+                success, likelihood = likelihoodModel.score(p, task)
+            else:
+                likelihood = likelihoods[n]
+                success = valid(likelihood)
+            if not success:
+                continue
+
+            dt = time() - starting + elapsedTime
+            priority = -(likelihood + prior)
+            hits[n].push(
+                priority,
+                (
+                    dt,
+                    FrontierEntry(program=p, logLikelihood=likelihood, logPrior=prior),
+                ),
+            )
+            if len(hits[n]) > maximumFrontiers[n]:
+                hits[n].popMaximum()
+
+    def collect():
+        """Records the chunks which the pool has answered, in order"""
+        while submitted and submitted[0][1].done:
+            chunk, evaluation = submitted.popleft()
+            for (prior, p), (ls, _) in zip(chunk, evaluation.results()):
+                record(prior, p, ls)
+
+    def submit():
+        programs = [p for _, p in pending]
+        evaluation = pool.submit(batch, programs, likelihoodModel.timeout, table=table)
+        submitted.append((list(pending), evaluation))
+        pending.clear()
+        pool.poll()
+        while pool.inFlight > maximumInFlight:
+            wait()
+        collect()
+
+    def flush():
+        """Waits for the pool to check every program enumerated so far"""
+        if pending:
+            submit()
+        while pool.inFlight:
+            wait()
+        collect()
+
+    def wait():
+        """Waits for an answer of the pool, but not past the end of the search"""
+        remaining = starting + timeout - time()
+        if remaining <= 0:
+            raise EnumerationTimeout
+        pool.poll(remaining)
+
+    # Programs already sent to onHit, for each task
+    reported = [set() for _ in tasks]
+
     starting = time()
     previousBudget = lowerBound
     budget = lowerBound + budgetIncrement
-    try:
-        totalNumberOfPrograms = 0
-        while (
-            time() < starting + timeout
-            and any(len(h) < mf for h, mf in zip(hits, maximumFrontiers))
-            and budget <= upperBound
-        ):
-            numberOfPrograms = 0
-
-            for prior, _, p in g.enumeration(
-                Context.EMPTY,
-                [],
-                request,
-                maximumDepth=99,
-                upperBound=budget,
-                lowerBound=previousBudget,
+    # One timer serves every evaluation of the search
+    with EVALUATION_DEADLINE.batch(getattr(likelihoodModel, "timeout", None)):
+        try:
+            totalNumberOfPrograms = 0
+            while (
+                time() < starting + timeout
+                and any(len(h) < mf for h, mf in zip(hits, maximumFrontiers))
+                and budget <= upperBound
             ):
-                descriptionLength = -prior
-                # Shouldn't see it on this iteration
-                assert descriptionLength <= budget
-                # Should already have seen it
-                assert descriptionLength > previousBudget
-
-                numberOfPrograms += 1
-                totalNumberOfPrograms += 1
-
-                for n in range(len(tasks)):
-                    task = tasks[n]
-
-                    # Warning:changed to max's new likelihood model situation
-                    # likelihood = task.logLikelihood(p, evaluationTimeout)
-                    # if invalid(likelihood):
-                    # continue
-                    success, likelihood = likelihoodModel.score(p, task)
-                    if not success:
-                        continue
-
-                    dt = time() - starting + elapsedTime
-                    priority = -(likelihood + prior)
-                    hits[n].push(
-                        priority,
-                        (
-                            dt,
-                            FrontierEntry(
-                                program=p, logLikelihood=likelihood, logPrior=prior
-                            ),
-                        ),
-                    )
-                    if len(hits[n]) > maximumFrontiers[n]:
-                        hits[n].popMaximum()
-
-                if timeout is not None and time() - starting > timeout:
-                    raise EnumerationTimeout
-
-            previousBudget = budget
-            budget += budgetIncrement
-
-            if budget > upperBound:
-                break
-    except EnumerationTimeout:
-        pass
+                numberOfPrograms = 0
+
+                for prior, _, p in enumerator.enumerate(budget):
+                    descriptionLength = -prior
+                    # Shouldn't see it on this iteration
+                    assert descriptionLength <= budget
+                    # Should already have seen it
+                    assert descriptionLength > previousBudget
+
+                    numberOfPrograms += 1
+                    totalNumberOfPrograms += 1
+
+                    if pool is not None:
+                        pending.append((prior, p))
+                        if len(pending) >= pool.chunkSize:
+                            submit()
+                    elif batch is not None:
+                        record(prior, p, batch.logLikelihoods(p, likelihoodModel.timeout))
+                    else:
+                        record(prior, p, None)
+
+                    if timeout is not None and time() - starting > timeout:
+                        raise EnumerationTimeout
+
+                if pool is not None:
+                    flush()
+                if onHit is not None:
+                    for n, h in enumerate(hits):
+                        for dt, entry in h:
+                            if entry.program not in reported[n]:
+                                reported[n].add(entry.program)
+                                onHit(tasks[n].name, entry, dt)
+                previousBudget = budget
+                budget += budgetIncrement
+
+                if budget > upperBound or len(enumerator) == 0:
+                    break
+        except EnumerationTimeout:
+            if pool is not None:
+                # Keeps the answers already in; the chunks still in flight
+                # are dropped, and their workers killed by close
+                pool.poll(0)
+                collect()
+        finally:
+            if pool is not None:
+                pool.close()
     frontiers = {
         tasks[n]: Frontier([e for _, e in hits[n]], task=tasks[n])
         for n in range(len(tasks))
@@ -0,0 +1,182 @@
+"""
+Asynchronous client for the Julia enumerator service.
+
+Task messages are pushed onto the "tasks" queue in batches, one round trip per
+batch, while responses are popped from the "results" queue concurrently.
+Decoding a response and scoring its programs under the task's grammar is done
+by a pool of worker processes, so that result handling keeps up with a service
+running on many cores. Frontier entries are rebuilt on the calling thread,
+where the result callback runs.
+
+Backpressure is applied at both ends: at most `maximumInFlight` tasks are
+submitted but not yet handled, and at most `maximumBuffered` responses wait
+for a scoring worker. Once the buffer is full, responses are left on the
+service until the scorers catch up.
+"""
+
+import asyncio
+import concurrent.futures
+import multiprocessing
+
+from dreamcoder.enumeration import (
+    WorkerError,
+    rebuild_scored_result,
+    score_result_message,
+)
+from dreamcoder.utilities import eprint
+
+
+# Scoring workers are forked with the tasks and grammars of the current run,
+# so that only the raw responses are sent to them
+_SCORING_CONTEXT = None
+
+
+def _initialize_scorer(tasks_by_name, task2grammar):
+    global _SCORING_CONTEXT
+    _SCORING_CONTEXT = (tasks_by_name, task2grammar)
+
+
+def _score_response(response):
+    return score_result_message(response, *_SCORING_CONTEXT)
+
+
+class EnumeratorClient:
+    def __init__(
+        self,
+        conn,
+        tasks_by_name,
+        task2grammar,
+        _=None,
+        scoringWorkers=1,
+        maximumInFlight=None,
+        maximumBuffered=64,
+        batchSize=32,
+        pollTimeout=1,
+    ):
+        """conn: transport to the enumerator service, see dreamcoder.transport.
+        scoringWorkers: number of processes scoring responses; with 0 they are
+        scored on a thread of this process.
+        maximumInFlight: bound on tasks submitted but not yet handled."""
+        self.conn = conn
+        self.tasks_by_name = tasks_by_name
+        self.task2grammar = task2grammar
+        self.scoringWorkers = scoringWorkers
+        self.maximumInFlight = maximumInFlight
+        self.maximumBuffered = maximumBuffered
+        self.batchSize = batchSize
+        self.pollTimeout = pollTimeout
+        # Number of round trips used to submit tasks
+        self.submissions = 0
+
+    def run(self, messages, onResult):
+        """Submits every task message and calls onResult(task, frontierEntries,
+        searchTime, numberOfPrograms) for each response, on the calling thread.
+        Returns once every task has been answered."""
+        if not messages:
+            return
+        scorer = self._startScorer()
+        io = concurrent.futures.ThreadPoolExecutor(2)
+        try:
+            asyncio.run(self._run(list(messages), onResult, scorer, io))
+        finally:
+            # A consumer blocked on the service gives up within pollTimeout
+            io.shutdown(wait=False)
+            scorer.shutdown(cancel_futures=True)
+
+    def _startScorer(self):
+        if self.scoringWorkers <= 0:
+            _initialize_scorer(self.tasks_by_name, self.task2grammar)
+            return concurrent.futures.ThreadPoolExecutor(1)
+        scorer = concurrent.futures.ProcessPoolExecutor(
+            self.scoringWorkers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_initialize_scorer,
+            initargs=(self.tasks_by_name, self.task2grammar),
+        )
+        # Fork the workers now, before this process starts any other threads
+        scorer.submit(int).result()
+        return scorer
+
+    async def _submit(self, messages, inFlight, io):
+        loop = asyncio.get_running_loop()
+        i = 0
+        while i < len(messages):
+            await inFlight.acquire()
+            batch = [messages[i]]
+            i += 1
+            while (
+                i < len(messages)
+                and len(batch) < self.batchSize
+                and not inFlight.locked()
+            ):
+                await inFlight.acquire()
+                batch.append(messages[i])
+                i += 1
+            await loop.run_in_executor(io, self._push, batch)
+
+    def _push(self, batch):
+        self.conn.rpush("tasks", *batch)
+        self.submissions += 1
+
+    async def _consume(self, expected, responses, io):
+        loop = asyncio.get_running_loop()
+        received = 0
+        while received < expected:
+            item = await loop.run_in_executor(
+                io, self.conn.blpop, ["results"], self.pollTimeout
+            )
+            if item is None:
+                continue
+            await responses.put(item[1])
+            received += 1
+
+    async def _run(self, messages, onResult, scorer, io):
+        loop = asyncio.get_running_loop()
+        expected = len(messages)
+        inFlight = asyncio.Semaphore(self.maximumInFlight or expected)
+        responses = asyncio.Queue(self.maximumBuffered)
+        background = {
+            asyncio.ensure_future(self._submit(messages, inFlight, io)),
+            asyncio.ensure_future(self._consume(expected, responses, io)),
+        }
+        # Map from scoring future to the response being scored
+        scoring = {}
+        # Scorers get a little more than one response each, so none of them idles
+        slots = 2 * max(1, self.scoringWorkers)
+        getter = None
+        received = handled = 0
+        try:
+            while handled < expected:
+                if getter is None and received < expected and len(scoring) < slots:
+                    getter = asyncio.ensure_future(responses.get())
+                waiting = set(scoring) | background
+                if getter is not None:
+                    waiting.add(getter)
+                done, _ = await asyncio.wait(
+                    waiting, return_when=asyncio.FIRST_COMPLETED
+                )
+                for f in done & background:
+                    background.discard(f)
+                    # Raises if submission or consumption failed
+                    f.result()
+                if getter in done:
+                    response = getter.result()
+                    getter = None
+                    received += 1
+                    f = loop.run_in_executor(scorer, _score_response, response)
+                    scoring[f] = response
+                for f in done & set(scoring):
+                    response = scoring.pop(f)
+                    try:
+                        result = rebuild_scored_result(f.result(), self.tasks_by_name)
+                    except WorkerError:
+                        raise
+                    except:
+                        eprint("Failure processing response: ", response)
+                        raise
+                    onResult(*result)
+                    handled += 1
+                    inFlight.release()
+        finally:
+            for f in background | set(scoring) | ({getter} if getter else set()):
+                f.cancel()
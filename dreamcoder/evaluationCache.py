@@ -0,0 +1,204 @@
+"""
+Memoized evaluations of programs on the inputs of tasks, for Task.check.
+
+Outputs are kept in a per-process table bounded by an estimate of the bytes
+its entries take, which forgets the least recently used ones. A program is
+known by a digest of its text and an input by a small integer interned from
+its fingerprint, so entries do not keep programs or inputs alive.
+
+Optionally, verdicts (whether a program maps an input to an expected
+output) also go in a fixed-size table in shared memory. It is created
+before workers are forked, so that they reuse each other's verdicts; the
+outputs themselves stay in each process.
+"""
+
+import collections
+import hashlib
+import mmap
+import struct
+import sys
+
+from dreamcoder.utilities import fingerprintValue
+
+# Bytes charged to an entry on top of the size of its output
+ENTRY_OVERHEAD = 200
+
+
+def approximateSize(value, depth=3):
+    """Bytes taken by a value, counting the items of containers a few levels deep"""
+    size = sys.getsizeof(value)
+    if depth > 0 and isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approximateSize(x, depth - 1) for x in value)
+    elif depth > 0 and isinstance(value, dict):
+        size += sum(
+            approximateSize(k, depth - 1) + approximateSize(v, depth - 1)
+            for k, v in value.items()
+        )
+    return size
+
+
+def digest(*parts):
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part)
+    return h.digest()
+
+
+class SharedVerdicts:
+    """
+    Verdicts in an anonymous shared mapping, inherited by forked processes.
+
+    Each slot holds an 8-byte tag of its key and the tag xor a code of the
+    verdict. Slots are written without locks: a read which finds a slot
+    half written sees a code which is neither verdict, and misses. A key is
+    looked for in a few consecutive slots; when they are all taken, the
+    first one is replaced.
+    """
+
+    SLOT = struct.Struct("<QQ")
+    PROBES = 4
+    CODES = {True: 0x5A17ED7C0DE5A1E5, False: 0x0BADC0DEFA11ED00}
+    VERDICTS = {code: verdict for verdict, code in CODES.items()}
+
+    def __init__(self, slots=2**20):
+        self.slots = slots
+        self.memory = mmap.mmap(-1, slots * self.SLOT.size)
+
+    def _positions(self, tag):
+        start = tag % self.slots
+        return ((start + i) % self.slots * self.SLOT.size for i in range(self.PROBES))
+
+    def get(self, key):
+        tag = int.from_bytes(key[:8], "little") | 1
+        for offset in self._positions(tag):
+            t, code = self.SLOT.unpack_from(self.memory, offset)
+            if t == tag:
+                return self.VERDICTS.get(code ^ tag)
+            if t == 0:
+                return None
+        return None
+
+    def __setitem__(self, key, verdict):
+        tag = int.from_bytes(key[:8], "little") | 1
+        positions = list(self._positions(tag))
+        for offset in positions:
+            t, _ = self.SLOT.unpack_from(self.memory, offset)
+            if t == tag or t == 0:
+                break
+        else:
+            offset = positions[0]
+        self.SLOT.pack_into(self.memory, offset, tag, tag ^ self.CODES[verdict])
+
+    def close(self):
+        self.memory.close()
+
+
+class EvaluationCache:
+    """
+    Outputs of programs on inputs, keyed by (program digest, input id) and
+    bounded by maximumBytes. Statistics are those of this process.
+    """
+
+    def __init__(self, maximumBytes=2**28):
+        self.maximumBytes = maximumBytes
+        # (program digest, input id) -> (output, bytes)
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        # input fingerprint -> (input id, digest of the fingerprint)
+        self.inputs = {}
+        self.shared = None
+        self.hits = 0
+        self.sharedHits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def programKey(program):
+        """Digest of a program, the same in every process"""
+        return digest(str(program).encode())
+
+    def _input(self, x):
+        fingerprint = fingerprintValue(x)
+        if fingerprint is None:
+            return None
+        known = self.inputs.get(fingerprint)
+        if known is None:
+            known = self.inputs[fingerprint] = (
+                len(self.inputs),
+                digest(repr(fingerprint).encode()),
+            )
+        return known
+
+    def _sharedKey(self, program, inputDigest, y):
+        fingerprint = fingerprintValue(y)
+        if fingerprint is None:
+            return None
+        return digest(program, inputDigest, repr(fingerprint).encode())
+
+    def verdict(self, program, x, y):
+        """Whether the program maps x to y: True or False if it is known,
+        None otherwise"""
+        known = self._input(x)
+        if known is None:
+            return None
+        inputId, inputDigest = known
+        entry = self.entries.get((program, inputId))
+        if entry is not None:
+            self.entries.move_to_end((program, inputId))
+            self.hits += 1
+            return not (entry[0] != y)
+        if self.shared is not None:
+            key = self._sharedKey(program, inputDigest, y)
+            verdict = None if key is None else self.shared.get(key)
+            if verdict is not None:
+                self.sharedHits += 1
+                return verdict
+        self.misses += 1
+        return None
+
+    def record(self, program, x, y, output):
+        """Remembers the output of the program on x; returns whether it is y"""
+        verdict = not (output != y)
+        known = self._input(x)
+        if known is None:
+            return verdict
+        inputId, inputDigest = known
+        key = (program, inputId)
+        size = ENTRY_OVERHEAD + approximateSize(output)
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= previous[1]
+        if size <= self.maximumBytes:
+            self.entries[key] = (output, size)
+            self.bytes += size
+            while self.bytes > self.maximumBytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+        if self.shared is not None:
+            sharedKey = self._sharedKey(program, inputDigest, y)
+            if sharedKey is not None:
+                self.shared[sharedKey] = verdict
+        return verdict
+
+    def share(self, slots=2**20):
+        """Also keeps verdicts in shared memory, for processes forked from now on"""
+        if self.shared is None:
+            self.shared = SharedVerdicts(slots)
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def statistics(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "sharedHits": self.sharedHits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+EVALUATION_CACHE = EvaluationCache()
@@ -0,0 +1,116 @@
+"""
+Timeouts for evaluating programs, without a system call per evaluation.
+
+A batch of evaluations sharing a timeout runs inside
+`EVALUATION_DEADLINE.batch(timeout)`, and each evaluation calls `start()`,
+which only reads the clock. Compiled programs (see ProgramCompiler) count
+the calls of their lambdas down and look at the clock every STEPS calls,
+raising EvaluationTimeout once the deadline of the evaluation has passed.
+
+Primitives which run for long without calling back into the program are
+caught by a periodic virtual timer, armed once by the outermost batch of
+the main thread. Its handler raises once the current deadline has passed,
+and only once per evaluation, as a one-shot timer would. Other threads rely
+on the cooperative checks alone.
+
+Deadlines are measured in CPU time, as the virtual timer is: with
+time.process_time in the main thread and time.thread_time in the others,
+so that evaluations are not charged for the time their process is
+descheduled.
+"""
+
+import signal
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+class EvaluationTimeout(Exception):
+    pass
+
+
+class EvaluationDeadline(threading.local):
+    # Calls of compiled lambdas between two looks at the clock
+    STEPS = 1000
+    # The virtual timer fires this many times per timeout
+    ALARMS_PER_TIMEOUT = 4
+
+    def __init__(self):
+        self.remaining = sys.maxsize
+        self.deadline = None
+        self.timeout = None
+        self.alarmed = False
+        # Period of the virtual timer of this thread, if it is armed
+        self.period = None
+        self.clock = (
+            time.process_time
+            if threading.current_thread() is threading.main_thread()
+            else time.thread_time
+        )
+
+    def tick(self):
+        """Called by compiled programs when they have used up their steps"""
+        if self.deadline is None:
+            self.remaining = sys.maxsize
+        elif self.clock() >= self.deadline:
+            raise EvaluationTimeout()
+        else:
+            self.remaining = self.STEPS
+
+    def start(self):
+        """Starts the clock of one evaluation of the batch"""
+        if self.timeout is not None:
+            self.deadline = self.clock() + self.timeout
+            self.remaining = self.STEPS
+            self.alarmed = False
+
+    def stop(self):
+        self.deadline = None
+        self.remaining = sys.maxsize
+
+    def _alarm(self, _1, _2):
+        if (
+            self.deadline is not None
+            and not self.alarmed
+            and self.clock() >= self.deadline
+        ):
+            self.alarmed = True
+            raise EvaluationTimeout()
+
+    @contextmanager
+    def batch(self, timeout):
+        """Evaluations which each get `timeout` seconds, or no limit if it
+        is None. Batches nest; the deadline of the enclosing batch is
+        restored on exit."""
+        previous = (self.timeout, self.deadline, self.remaining)
+        self.timeout = timeout
+        self.stop()
+
+        period = None if timeout is None else timeout / self.ALARMS_PER_TIMEOUT
+        arm = (
+            period is not None
+            and (self.period is None or period < self.period)
+            and threading.current_thread() is threading.main_thread()
+        )
+        if arm:
+            previousPeriod = self.period
+            if previousPeriod is None:
+                previousHandler = signal.signal(signal.SIGVTALRM, self._alarm)
+            previousTimer = signal.setitimer(signal.ITIMER_VIRTUAL, period, period)
+            self.period = period
+        try:
+            yield self
+        finally:
+            if arm:
+                signal.setitimer(signal.ITIMER_VIRTUAL, *previousTimer)
+                if previousPeriod is None:
+                    signal.signal(
+                        signal.SIGVTALRM,
+                        signal.SIG_DFL if previousHandler is None else previousHandler,
+                    )
+                self.period = previousPeriod
+            self.timeout, self.deadline, self.remaining = previous
+
+
+EVALUATION_DEADLINE = EvaluationDeadline()
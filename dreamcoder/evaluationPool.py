@@ -0,0 +1,403 @@
+"""
+Pool of forked processes which check programs against tasks.
+
+Timeouts only stop a program which gives the interpreter a chance to run
+them: a recursion which overflows the C stack, a huge allocation or a loop
+inside C code can still take down the process doing the checking. An
+EvaluationPool checks programs in worker processes forked from the current
+one, so that they know every registered primitive, each under optional
+limits on its address space (RLIMIT_AS) and CPU time (RLIMIT_CPU).
+
+Programs are sent to workers in chunks, as text or in the binary encoding
+of a ProgramTable. For each program a worker answers with its log
+likelihood for each task of a TaskBatch and, on request, its outputs. While
+it works, a worker writes the position of the program it is evaluating to
+shared memory. When it dies, or makes no
+progress for `stallTimeout` seconds, the pool forks a replacement, fails the
+program it was evaluating and sends the others again.
+
+`evaluate` waits for its results. A caller with more work to do meanwhile,
+such as an enumerator, rather calls `submit`, which returns an Evaluation at
+once, and `poll` now and then, which hands waiting chunks to idle workers
+and collects the answers of busy ones.
+
+Workers cache the TaskBatches they were sent. Once a worker holds
+TASK_CACHE_SIZE of them and a new one arrives, it forgets all of them; the
+pool mirrors this rule to know which batches each worker has.
+"""
+
+import collections
+import itertools
+import math
+import multiprocessing
+import pickle
+import resource
+import signal
+import time
+import weakref
+from multiprocessing.connection import wait
+
+from dreamcoder.evaluationDeadline import EVALUATION_DEADLINE
+from dreamcoder.program import Program
+from dreamcoder.task import TIMED_OUT, TaskBatch
+from dreamcoder.utilities import NEGATIVEINFINITY, eprint
+
+TASK_CACHE_SIZE = 16
+
+
+class _TimedOut:
+    """Stands for TIMED_OUT between processes: a class pickles by name"""
+
+
+def _picklable(value):
+    try:
+        pickle.dumps(value)
+        return True
+    except Exception:
+        return False
+
+
+def _evaluate(batch, table, source, timeout, withOutputs):
+    try:
+        p = Program.parse(source) if table is None else table.decode(source)
+    except Exception:
+        return [NEGATIVEINFINITY] * len(batch.tasks), None
+    if not withOutputs:
+        return batch.logLikelihoods(p, timeout), None
+    outputs = batch.outputs(p, timeout)
+    likelihoods = batch.logLikelihoods(p, timeout, solved=batch.solvedBy(outputs))
+    if outputs is not None:
+        outputs = [_TimedOut if y is TIMED_OUT else y for y in outputs]
+    return likelihoods, outputs
+
+
+def _limitCPU(seconds):
+    """Lets this process use `seconds` more of CPU time before SIGXCPU kills it"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = math.ceil(usage.ru_utime + usage.ru_stime + seconds)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _serve(connection, progress, maximumMemory, maximumCPU):
+    # A batch of evaluations the parent was in the middle of is not ours
+    EVALUATION_DEADLINE.__init__()
+    # Interrupts are for the process which owns the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if maximumMemory is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (maximumMemory, maximumMemory))
+
+    batches = {}
+    # Tables are only known by weak references otherwise
+    tables = {}
+    while True:
+        try:
+            request = connection.recv()
+        except (EOFError, OSError):
+            return
+        if request is None:
+            return
+        key, tasks, table, programs, timeout, withOutputs = request
+        if tasks is not None:
+            if len(batches) >= TASK_CACHE_SIZE:
+                batches.clear()
+            batches[key] = TaskBatch(tasks)
+        batch = batches[key]
+        if table is not None and table.hash not in tables:
+            if len(tables) >= TASK_CACHE_SIZE:
+                tables.clear()
+            tables[table.hash] = table
+        if maximumCPU is not None:
+            _limitCPU(maximumCPU * len(programs))
+
+        results = []
+        # One timer serves every evaluation of the chunk
+        with EVALUATION_DEADLINE.batch(timeout):
+            for i, source in enumerate(programs):
+                progress.value = i
+                results.append(_evaluate(batch, table, source, timeout, withOutputs))
+        try:
+            connection.send(results)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # Outputs which cannot be pickled are sent as None
+            connection.send(
+                [
+                    (ls, None if ys is None else [y if _picklable(y) else None for y in ys])
+                    for ls, ys in results
+                ]
+            )
+
+
+class Evaluation:
+    """Programs submitted to an EvaluationPool, whose results arrive chunk by
+    chunk while the pool is polled"""
+
+    def __init__(self, key, batch, table, programs, timeout, outputs):
+        self.key = key
+        self.batch = batch
+        self.table = table
+        self.programs = programs
+        self.timeout = timeout
+        self.outputs = outputs
+        self.answers = [None] * len(programs)
+        # Programs which have not been answered yet
+        self.remaining = len(programs)
+
+    @property
+    def done(self):
+        return self.remaining == 0
+
+    def answer(self, start, answers):
+        self.answers[start : start + len(answers)] = answers
+        self.remaining -= len(answers)
+
+    def results(self):
+        """As EvaluationPool.evaluate returns them, once done"""
+        assert self.done
+        return [
+            (ls, None if ys is None else [TIMED_OUT if y is _TimedOut else y for y in ys])
+            for ls, ys in self.answers
+        ]
+
+
+class EvaluationWorker:
+    def __init__(self, context, maximumMemory=None, maximumCPU=None):
+        # Position in its chunk of the program being evaluated
+        self.progress = context.RawValue("q", 0)
+        self.connection, child = context.Pipe()
+        self.process = context.Process(
+            target=_serve,
+            args=(child, self.progress, maximumMemory, maximumCPU),
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+        # Keys of the TaskBatches held in the worker's cache
+        self.knownBatches = set()
+        # (Evaluation, position of the chunk among its programs, the chunk)
+        # in flight
+        self.chunk = None
+        self.lastProgress = 0
+        self.lastChange = None
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    @property
+    def alive(self):
+        return self.process.is_alive()
+
+    def rememberBatch(self, key):
+        """Records that the worker was sent the batch with this key,
+        following the same eviction rule as the worker"""
+        if key not in self.knownBatches and len(self.knownBatches) >= TASK_CACHE_SIZE:
+            self.knownBatches.clear()
+        self.knownBatches.add(key)
+
+    def submit(self, evaluation, start, programs):
+        key = evaluation.key
+        tasks = None if key in self.knownBatches else evaluation.batch.tasks
+        self.progress.value = 0
+        self.connection.send(
+            (key, tasks, evaluation.table, programs, evaluation.timeout, evaluation.outputs)
+        )
+        self.rememberBatch(key)
+        self.chunk = (evaluation, start, programs)
+        self.lastProgress, self.lastChange = 0, time.monotonic()
+
+    def stalled(self, seconds):
+        """Whether the worker has been on the same program for `seconds`"""
+        position = self.progress.value
+        now = time.monotonic()
+        if position != self.lastProgress:
+            self.lastProgress, self.lastChange = position, now
+            return False
+        return now - self.lastChange > seconds
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+    def close(self):
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        self.kill()
+
+
+class EvaluationPool:
+    """Keeps `workers` evaluation processes, forked when the pool is made.
+
+    maximumMemory: bytes of address space of a worker, counting what it
+    shares with the process it was forked from.
+    maximumCPU: CPU seconds a worker may spend per program of a chunk.
+    stallTimeout: seconds a worker may spend on one program, or None."""
+
+    # Seconds between two looks at the progress of the workers
+    POLL = 0.1
+
+    def __init__(
+        self,
+        workers=1,
+        maximumMemory=None,
+        maximumCPU=None,
+        chunkSize=64,
+        stallTimeout=60.0,
+    ):
+        self.context = multiprocessing.get_context("fork")
+        self.maximumMemory = maximumMemory
+        self.maximumCPU = maximumCPU
+        self.chunkSize = chunkSize
+        self.stallTimeout = stallTimeout
+        self.workers = [self._fork() for _ in range(workers)]
+        self.idle = list(self.workers)
+        # connection -> worker with a chunk in flight
+        self.busy = {}
+        # (Evaluation, start, chunk) waiting for a worker
+        self.waiting = collections.deque()
+        # TaskBatch -> key by which the workers know it
+        self.batchKeys = weakref.WeakKeyDictionary()
+        self.keys = itertools.count()
+        self.restarts = 0
+
+    def _fork(self):
+        return EvaluationWorker(self.context, self.maximumMemory, self.maximumCPU)
+
+    def _key(self, batch):
+        key = self.batchKeys.get(batch)
+        if key is None:
+            key = self.batchKeys[batch] = next(self.keys)
+        return key
+
+    def _replace(self, worker):
+        worker.kill()
+        self.restarts += 1
+        replacement = self._fork()
+        self.workers[self.workers.index(worker)] = replacement
+        self.idle.append(replacement)
+
+    def _lost(self, worker):
+        """Replaces a worker which died or stalled on a chunk. The program it
+        was evaluating fails, and the others are evaluated again."""
+        evaluation, start, chunk = worker.chunk
+        culprit = min(worker.progress.value, len(chunk) - 1)
+        eprint(
+            "(evaluation) Worker %d exited with code %s on %s"
+            % (worker.pid, worker.process.exitcode, evaluation.programs[start + culprit])
+        )
+        evaluation.answer(
+            start + culprit, [([NEGATIVEINFINITY] * len(evaluation.batch.tasks), None)]
+        )
+        if culprit > 0:
+            self.waiting.append((evaluation, start, chunk[:culprit]))
+        if culprit + 1 < len(chunk):
+            self.waiting.append((evaluation, start + culprit + 1, chunk[culprit + 1 :]))
+        self._replace(worker)
+
+    @property
+    def inFlight(self):
+        """Chunks submitted and not answered yet"""
+        return len(self.waiting) + len(self.busy)
+
+    def submit(self, batch, programs, timeout=None, outputs=False, table=None):
+        """Queues programs for evaluation, as `evaluate` does, and returns
+        their Evaluation without waiting for it"""
+        programs = list(programs)
+        if table is None:
+            sources = [str(p) for p in programs]
+        else:
+            sources = [table.encode(p) for p in programs]
+        evaluation = Evaluation(self._key(batch), batch, table, programs, timeout, outputs)
+        self.waiting.extend(
+            (evaluation, i, sources[i : i + self.chunkSize])
+            for i in range(0, len(sources), self.chunkSize)
+        )
+        self._dispatch()
+        return evaluation
+
+    def _dispatch(self):
+        while self.waiting and self.idle:
+            worker = self.idle.pop()
+            evaluation, start, chunk = self.waiting.popleft()
+            try:
+                worker.submit(evaluation, start, chunk)
+            except (OSError, EOFError):
+                # It died while it was idle
+                self.waiting.appendleft((evaluation, start, chunk))
+                self._replace(worker)
+                continue
+            self.busy[worker.connection] = worker
+
+    def poll(self, timeout=0.0):
+        """Collects the answers of the workers, waiting up to `timeout`
+        seconds for one, or until one answers if it is None, and hands the
+        chunks still waiting to the workers which are free"""
+        self._dispatch()
+        if not self.busy:
+            return
+        if self.stallTimeout is not None:
+            timeout = self.POLL if timeout is None else min(timeout, self.POLL)
+        for connection in wait(list(self.busy), timeout):
+            worker = self.busy.pop(connection)
+            try:
+                answers = connection.recv()
+            except (EOFError, OSError):
+                worker.process.join()
+                self._lost(worker)
+                continue
+            evaluation, start, _ = worker.chunk
+            evaluation.answer(start, answers)
+            worker.chunk = None
+            self.idle.append(worker)
+
+        if self.stallTimeout is not None:
+            for connection, worker in list(self.busy.items()):
+                if worker.stalled(self.stallTimeout):
+                    del self.busy[connection]
+                    worker.process.kill()
+                    worker.process.join()
+                    self._lost(worker)
+        self._dispatch()
+
+    def evaluate(self, batch, programs, timeout=None, outputs=False, table=None):
+        """For each program, its log likelihood for each task of the
+        TaskBatch, and its outputs as TaskBatch.outputs gives them if
+        `outputs` is set, None otherwise. Outputs which cannot be pickled are
+        None. A program which takes down its worker has no outputs, and a log
+        likelihood of -inf for every task.
+        table: ProgramTable in whose encoding programs are sent, rather than
+        as text"""
+        evaluation = self.submit(batch, programs, timeout, outputs, table)
+        while not evaluation.done:
+            self.poll(None)
+        return evaluation.results()
+
+    def logLikelihoods(self, batch, programs, timeout=None, table=None):
+        """As TaskBatch.logLikelihoods, for each program"""
+        return [ls for ls, _ in self.evaluate(batch, programs, timeout, table=table)]
+
+    def close(self):
+        """Stops the workers, killing those with a chunk in flight"""
+        for worker in self.workers:
+            if worker.chunk is None:
+                worker.close()
+            else:
+                worker.kill()
+        self.workers = []
+        self.idle = []
+        self.busy = {}
+        self.waiting.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
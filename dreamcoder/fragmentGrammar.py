@@ -222,13 +222,29 @@ class FragmentGrammar(object):
                    for l, u in frontier)
 
     def insideOutside(self, frontiers, pseudoCounts):
-        uses = self.expectedUses(frontiers)
-        return FragmentGrammar(log(uses.actualVariables +
-                                   pseudoCounts) -
-                               log(max(uses.possibleVariables, 1.)), [(log(uses.actualUses.get(p, 0.) +
-                                                                           pseudoCounts) -
-                                                                       log(uses.possibleUses.get(p, 0.) +
-                                                                           pseudoCounts), t, p) for _, t, p in self.productions])
+        import numpy as np
+
+        frontiers = list(frontiers)
+        scored = [self.closedUses(frontier.task.request, entry.program)
+                  for frontier in frontiers
+                  for entry in frontier]
+        # The productions, then the variables
+        column = {p: j for j, (_, _, p) in enumerate(self.productions)}
+        uses = np.zeros((len(scored), len(self.productions) + 1))
+        possibleUses = np.zeros((len(scored), len(self.productions) + 1))
+        for i, (_, u) in enumerate(scored):
+            for p, n in u.actualUses.items():
+                uses[i, column[p]] = n
+            for p, n in u.possibleUses.items():
+                possibleUses[i, column[p]] = n
+            uses[i, -1] = u.actualVariables
+            possibleUses[i, -1] = u.possibleVariables
+        uses, possibleUses = InsideOutside(frontiers, uses, possibleUses).expectedUses(
+            [l for l, _ in scored])
+        uses, possibleUses = uses.tolist(), possibleUses.tolist()
+        return FragmentGrammar(log(uses[-1] + pseudoCounts) - log(max(possibleUses[-1], 1.)),
+                               [(log(uses[j] + pseudoCounts) - log(possibleUses[j] + pseudoCounts), t, p)
+                                for j, (_, t, p) in enumerate(self.productions)])
 
     def jointFrontiersLikelihood(self, frontiers):
         return sum(lse([entry.logLikelihood + self.logLikelihood(frontier.task.request, entry.program)
@@ -1,9 +1,27 @@
+from contextlib import contextmanager
+
 from dreamcoder.utilities import *
 from dreamcoder.program import *
 from dreamcoder.task import Task
 
 
+@contextmanager
+def binaryPrograms(table):
+    """While active, frontier entries pickle their programs in the binary
+    encoding of `table` (see ProgramTable). The table itself is pickled once
+    per stream. Unpickling needs nothing more, so both formats can be read
+    back whatever the setting."""
+    previous = FrontierEntry.programTable
+    FrontierEntry.programTable = table
+    try:
+        yield
+    finally:
+        FrontierEntry.programTable = previous
+
+
 class FrontierEntry(object):
+    __slots__ = ("program", "logPrior", "logLikelihood", "logPosterior", "search_time")
+
     def __init__(
             self,
             program,
@@ -15,6 +33,28 @@ class FrontierEntry(object):
         self.program = program
         self.logPrior = logPrior
         self.logLikelihood = logLikelihood
+        self.search_time = None
+
+    # Set by binaryPrograms: the ProgramTable with which programs are pickled
+    programTable = None
+
+    def __getstate__(self):
+        table = FrontierEntry.programTable
+        if table is not None:
+            return (table, table.encode(self.program), self.logPrior, self.logLikelihood,
+                    self.logPosterior, self.search_time)
+        return (self.program, self.logPrior, self.logLikelihood, self.logPosterior, self.search_time)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # backward compatibility
+            state = (state["program"], state["logPrior"], state["logLikelihood"],
+                     state["logPosterior"], state.get("search_time"))
+        elif len(state) == 6:
+            table, data = state[:2]
+            state = (table.decode(data),) + state[2:]
+        (self.program, self.logPrior, self.logLikelihood,
+         self.logPosterior, self.search_time) = state
 
     def __repr__(self):
         return "FrontierEntry(program={self.program}, logPrior={self.logPrior}, logLikelihood={self.logLikelihood}".format(
@@ -33,10 +73,21 @@ class FrontierEntry(object):
 
 
 class Frontier(object):
+    __slots__ = ("entries", "task")
+
     def __init__(self, frontier, task):
         self.entries = frontier
         self.task = task
 
+    def __getstate__(self):
+        return (self.entries, self.task)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # backward compatibility
+            state = (state["entries"], state["task"])
+        self.entries, self.task = state
+
     def __repr__(
         self): return "Frontier(entries={self.entries}, task={self.task})".format(self=self)
 
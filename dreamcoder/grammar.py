@@ -7,6 +7,7 @@ from dreamcoder.program import *
 from dreamcoder.type import *
 from dreamcoder.utilities import *
 
+import heapq
 import time
 
 import itertools
@@ -25,6 +26,14 @@ class NoCandidates(Exception):
 
 
 class Grammar(object):
+    # Bound on the number of (request, environment) signatures whose
+    # candidates each grammar remembers
+    CANDIDATE_CACHE_SIZE = 2**14
+    # Bound on the number of subprogram summaries remembered for each
+    # signature, and on the number of signatures
+    SUMMARY_CACHE_SIZE = 2**16
+    SUMMARY_CACHES = BoundedCache(16)
+
     def __init__(
         self,
         logVariable,
@@ -45,6 +54,9 @@ class Grammar(object):
         self.expression2likelihood[FreeVariable(None)] = self.logFreeVariable
         self.expression2likelihood[Abstraction(Hole())] = self.logLambda
 
+        self.candidateCache = BoundedCache(Grammar.CANDIDATE_CACHE_SIZE)
+        self._summaryCache = None
+
     def randomWeights(self, r):
         """returns a new grammar with random weights drawn from r. calls `r` w/ old weight"""
         return Grammar(
@@ -77,6 +89,12 @@ class Grammar(object):
             continuationType=self.continuationType,
         )
 
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["candidateCache"]
+        del state["_summaryCache"]
+        return state
+
     def __setstate__(self, state):
         """
         Legacy support for loading grammar objects without the imperative type filled in
@@ -220,7 +238,11 @@ class Grammar(object):
     ):
         """Primitives that are candidates for being used given a requested type
         If returnTable is false (default): returns [((log)likelihood, tp, primitive, context)]
-        if returntable is true: returns {primitive: ((log)likelihood, tp, context)}"""
+        if returntable is true: returns {primitive: ((log)likelihood, tp, context)}
+
+        Candidates only depend on the request and environment up to renaming of
+        their type variables, so they are computed for the canonical renaming
+        once, cached, and renamed back into the context of each call."""
         if returnProbabilities:
             assert normalize
 
@@ -229,6 +251,88 @@ class Grammar(object):
         else:
             in_lambda_wrapper = False
 
+        bindings = {}
+        canonicalRequest = request.apply(context).canonical(bindings)
+        canonicalEnvironment = tuple(
+            t.apply(context).canonical(bindings) for t in environment
+        )
+        key = (
+            canonicalRequest,
+            canonicalEnvironment,
+            # Compared before applying the context, as it always has been
+            self.continuationType == request,
+            in_lambda_wrapper,
+            normalize,
+            returnProbabilities,
+            mustBeLeaf,
+            # Checkers are not all hashable, but they all show their state
+            repr(checker),
+            can_use_lambda_wrapper,
+            can_use_free_variable,
+        )
+        cached = self.candidateCache.get(key)
+        if cached is None:
+            cached = self._buildCanonicalCandidates(
+                canonicalRequest,
+                Context(len(bindings), []),
+                list(canonicalEnvironment),
+                key[2],
+                in_lambda_wrapper,
+                normalize,
+                returnProbabilities,
+                mustBeLeaf,
+                checker,
+                path,
+                can_use_lambda_wrapper,
+                can_use_free_variable,
+            )
+            self.candidateCache[key] = cached
+        if not cached:
+            raise NoCandidates()
+
+        # Canonical variables go back to the variables they stand for, and
+        # fresh ones are numbered from the next variable of the context, as
+        # if they had been instantiated here
+        renaming = {c.v: TypeVariable(v) for v, c in bindings.items()}
+        canonicalVariables = len(bindings)
+        offset = context.nextVariable - canonicalVariables
+        candidates = []
+        for l, t, p, fresh, substitution in cached:
+            for j in range(canonicalVariables, canonicalVariables + fresh):
+                renaming[j] = TypeVariable(j + offset)
+            t = t.instantiate(context, renaming)[1]
+            newContext = context.extension(
+                fresh,
+                [
+                    (renaming[j].v, u.instantiate(context, renaming)[1])
+                    for j, u in substitution
+                ],
+            )
+            candidates.append((l, t, p, newContext))
+
+        if returnTable:
+            return {p: (l, t, k) for l, t, p, k in candidates}
+        else:
+            return candidates
+
+    def _buildCanonicalCandidates(
+        self,
+        request,
+        context,
+        environment,
+        continuation,
+        in_lambda_wrapper,
+        normalize,
+        returnProbabilities,
+        mustBeLeaf,
+        checker,
+        path,
+        can_use_lambda_wrapper,
+        can_use_free_variable,
+    ):
+        """Candidates for a canonical request in a context without
+        substitutions, as [(l, type, program, number of fresh variables,
+        substitution)], or [] if there are none"""
         candidates = []
         for l, t, p in self.productions:
             try:
@@ -279,7 +383,7 @@ class Grammar(object):
                 except UnificationFailure:
                     continue
 
-            if self.continuationType == request:
+            if continuation:
                 terminalIndices = [
                     v.i for t, v, k in variableCandidates if not t.isArrow()
                 ]
@@ -302,7 +406,7 @@ class Grammar(object):
                 candidates.append((self.logFreeVariable, request, p, context))
 
         if candidates == []:
-            raise NoCandidates()
+            return []
         # eprint("candidates inside buildCandidates before norm:")
         # eprint(candidates)
 
@@ -316,10 +420,10 @@ class Grammar(object):
         # eprint("candidates inside buildCandidates after norm:")
         # eprint(candidates)
 
-        if returnTable:
-            return {p: (l, t, k) for l, t, p, k in candidates}
-        else:
-            return candidates
+        return [
+            (l, t, p, k.nextVariable - context.nextVariable, k.substitution)
+            for l, t, p, k in candidates
+        ]
 
     def sample(self, request, maximumDepth=6, maxAttempts=None):
         attempts = 0
@@ -362,7 +466,8 @@ class Grammar(object):
         )
         # eprint("candidates:")
         # eprint(candidates)
-        newType, chosenPrimitive, context = sampleDistribution(candidates)
+        newType, chosenPrimitive, newContext = sampleDistribution(candidates)
+        context = context.enter(newContext)
 
         # Sample the arguments
         xs = newType.functionArguments()
@@ -375,6 +480,24 @@ class Grammar(object):
 
         return context, returnValue
 
+    @property
+    def summaryCache(self):
+        """Memoized summaries of subprograms. Summaries do not depend on the
+        weights of the grammar, so grammars with the same productions share
+        them; any other change of the grammar gets a new cache."""
+        if self._summaryCache is None:
+            signature = (
+                tuple((t, p) for _, t, p in self.productions),
+                self.continuationType,
+            )
+            cache = Grammar.SUMMARY_CACHES.get(signature)
+            if cache is None:
+                cache = Grammar.SUMMARY_CACHES[signature] = BoundedCache(
+                    Grammar.SUMMARY_CACHE_SIZE
+                )
+            self._summaryCache = cache
+        return self._summaryCache
+
     def likelihoodSummary(
         self,
         context,
@@ -385,6 +508,86 @@ class Grammar(object):
         silent=False,
         checker=CombinedArgChecker.from_checkers([SimpleArgChecker(False, -1, True)]),
         path=[],
+    ):
+        """Returns (context, requests of the free variables, summary), or a
+        None summary if the expression cannot be generated.
+
+        Like candidates, a summary only depends on the request, environment
+        and workspace up to renaming of their type variables. It is computed
+        for the canonical renaming, together with the bindings it makes, and
+        these are renamed back into the context of each call. The summary
+        returned may be shared, and must not be modified."""
+        bindings = {}
+        canonicalRequest = request.apply(context).canonical(bindings)
+        canonicalEnvironment = tuple(
+            t.apply(context).canonical(bindings) for t in environment
+        )
+        canonicalWorkspace = tuple(
+            (name, workspace[name].apply(context).canonical(bindings))
+            for name in sorted(workspace)
+        )
+        key = (
+            expression,
+            canonicalRequest,
+            canonicalEnvironment,
+            canonicalWorkspace,
+            self.continuationType == request,
+            len(path) > 0 and path[-1][0].isAbstraction and path[-1][1] == -1,
+            # Checkers are not all hashable, but they all show their state
+            repr(checker),
+        )
+        cache = self.summaryCache
+        cached = cache.get(key)
+        canonicalVariables = len(bindings)
+        if cached is None:
+            newContext, requests, summary = self._likelihoodSummary(
+                Context(canonicalVariables, []),
+                list(canonicalEnvironment),
+                dict(canonicalWorkspace),
+                canonicalRequest,
+                expression,
+                silent=silent,
+                checker=checker,
+                path=path,
+            )
+            if summary is None:
+                return context, {}, None
+            cached = (
+                newContext.nextVariable - canonicalVariables,
+                newContext.substitution,
+                requests,
+                summary,
+            )
+            cache[key] = cached
+
+        fresh, substitution, requests, summary = cached
+        if not fresh and not substitution and not requests:
+            return context, {}, summary
+        renaming = {c.v: TypeVariable(v) for v, c in bindings.items()}
+        offset = context.nextVariable - canonicalVariables
+        for j in range(canonicalVariables, canonicalVariables + fresh):
+            renaming[j] = TypeVariable(j + offset)
+        context = context.enter(
+            context.extension(
+                fresh,
+                [(renaming[j].v, u.instantiate(context, renaming)[1]) for j, u in substitution],
+            )
+        )
+        requests = {
+            name: t.instantiate(context, renaming)[1] for name, t in requests.items()
+        }
+        return context, requests, summary
+
+    def _likelihoodSummary(
+        self,
+        context,
+        environment,
+        workspace,
+        request,
+        expression,
+        silent=False,
+        checker=CombinedArgChecker.from_checkers([SimpleArgChecker(False, -1, True)]),
+        path=[],
     ):
         if isinstance(request, TypeNamedArgsConstructor) and request.isArrow():
             merged_workspace = dict(workspace, **request.arguments)
@@ -457,9 +660,8 @@ class Grammar(object):
             )
             var_requests.update(var_def_requests)
             var_requests.pop(expression.var_name)
-            summary.join(def_summary)
 
-            return context, var_requests, summary
+            return context, var_requests, summary.joined(def_summary)
 
         if expression.isLetRevClause:
             context, var_requests, summary = self.likelihoodSummary(
@@ -485,12 +687,11 @@ class Grammar(object):
                 checker=checker,
                 path=path,
             )
-            summary.join(body_summary)
             var_body_requests[expression.inp_var_name] = workspace[
                 expression.inp_var_name
             ]
 
-            return context, var_body_requests, summary
+            return context, var_body_requests, summary.joined(body_summary)
 
         thisSummary = LikelihoodSummary()
 
@@ -549,11 +750,12 @@ class Grammar(object):
         )
 
         if is_lambda_wrapper:
-            _, tp, context = candidates[Abstraction(Hole())]
+            _, tp, newContext = candidates[Abstraction(Hole())]
         elif is_free_variable:
-            _, tp, context = candidates[FreeVariable(None)]
+            _, tp, newContext = candidates[FreeVariable(None)]
         else:
-            _, tp, context = candidates[f]
+            _, tp, newContext = candidates[f]
+        context = context.enter(newContext)
         argumentTypes = tp.functionArguments()
         if len(xs) != len(argumentTypes):
             eprint("PANIC: not enough arguments for the type")
@@ -613,96 +815,6 @@ class Grammar(object):
 
         return context, var_requests, thisSummary
 
-    def bestFirstEnumeration(self, request):
-        from heapq import heappush, heappop
-
-        pq = []
-
-        def choices(parentCost, xs):
-            for c, x in xs:
-                heappush(pq, (parentCost + c, x))
-
-        def g(parentCost, request, _=None, context=None, environment=[], k=None):
-            """
-            k is a continuation.
-            k: Expects to be called with MDL, context, expression.
-            """
-
-            assert k is not None
-            if context is None:
-                context = Context.EMPTY
-
-            if request.isArrow():
-                g(
-                    parentCost,
-                    request.arguments[1],
-                    context=context,
-                    environment=[request.arguments[0]] + environment,
-                    k=lambda MDL, newContext, p: k(MDL, newContext, Abstraction(p)),
-                )
-            else:
-                candidates = self.buildCandidates(
-                    request,
-                    context,
-                    environment,
-                    normalize=True,
-                    returnProbabilities=False,
-                    returnTable=True,
-                )
-                choices(
-                    parentCost,
-                    [
-                        (
-                            -f_ll_tp_newContext[1][0],
-                            lambda: ga(
-                                parentCost - f_ll_tp_newContext[1][0],
-                                f_ll_tp_newContext[0],
-                                f_ll_tp_newContext[1][1].functionArguments(),
-                                context=f_ll_tp_newContext[1][2],
-                                environment=environment,
-                                k=k,
-                            ),
-                        )
-                        for f_ll_tp_newContext in iter(candidates.items())
-                    ],
-                )
-
-        def ga(
-            costSoFar, f, argumentTypes, _=None, context=None, environment=None, k=None
-        ):
-            if argumentTypes == []:
-                k(costSoFar, context, f)
-            else:
-                t1 = argumentTypes[0].apply(context)
-                g(
-                    costSoFar,
-                    t1,
-                    context=context,
-                    environment=environment,
-                    k=lambda newCost, newContext, argument: ga(
-                        newCost,
-                        Application(f, argument),
-                        argumentTypes[1:],
-                        context=newContext,
-                        environment=environment,
-                        k=k,
-                    ),
-                )
-
-        def receiveResult(MDL, _, expression):
-            heappush(pq, (MDL, expression))
-
-        g(0.0, request, context=Context.EMPTY, environment=[], k=receiveResult)
-        frontier = []
-        while len(frontier) < 10**3:
-            MDL, action = heappop(pq)
-            if isinstance(action, Program):
-                expression = action
-                frontier.append(expression)
-                # eprint("Enumerated program",expression,-MDL,self.closedLogLikelihood(request, expression))
-            else:
-                action()
-
     def closedLikelihoodSummary(self, request, expression, silent=False):
         try:
             _, _, summary = self.likelihoodSummary(
@@ -717,9 +829,11 @@ class Grammar(object):
                 pickle.dump((e, self, request, expression), handle)
             assert False
 
-        return summary
+        # The summary of the whole program is shared through the cache
+        return None if summary is None else LikelihoodSummary().joined(summary)
 
-    def logLikelihood(self, request, expression):
+    def scoredLikelihoodSummary(self, request, expression):
+        """The summary of a program that must have one"""
         try:
             summary = self.closedLikelihoodSummary(request, expression)
         except:
@@ -736,95 +850,87 @@ class Grammar(object):
                 self,
             )
             assert False
-        return summary.logLikelihood(self)
+        return summary
 
-    def rescoreFrontier(self, frontier):
-        return Frontier(
+    def logLikelihood(self, request, expression):
+        return self.scoredLikelihoodSummary(request, expression).logLikelihood(self)
+
+    def summaryBatch(self, frontiers):
+        """The likelihood summaries of the entries of the frontiers, in order"""
+        return SummaryBatch(
             [
-                FrontierEntry(
-                    e.program,
-                    logPrior=self.logLikelihood(frontier.task.request, e.program),
-                    logLikelihood=e.logLikelihood,
-                )
-                for e in frontier
+                self.scoredLikelihoodSummary(f.task.request, e.program)
+                for f in frontiers
+                for e in f
             ],
-            frontier.task,
+            ProductionIndex.ofGrammar(self),
         )
 
-    def productionUses(self, frontiers):
-        """Returns the expected number of times that each production was used. {production: expectedUses}"""
-        frontiers = [
-            self.rescoreFrontier(f).normalize() for f in frontiers if not f.empty
-        ]
-        uses = {p: 0.0 for p in self.primitives}
-        for f in frontiers:
-            for e in f:
-                summary = self.closedLikelihoodSummary(f.task.request, e.program)
-                for p, u in summary.uses:
-                    uses[p] += u * math.exp(e.logPosterior)
-        return uses
+    def rescoreFrontier(self, frontier):
+        return self.rescoreFrontiers([frontier])[0]
 
-    def insideOutside(self, frontiers, pseudoCounts, iterations=1):
-        # Replace programs with (likelihood summary, uses)
-        frontiers = [
+    def rescoreFrontiers(self, frontiers):
+        """Rescores all the entries of the frontiers in one batch"""
+        logPriors = iter(self.summaryBatch(frontiers).logLikelihood(self).tolist())
+        return [
             Frontier(
                 [
                     FrontierEntry(
-                        (summary, summary.toUses()),
-                        logPrior=summary.logLikelihood(self),
+                        e.program,
+                        logPrior=next(logPriors),
                         logLikelihood=e.logLikelihood,
                     )
-                    for e in f
-                    for summary in [
-                        self.closedLikelihoodSummary(f.task.request, e.program)
-                    ]
+                    for e in frontier
                 ],
-                task=f.task,
+                frontier.task,
             )
-            for f in frontiers
+            for frontier in frontiers
         ]
 
+    def productionUses(self, frontiers):
+        """Returns the expected number of times that each production was used. {production: expectedUses}"""
+        import numpy as np
+
+        frontiers = [f for f in frontiers if not f.empty]
+        batch = self.summaryBatch(frontiers)
+        logPosteriors = batch.logLikelihood(self) + np.array(
+            [e.logLikelihood for f in frontiers for e in f]
+        )
+        # Normalize the posteriors within each frontier
+        start = 0
+        for f in frontiers:
+            entries = logPosteriors[start : start + len(f)]
+            entries -= lse(entries.tolist())
+            start += len(f)
+        posteriors = np.exp(logPosteriors)
+        uses = np.bincount(
+            batch.useIds,
+            weights=batch.useCounts * posteriors[batch.useRows],
+            minlength=len(batch.index),
+        )
+        return {p: float(uses[i]) for i, p in enumerate(self.primitives)}
+
+    def insideOutside(self, frontiers, pseudoCounts, iterations=1):
+        import numpy as np
+
+        frontiers = [f for f in frontiers if not f.empty]
+        batch = self.summaryBatch(frontiers)
+        # The primitives, then the variables
+        columns = list(range(len(self.productions))) + [batch.index.ids[Index(0)]]
+        counts, masks = batch.normalizerMatrix()
+        em = InsideOutside(
+            frontiers, batch.useMatrix()[:, columns], (counts @ masks)[:, columns]
+        )
+
         g = self
         for i in range(iterations):
-            u = Uses()
-            for f in frontiers:
-                f = f.normalize()
-                for e in f:
-                    _, eu = e.program
-                    u += math.exp(e.logPosterior) * eu
-
-            lv = math.log(u.actualVariables + pseudoCounts) - math.log(
-                u.possibleVariables + pseudoCounts
-            )
+            uses, possibleUses = em.expectedUses(batch.logLikelihood(g))
+            weights = np.log(uses + pseudoCounts) - np.log(possibleUses + pseudoCounts)
             g = Grammar(
-                lv,
-                [
-                    (
-                        math.log(u.actualUses.get(p, 0.0) + pseudoCounts)
-                        - math.log(u.possibleUses.get(p, 0.0) + pseudoCounts),
-                        t,
-                        p,
-                    )
-                    for _, t, p in g.productions
-                ],
+                weights[-1].item(),
+                [(l, t, p) for l, (_, t, p) in zip(weights.tolist(), g.productions)],
                 continuationType=self.continuationType,
             )
-            if i < iterations - 1:
-                frontiers = [
-                    Frontier(
-                        [
-                            FrontierEntry(
-                                (summary, uses),
-                                logPrior=summary.logLikelihood(g),
-                                logLikelihood=e.logLikelihood,
-                            )
-                            for e in f
-                            for (summary, uses) in [e.program]
-                        ],
-                        task=f.task,
-                    )
-                    for f in frontiers
-                ]
         return g
 
     def frontierMDL(self, frontier):
@@ -862,6 +968,8 @@ class Grammar(object):
                 if not (mdl < upperBound):
                     continue
 
+                mark = context.mark()
+                newContext = context.enter(newContext)
                 xs = t.functionArguments()
                 for aL, aK, application in self.enumerateApplication(
                     newContext,
@@ -873,6 +981,25 @@ class Grammar(object):
                     maximumDepth=maximumDepth - 1,
                 ):
                     yield aL + l, aK, application
+                context = context.undo(mark)
+
+    def bestFirstEnumeration(
+        self, context, environment, request, maximumDepth=20, upperBound=None
+    ):
+        """Resumable enumeration of the programs Grammar.enumeration finds, see
+        BestFirstEnumerator"""
+
+        def candidates(request, context, environment, parent, parentIndex):
+            return self.buildCandidates(request, context, environment, normalize=True)
+
+        return BestFirstEnumerator(
+            candidates,
+            context,
+            environment,
+            request,
+            maximumDepth=maximumDepth,
+            upperBound=upperBound,
+        )
 
     def enumerateApplication(
         self,
@@ -1233,11 +1360,22 @@ class Grammar(object):
 class LikelihoodSummary(object):
     """Summarizes the terms that will be used in a likelihood calculation"""
 
+    __slots__ = ("uses", "normalizers", "constant")
+
     def __init__(self):
         self.uses = {}
         self.normalizers = {}
         self.constant = 0.0
 
+    def __getstate__(self):
+        return (self.uses, self.normalizers, self.constant)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # backward compatibility
+            state = (state["uses"], state["normalizers"], state["constant"])
+        self.uses, self.normalizers, self.constant = state
+
     def __str__(self):
         return """LikelihoodSummary(constant = %f,
 uses = {%s},
@@ -1272,6 +1410,13 @@ normalizers = {%s})""" % (
         for k, v in other.normalizers.items():
             self.normalizers[k] = self.normalizers.get(k, 0) + v
 
+    def joined(self, other):
+        """A new summary of both, leaving them unchanged"""
+        summary = LikelihoodSummary()
+        summary.join(self)
+        summary.join(other)
+        return summary
+
     def logLikelihood(self, grammar):
         return (
             self.constant
@@ -1333,16 +1478,216 @@ normalizers = {%s})""" % (
         return Uses(possibleVariables, actualVariables, possibleUses, actualUses)
 
 
+class ProductionIndex(object):
+    """
+    Integer ids for the productions of a grammar, ordered like the production
+    vectors of the recognition model: the primitives, then the variable, the
+    lambda and the free variable. Normalizers, the sets of productions that a
+    choice was made among, are interned as bitsets over these ids, so that
+    equal sets get one id.
+    """
+
+    INDICES = BoundedCache(64)
+
+    def __init__(self, primitives):
+        self.productions = list(primitives) + [
+            Index(0),
+            Abstraction(Hole()),
+            FreeVariable(None),
+        ]
+        self.ids = {p: i for i, p in enumerate(self.productions)}
+        # normalizer id -> bitset of production ids
+        self.bitsets = []
+        self.normalizerOfBitset = {}
+        self.normalizerOfSet = {}
+        self._masks = None
+
+    @staticmethod
+    def ofGrammar(g):
+        """Shared by all grammars with the same primitives"""
+        key = tuple(g.primitives)
+        index = ProductionIndex.INDICES.get(key)
+        if index is None:
+            index = ProductionIndex.INDICES[key] = ProductionIndex(key)
+        return index
+
+    def __len__(self):
+        return len(self.productions)
+
+    def normalizer(self, possibles):
+        k = self.normalizerOfSet.get(possibles)
+        if k is None:
+            bitset = 0
+            for p in possibles:
+                bitset |= 1 << self.ids[p]
+            k = self.normalizerOfBitset.get(bitset)
+            if k is None:
+                k = self.normalizerOfBitset[bitset] = len(self.bitsets)
+                self.bitsets.append(bitset)
+            self.normalizerOfSet[possibles] = k
+        return k
+
+    def masks(self):
+        """Boolean matrix of normalizers x productions"""
+        import numpy as np
+
+        if self._masks is None or len(self._masks) < len(self.bitsets):
+            done = 0 if self._masks is None else len(self._masks)
+            rows = np.array(
+                [[(b >> i) & 1 for i in range(len(self))] for b in self.bitsets[done:]],
+                dtype=bool,
+            ).reshape(-1, len(self))
+            self._masks = rows if self._masks is None else np.vstack([self._masks, rows])
+        return self._masks
+
+    def logProbabilities(self, grammar):
+        import numpy as np
+
+        l = grammar.expression2likelihood
+        return np.array([l[p] for p in self.productions], dtype=float)
+
+    def useVector(self, summary):
+        """Dense vector of the number of times the summary uses each production"""
+        import numpy as np
+
+        u = np.zeros(len(self))
+        for p, count in summary.uses.items():
+            u[self.ids[p]] = count
+        return u
+
+
+class SummaryBatch(object):
+    """
+    Likelihood summaries as sparse count vectors over the ids of a
+    ProductionIndex: (summary, production, count) triples for the uses and
+    (summary, normalizer, count) triples for the normalizers. logLikelihood
+    scores the whole batch against a grammar at once.
+    """
+
+    def __init__(self, summaries, index):
+        import numpy as np
+
+        self.index = index
+        self.size = len(summaries)
+        ids = index.ids
+        useRows, useIds, useCounts = [], [], []
+        normalizerRows, normalizerIds, normalizerCounts = [], [], []
+        for b, summary in enumerate(summaries):
+            for p, count in summary.uses.items():
+                useRows.append(b)
+                useIds.append(ids[p])
+                useCounts.append(count)
+            for ps, count in summary.normalizers.items():
+                normalizerRows.append(b)
+                normalizerIds.append(index.normalizer(ps))
+                normalizerCounts.append(count)
+        self.constants = np.array([summary.constant for summary in summaries], dtype=float)
+        self.useRows = np.array(useRows, dtype=np.intp)
+        self.useIds = np.array(useIds, dtype=np.intp)
+        self.useCounts = np.array(useCounts, dtype=float)
+        self.normalizerRows = np.array(normalizerRows, dtype=np.intp)
+        self.normalizerIds = np.array(normalizerIds, dtype=np.intp)
+        self.normalizerCounts = np.array(normalizerCounts, dtype=float)
+
+    def __len__(self):
+        return self.size
+
+    def useMatrix(self):
+        """Dense summaries x productions matrix of uses"""
+        import numpy as np
+
+        uses = np.zeros((self.size, len(self.index)))
+        np.add.at(uses, (self.useRows, self.useIds), self.useCounts)
+        return uses
+
+    def normalizerMatrix(self):
+        """The normalizers that occur in the batch, as a dense summaries x
+        normalizers matrix of counts, and their normalizers x productions masks"""
+        import numpy as np
+
+        occurring, columns = np.unique(self.normalizerIds, return_inverse=True)
+        counts = np.zeros((self.size, len(occurring)))
+        np.add.at(counts, (self.normalizerRows, columns), self.normalizerCounts)
+        return counts, self.index.masks()[occurring]
+
+    def logLikelihood(self, grammar):
+        """Vector of the log likelihood of each summary under the grammar"""
+        import numpy as np
+
+        l = self.index.logProbabilities(grammar)
+        # Log normalizing constant of each interned normalizer
+        alternatives = np.where(self.index.masks(), l, NEGATIVEINFINITY)
+        largest = alternatives.max(1)
+        largest[~np.isfinite(largest)] = 0.0
+        with np.errstate(divide="ignore"):
+            z = largest + np.log(np.exp(alternatives - largest[:, None]).sum(1))
+
+        numerator = np.bincount(
+            self.useRows, weights=self.useCounts * l[self.useIds], minlength=self.size
+        )
+        denominator = np.bincount(
+            self.normalizerRows,
+            weights=self.normalizerCounts * z[self.normalizerIds],
+            minlength=self.size,
+        )
+        return self.constants + numerator - denominator
+
+
+class InsideOutside(object):
+    """
+    Expected uses of productions under the posterior of the entries of
+    frontiers, from which EM reestimates the weights of a grammar. Each
+    entry is a row of a dense use matrix and of a possible-use matrix,
+    whose columns are productions; the grammar decides what they are, and
+    what the weights are.
+    """
+
+    def __init__(self, frontiers, uses, possibleUses):
+        import numpy as np
+
+        sizes = [len(f) for f in frontiers if not f.empty]
+        self.logLikelihoods = np.array(
+            [e.logLikelihood for f in frontiers for e in f], dtype=float
+        )
+        assert len(self.logLikelihoods) == sum(sizes)
+        self.starts = np.cumsum([0] + sizes[:-1]).astype(np.intp)
+        self.frontierOfEntry = np.repeat(np.arange(len(sizes)), sizes)
+        self.uses = np.asarray(uses, dtype=float)
+        self.possibleUses = np.asarray(possibleUses, dtype=float)
+
+    def posteriorWeights(self, logPriors):
+        """Posterior probability of each entry within its frontier"""
+        import numpy as np
+
+        if len(self.logLikelihoods) == 0:
+            return self.logLikelihoods
+        logPosteriors = np.asarray(logPriors, dtype=float) + self.logLikelihoods
+        largest = np.maximum.reduceat(logPosteriors, self.starts)
+        largest[~np.isfinite(largest)] = 0.0
+        shifted = logPosteriors - largest[self.frontierOfEntry]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z = largest + np.log(np.add.reduceat(np.exp(shifted), self.starts))
+            weights = np.exp(logPosteriors - z[self.frontierOfEntry])
+        # Frontiers none of whose entries are possible count for nothing
+        weights[np.isnan(weights)] = 0.0
+        return weights
+
+    def expectedUses(self, logPriors):
+        """(expected uses, expected possible uses) of each column"""
+        weights = self.posteriorWeights(logPriors)
+        return weights @ self.uses, weights @ self.possibleUses
+
+
 class Uses(object):
     """Tracks uses of different grammar productions"""
 
     def __init__(
-        self, possibleVariables=0.0, actualVariables=0.0, possibleUses={}, actualUses={}
+        self, possibleVariables=0.0, actualVariables=0.0, possibleUses=None, actualUses=None
     ):
         self.actualVariables = actualVariables
         self.possibleVariables = possibleVariables
-        self.possibleUses = possibleUses
-        self.actualUses = actualUses
+        self.possibleUses = {} if possibleUses is None else possibleUses
+        self.actualUses = {} if actualUses is None else actualUses
 
     def __str__(self):
         return (
@@ -1601,7 +1946,8 @@ class ContextualGrammar:
             constant=-math.log(numberOfVariables) if f.isIndex else 0,
         )
 
-        _, tp, context = candidates[f]
+        _, tp, newContext = candidates[f]
+        context = context.enter(newContext)
         argumentTypes = tp.functionArguments()
         assert len(xs) == len(argumentTypes)
 
@@ -1615,8 +1961,10 @@ class ContextualGrammar:
         return context, thisSummary
 
     def closedLikelihoodSummary(self, request, expression):
+        # Summaries of contextual grammars are not cached by subprogram, so
+        # every binding is made here, in place
         return self.likelihoodSummary(
-            None, None, Context.EMPTY, [], request, expression
+            None, None, UnionFindContext(), [], request, expression
         )[1]
 
     def logLikelihood(self, request, expression):
@@ -1662,7 +2010,8 @@ class ContextualGrammar:
             returnProbabilities=True,
             mustBeLeaf=(maximumDepth <= 1),
         )
-        newType, chosenPrimitive, context = sampleDistribution(candidates)
+        newType, chosenPrimitive, newContext = sampleDistribution(candidates)
+        context = context.enter(newContext)
 
         xs = newType.functionArguments()
         returnValue = chosenPrimitive
@@ -1811,6 +2160,8 @@ class ContextualGrammar:
                 if not (mdl < upperBound):
                     continue
 
+                mark = context.mark()
+                newContext = context.enter(newContext)
                 xs = t.functionArguments()
                 for aL, aK, application in self.enumerateApplication(
                     newContext,
@@ -1823,6 +2174,31 @@ class ContextualGrammar:
                     maximumDepth=maximumDepth - 1,
                 ):
                     yield aL + l, aK, application
+                context = context.undo(mark)
+
+    def bestFirstEnumeration(
+        self, context, environment, request, maximumDepth=20, upperBound=None
+    ):
+        """Resumable enumeration of the programs ContextualGrammar.enumeration
+        finds, see BestFirstEnumerator"""
+
+        def candidates(request, context, environment, parent, parentIndex):
+            if parent is None:
+                g = self.noParent
+            elif parent.isIndex:
+                g = self.variableParent
+            else:
+                g = self.library[parent][parentIndex]
+            return g.buildCandidates(request, context, environment, normalize=True)
+
+        return BestFirstEnumerator(
+            candidates,
+            context,
+            environment,
+            request,
+            maximumDepth=maximumDepth,
+            upperBound=upperBound,
+        )
 
     def enumerateApplication(
         self,
@@ -1914,10 +2290,141 @@ def violatesSymmetry(f, x, argumentIndex):
     return False
 
 
+class BestFirstEnumerator:
+    """Enumerates programs in order of decreasing prior, like heap_search.ml.
+
+    Partial programs wait on a heap ordered by the description length of the
+    choices made so far, and the leftmost hole of the cheapest one is filled
+    next. The candidates for a hole are sorted once, and only the cheapest
+    one not yet taken waits on the heap, so each step pushes at most two
+    states. enumerate(upperBound) yields every program whose description
+    length is below upperBound and then stops, keeping the heap, so that the
+    next budget window resumes where this one ended.
+
+    candidates(request, context, environment, parent, parentIndex) returns
+    [(log probability, type, program, context)] as Grammar.buildCandidates
+    does. The programs are the ones Grammar.enumeration finds with the same
+    maximumDepth, and nothing at or above upperBound is ever stored. Waiting
+    states keep their own contexts, so the context must be a Context rather
+    than a UnionFindContext."""
+
+    def __init__(
+        self,
+        candidates,
+        context,
+        environment,
+        request,
+        maximumDepth=20,
+        upperBound=None,
+    ):
+        self.candidates = candidates
+        self.upperBound = upperBound
+        # (cost, serial, program, context, choice)
+        # choice is None for complete programs, and otherwise
+        # (cost before the choice, sorted candidates, index, hole, frames)
+        self.heap = []
+        # Breaks ties between states of equal cost, first in first out
+        self.serial = 0
+        self.expanded = 0
+        self.emitted = 0
+        root = (request, environment, maximumDepth, None, None)
+        self._expand(0.0, context, root, None)
+
+    def _push(self, cost, program, context, choice):
+        heapq.heappush(self.heap, (cost, self.serial, program, context, choice))
+        self.serial += 1
+
+    def _expand(self, cost, context, hole, frames):
+        request, environment, depth, parent, parentIndex = hole
+        while request.isArrow():
+            environment = [request.arguments[0]] + environment
+            request = request.arguments[1]
+        # Grammar.enumeration gives up at depth 1, and on applications at depth 1
+        if depth <= 2:
+            return
+        choices = self.candidates(request, context, environment, parent, parentIndex)
+        if self.upperBound is not None:
+            choices = [c for c in choices if cost - c[0] < self.upperBound]
+        if choices:
+            choices.sort(key=lambda c: -c[0])
+            choice = (cost, choices, 0, hole, frames)
+            self._push(cost - choices[0][0], None, None, choice)
+
+    def _choose(self, choice):
+        base, choices, i, hole, frames = choice
+        if i + 1 < len(choices):
+            sibling = (base, choices, i + 1, hole, frames)
+            self._push(base - choices[i + 1][0], None, None, sibling)
+
+        l, t, p, context = choices[i]
+        cost = base - l
+        request, environment, depth, _, _ = hole
+        lambdas = 0
+        while request.isArrow():
+            environment = [request.arguments[0]] + environment
+            request = request.arguments[1]
+            lambdas += 1
+        xs = t.functionArguments()
+        if xs:
+            # frame: (function so far, head, remaining argument requests,
+            #         argument index, environment, depth, lambdas)
+            frame = (p, p, xs[1:], 0, environment, depth - 1, lambdas)
+            argument = (xs[0].apply(context), environment, depth - 1, p, 0)
+            self._expand(cost, context, argument, (frame, frames))
+        else:
+            self._complete(cost, context, p.wrap_in_abstractions(lambdas), frames)
+
+    def _complete(self, cost, context, value, frames):
+        """value fills the innermost argument hole of frames"""
+        while frames is not None:
+            frame, frames = frames
+            function, head, remaining, index, environment, depth, lambdas = frame
+            if violatesSymmetry(head, value, index):
+                return
+            function = Application(function, value)
+            if remaining:
+                frame = (
+                    function,
+                    head,
+                    remaining[1:],
+                    index + 1,
+                    environment,
+                    depth,
+                    lambdas,
+                )
+                argument = (
+                    remaining[0].apply(context),
+                    environment,
+                    depth,
+                    head,
+                    index + 1,
+                )
+                self._expand(cost, context, argument, (frame, frames))
+                return
+            value = function.wrap_in_abstractions(lambdas)
+        self._push(cost, value, context, None)
+
+    def enumerate(self, upperBound):
+        """Yields (log prior, context, program) for the programs not yet
+        yielded whose description length is below upperBound, cheapest first"""
+        while self.heap and self.heap[0][0] < upperBound:
+            cost, _, program, context, choice = heapq.heappop(self.heap)
+            if choice is None:
+                self.emitted += 1
+                yield -cost, context, program
+            else:
+                self.expanded += 1
+                self._choose(choice)
+
+    def __len__(self):
+        return len(self.heap)
+
+
 def batchLikelihood(jobs):
     """Takes as input a set of (program, request, grammar) and returns a dictionary mapping each of these to its likelihood under the grammar"""
+    # Sorted, so that calls with the same primitives share summaries
     superGrammar = Grammar.uniform(
-        list({p for _1, _2, g in jobs for p in g.primitives}),
+        sorted({p for _1, _2, g in jobs for p in g.primitives}, key=str),
         continuationType=list(jobs)[0][-1].continuationType,
     )
     programsAndRequests = {(program, request) for program, request, grammar in jobs}
@@ -1941,12 +2448,109 @@ def batchLikelihood(jobs):
     return response
 
 
+class ObservationalEquivalence:
+    """Drops expressions of the bottom-up enumerator that compute the same
+    outputs, on every task input, as an expression of no greater cost.
+
+    Only expressions whose variables are the task arguments can be evaluated,
+    so lambda bodies are never pruned. The fingerprint table holds at most
+    `maximumFingerprints` entries and forgets the least recently used ones."""
+
+    def __init__(
+        self,
+        inputs,
+        number_of_arguments,
+        _=None,
+        maximumFingerprints=10**6,
+        evaluationTimeout=None,
+    ):
+        # Inputs shared by several tasks are only evaluated once
+        self.inputs = []
+        distinct = set()
+        for xs in inputs:
+            k = fingerprintValue(xs)
+            if k is None or k not in distinct:
+                distinct.add(k)
+                self.inputs.append(xs)
+        self.number_of_arguments = number_of_arguments
+        self.evaluationTimeout = evaluationTimeout
+        # (nonterminal, outputs) -> cheapest cost producing them
+        self.table = BoundedCache(maximumFingerprints)
+        self.evaluated = 0
+        self.pruned = 0
+        # Expressions that timed out or produced values we cannot compare
+        self.unobservable = 0
+
+    def outputs(self, expression):
+        try:
+            # Each expression is only seen once, so its compiled form is not cached
+            f = expression.wrap_in_abstractions(self.number_of_arguments).evaluateCompiled(
+                cache=False
+            )
+        except Exception:
+            return tuple(EVALUATION_ERROR for _ in self.inputs)
+        outputs = []
+        for xs in self.inputs:
+            try:
+                y = f
+                for x in xs:
+                    y = y(x)
+                y = fingerprintValue(y)
+                if y is None:
+                    return None
+            except Exception:
+                y = EVALUATION_ERROR
+            outputs.append(y)
+        return tuple(outputs)
+
+    def fingerprint(self, expression):
+        """Outputs of the expression on every input, or None if they cannot be compared"""
+        try:
+            return runWithTimeout(
+                lambda: self.outputs(expression), self.evaluationTimeout
+            )
+        except RunWithTimeout:
+            return None
+
+    def admit(self, symbol, cost, expression):
+        self.evaluated += 1
+        outputs = self.fingerprint(expression)
+        if outputs is None:
+            self.unobservable += 1
+            return True
+        key = (symbol, outputs)
+        best = self.table.get(key)
+        if best is not None and best <= cost:
+            self.pruned += 1
+            return False
+        self.table[key] = cost
+        return True
+
+    @property
+    def hitRate(self):
+        return self.pruned / self.evaluated if self.evaluated else 0.0
+
+    def report(self):
+        eprint(
+            "Observational equivalence: pruned %d of %d expressions (%.1f%%), %d unobservable, %d fingerprints stored"
+            % (
+                self.pruned,
+                self.evaluated,
+                100 * self.hitRate,
+                self.unobservable,
+                len(self.table),
+            )
+        )
+
+
 class PCFG:
-    def __init__(self, productions, start_symbol, number_of_arguments):
+    def __init__(self, productions, start_symbol, number_of_arguments, symbols=None):
         # productions: nonterminal -> [(log probability, constructor, [(#lambdas, nonterminal)])]
         self.number_of_arguments = number_of_arguments
         self.productions = productions
         self.start_symbol = start_symbol
+        # For numbered rules: nonterminal -> (type, environment) that it stands for
+        self.symbols = symbols
 
     @staticmethod
     def from_grammar(g, request, maximum_type=3, maximum_environment=2):
@@ -2148,9 +2752,24 @@ class PCFG:
         ]
 
         return PCFG(
-            new_productions, mapping[self.start_symbol], self.number_of_arguments
+            new_productions,
+            mapping[self.start_symbol],
+            self.number_of_arguments,
+            symbols=[reverse_mapping[i] for i in range(len(self.productions))],
         )
 
+    def closed_symbols(self):
+        """Numbered nonterminals whose only variables are the arguments of the
+        request, so that their expressions can be evaluated on task inputs"""
+        if self.symbols is None:
+            return set()
+        _, start_environment = self.symbols[self.start_symbol]
+        return {
+            i
+            for i, (_, environment) in enumerate(self.symbols)
+            if environment == start_environment
+        }
+
     def json(self):
         self = self.number_rules()
         return {
@@ -2322,8 +2941,11 @@ class PCFG:
         # eprint(quality(split))
         # import pdb; pdb.set_trace()
 
-    def quantized_enumeration(self, resolution=0.5, skeletons=None):
+    def quantized_enumeration(self, resolution=0.5, skeletons=None, equivalence=None):
+        """equivalence: an ObservationalEquivalence, to drop expressions that
+        compute the same outputs as a cheaper one"""
         self = self.number_rules()
+        observable = self.closed_symbols() if equivalence is not None else set()
 
         if skeletons is None:
             skeletons = [
@@ -2491,6 +3113,8 @@ class PCFG:
                         assert (
                             False
                         ), "more than five arguments not supported for the enumeration algorithm but that is not for any good reason"
+                if symbol in observable:
+                    new = [e for e in new if equivalence.admit(symbol, size, e)]
                 expressions[symbol][size] = new
 
             return expressions[symbol][size]
@@ -2510,10 +3134,29 @@ class PCFG:
                 if cost == 0:
                     yield skeleton
 
+        def body_of(e):
+            for _ in range(self.number_of_arguments):
+                e = e.body
+            return e
+
+        # Programs completing a bare hole were already checked as expressions of
+        # the start symbol, the others are only checked once they are complete.
+        # Complete programs get their own key: the same expression may already
+        # be in the table as a subexpression built from the start symbol.
+        check_complete = [
+            self.start_symbol in observable
+            and not isinstance(body_of(skeleton), NamedHole)
+            for skeleton in skeletons
+        ]
+
         expressions = [
             [None for _ in range(int(100 / resolution))] for _ in range(nonterminals)
         ]
         for cost in range(int(100 / resolution)):
-            for skeleton, skeleton_cost in zip(skeletons, skeleton_costs):
+            for skeleton, skeleton_cost, check in zip(
+                skeletons, skeleton_costs, check_complete
+            ):
                 for e in complete_skeleton(cost - skeleton_cost, skeleton):
+                    if check and not equivalence.admit(None, cost, body_of(e)):
+                        continue
                     yield e
@@ -0,0 +1,67 @@
+"""
+Batched and memoized scoring of the programs returned by the solvers.
+
+Every solution comes back as a program string that must be parsed and scored
+under the grammar it was enumerated from. The same programs come back for
+many tasks, budget windows and iterations, so parses are cached by program
+string and priors by (grammar hash, request, program string). The grammar
+hash is its DSL registry hash, so that equal grammars share their entries.
+Parsed programs are interned, so the cached programs share their common
+subtrees.
+"""
+
+from dreamcoder.dslRegistry import DSL_REGISTRY
+from dreamcoder.program import Program
+from dreamcoder.utilities import BoundedCache
+
+
+class PriorScorer:
+    def __init__(self, maximumPrograms=2**16, maximumPriors=2**18):
+        self.programs = BoundedCache(maximumPrograms)
+        self.priors = BoundedCache(maximumPriors)
+
+    def parse(self, programString):
+        p = self.programs.get(programString)
+        if p is None:
+            p = Program.parse(programString).intern()
+            self.programs[programString] = p
+        return p
+
+    def score(self, g, jobs, onFailure=None):
+        """jobs: iterable of (request, program string).
+        Returns a map from each job to (program, log prior under g).
+        Each distinct program is parsed once and each distinct job is scored
+        once. onFailure(request, program) is called before the exception is
+        raised when a program cannot be scored."""
+        h = DSL_REGISTRY.hash(g)
+        scored = {}
+        missing = []
+        for job in jobs:
+            if job in scored:
+                continue
+            request, programString = job
+            cached = self.priors.get((h, request, programString))
+            if cached is None:
+                missing.append(job)
+                # Placeholder keeps duplicates out of `missing`
+                scored[job] = None
+            else:
+                scored[job] = cached
+        for request, programString in missing:
+            p = self.parse(programString)
+            try:
+                logPrior = g.logLikelihood(request, p)
+            except:
+                if onFailure is not None:
+                    onFailure(request, p)
+                raise
+            scored[(request, programString)] = (p, logPrior)
+            self.priors[(h, request, programString)] = (p, logPrior)
+        return scored
+
+    def clear(self):
+        self.programs.clear()
+        self.priors.clear()
+
+
+PRIOR_SCORER = PriorScorer()
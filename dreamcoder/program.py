@@ -3,9 +3,19 @@
 from typing import Any
 from dreamcoder.type import *
 from dreamcoder.utilities import *
+from dreamcoder.evaluationDeadline import EVALUATION_DEADLINE
 
 from time import time
+import ast
+import copy
+import hashlib
+import inspect
 import math
+import operator
+import re
+import textwrap
+import weakref
+from types import GeneratorType
 
 
 class InferenceFailure(Exception):
@@ -20,7 +30,112 @@ class RunFailure(Exception):
     pass
 
 
+# Frames unwound after a RecursionError before a traversal carries on without
+# recursion, so that the frames in between do not each start over
+_STACK_MARGIN = 50
+
+
+def _unwound(error):
+    """Counts the frames which caught the RecursionError `error`: whether
+    enough were unwound to carry on from the current one"""
+    error.unwound = getattr(error, "unwound", 0) + 1
+    return error.unwound > _STACK_MARGIN
+
+
+class _RecursiveCalls(ast.NodeTransformer):
+    """Turns the calls of a method into yields of its generator version.
+    In __eq__, a == b is such a call, and in __hash__, so is hash(e) of
+    anything but a tuple."""
+
+    def __init__(self, name, deepName):
+        self.name = name
+        self.deepName = deepName
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        f = node.func
+        if isinstance(f, ast.Attribute) and f.attr == self.name:
+            f.attr = self.deepName
+            return ast.Yield(node)
+        if (
+            self.name == "__hash__"
+            and isinstance(f, ast.Name)
+            and f.id == "hash"
+            and not isinstance(node.args[0], ast.Tuple)
+        ):
+            return ast.Yield(
+                ast.Call(ast.Attribute(node.args[0], self.deepName, ast.Load()), [], [])
+            )
+        return node
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        if self.name == "__eq__" and len(node.ops) == 1 and isinstance(node.ops[0], ast.Eq):
+            f = ast.Attribute(node.left, self.deepName, ast.Load())
+            return ast.Yield(ast.Call(f, node.comparators, []))
+        return node
+
+
+class _deepened(object):
+    """
+    Decorates a method of programs which calls itself on their children, so
+    that no program is too deep for it. The method runs as written, which
+    is the fastest, until it runs out of stack. The subprogram it could not
+    finish is then handed to a generator made from the source of the method,
+    in which each call `e.method(...)` is `(yield e._methodDeep(...))`
+    instead, and run by trampoline. Other programs answer these yields by
+    calling the method itself.
+    """
+
+    def __init__(self, method):
+        self.method = method
+
+    def __set_name__(self, owner, name):
+        method = self.method
+        deepName = "_%sDeep" % name.strip("_")
+        lines, start = inspect.getsourcelines(method)
+        definition = ast.parse(textwrap.dedent("".join(lines))).body[0]
+        definition.decorator_list = []
+        parameters = [a.arg for a in definition.args.args]
+
+        deep = _RecursiveCalls(name, deepName).visit(copy.deepcopy(definition))
+        deep.name = deepName
+
+        fallback = ast.parse(
+            "try:\n    pass\n"
+            "except RecursionError as error:\n"
+            "    if not _unwound(error):\n"
+            "        raise\n"
+            "    return trampoline(%s.%s(%s))\n"
+            % (parameters[0], deepName, ", ".join(parameters[1:]))
+        ).body[0]
+        # Traced back to the line of the definition
+        for node in ast.walk(fallback):
+            if "lineno" in node._attributes:
+                node.lineno = node.end_lineno = definition.lineno
+        fallback.body = definition.body
+        definition.body = [fallback]
+
+        module = ast.Module(body=[definition, deep], type_ignores=[])
+        ast.fix_missing_locations(module)
+        ast.increment_lineno(module, start - 1)
+        namespace = {}
+        exec(compile(module, inspect.getsourcefile(method), "exec"), method.__globals__, namespace)
+        for n in (name, deepName):
+            namespace[n].__qualname__ = "%s.%s" % (owner.__qualname__, n)
+            setattr(owner, n, namespace[n])
+
+        # Programs which do not recurse answer with the method itself
+        root = owner.__mro__[-2]
+        if deepName not in vars(root):
+            setattr(root, deepName, lambda self, *arguments: getattr(self, name)(*arguments))
+
+
 class Program(object):
+    __slots__ = ("annotatedType", "__weakref__")
+
+    interned = False
+
     def __repr__(self):
         return str(self)
 
@@ -30,6 +145,10 @@ class Program(object):
     def __str__(self):
         return self.show(False)
 
+    def intern(self):
+        """The hash-consed copy of this program, see ProgramInterner"""
+        return PROGRAM_INTERNER.intern(self)
+
     def canHaveType(self, t):
         try:
             context, actualType = self.inferType(Context.EMPTY, [], {})
@@ -45,12 +164,15 @@ class Program(object):
         return self
 
     def betaNormalForm(self):
-        n = self
-        while True:
-            np = n.betaReduce()
-            if np is None:
-                return n
-            n = np
+        """What betaReduce reduces this program to once it gives None"""
+        n = self.betaReduce()
+        return self if n is None else n.betaNormalForm()
+
+    def _contracted(self, xs, d):
+        """This program, under d abstractions in the body of one applied to
+        xs[0], with xs[0] for the variable of that abstraction. xs[k] is
+        xs[0] shifted by k, and is added once needed."""
+        return self.substitute(Index(d), xs[0].shift(d + 1)).shift(-1, d)
 
     def infer(self):
         try:
@@ -97,8 +219,12 @@ class Program(object):
         except InferenceFailure:
             return False
 
+    def evaluateCompiled(self, environment=(), cache=True):
+        """Same as evaluate, through the compiled form of the program, see ProgramCompiler"""
+        return PROGRAM_COMPILER.compile(self, cache)(tuple(environment))
+
     def runWithArguments(self, xs):
-        f = self.evaluate([])
+        f = self.evaluateCompiled()
         for x in xs:
             f = f(x)
         return f
@@ -109,6 +235,38 @@ class Program(object):
     def applicationParse(self):
         return self, []
 
+    def walk(self, surroundingAbstractions=0):
+        """Each subprogram in preorder, with the number of abstractions
+        around it. The bodies of invented primitives are not entered."""
+        stack = [(surroundingAbstractions, self)]
+        while stack:
+            d, e = stack.pop()
+            while True:
+                yield d, e
+                if isinstance(e, Application):
+                    stack.append((d, e.x))
+                    e = e.f
+                elif isinstance(e, Abstraction):
+                    d += 1
+                    e = e.body
+                else:
+                    break
+
+    def walkUncurried(self, d=0):
+        """As walk, visiting the head and the arguments of each application
+        rather than its partial applications"""
+        stack = [(d, self)]
+        while stack:
+            d, e = stack.pop()
+            yield d, e
+            if isinstance(e, Application):
+                f, xs = e.applicationParse()
+                for x in reversed(xs):
+                    stack.append((d, x))
+                stack.append((d, f))
+            elif isinstance(e, Abstraction):
+                stack.append((d + 1, e.body))
+
     @property
     def closed(self):
         for surroundingAbstractions, child in self.walk():
@@ -192,52 +350,20 @@ class Program(object):
 
     @staticmethod
     def parse(s):
-        s = parseSExpression(s)
+        """Parses are cached by string and shared, so they must not be mutated"""
+        return PROGRAM_PARSER.parse(s)
 
-        # eprint(s)
-        def p(e):
-            if isinstance(e, list):
-                if e[0] == "#":
-                    assert len(e) == 2
-                    return Invented(p(e[1]))
-                if e[0] == "lambda":
-                    assert len(e) == 2
-                    return Abstraction(p(e[1]))
-                if e[0] == "let":
-                    if e[-3][0] == "rev":
-                        return LetRevClause(
-                            [v[1:] for v in e[1:-4]],
-                            e[-3][1][1:],
-                            p(e[-3][3]),
-                            p(e[-1]),
-                        )
-                    else:
-                        return LetClause(
-                            e[1][0][1:], Type.fromstring(e[1][1]), p(e[3]), p(e[5])
-                        )
-                if e[0] == "Const":
-                    return Constant(Type.fromstring(e[1]), e[2])
-                f = p(e[0])
-                for x in e[1:]:
-                    f = Application(f, p(x))
-                return f
-            assert isinstance(e, str)
-            if e[0] == "$":
-                try:
-                    return Index(int(e[1:]))
-                except ValueError:
-                    return FreeVariable(e[1:])
-            if e == "FREE_VAR":
-                return FreeVariable(None)
-            if e in Primitive.GLOBALS:
-                return Primitive.GLOBALS[e]
-            if e == "??" or e == "?":
-                return FragmentVariable.single
-            if e == "<HOLE>":
-                return Hole.single
-            raise ParseFailure((s, e))
-
-        return p(s)
+    @staticmethod
+    def parse_many(strings):
+        return PROGRAM_PARSER.parse_many(strings)
+
+    def encode(self, table):
+        """The binary encoding of this program, see ProgramTable"""
+        return table.encode(self)
+
+    @staticmethod
+    def decode(data, table):
+        return table.decode(data)
 
     @staticmethod
     def _parse(s, n):
@@ -301,25 +427,31 @@ class Program(object):
 class Application(Program):
     """Function application"""
 
+    __slots__ = ("f", "x", "hashCode", "isConditional", "interned", "internedSize")
+
     def __init__(self, f, x):
         self.f = f
         self.x = x
         self.hashCode = None
+        self.interned = False
         self.isConditional = (
-            (not isinstance(f, int))
-            and f.isApplication
-            and f.f.isApplication
-            and f.f.f.isPrimitive
+            isinstance(f, Application)
+            and isinstance(f.f, Application)
+            and isinstance(f.f.f, Primitive)
             and f.f.f.name == "if"
         )
-        if self.isConditional:
-            self.falseBranch = x
-            self.trueBranch = f.x
-            self.branch = f.f.x
-        else:
-            self.falseBranch = None
-            self.trueBranch = None
-            self.branch = None
+
+    @property
+    def falseBranch(self):
+        return self.x if self.isConditional else None
+
+    @property
+    def trueBranch(self):
+        return self.f.x if self.isConditional else None
+
+    @property
+    def branch(self):
+        return self.f.f.x if self.isConditional else None
 
     def fill_args(self, environment):
         return Application(self.f.fill_args(environment), self.x.fill_args(environment))
@@ -362,6 +494,7 @@ class Application(Program):
             )
         return checkers[1:], indices_checkers
 
+    @_deepened
     def betaReduce(self):
         # See if either the function or the argument can be reduced
         f = self.f.betaReduce()
@@ -376,15 +509,28 @@ class Application(Program):
             return None
 
         # Perform substitution
-        b = self.f.body
-        v = self.x
-        return b.substitute(Index(0), v.shift(1)).shift(-1)
+        return _contract(self.f, self.x)
+
+    @_deepened
+    def betaNormalForm(self):
+        # Reduces in the same order as betaReduce, without going back to the
+        # root after each step. Substituting a normal form which is not an
+        # abstraction into one makes no redex.
+        f = self.f.betaNormalForm()
+        x = self.x.betaNormalForm()
+        if f.isAbstraction:
+            reduced = _contract(f, x)
+            return reduced.betaNormalForm() if x.isAbstraction else reduced
+        if f is self.f and x is self.x:
+            return self
+        return Application(f, x)
 
     def isBetaLong(self):
         return (
             (not self.f.isAbstraction) and self.f.isBetaLong() and self.x.isBetaLong()
         )
 
+    @_deepened
     def freeVariables(self):
         return self.f.freeVariables() | self.x.freeVariables()
 
@@ -402,11 +548,17 @@ class Application(Program):
     def isApplication(self):
         return True
 
+    @_deepened
     def __eq__(self, other):
-        return (
-            isinstance(other, Application) and self.f == other.f and self.x == other.x
-        )
+        if self is other:
+            return True
+        if not isinstance(other, Application):
+            return False
+        if self.interned and other.interned:
+            return False
+        return self.f == other.f and self.x == other.x
 
+    @_deepened
     def __hash__(self):
         if self.hashCode is None:
             self.hashCode = hash((hash(self.f), hash(self.x)))
@@ -415,54 +567,21 @@ class Application(Program):
     """Because Python3 randomizes the hash function, we need to never pickle the hash"""
 
     def __getstate__(self):
-        return (
-            self.f,
-            self.x,
-            self.isConditional,
-            self.falseBranch,
-            self.trueBranch,
-            self.branch,
-        )
+        return (self.f, self.x)
 
     def __setstate__(self, state):
-        try:
-            (
-                self.f,
-                self.x,
-                self.isConditional,
-                self.falseBranch,
-                self.trueBranch,
-                self.branch,
-            ) = state
-        except ValueError:
+        if isinstance(state, dict):
             # backward compatibility
             assert "x" in state
             assert "f" in state
-            f = state["f"]
-            x = state["x"]
-            self.f = f
-            self.x = x
-            self.isConditional = (
-                (not isinstance(f, int))
-                and f.isApplication
-                and f.f.isApplication
-                and f.f.f.isPrimitive
-                and f.f.f.name == "if"
-            )
-            if self.isConditional:
-                self.falseBranch = x
-                self.trueBranch = f.x
-                self.branch = f.f.x
-            else:
-                self.falseBranch = None
-                self.trueBranch = None
-                self.branch = None
-
-        self.hashCode = None
+            state = (state["f"], state["x"])
+        # Older checkpoints also stored the conditional branches after f and x
+        Application.__init__(self, state[0], state[1])
 
     def visit(self, visitor, *arguments, **keywords):
         return visitor.application(self, *arguments, **keywords)
 
+    @_deepened
     def show(self, isFunction):
         if isFunction:
             return "%s %s" % (self.f.show(True), self.x.show(False))
@@ -471,10 +590,10 @@ class Application(Program):
 
     def evaluate(self, environment):
         if self.isConditional:
-            if self.branch.evaluate(environment):
-                return self.trueBranch.evaluate(environment)
+            if self.f.f.x.evaluate(environment):
+                return self.f.x.evaluate(environment)
             else:
-                return self.falseBranch.evaluate(environment)
+                return self.x.evaluate(environment)
         else:
             return self.f.evaluate(environment)(self.x.evaluate(environment))
 
@@ -486,35 +605,51 @@ class Application(Program):
         return (context, returnType.apply(context))
 
     def applicationParses(self):
-        yield self, []
-        for f, xs in self.f.applicationParses():
-            yield f, xs + [self.x]
+        e, xs = self, []
+        while isinstance(e, Application):
+            yield e, xs
+            xs = [e.x] + xs
+            e = e.f
+        yield e, xs
 
     def applicationParse(self):
-        f, xs = self.f.applicationParse()
-        return f, xs + [self.x]
-
+        e, xs = self, []
+        while isinstance(e, Application):
+            xs.append(e.x)
+            e = e.f
+        xs.reverse()
+        return e, xs
+
+    @_deepened
     def shift(self, offset, depth=0):
-        return Application(self.f.shift(offset, depth), self.x.shift(offset, depth))
+        f = self.f.shift(offset, depth)
+        x = self.x.shift(offset, depth)
+        if f is self.f and x is self.x:
+            return self
+        return Application(f, x)
 
+    @_deepened
     def substitute(self, old, new):
         if self == old:
             return new
-        return Application(self.f.substitute(old, new), self.x.substitute(old, new))
-
-    def walkUncurried(self, d=0):
-        yield d, self
-        f, xs = self.applicationParse()
-        yield from f.walkUncurried(d)
-        for x in xs:
-            yield from x.walkUncurried(d)
+        f = self.f.substitute(old, new)
+        x = self.x.substitute(old, new)
+        if f is self.f and x is self.x:
+            return self
+        return Application(f, x)
 
-    def walk(self, surroundingAbstractions=0):
-        yield surroundingAbstractions, self
-        yield from self.f.walk(surroundingAbstractions)
-        yield from self.x.walk(surroundingAbstractions)
+    @_deepened
+    def _contracted(self, xs, d):
+        f = self.f._contracted(xs, d)
+        x = self.x._contracted(xs, d)
+        if f is self.f and x is self.x:
+            return self
+        return Application(f, x)
 
+    @_deepened
     def size(self):
+        if self.interned:
+            return self.internedSize
         return self.f.size() + self.x.size()
 
     @staticmethod
@@ -548,9 +683,21 @@ class Index(Program):
     These indices encode variables.
     """
 
+    __slots__ = ("i",)
+
     def __init__(self, i):
         self.i = i
 
+    def __getstate__(self):
+        return (self.i,)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # backward compatibility
+            self.i = state["i"]
+        else:
+            (self.i,) = state
+
     def show(self, isFunction):
         return "$%d" % self.i
 
@@ -620,6 +767,9 @@ class Index(Program):
     def betaReduce(self):
         return None
 
+    def betaNormalForm(self):
+        return self
+
     def isBetaLong(self):
         return True
 
@@ -632,11 +782,14 @@ class Index(Program):
         else:
             return self
 
-    def walk(self, surroundingAbstractions=0):
-        yield surroundingAbstractions, self
-
-    def walkUncurried(self, d=0):
-        yield d, self
+    def _contracted(self, xs, d):
+        if self.i < d:
+            return self
+        if self.i > d:
+            return Index(self.i - 1)
+        while len(xs) <= d:
+            xs.append(xs[0].shift(len(xs)))
+        return xs[d]
 
     def size(self):
         return 1
@@ -672,9 +825,12 @@ class Index(Program):
 class Abstraction(Program):
     """Lambda abstraction. Creates a new function."""
 
+    __slots__ = ("body", "hashCode", "interned", "internedSize")
+
     def __init__(self, body):
         self.body = body
         self.hashCode = None
+        self.interned = False
 
     def _is_reversible(self, environment, args):
         environment = {i + 1: c for (i, c) in environment.items()}
@@ -704,9 +860,17 @@ class Abstraction(Program):
     def isAbstraction(self):
         return True
 
+    @_deepened
     def __eq__(self, o):
-        return isinstance(o, Abstraction) and o.body == self.body
+        if self is o:
+            return True
+        if not isinstance(o, Abstraction):
+            return False
+        if self.interned and o.interned:
+            return False
+        return o.body == self.body
 
+    @_deepened
     def __hash__(self):
         if self.hashCode is None:
             self.hashCode = hash((hash(self.body),))
@@ -719,12 +883,15 @@ class Abstraction(Program):
     def __setstate__(self, state):
         self.body = state
         self.hashCode = None
+        self.interned = False
 
     def isBetaLong(self):
         return self.body.isBetaLong()
 
+    @_deepened
     def freeVariables(self):
-        return {f - 1 for f in self.body.freeVariables() if f > 0}
+        variables = self.body.freeVariables()
+        return {f - 1 for f in variables if f > 0}
 
     def visit(self, visitor, *arguments, **keywords):
         return visitor.abstraction(self, *arguments, **keywords)
@@ -737,18 +904,25 @@ class Abstraction(Program):
         self.body.annotateTypes(context, [v] + environment)
         self.annotatedType = arrow(v.applyMutable(context), self.body.annotatedType)
 
+    @_deepened
     def show(self, isFunction):
         return "(lambda %s)" % (self.body.show(False))
 
     def evaluate(self, environment):
         return lambda x: self.body.evaluate([x] + environment)
 
+    @_deepened
     def betaReduce(self):
         b = self.body.betaReduce()
         if b is None:
             return None
         return Abstraction(b)
 
+    @_deepened
+    def betaNormalForm(self):
+        body = self.body.betaNormalForm()
+        return self if body is self.body else Abstraction(body)
+
     def inferType(self, context, environment, freeVariables):
         (context, argumentType) = context.makeVariable()
         (context, returnType) = self.body.inferType(
@@ -756,25 +930,29 @@ class Abstraction(Program):
         )
         return (context, arrow(argumentType, returnType).apply(context))
 
+    @_deepened
     def shift(self, offset, depth=0):
-        return Abstraction(self.body.shift(offset, depth + 1))
+        body = self.body.shift(offset, depth + 1)
+        return self if body is self.body else Abstraction(body)
 
+    @_deepened
     def substitute(self, old, new):
         if self == old:
             return new
         old = old.shift(1)
         new = new.shift(1)
-        return Abstraction(self.body.substitute(old, new))
-
-    def walk(self, surroundingAbstractions=0):
-        yield surroundingAbstractions, self
-        yield from self.body.walk(surroundingAbstractions + 1)
+        body = self.body.substitute(old, new)
+        return self if body is self.body else Abstraction(body)
 
-    def walkUncurried(self, d=0):
-        yield d, self
-        yield from self.body.walkUncurried(d + 1)
+    @_deepened
+    def _contracted(self, xs, d):
+        body = self.body._contracted(xs, d + 1)
+        return self if body is self.body else Abstraction(body)
 
+    @_deepened
     def size(self):
+        if self.interned:
+            return self.internedSize
         return self.body.size()
 
     @staticmethod
@@ -863,6 +1041,9 @@ class Primitive(Program):
     def betaReduce(self):
         return None
 
+    def betaNormalForm(self):
+        return self
+
     def isBetaLong(self):
         return True
 
@@ -881,11 +1062,8 @@ class Primitive(Program):
         else:
             return self
 
-    def walk(self, surroundingAbstractions=0):
-        yield surroundingAbstractions, self
-
-    def walkUncurried(self, d=0):
-        yield d, self
+    def _contracted(self, xs, d):
+        return self
 
     def size(self):
         return 1
@@ -919,10 +1097,13 @@ class Primitive(Program):
 class Invented(Program):
     """New invented primitives"""
 
+    __slots__ = ("body", "tp", "hashCode", "interned", "internedSize")
+
     def __init__(self, body):
         self.body = body
         self.tp = self.body.infer()
         self.hashCode = None
+        self.interned = False
 
     def _is_reversible(self, environment, args):
         return self.body._is_reversible(environment, args)
@@ -947,7 +1128,13 @@ class Invented(Program):
         return visitor.invented(self, *arguments, **keywords)
 
     def __eq__(self, o):
-        return isinstance(o, Invented) and o.body == self.body
+        if self is o:
+            return True
+        if not isinstance(o, Invented):
+            return False
+        if self.interned and o.interned:
+            return False
+        return o.body == self.body
 
     def __hash__(self):
         if self.hashCode is None:
@@ -962,6 +1149,17 @@ class Invented(Program):
     def __setstate__(self, state):
         self.body, self.tp = state
         self.hashCode = None
+        self.interned = False
+
+    @staticmethod
+    def _withType(body, tp):
+        """An invented primitive whose type is already known"""
+        e = Invented.__new__(Invented)
+        e.body = body
+        e.tp = tp
+        e.hashCode = None
+        e.interned = False
+        return e
 
     def clone(self):
         return Invented(self.body)
@@ -993,11 +1191,8 @@ class Invented(Program):
         else:
             return self
 
-    def walk(self, surroundingAbstractions=0):
-        yield surroundingAbstractions, self
-
-    def walkUncurried(self, d=0):
-        yield d, self
+    def _contracted(self, xs, d):
+        return self
 
     def size(self):
         return 1
@@ -1057,12 +1252,6 @@ class FragmentVariable(Program):
         except ShiftFailure:
             raise MatchFailure()
 
-    def walk(self, surroundingAbstractions=0):
-        yield surroundingAbstractions, self
-
-    def walkUncurried(self, d=0):
-        yield d, self
-
     def size(self):
         return 1
 
@@ -1106,12 +1295,6 @@ class Hole(Program):
     def shift(self, offset, depth=0):
         raise Exception("Attempt to shift fragment variable")
 
-    def walk(self, surroundingAbstractions=0):
-        yield surroundingAbstractions, self
-
-    def walkUncurried(self, d=0):
-        yield d, self
-
     def size(self):
         return 1
 
@@ -1155,12 +1338,6 @@ class NamedHole(Program):
     def shift(self, offset, depth=0):
         raise Exception("Attempt to shift named hl")
 
-    def walk(self, surroundingAbstractions=0):
-        yield surroundingAbstractions, self
-
-    def walkUncurried(self, d=0):
-        yield d, self
-
     def size(self):
         return 1
 
@@ -1272,9 +1449,21 @@ class LetRevClause(Program):
 
 
 class FreeVariable(Program):
+    __slots__ = ("name",)
+
     def __init__(self, name):
         self.name = name
 
+    def __getstate__(self):
+        return (self.name,)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # backward compatibility
+            self.name = state["name"]
+        else:
+            (self.name,) = state
+
     def show(self, isFunction):
         if self.name is not None:
             return "$" + self.name
@@ -1291,8 +1480,13 @@ class FreeVariable(Program):
     def isFreeVariable(self):
         return True
 
+    def size(self):
+        return 1
+
 
 class Constant(Program):
+    __slots__ = ("tp", "value", "hashCode")
+
     def __init__(self, tp, value):
         self.tp = tp
         self.value = value
@@ -1325,6 +1519,9 @@ class Constant(Program):
     def isConst(self):
         return True
 
+    def size(self):
+        return 1
+
     def inferType(self, context, environment, freeVariables):
         return self.tp.instantiate(context)
 
@@ -1334,9 +1531,6 @@ class Constant(Program):
     def _get_custom_arg_checkers(self, checker, indices_checkers):
         return [], indices_checkers
 
-    def walk(self, surroundingAbstractions=0):
-        yield surroundingAbstractions, self
-
     def substitute(self, old, new):
         if self == old:
             return new
@@ -1350,6 +1544,54 @@ class Constant(Program):
         return []
 
 
+def _contract(f, x):
+    """The body of the abstraction f with x for its variable, as
+    f.body.substitute(Index(0), x.shift(1)).shift(-1) without going through
+    x, which is shared where no abstraction surrounds its variable"""
+    return f.body._contracted([x], 0)
+
+
+def trampoline(computation):
+    """Runs a recursive computation without using the interpreter's stack.
+    The computation is a generator which, rather than making a recursive
+    call, yields the generator of that call and is sent back its result,
+    or has its exception thrown into it. For example a visitor method
+    returns `(yield e.body.visit(self))` instead of `e.body.visit(self)`.
+    Calls which return at once, such as the visits of leaves, may give
+    their result rather than a generator; it is sent straight back."""
+    if not isinstance(computation, GeneratorType):
+        return computation
+    # Computations waiting for the result of the one running
+    stack = []
+    value = None
+    error = None
+    while True:
+        try:
+            if error is None:
+                call = computation.send(value)
+            else:
+                error, raised = None, error
+                call = computation.throw(raised)
+        except StopIteration as result:
+            if not stack:
+                return result.value
+            computation = stack.pop()
+            value = result.value
+            continue
+        except Exception as e:
+            if not stack:
+                raise
+            computation = stack.pop()
+            error = e
+            continue
+        if not isinstance(call, GeneratorType):
+            value = call
+            continue
+        stack.append(computation)
+        computation = call
+        value = None
+
+
 class CombinedArgChecker:
     def __init__(self, should_be_reversible, max_index, can_have_free_vars, checkers):
         self.should_be_reversible = should_be_reversible
@@ -1556,6 +1798,654 @@ class ShareVisitor(object):
         return e.visit(self)
 
 
+class ProgramInterner(object):
+    """
+    Hash-consing of programs. Interned programs that are structurally equal
+    are the same object. Interned applications, abstractions and invented
+    primitives carry a precomputed hash and size, and two of them are equal
+    only if they are identical, so equality is O(1).
+
+    Compound nodes are held weakly and leave the table when no longer used.
+    There is a single interner per process, PROGRAM_INTERNER: interned
+    programs from two different interners would compare unequal. Interned
+    subtrees are shared between programs, so they must not be mutated.
+    """
+
+    def __init__(self):
+        self.leaves = {}
+        self.compounds = weakref.WeakValueDictionary()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.leaves) + len(self.compounds)
+
+    def intern(self, e):
+        if e.interned:
+            self.hits += 1
+            return e
+        if isinstance(e, Application):
+            f = self.intern(e.f)
+            x = self.intern(e.x)
+            key = (Application, id(f), id(x))
+            same = f is e.f and x is e.x
+            build = lambda: Application(f, x)
+        elif isinstance(e, Abstraction):
+            body = self.intern(e.body)
+            key = (Abstraction, id(body))
+            same = body is e.body
+            build = lambda: Abstraction(body)
+        elif isinstance(e, Invented):
+            body = self.intern(e.body)
+            key = (Invented, id(body))
+            same = body is e.body
+            build = lambda: Invented._withType(body, e.tp)
+        else:
+            return self._leaf(e)
+
+        interned = self.compounds.get(key)
+        if interned is not None:
+            self.hits += 1
+            return interned
+        self.misses += 1
+        interned = e if same else build()
+        interned.hashCode = hash(interned)
+        interned.internedSize = interned.size()
+        interned.interned = True
+        self.compounds[key] = interned
+        return interned
+
+    def _leaf(self, e):
+        # Leaves are few and are compared by value
+        if isinstance(e, Index):
+            key = (Index, e.i)
+        elif isinstance(e, Primitive):
+            key = (Primitive, e.name)
+        else:
+            key = e
+        interned = self.leaves.get(key)
+        if interned is None:
+            self.misses += 1
+            self.leaves[key] = interned = e
+        else:
+            self.hits += 1
+        return interned
+
+
+PROGRAM_INTERNER = ProgramInterner()
+
+
+class _ListFrame(object):
+    __slots__ = ("items", "isLambda", "closer")
+
+    def __init__(self, closer):
+        self.items = []
+        self.isLambda = False
+        self.closer = closer
+
+
+class _LetFrame(object):
+    # states: reading the variables, their definition, "in", the body
+    __slots__ = ("state", "names", "tp", "definition", "source")
+
+    def __init__(self):
+        self.state = 0
+        self.names = []
+        self.tp = None
+        self.definition = None
+        self.source = None
+
+
+class _RevFrame(object):
+    # states: reading the source variable, "=", its definition, ")"
+    __slots__ = ("state", "source", "definition")
+
+    def __init__(self):
+        self.state = 0
+        self.source = None
+        self.definition = None
+
+
+_HASH = "#"
+_PROGRAM_TOKEN = re.compile(r"\s*(?:([()\[\]#])|([^\s()\[\]]+))")
+
+
+class ProgramParser(object):
+    """
+    Parses the textual form of programs, including the let, rev and Const
+    forms printed by the solvers. The parser keeps an explicit stack rather
+    than recursing, so arbitrarily deep programs parse, and parses are kept
+    in a bounded cache keyed by string, so the returned programs are shared
+    and must not be mutated. Invented primitives are also cached by body,
+    because inferring their types dominates the parse of compressor output.
+    """
+
+    def __init__(self, maximumPrograms=2**16, maximumInventions=2**12):
+        self.programs = BoundedCache(maximumPrograms)
+        self.inventions = BoundedCache(maximumInventions)
+
+    def parse(self, s):
+        p = self.programs.get(s)
+        if p is None:
+            p = self._parse(s)
+            self.programs[s] = p
+        return p
+
+    def parse_many(self, strings):
+        """Parses a batch of program strings, each distinct string once"""
+        parsed = {}
+        programs = []
+        for s in strings:
+            p = parsed.get(s)
+            if p is None:
+                p = parsed[s] = self.parse(s)
+            programs.append(p)
+        return programs
+
+    def clear(self):
+        self.programs.clear()
+        self.inventions.clear()
+
+    def _invented(self, body):
+        e = self.inventions.get(body)
+        if e is None:
+            e = Invented(body)
+            self.inventions[body] = e
+        return e
+
+    @staticmethod
+    def _atom(s, token):
+        if token[0] == "$":
+            try:
+                return Index(int(token[1:]))
+            except ValueError:
+                return FreeVariable(token[1:])
+        if token == "FREE_VAR":
+            return FreeVariable(None)
+        p = Primitive.GLOBALS.get(token)
+        if p is not None:
+            return p
+        if token == "??" or token == "?":
+            return FragmentVariable.single
+        if token == "<HOLE>":
+            return Hole.single
+        raise ParseFailure((s, token))
+
+    @staticmethod
+    def _scanType(s, n):
+        """Reads a type annotation up to a space or comma outside parentheses"""
+        start = n
+        depth = 0
+        while n < len(s) and (depth > 0 or not (s[n].isspace() or s[n] == ",")):
+            if s[n] == "(":
+                depth += 1
+            elif s[n] == ")":
+                depth -= 1
+            n += 1
+        if depth != 0 or n == start:
+            raise ParseFailure(s)
+        return s[start:n], n
+
+    @staticmethod
+    def _scanConstant(s, n):
+        """Reads Const(type, value) from just after the opening parenthesis"""
+        start = n
+        depth = 0
+        while True:
+            if n >= len(s):
+                raise ParseFailure(s)
+            c = s[n]
+            if c == "(":
+                depth += 1
+            elif c == ")":
+                depth -= 1
+            elif c == "," and depth == 0:
+                break
+            n += 1
+        tp = s[start:n]
+        start = n + 1
+        depth = 0
+        while True:
+            n += 1
+            if n >= len(s):
+                raise ParseFailure(s)
+            c = s[n]
+            if c == "(":
+                depth += 1
+            elif c == ")":
+                depth -= 1
+                if depth == -1:
+                    break
+        return Constant(Type.fromstring(tp), s[start:n].strip()), n + 1
+
+    def _tokens(self, s):
+        """(punctuation, token) pairs. Constants come back already parsed as
+        the token, and type annotations such as $v1::list(int) as one token."""
+        if "Const(" not in s and "::" not in s:
+            return _PROGRAM_TOKEN.findall(s)
+        tokens = []
+        n = 0
+        while True:
+            m = _PROGRAM_TOKEN.match(s, n)
+            if m is None:
+                return tokens
+            n = m.end()
+            punctuation, token = m.groups()
+            if token == "Const" and s.startswith("(", n):
+                token, n = self._scanConstant(s, n + 1)
+            elif token and "::" in token:
+                start = m.start(2)
+                _, n = self._scanType(s, start + token.index("::") + 2)
+                token = s[start:n]
+                if s.startswith(",", n):
+                    n += 1
+            tokens.append((punctuation, token))
+
+    @staticmethod
+    def _header(s, stack, top, punctuation, token):
+        """Consumes a token of the variables of a let or the source of a rev"""
+        if top.__class__ is _RevFrame:
+            if top.state == 0 and token and token[0] == "$":
+                top.source = token[1:]
+                top.state = 1
+            elif top.state == 1 and token == "=":
+                top.state = 2
+            elif top.state == 3 and punctuation == ")":
+                stack.pop()
+                let = stack[-1]
+                let.source = top.source
+                let.definition = top.definition
+                let.state = 2
+            else:
+                raise ParseFailure(s)
+        elif punctuation:
+            raise ParseFailure(s)
+        elif top.state == 2:
+            if token != "in" and token != ";":
+                raise ParseFailure(s)
+            top.state = 3
+        elif token == "=":
+            if not top.names:
+                raise ParseFailure(s)
+            top.state = 1
+        elif token.__class__ is not str or token[0] != "$":
+            raise ParseFailure(s)
+        elif "::" in token:
+            if top.names:
+                raise ParseFailure(s)
+            name, top.tp = token.split("::", 1)
+            top.names.append(name[1:])
+        else:
+            top.names.append(token[1:].rstrip(","))
+
+    def _parse(self, s):
+        tokens = self._tokens(s.strip())
+        stack = []
+        result = None
+        n = 0
+        while n < len(tokens):
+            if result is not None:
+                raise ParseFailure(s)
+            punctuation, token = tokens[n]
+            n += 1
+            top = stack[-1] if stack else None
+
+            if (
+                top.__class__ is _LetFrame
+                and (top.state == 0 or top.state == 2)
+                or top.__class__ is _RevFrame
+                and top.state != 2
+            ):
+                self._header(s, stack, top, punctuation, token)
+                continue
+            if punctuation == ")" or punctuation == "]":
+                if top.__class__ is not _ListFrame or top.closer != punctuation:
+                    raise ParseFailure(s)
+                stack.pop()
+                items = top.items
+                if top.isLambda:
+                    if len(items) != 1:
+                        raise ParseFailure(s)
+                    e = Abstraction(items[0])
+                else:
+                    if not items:
+                        raise ParseFailure(s)
+                    e = items[0]
+                    for x in items[1:]:
+                        e = Application(e, x)
+            elif punctuation:
+                if punctuation == _HASH:
+                    stack.append(_HASH)
+                else:
+                    stack.append(_ListFrame(")" if punctuation == "(" else "]"))
+                continue
+            elif token.__class__ is Constant:
+                e = token
+            elif token == "lambda":
+                if top.__class__ is not _ListFrame or top.items or top.isLambda:
+                    raise ParseFailure(s)
+                top.isLambda = True
+                continue
+            elif token == "let":
+                stack.append(_LetFrame())
+                continue
+            elif (
+                token == "rev"
+                and top.__class__ is _LetFrame
+                and top.state == 1
+                and n < len(tokens)
+                and tokens[n][0] == "("
+            ):
+                stack.append(_RevFrame())
+                n += 1
+                continue
+            else:
+                e = self._atom(s, token)
+
+            # e is complete: hand it to the enclosing forms
+            while True:
+                if not stack:
+                    result = e
+                    break
+                top = stack[-1]
+                if top.__class__ is _ListFrame:
+                    top.items.append(e)
+                    break
+                if top is _HASH:
+                    stack.pop()
+                    e = self._invented(e)
+                elif top.__class__ is _RevFrame:
+                    top.definition = e
+                    top.state = 3
+                    break
+                elif top.state == 1:
+                    top.definition = e
+                    top.state = 2
+                    break
+                else:
+                    stack.pop()
+                    if top.source is not None:
+                        e = LetRevClause(top.names, top.source, top.definition, e)
+                    elif top.tp is not None and len(top.names) == 1:
+                        e = LetClause(top.names[0], Type.fromstring(top.tp), top.definition, e)
+                    else:
+                        raise ParseFailure(s)
+
+        if result is None or stack:
+            raise ParseFailure(s)
+        return result
+
+
+PROGRAM_PARSER = ProgramParser()
+
+
+# Opcodes of the binary program encoding. A program is written in prefix
+# order, one opcode byte per node followed by its operands, if any. Small
+# de Bruijn indices, table ids and numbers of arguments are folded into the
+# opcode byte itself, so that most programs are a string of single-byte
+# opcodes.
+_OP_ABSTRACTION = 0  # then the body
+_OP_HOLE = 1
+_OP_FRAGMENT_VARIABLE = 2
+_OP_FREE_VARIABLE = 3  # an anonymous free variable
+_OP_INVENTED = 4  # then the body: an invention that is not in the table
+_OP_APPLY = 5  # varint n, then the function and its n arguments
+_OP_INDEX = 6  # varint de Bruijn index
+_OP_PRODUCTION = 7  # varint id of a primitive or invention in the table
+_OP_PRIMITIVE = 8  # string: a primitive that is not in the table
+_OP_NAMED_FREE_VARIABLE = 9  # string
+_OP_TEXT = 10  # string: constants and let clauses, in their textual form
+_SMALL_APPLY = 11  # 10 + n for applications to 1 <= n <= 5 arguments
+_SMALL_INDEX = 16  # 16 + i for the indices below 32
+_SMALL_PRODUCTION = 48  # 48 + id for the ids below 208
+# Opcodes without operands
+_SINGLE_BYTE_OPCODES = bytes(range(_OP_APPLY)) + bytes(range(_SMALL_APPLY, 256))
+
+
+def _writeVarint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _readVarint(data, n):
+    b = data[n]
+    n += 1
+    value = b & 0x7F
+    shift = 7
+    while b & 0x80:
+        b = data[n]
+        n += 1
+        value |= (b & 0x7F) << shift
+        shift += 7
+    return value, n
+
+
+def _writeString(out, s):
+    b = s.encode("utf-8")
+    _writeVarint(out, len(b))
+    out += b
+
+
+def _readString(data, n):
+    size, n = _readVarint(data, n)
+    return bytes(data[n : n + size]).decode("utf-8"), n + size
+
+
+class ProgramTable(object):
+    """
+    Numbers the primitives and inventions of a DSL for the binary encoding of
+    programs. Both ends of a channel build the same table from the same
+    productions; a table is named by the hash of their names and pickles as
+    those names, so it is sent once per stream rather than once per program.
+    Programs may still use primitives and inventions outside of the table,
+    which are then written out in full.
+    """
+
+    BY_HASH = weakref.WeakValueDictionary()
+    # id(grammar) -> table, dropped when the grammar is garbage collected
+    OF_GRAMMAR = {}
+
+    def __init__(self, productions, maximumPrograms=2**16):
+        self.productions = list(productions)
+        self.names = [str(p) for p in self.productions]
+        self.hash = hashlib.sha1("\n".join(self.names).encode("utf-8")).hexdigest()
+        self.ids = {}
+        for i, p in enumerate(self.productions):
+            self.ids.setdefault(p, i)
+        # Equal programs share their encoding, and equal encodings their
+        # decoding, so that the sharing of a pickled object graph survives
+        self.encodings = BoundedCache(maximumPrograms)
+        self.decodings = BoundedCache(maximumPrograms)
+
+    @staticmethod
+    def named(h, names):
+        """The table with hash `h`, parsing `names` only if it is not known yet"""
+        table = ProgramTable.BY_HASH.get(h)
+        if table is None:
+            table = ProgramTable(Program.parse_many(names))
+            ProgramTable.BY_HASH[table.hash] = table
+        return table
+
+    @staticmethod
+    def fromGrammar(g):
+        i = id(g)
+        table = ProgramTable.OF_GRAMMAR.get(i)
+        if table is None:
+            table = ProgramTable(p for _, _, p in g.productions)
+            table = ProgramTable.BY_HASH.setdefault(table.hash, table)
+            ProgramTable.OF_GRAMMAR[i] = table
+            weakref.finalize(g, ProgramTable.OF_GRAMMAR.pop, i, None)
+        return table
+
+    def __reduce__(self):
+        return (ProgramTable.named, (self.hash, self.names))
+
+    def __len__(self):
+        return len(self.productions)
+
+    def encode(self, p):
+        data = self.encodings.get(p)
+        if data is None:
+            data = self.encodings[p] = self._encode(p)
+        return data
+
+    def decode(self, data):
+        """Decodings are cached and shared, so they must not be mutated"""
+        p = self.decodings.get(data)
+        if p is None:
+            p = self.decodings[data] = self._decode(data)
+        return p
+
+    def _encode(self, p):
+        out = bytearray()
+        ids = self.ids
+        stack = [p]
+        while stack:
+            p = stack.pop()
+            if isinstance(p, Application):
+                xs = []
+                while isinstance(p, Application):
+                    xs.append(p.x)
+                    p = p.f
+                if len(xs) < _SMALL_INDEX - _SMALL_APPLY + 1:
+                    out.append(_SMALL_APPLY - 1 + len(xs))
+                else:
+                    out.append(_OP_APPLY)
+                    _writeVarint(out, len(xs))
+                # xs holds the arguments last to first, so the first one is
+                # popped right after the function
+                stack.extend(xs)
+                stack.append(p)
+            elif isinstance(p, Abstraction):
+                out.append(_OP_ABSTRACTION)
+                stack.append(p.body)
+            elif isinstance(p, Index):
+                if p.i < _SMALL_PRODUCTION - _SMALL_INDEX:
+                    out.append(_SMALL_INDEX + p.i)
+                else:
+                    out.append(_OP_INDEX)
+                    _writeVarint(out, p.i)
+            elif isinstance(p, (Primitive, Invented)):
+                i = ids.get(p)
+                if i is None:
+                    if isinstance(p, Primitive):
+                        out.append(_OP_PRIMITIVE)
+                        _writeString(out, p.name)
+                    else:
+                        out.append(_OP_INVENTED)
+                        stack.append(p.body)
+                elif i < 256 - _SMALL_PRODUCTION:
+                    out.append(_SMALL_PRODUCTION + i)
+                else:
+                    out.append(_OP_PRODUCTION)
+                    _writeVarint(out, i)
+            elif isinstance(p, Hole):
+                out.append(_OP_HOLE)
+            elif isinstance(p, FragmentVariable):
+                out.append(_OP_FRAGMENT_VARIABLE)
+            elif isinstance(p, FreeVariable):
+                if p.name is None:
+                    out.append(_OP_FREE_VARIABLE)
+                else:
+                    out.append(_OP_NAMED_FREE_VARIABLE)
+                    _writeString(out, p.name)
+            elif isinstance(p, (Constant, LetClause, LetRevClause)):
+                out.append(_OP_TEXT)
+                _writeString(out, p.show(False))
+            else:
+                raise ValueError(f"Cannot encode {p!r}")
+        return bytes(out)
+
+    def _decode(self, data):
+        """
+        Prefix order read backwards is postfix order: the opcodes are
+        evaluated last to first against a stack of the subprograms built so
+        far. Opcodes with operands are only decodable forwards, so programs
+        that have any are first split into tokens.
+        """
+        productions = self.productions
+        if data.translate(None, _SINGLE_BYTE_OPCODES):
+            tokens, leaves = self._tokens(data)
+            tokens = reversed(tokens)
+            productions = productions + leaves
+        else:
+            tokens = reversed(data)
+        values = []
+        try:
+            for op in tokens:
+                if op >= _SMALL_PRODUCTION:
+                    values.append(productions[op - _SMALL_PRODUCTION])
+                elif op >= _SMALL_INDEX:
+                    values.append(Index(op - _SMALL_INDEX))
+                elif op >= _SMALL_APPLY:
+                    f = values.pop()
+                    for _ in range(op - _SMALL_APPLY + 1):
+                        f = Application(f, values.pop())
+                    values.append(f)
+                elif op == _OP_ABSTRACTION:
+                    values.append(Abstraction(values.pop()))
+                elif op == _OP_INVENTED:
+                    values.append(PROGRAM_PARSER._invented(values.pop()))
+                elif op == _OP_HOLE:
+                    values.append(Hole.single)
+                elif op == _OP_FRAGMENT_VARIABLE:
+                    values.append(FragmentVariable.single)
+                elif op == _OP_FREE_VARIABLE:
+                    values.append(FreeVariable(None))
+                elif op < 0:
+                    # An application to more arguments than fit in the opcode
+                    f = values.pop()
+                    for _ in range(-op):
+                        f = Application(f, values.pop())
+                    values.append(f)
+                else:
+                    raise ValueError(f"Unknown opcode {op}")
+        except (IndexError, TypeError):
+            raise ValueError("Truncated program encoding")
+        if len(values) != 1:
+            raise ValueError("Malformed program encoding")
+        return values[0]
+
+    def _tokens(self, data):
+        """Splits an encoding into opcodes without operands, negated numbers of
+        arguments of large applications, and leaves. The leaves are returned
+        apart and are referred to as if they followed the productions."""
+        tokens = []
+        leaves = []
+        offset = _SMALL_PRODUCTION + len(self.productions)
+        n = 0
+        while n < len(data):
+            op = data[n]
+            n += 1
+            if op == _OP_APPLY:
+                arguments, n = _readVarint(data, n)
+                tokens.append(-arguments)
+                continue
+            elif op == _OP_INDEX:
+                i, n = _readVarint(data, n)
+                p = Index(i)
+            elif op == _OP_PRODUCTION:
+                i, n = _readVarint(data, n)
+                p = self.productions[i]
+            elif op == _OP_PRIMITIVE:
+                name, n = _readString(data, n)
+                p = Primitive.GLOBALS[name]
+            elif op == _OP_NAMED_FREE_VARIABLE:
+                name, n = _readString(data, n)
+                p = FreeVariable(name)
+            elif op == _OP_TEXT:
+                text, n = _readString(data, n)
+                p = Program.parse(text)
+            else:
+                tokens.append(op)
+                continue
+            tokens.append(offset + len(leaves))
+            leaves.append(p)
+        return tokens, leaves
+
+
 class Mutator:
     """Perform local mutations to an expr, yielding the expr and the
     description length distance from the original program"""
@@ -1744,7 +2634,8 @@ class EtaExpandFailure(Exception):
 
 
 class EtaLongVisitor(object):
-    """Converts an expression into eta-longform"""
+    """Converts an expression into eta-longform. Its methods are generators
+    run by trampoline, so that deep programs do not overflow the stack."""
 
     def __init__(self, request=None):
         self.request = request
@@ -1761,27 +2652,29 @@ class EtaLongVisitor(object):
             raise EtaExpandFailure()
 
         return Abstraction(
-            e.body.visit(
-                self, request.arguments[1], [request.arguments[0]] + environment
+            (
+                yield e.body.visit(
+                    self, request.arguments[1], [request.arguments[0]] + environment
+                )
             )
         )
 
     def _application(self, e, request, environment):
         l = self.makeLong(e, request)
         if l is not None:
-            return l.visit(self, request, environment)
+            return (yield l.visit(self, request, environment))
 
         f, xs = e.applicationParse()
 
         if f.isIndex:
-            ft = environment[f.i].applyMutable(self.context)
+            ft = environment[f.i].apply(self.context)
         elif f.isInvented or f.isPrimitive:
-            ft = f.tp.instantiateMutable(self.context)
+            _, ft = f.tp.instantiate(self.context)
         else:
             assert False, "Not in beta long form: %s" % e
 
         self.context.unify(request, ft.returns())
-        ft = ft.applyMutable(self.context)
+        ft = ft.apply(self.context)
 
         xt = ft.functionArguments()
         if len(xs) != len(xt):
@@ -1789,8 +2682,8 @@ class EtaLongVisitor(object):
 
         returnValue = f
         for x, t in zip(xs, xt):
-            t = t.applyMutable(self.context)
-            returnValue = Application(returnValue, x.visit(self, t, environment))
+            t = t.apply(self.context)
+            returnValue = Application(returnValue, (yield x.visit(self, t, environment)))
         return returnValue
 
     # This procedure works by recapitulating the generative process
@@ -1814,8 +2707,8 @@ class EtaLongVisitor(object):
         if self.request is None:
             eprint("WARNING: request not specified for etaexpansion")
             self.request = e.infer()
-        self.context = MutableContext()
-        el = e.visit(self, self.request, [])
+        self.context = UnionFindContext()
+        el = trampoline(e.visit(self, self.request, []))
         self.context = None
         # assert el.infer().canonical() == e.infer().canonical(), \
         #     f"Types are not preserved by ETA expansion: {e} : {e.infer().canonical()} vs {el} : {el.infer().canonical()}"
@@ -1823,19 +2716,21 @@ class EtaLongVisitor(object):
 
 
 class StripPrimitiveVisitor:
-    """Replaces all primitives .value's w/ None. Does not destructively modify anything"""
+    """Replaces all primitives .value's w/ None. Does not destructively modify anything.
+    Frontiers go through it on their way to compression, which can make them
+    deep, so its methods are generators run by trampoline."""
 
     def invented(self, e):
-        return Invented(e.body.visit(self))
+        return Invented((yield e.body.visit(self)))
 
     def primitive(self, e):
         return Primitive(e.name, e.tp, None)
 
     def application(self, e):
-        return Application(e.f.visit(self), e.x.visit(self))
+        return Application((yield e.f.visit(self)), (yield e.x.visit(self)))
 
     def abstraction(self, e):
-        return Abstraction(e.body.visit(self))
+        return Abstraction((yield e.body.visit(self)))
 
     def index(self, e):
         return e
@@ -1847,27 +2742,27 @@ class ReplacePrimitiveValueVisitor:
     """
 
     def invented(self, e):
-        return Invented(e.body.visit(self))
+        return Invented((yield e.body.visit(self)))
 
     def primitive(self, e):
         return Primitive(e.name, e.tp, Primitive.GLOBALS[e.name].value)
 
     def application(self, e):
-        return Application(e.f.visit(self), e.x.visit(self))
+        return Application((yield e.f.visit(self)), (yield e.x.visit(self)))
 
     def abstraction(self, e):
-        return Abstraction(e.body.visit(self))
+        return Abstraction((yield e.body.visit(self)))
 
     def index(self, e):
         return e
 
 
 def strip_primitive_values(e):
-    return e.visit(StripPrimitiveVisitor())
+    return trampoline(e.visit(StripPrimitiveVisitor()))
 
 
 def unstrip_primitive_values(e):
-    return e.visit(ReplacePrimitiveValueVisitor())
+    return trampoline(e.visit(ReplacePrimitiveValueVisitor()))
 
 
 # from luke
@@ -1898,34 +2793,116 @@ def untokeniseProgram(l):
     return Program.parse(s)
 
 
-class _Abstraction:
-    def __init__(self, n, body):
-        self.n, self.body = n, body
-
-    def evaluate(self, environment):
-        return lambda *arguments: self.body.evaluate(list(arguments) + environment)
-
+class ProgramCompiler(object):
+    """
+    Compiles programs into nested Python closures, which compute the same as
+    Program.evaluate without walking the tree. The compiled form of a program
+    is a function of its environment, a tuple with the innermost variable
+    first. Compilation resolves once what evaluate decides at every call:
+    - the values of primitives are bound directly;
+    - applications are compiled by their number of arguments;
+    - a fully applied `if` only evaluates the branch it takes;
+    - de Bruijn indices become tuple lookups;
+    - lambdas count their calls against EVALUATION_DEADLINE, so that a
+      program which does not terminate runs out of time.
+    Programs the compiler does not know are handed to evaluate.
+
+    Compiled forms are cached by program, and so by the names of the
+    primitives: a program whose primitives carry other values than the
+    registered ones must be compiled with cache=False.
+    """
 
-class _Apply:
-    def __init__(self, f, *xs):
-        self.f = f
-        self.xs = xs
+    def __init__(self, maximumPrograms=2**14):
+        self.programs = BoundedCache(maximumPrograms)
 
-    def evaluate(self, environment):
-        return self.f.evaluate(environment)(*[x.evaluate(environment) for x in self.xs])
+    def compile(self, p, cache=True):
+        if not cache:
+            return self._compile(p)
+        code = self.programs.get(p)
+        if code is None:
+            code = self.programs[p] = self._compile(p)
+        return code
 
+    def clear(self):
+        self.programs.clear()
 
-def to_fast_program(p):
-    if p.isAbstraction:
-        n = 0
-        while p.isAbstraction:
-            p = p.body
-            n += 1
-        return _Abstraction(n, to_fast_program(p))
-    if p.isApplication:
+    def _compile(self, p):
+        if isinstance(p, Application):
+            return self._application(p)
+        if isinstance(p, Index):
+            return operator.itemgetter(p.i)
+        if isinstance(p, Abstraction):
+            body = self._compile(p.body)
+            deadline = EVALUATION_DEADLINE
+
+            def abstraction(environment):
+                def function(x):
+                    deadline.remaining -= 1
+                    if deadline.remaining < 0:
+                        deadline.tick()
+                    return body((x,) + environment)
+
+                return function
+
+            return abstraction
+        if isinstance(p, Primitive):
+            value = p.value
+            return lambda _: value
+        if isinstance(p, Invented):
+            body = self._compile(p.body)
+            return lambda _: body(())
+        return lambda environment: p.evaluate(list(environment))
+
+    def _application(self, p):
         f, xs = p.applicationParse()
-        return _Apply(to_fast_program(f), *[to_fast_program(x) for x in xs])
-    return p
+        if isinstance(f, Primitive) and f.name == "if" and len(xs) >= 3:
+            branch, yes, no = [self._compile(x) for x in xs[:3]]
+
+            def conditional(environment):
+                if branch(environment):
+                    return yes(environment)
+                return no(environment)
+
+            if len(xs) == 3:
+                return conditional
+            return self._apply(conditional, [self._compile(x) for x in xs[3:]])
+
+        xs = [self._compile(x) for x in xs]
+        if isinstance(f, Primitive):
+            value = f.value
+            if len(xs) == 1:
+                (a,) = xs
+                return lambda environment: value(a(environment))
+            if len(xs) == 2:
+                a, b = xs
+                return lambda environment: value(a(environment))(b(environment))
+            if len(xs) == 3:
+                a, b, c = xs
+                return lambda environment: value(a(environment))(b(environment))(c(environment))
+        return self._apply(self._compile(f), xs)
+
+    @staticmethod
+    def _apply(f, xs):
+        if len(xs) == 1:
+            (a,) = xs
+            return lambda environment: f(environment)(a(environment))
+        if len(xs) == 2:
+            a, b = xs
+            return lambda environment: f(environment)(a(environment))(b(environment))
+        if len(xs) == 3:
+            a, b, c = xs
+            return lambda environment: f(environment)(a(environment))(b(environment))(c(environment))
+
+        def application(environment):
+            y = f(environment)
+            for x in xs:
+                y = y(x(environment))
+            return y
+
+        return application
+
+
+PROGRAM_COMPILER = ProgramCompiler()
 
 
 if __name__ == "__main__":
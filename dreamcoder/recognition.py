@@ -1,6 +1,7 @@
-import redis
 from dreamcoder.enumeration import *
 from dreamcoder.grammar import *
+from dreamcoder.dslRegistry import DSL_REGISTRY
+from dreamcoder.transport import enumerator_transport
 
 # luke
 
@@ -114,56 +115,28 @@ class GrammarNetwork(nn.Module):
         logProductions = self.logProductions(xs)
 
         # uses[b][p] is # uses of primitive p by summary b
-        uses = np.zeros((B, len(self.grammar) + 3))
-        for b, summary in enumerate(summaries):
-            for p, production in enumerate(self.grammar.primitives):
-                uses[b, p] = summary.uses.get(production, 0.0)
-            uses[b, len(self.grammar)] = summary.uses.get(Index(0), 0)
-            uses[b, len(self.grammar) + 1] = summary.uses.get(Abstraction(Hole()), 0)
-            uses[b, len(self.grammar) + 2] = summary.uses.get(FreeVariable(None), 0)
+        batch = SummaryBatch(summaries, ProductionIndex.ofGrammar(self.grammar))
+        uses = batch.useMatrix()
 
         numerator = (
             logProductions * maybe_cuda(torch.from_numpy(uses).float(), use_cuda)
         ).sum(1)
-        numerator += maybe_cuda(
-            torch.tensor([summary.constant for summary in summaries]).float(), use_cuda
-        )
-
-        alternativeSet = {normalizer for s in summaries for normalizer in s.normalizers}
-        alternativeSet = list(alternativeSet)
+        numerator += maybe_cuda(torch.from_numpy(batch.constants).float(), use_cuda)
 
-        mask = np.zeros((len(alternativeSet), len(self.grammar) + 3))
-        for tau in range(len(alternativeSet)):
-            for p, production in enumerate(self.grammar.primitives):
-                mask[tau, p] = (
-                    0.0 if production in alternativeSet[tau] else NEGATIVEINFINITY
-                )
-            mask[tau, len(self.grammar)] = (
-                0.0 if Index(0) in alternativeSet[tau] else NEGATIVEINFINITY
-            )
-            mask[tau, len(self.grammar) + 1] = (
-                0.0 if Abstraction(Hole()) in alternativeSet[tau] else NEGATIVEINFINITY
-            )
-            mask[tau, len(self.grammar) + 2] = (
-                0.0 if FreeVariable(None) in alternativeSet[tau] else NEGATIVEINFINITY
-            )
+        # N[b][tau] is # uses of normalizer tau by summary b
+        N, alternatives = batch.normalizerMatrix()
+        mask = np.where(alternatives, 0.0, NEGATIVEINFINITY)
         mask = maybe_cuda(torch.tensor(mask).float(), use_cuda)
 
         # mask: Rx|G|
         # logProductions: Bx|G|
         # Want: mask + logProductions : BxRx|G| = z
         z = mask.repeat(B, 1, 1) + logProductions.repeat(
-            len(alternativeSet), 1, 1
+            len(mask), 1, 1
         ).transpose(1, 0)
         # z: BxR
         z = torch.logsumexp(z, 2)  # pytorch 1.0 dependency
 
-        # Calculate how many times each normalizer was used
-        N = np.zeros((B, len(alternativeSet)))
-        for b, summary in enumerate(summaries):
-            for tau, alternatives in enumerate(alternativeSet):
-                N[b, tau] = summary.normalizers.get(alternatives, 0.0)
-
         denominator = (maybe_cuda(torch.tensor(N).float(), use_cuda) * z).sum(1)
         return numerator - denominator
 
@@ -243,51 +216,20 @@ class ContextualGrammarNetwork_LowRank(nn.Module):
 
         transitionMatrix = self.transitionMatrix(x)
 
+        index = ProductionIndex.ofGrammar(self.grammar)
         # uses[b][g][p] is # uses of primitive p by summary b for parent g
         uses = np.zeros((B, self.n_grammars, len(self.grammar) + 3))
         for b, summary in enumerate(summaries):
             for e, ss in summary.library.items():
                 for g, s in zip(self.library[e], ss):
                     assert g < self.n_grammars - 2
-                    for p, production in enumerate(self.grammar.primitives):
-                        uses[b, g, p] = s.uses.get(production, 0.0)
-                    uses[b, g, len(self.grammar)] = s.uses.get(Index(0), 0)
-                    uses[b, g, len(self.grammar) + 1] = s.uses.get(
-                        Abstraction(Hole()), 0
-                    )
-                    uses[b, g, len(self.grammar) + 2] = s.uses.get(
-                        FreeVariable(None), 0
-                    )
+                    uses[b, g] = index.useVector(s)
 
             # noParent: this is the last network output
-            for p, production in enumerate(self.grammar.primitives):
-                uses[b, self.n_grammars - 1, p] = summary.noParent.uses.get(
-                    production, 0.0
-                )
-            uses[b, self.n_grammars - 1, G - 3] = summary.noParent.uses.get(
-                Index(0), 0.0
-            )
-            uses[b, self.n_grammars - 1, G - 2] = summary.noParent.uses.get(
-                Abstraction(Hole()), 0.0
-            )
-            uses[b, self.n_grammars - 1, G - 1] = summary.noParent.uses.get(
-                FreeVariable(None), 0.0
-            )
+            uses[b, self.n_grammars - 1] = index.useVector(summary.noParent)
 
             # variableParent: this is the penultimate network output
-            for p, production in enumerate(self.grammar.primitives):
-                uses[b, self.n_grammars - 2, p] = summary.variableParent.uses.get(
-                    production, 0.0
-                )
-            uses[b, self.n_grammars - 2, G - 3] = summary.variableParent.uses.get(
-                Index(0), 0.0
-            )
-            uses[b, self.n_grammars - 2, G - 2] = summary.variableParent.uses.get(
-                Abstraction(Hole()), 0.0
-            )
-            uses[b, self.n_grammars - 2, G - 1] = summary.variableParent.uses.get(
-                FreeVariable(None), 0.0
-            )
+            uses[b, self.n_grammars - 2] = index.useVector(summary.variableParent)
 
         uses = maybe_cuda(torch.tensor(uses).float(), use_cuda)
         numerator = uses.view(B, -1) @ transitionMatrix.view(-1)
@@ -346,51 +288,20 @@ class ContextualGrammarNetwork_LowRank(nn.Module):
 
         # logProductions: Bx n_grammars x G
         logProductions = self.transitionMatrix(xs)
+        index = ProductionIndex.ofGrammar(self.grammar)
         # uses[b][g][p] is # uses of primitive p by summary b for parent g
         uses = np.zeros((B, self.n_grammars, len(self.grammar) + 3))
         for b, summary in enumerate(summaries):
             for e, ss in summary.library.items():
                 for g, s in zip(self.library[e], ss):
                     assert g < self.n_grammars - 2
-                    for p, production in enumerate(self.grammar.primitives):
-                        uses[b, g, p] = s.uses.get(production, 0.0)
-                    uses[b, g, len(self.grammar)] = s.uses.get(Index(0), 0)
-                    uses[b, g, len(self.grammar) + 1] = s.uses.get(
-                        Abstraction(Hole()), 0
-                    )
-                    uses[b, g, len(self.grammar) + 2] = s.uses.get(
-                        FreeVariable(None), 0
-                    )
+                    uses[b, g] = index.useVector(s)
 
             # noParent: this is the last network output
-            for p, production in enumerate(self.grammar.primitives):
-                uses[b, self.n_grammars - 1, p] = summary.noParent.uses.get(
-                    production, 0.0
-                )
-            uses[b, self.n_grammars - 1, G - 3] = summary.noParent.uses.get(
-                Index(0), 0.0
-            )
-            uses[b, self.n_grammars - 1, G - 2] = summary.noParent.uses.get(
-                Abstraction(Hole()), 0.0
-            )
-            uses[b, self.n_grammars - 1, G - 1] = summary.noParent.uses.get(
-                FreeVariable(None), 0.0
-            )
+            uses[b, self.n_grammars - 1] = index.useVector(summary.noParent)
 
             # variableParent: this is the penultimate network output
-            for p, production in enumerate(self.grammar.primitives):
-                uses[b, self.n_grammars - 2, p] = summary.variableParent.uses.get(
-                    production, 0.0
-                )
-            uses[b, self.n_grammars - 2, G - 3] = summary.variableParent.uses.get(
-                Index(0), 0.0
-            )
-            uses[b, self.n_grammars - 2, G - 2] = summary.variableParent.uses.get(
-                Abstraction(Hole()), 0.0
-            )
-            uses[b, self.n_grammars - 2, G - 1] = summary.variableParent.uses.get(
-                FreeVariable(None), 0.0
-            )
+            uses[b, self.n_grammars - 2] = index.useVector(summary.variableParent)
 
         numerator = (
             (logProductions * maybe_cuda(torch.tensor(uses).float(), use_cuda))
@@ -564,51 +475,20 @@ class ContextualGrammarNetwork_Mask(nn.Module):
 
         # logProductions: Bx n_grammars x G
         logProductions = self.transitionMatrix(xs)
+        index = ProductionIndex.ofGrammar(self.grammar)
         # uses[b][g][p] is # uses of primitive p by summary b for parent g
         uses = np.zeros((B, self.n_grammars, len(self.grammar) + 3))
         for b, summary in enumerate(summaries):
             for e, ss in summary.library.items():
                 for g, s in zip(self.library[e], ss):
                     assert g < self.n_grammars - 2
-                    for p, production in enumerate(self.grammar.primitives):
-                        uses[b, g, p] = s.uses.get(production, 0.0)
-                    uses[b, g, len(self.grammar)] = s.uses.get(Index(0), 0)
-                    uses[b, g, len(self.grammar) + 1] = s.uses.get(
-                        Abstraction(Hole()), 0
-                    )
-                    uses[b, g, len(self.grammar) + 2] = s.uses.get(
-                        FreeVariable(None), 0
-                    )
+                    uses[b, g] = index.useVector(s)
 
             # noParent: this is the last network output
-            for p, production in enumerate(self.grammar.primitives):
-                uses[b, self.n_grammars - 1, p] = summary.noParent.uses.get(
-                    production, 0.0
-                )
-            uses[b, self.n_grammars - 1, G - 3] = summary.noParent.uses.get(
-                Index(0), 0.0
-            )
-            uses[b, self.n_grammars - 1, G - 2] = summary.noParent.uses.get(
-                Abstraction(Hole()), 0.0
-            )
-            uses[b, self.n_grammars - 1, G - 1] = summary.noParent.uses.get(
-                FreeVariable(None), 0.0
-            )
+            uses[b, self.n_grammars - 1] = index.useVector(summary.noParent)
 
             # variableParent: this is the penultimate network output
-            for p, production in enumerate(self.grammar.primitives):
-                uses[b, self.n_grammars - 2, p] = summary.variableParent.uses.get(
-                    production, 0.0
-                )
-            uses[b, self.n_grammars - 2, G - 3] = summary.variableParent.uses.get(
-                Index(0), 0.0
-            )
-            uses[b, self.n_grammars - 2, G - 2] = summary.variableParent.uses.get(
-                Abstraction(Hole()), 0.0
-            )
-            uses[b, self.n_grammars - 2, G - 1] = summary.variableParent.uses.get(
-                FreeVariable(None), 0.0
-            )
+            uses[b, self.n_grammars - 2] = index.useVector(summary.variableParent)
 
         numerator = (
             (logProductions * maybe_cuda(torch.tensor(uses).float(), use_cuda))
@@ -766,51 +646,20 @@ class ContextualGrammarNetwork(nn.Module):
 
         # logProductions: Bx n_grammars x G
         logProductions = self.network(xs).view(B, self.n_grammars, G)
+        index = ProductionIndex.ofGrammar(self.grammar)
         # uses[b][g][p] is # uses of primitive p by summary b for parent g
         uses = np.zeros((B, self.n_grammars, len(self.grammar) + 3))
         for b, summary in enumerate(summaries):
             for e, ss in summary.library.items():
                 for g, s in zip(self.library[e], ss):
                     assert g < self.n_grammars - 2
-                    for p, production in enumerate(self.grammar.primitives):
-                        uses[b, g, p] = s.uses.get(production, 0.0)
-                    uses[b, g, len(self.grammar)] = s.uses.get(Index(0), 0)
-                    uses[b, g, len(self.grammar) + 1] = s.uses.get(
-                        Abstraction(Hole()), 0
-                    )
-                    uses[b, g, len(self.grammar) + 2] = s.uses.get(
-                        FreeVariable(None), 0
-                    )
+                    uses[b, g] = index.useVector(s)
 
             # noParent: this is the last network output
-            for p, production in enumerate(self.grammar.primitives):
-                uses[b, self.n_grammars - 1, p] = summary.noParent.uses.get(
-                    production, 0.0
-                )
-            uses[b, self.n_grammars - 1, G - 3] = summary.noParent.uses.get(
-                Index(0), 0.0
-            )
-            uses[b, self.n_grammars - 1, G - 2] = summary.noParent.uses.get(
-                Abstraction(Hole()), 0.0
-            )
-            uses[b, self.n_grammars - 1, G - 1] = summary.noParent.uses.get(
-                FreeVariable(None), 0.0
-            )
+            uses[b, self.n_grammars - 1] = index.useVector(summary.noParent)
 
             # variableParent: this is the penultimate network output
-            for p, production in enumerate(self.grammar.primitives):
-                uses[b, self.n_grammars - 2, p] = summary.variableParent.uses.get(
-                    production, 0.0
-                )
-            uses[b, self.n_grammars - 2, G - 3] = summary.variableParent.uses.get(
-                Index(0), 0.0
-            )
-            uses[b, self.n_grammars - 2, G - 2] = summary.variableParent.uses.get(
-                Abstraction(Hole()), 0.0
-            )
-            uses[b, self.n_grammars - 2, G - 1] = summary.variableParent.uses.get(
-                FreeVariable(None), 0.0
-            )
+            uses[b, self.n_grammars - 2] = index.useVector(summary.variableParent)
 
         numerator = (
             (logProductions * maybe_cuda(torch.tensor(uses).float(), use_cuda))
@@ -1586,12 +1435,13 @@ class RecognitionModel(nn.Module):
         return program, task
 
     def sample_helmholtz_julia(self, requests, N):
-        r = redis.Redis(host="localhost", port=6379, db=0)
+        r = enumerator_transport()
+        dslHash = DSL_REGISTRY.upload(r, [self.generativeModel])[self.generativeModel]
         for _ in range(N):
             request = random.choice(requests)
             message = {
                 "request": str(request),
-                "DSL": self.generativeModel.json(),
+                "DSLHash": dslHash,
                 "max_depth": 3,
                 "max_block_depth": 10,
                 "max_attempts": 100,
@@ -1702,6 +1552,9 @@ class RecognitionModel(nn.Module):
         maximumFrontier=None,
         evaluationTimeout=None,
         type_weights=None,
+        schedulingPolicy="mdl",
+        observationalEquivalence=False,
+        sandboxedEvaluation=False,
     ):
         with timing("Evaluated recognition model"):
             grammars = {task: self.grammarOfTask(task) for task in tasks}
@@ -1722,6 +1575,9 @@ class RecognitionModel(nn.Module):
             maximumFrontier=maximumFrontier,
             evaluationTimeout=evaluationTimeout,
             type_weights=type_weights,
+            schedulingPolicy=schedulingPolicy,
+            observationalEquivalence=observationalEquivalence,
+            sandboxedEvaluation=sandboxedEvaluation,
         )
 
 
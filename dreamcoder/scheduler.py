@@ -0,0 +1,272 @@
+"""
+Scheduling of enumeration jobs onto CPUs.
+
+A job is a set of tasks sharing a grammar and a request type. Each time it is
+launched, a job enumerates the next budget slice lowerBound <= MDL < upperBound.
+Free CPUs first go to jobs that are not running, in the order given by the
+priority policy. CPUs that are still idle then steal the next budget slice of
+the most promising job that is already running. This keeps every core busy
+until the last job runs out of time.
+
+Solvers which keep their search from one budget window to the next, such as
+the best-first enumerator of the python solver, would redo every cheaper
+window in each slice. For them the scheduler is resumable: a job is launched
+once, in a slice which goes through its windows until it runs out of time,
+and its windows are not stolen.
+"""
+
+import math
+
+from dreamcoder.utilities import Stopwatch, eprint, lse
+
+
+class EnumerationJob:
+    def __init__(self, key, tasks):
+        self.key = key
+        self.tasks = tasks
+        # Next unclaimed budget slice starts here
+        self.lowerBound = 0.0
+        # Runs whenever at least one slice of this job is being enumerated
+        self.stopwatch = Stopwatch()
+        self.runningSlices = 0
+        # CPU seconds spent on this job, including solver subprocesses
+        self.cpuSeconds = 0.0
+        self._entropy = None
+
+    @property
+    def grammar(self):
+        return self.key[0]
+
+    @property
+    def request(self):
+        return self.key[1]
+
+    @property
+    def running(self):
+        return self.runningSlices > 0
+
+    @property
+    def entropy(self):
+        if self._entropy is None:
+            self._entropy = grammarEntropy(self.grammar)
+        return self._entropy
+
+
+class EnumerationSlice:
+    def __init__(
+        self,
+        ID,
+        job,
+        CPUs,
+        lowerBound,
+        upperBound,
+        timeout,
+        stolen=False,
+        budgetIncrement=None,
+    ):
+        self.ID = ID
+        self.job = job
+        self.CPUs = CPUs
+        self.lowerBound = lowerBound
+        self.upperBound = upperBound
+        self.timeout = timeout
+        self.stolen = stolen
+        # Width of the budget windows the slice goes through
+        self.budgetIncrement = (
+            upperBound - lowerBound if budgetIncrement is None else budgetIncrement
+        )
+
+
+def grammarEntropy(g):
+    """Entropy of the distribution over productions, as reported for
+    recognition models by RecognitionModel.grammarEntropyOfTask"""
+    g = getattr(g, "noParent", g)
+    logits = [l for l, _, _ in g.productions] + [
+        g.logVariable,
+        g.logLambda,
+        g.logFreeVariable,
+    ]
+    z = lse(logits)
+    return -sum(math.exp(l - z) * (l - z) for l in logits)
+
+
+class SchedulingPolicy:
+    """Jobs with the smallest priority are launched first"""
+
+    def priority(self, job, scheduler):
+        raise NotImplementedError()
+
+
+class LowestMDLBound(SchedulingPolicy):
+    def priority(self, job, scheduler):
+        return job.lowerBound
+
+
+class FewestHits(SchedulingPolicy):
+    def priority(self, job, scheduler):
+        hits = min(scheduler.numberOfHits(t) for t in job.tasks)
+        return (hits, job.lowerBound)
+
+
+class RecognitionEntropy(SchedulingPolicy):
+    """Prefers jobs whose grammar is most confident, which for recognition
+    models means the tasks the network knows the most about"""
+
+    def priority(self, job, scheduler):
+        return (job.entropy, job.lowerBound)
+
+
+SCHEDULINGPOLICIES = {
+    "mdl": LowestMDLBound,
+    "hits": FewestHits,
+    "entropy": RecognitionEntropy,
+}
+
+
+class EnumerationScheduler:
+    def __init__(
+        self,
+        jobs,
+        CPUs,
+        enumerationTimeout,
+        budgetIncrement,
+        _=None,
+        policy="mdl",
+        numberOfHits=None,
+        maximumFrontier=None,
+        testing=False,
+        stealing=True,
+        resumable=False,
+    ):
+        """jobs: map from (grammar, request[, index]) to list of tasks.
+        budgetIncrement: function from lower bound to the width of the next slice.
+        numberOfHits: function from task to how many solutions we have for it.
+        resumable: launch each job once, for all of its budget windows."""
+        self.jobs = {k: EnumerationJob(k, ts) for k, ts in jobs.items()}
+        self.CPUs = CPUs
+        self.enumerationTimeout = enumerationTimeout
+        self.budgetIncrement = budgetIncrement
+        if isinstance(policy, str):
+            assert policy in SCHEDULINGPOLICIES, (
+                "Unknown scheduling policy %s, options are %s"
+                % (policy, ", ".join(SCHEDULINGPOLICIES))
+            )
+            policy = SCHEDULINGPOLICIES[policy]()
+        self.policy = policy
+        self.numberOfHits = numberOfHits or (lambda t: 0)
+        self.maximumFrontier = maximumFrontier
+        self.testing = testing
+        self.stealing = stealing and not resumable
+        self.resumable = resumable
+
+        self.activeCPUs = 0
+        # Map from ID to the slice being enumerated under that ID
+        self.slices = {}
+        self.nextID = 0
+        # Every job that was ever scheduled, for accounting
+        self.allJobs = list(self.jobs.values())
+
+    @property
+    def running(self):
+        return bool(self.slices)
+
+    def unsolved(self, t):
+        return self.maximumFrontier is None or self.numberOfHits(t) < self.maximumFrontier
+
+    def hasTimeLeft(self, job):
+        return job.stopwatch.elapsed < self.enumerationTimeout - 0.5
+
+    def refresh(self):
+        """Drops tasks that are solved or whose job ran out of time"""
+        for k in list(self.jobs.keys()):
+            job = self.jobs[k]
+            job.tasks = [
+                t
+                for t in job.tasks
+                if self.unsolved(t)
+                and job.stopwatch.elapsed <= self.enumerationTimeout
+            ]
+            if not job.tasks:
+                del self.jobs[k]
+
+    def allocateCPUs(self, n, jobs):
+        allocation = {j: 0 for j in jobs}
+        while n > 0:
+            for j in jobs:
+                # During testing we use exactly one CPU per task
+                if self.testing and allocation[j] > 0:
+                    return allocation
+                allocation[j] += 1
+                n -= 1
+                if n == 0:
+                    break
+        return allocation
+
+    def launch(self, job, CPUs, stolen=False):
+        bi = self.budgetIncrement(job.lowerBound)
+        s = EnumerationSlice(
+            self.nextID,
+            job,
+            CPUs,
+            job.lowerBound,
+            math.inf if self.resumable else job.lowerBound + bi,
+            self.enumerationTimeout - job.stopwatch.elapsed,
+            stolen=stolen,
+            budgetIncrement=bi,
+        )
+        self.nextID += 1
+        if not job.running:
+            job.stopwatch.start()
+        job.runningSlices += 1
+        job.lowerBound = s.upperBound
+        self.activeCPUs += CPUs
+        self.slices[s.ID] = s
+        return s
+
+    def schedule(self):
+        """Returns the list of slices that should be launched now"""
+        self.refresh()
+        launched = []
+
+        # Jobs that we are not working on but could be
+        freeJobs = [
+            j
+            for j in self.jobs.values()
+            if not j.running and self.hasTimeLeft(j) and j.lowerBound < math.inf
+        ]
+        if freeJobs and self.activeCPUs < self.CPUs:
+            freeJobs.sort(key=lambda j: self.policy.priority(j, self))
+            allocation = self.allocateCPUs(self.CPUs - self.activeCPUs, freeJobs)
+            for j in freeJobs:
+                if allocation[j] > 0:
+                    launched.append(self.launch(j, allocation[j]))
+
+        # Idle CPUs steal the next budget slice of the most promising running job
+        while self.stealing and self.activeCPUs < self.CPUs:
+            candidates = [
+                j for j in self.jobs.values() if j.running and self.hasTimeLeft(j)
+            ]
+            if not candidates:
+                break
+            j = min(candidates, key=lambda j: self.policy.priority(j, self))
+            launched.append(self.launch(j, 1, stolen=True))
+
+        return launched
+
+    def finished(self, ID, cpuSeconds=0.0):
+        """Marks a slice as done; returns it"""
+        s = self.slices.pop(ID)
+        self.activeCPUs -= s.CPUs
+        s.job.runningSlices -= 1
+        if not s.job.running:
+            s.job.stopwatch.stop()
+        s.job.cpuSeconds += cpuSeconds
+        return s
+
+    def reportCPUTime(self):
+        total = sum(j.cpuSeconds for j in self.allJobs)
+        wall = max((j.stopwatch.elapsed for j in self.allJobs), default=0.0)
+        eprint(
+            "(frontend) Enumeration used %.1f CPU seconds over %d jobs (%.1f wall seconds for the longest job)"
+            % (total, len(self.allJobs), wall)
+        )
@@ -0,0 +1,246 @@
+"""
+Persistent pool of OCaml solver processes.
+
+Launching a fresh `solver` for every budget window pays process startup,
+primitive registration and DSL deserialization each time. Workers in a
+SolverPool are started once as `solver --server` and answer any number of
+requests. Every request and response is framed as the byte length of the
+payload in ASCII followed by a newline and then the JSON payload itself.
+
+A request with "stream" set makes the worker send a {"hit": ...} frame for
+each solution as soon as it is found, before the final response.
+
+Workers cache deserialized DSLs by their "DSLHash", so a DSL is only sent to
+a worker the first time it is needed. Once a worker holds DSL_CACHE_SIZE
+DSLs and a new one arrives, it forgets all of them. The pool mirrors this
+rule to know which DSLs each worker has.
+"""
+
+import json
+import multiprocessing
+import os
+import signal
+import subprocess
+
+from dreamcoder.utilities import eprint, get_root_dir
+
+DSL_CACHE_SIZE = 16
+
+
+class SolverWorkerError(Exception):
+    pass
+
+
+class SolverWorker:
+    def __init__(self, command):
+        self.command = command
+        self.process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+        # Number of requests that have been answered by this worker
+        self.requests = 0
+        # Set by the frontend when it wants the current request abandoned
+        self._cancellation = multiprocessing.Event()
+        # Hashes of the DSLs held in the worker's cache
+        self.knownDSLs = set()
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def send(self, payload):
+        header = b"%d\n" % len(payload)
+        try:
+            self.process.stdin.write(header + payload)
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise SolverWorkerError("could not write to solver worker: %s" % e)
+
+    def receive(self):
+        header = self.process.stdout.readline()
+        if not header:
+            raise SolverWorkerError(
+                "solver worker exited with code %s" % self.process.poll()
+            )
+        try:
+            size = int(header)
+        except ValueError:
+            raise SolverWorkerError("malformed frame header %r" % header)
+        payload = self.process.stdout.read(size)
+        if len(payload) != size:
+            raise SolverWorkerError(
+                "truncated frame: expected %d bytes, got %d" % (size, len(payload))
+            )
+        return payload
+
+    def request(self, message, onHit=None):
+        """Sends a JSON message and returns the decoded response.
+        Streamed hits are passed to `onHit` as they arrive.
+        Any failure leaves the worker killed, so that its owner recycles it."""
+        try:
+            self.send(bytes(message, encoding="utf-8"))
+            while True:
+                response = json.loads(self.receive().decode("utf-8"))
+                if "hit" not in response:
+                    break
+                if onHit is not None:
+                    onHit(response["hit"])
+        except SolverWorkerError:
+            self.kill()
+            raise
+        except ValueError as e:
+            self.kill()
+            raise SolverWorkerError("could not decode solver response: %s" % e)
+        if "error" in response:
+            self.kill()
+            raise SolverWorkerError(response["error"])
+        return response
+
+    def knowsDSL(self, h):
+        return h in self.knownDSLs
+
+    def rememberDSL(self, h):
+        """Records that the worker was sent the DSL with hash `h`,
+        following the same eviction rule as the worker"""
+        if h not in self.knownDSLs and len(self.knownDSLs) >= DSL_CACHE_SIZE:
+            self.knownDSLs.clear()
+        self.knownDSLs.add(h)
+
+    @property
+    def cancelled(self):
+        return self._cancellation.is_set()
+
+    def cancel(self):
+        """Abandons the request in flight. The job using this worker sees it
+        die, and the pool replaces it once the job is released."""
+        self._cancellation.set()
+        self.kill()
+
+    def residentMemory(self):
+        """Resident set size in bytes, or None if it cannot be determined"""
+        try:
+            with open("/proc/%d/statm" % self.pid) as handle:
+                return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def cpuTime(self):
+        """CPU seconds used by the worker and its finished children"""
+        try:
+            with open("/proc/%d/stat" % self.pid) as handle:
+                # The command name may contain spaces, so split after it
+                fields = handle.read().rsplit(")", 1)[1].split()
+            ticks = sum(int(x) for x in fields[11:15])
+            return ticks / os.sysconf("SC_CLK_TCK")
+        except (OSError, ValueError, IndexError):
+            return 0.0
+
+    def kill(self):
+        # Jobs run in forked children, where Popen believes the worker has
+        # already exited, so signal it directly. Waiting from such a child is
+        # harmless: the worker is only reaped by the process that started it.
+        if self.process.returncode is None:
+            try:
+                os.kill(self.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.process.wait()
+
+    def close(self):
+        if self.alive:
+            try:
+                self.process.stdin.close()
+                self.process.wait(5)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        self.kill()
+
+
+class SolverPool:
+    """Keeps up to `maximumWorkers` idle solver processes alive between jobs.
+
+    Workers are leased by the frontend before a job is launched and released
+    once the job reports back. A released worker is replaced if it died, has
+    served `maximumRequests` requests, or grew beyond `maximumMemory` bytes."""
+
+    def __init__(
+        self,
+        maximumWorkers=1,
+        maximumRequests=None,
+        maximumMemory=None,
+        command=None,
+    ):
+        self.maximumWorkers = maximumWorkers
+        self.maximumRequests = maximumRequests
+        self.maximumMemory = maximumMemory
+        self.command = command or [os.path.join(get_root_dir(), "solver"), "--server"]
+        self.idle = []
+        self.leased = set()
+        self.recycled = 0
+
+    def lease(self):
+        while self.idle:
+            worker = self.idle.pop()
+            if worker.alive:
+                break
+            self.recycled += 1
+        else:
+            worker = SolverWorker(self.command)
+        self.leased.add(worker)
+        return worker
+
+    def needsRecycling(self, worker):
+        if not worker.alive:
+            return True
+        if self.maximumRequests is not None and worker.requests >= self.maximumRequests:
+            return True
+        if self.maximumMemory is not None:
+            memory = worker.residentMemory()
+            if memory is not None and memory > self.maximumMemory:
+                return True
+        return False
+
+    def release(self, worker, dslHash=None):
+        """dslHash: hash of the DSL that the worker was asked to enumerate from"""
+        self.leased.discard(worker)
+        # Jobs run in forked children, so the bookkeeping is kept on this side
+        worker.requests += 1
+        if dslHash is not None:
+            worker.rememberDSL(dslHash)
+        if self.needsRecycling(worker):
+            eprint("(frontend) Recycling solver worker %d" % worker.pid)
+            self.recycled += 1
+            worker.close()
+        elif len(self.idle) >= self.maximumWorkers:
+            worker.close()
+        else:
+            self.idle.append(worker)
+
+    def close(self):
+        for worker in self.idle + list(self.leased):
+            worker.close()
+        self.idle = []
+        self.leased = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+_ACTIVE_POOL = None
+
+
+def active_solver_pool():
+    return _ACTIVE_POOL
+
+
+def set_active_solver_pool(pool):
+    global _ACTIVE_POOL
+    _ACTIVE_POOL = pool
@@ -1,14 +1,8 @@
 from dreamcoder.program import *
 from dreamcoder.differentiation import *
-
-import signal
-
-
-class EvaluationTimeout(Exception):
-    pass
-
-
-EVALUATIONTABLE = {}
+from dreamcoder.evaluationCache import EVALUATION_CACHE
+from dreamcoder.type import TYPE_INTERNER
+from dreamcoder.evaluationDeadline import EVALUATION_DEADLINE, EvaluationTimeout
 
 
 class Task(object):
@@ -21,7 +15,8 @@ class Task(object):
         features: list of floats."""
         self.cache = cache
         self.features = features
-        self.request = request
+        # Requests key jobs, frontiers and likelihood caches
+        self.request = TYPE_INTERNER.internFaithfully(request)
         self.name = name
         self.examples = examples
         self.test_examples = test_examples
@@ -71,51 +66,45 @@ class Task(object):
         return self.supervisedSolution
 
     def check(self, e, timeout=None):
-        if timeout is not None:
-
-            def timeoutCallBack(_1, _2):
-                raise EvaluationTimeout()
+        # The timeout covers evaluating the program on all of the examples
+        try:
+            with EVALUATION_DEADLINE.batch(timeout) as deadline:
+                deadline.start()
+                return self._check(e)
+        except EvaluationTimeout:
+            eprint("Timed out while evaluating", e)
+            return False
 
+    def _check(self, e):
         try:
-            signal.signal(signal.SIGVTALRM, timeoutCallBack)
-            signal.setitimer(signal.ITIMER_VIRTUAL, timeout)
+            f = e.evaluateCompiled()
+        except IndexError:
+            # free variable
+            return False
+        except EvaluationTimeout:
+            raise
+        except Exception as exception:
+            eprint("Exception during evaluation:", exception)
+            return False
 
-            try:
-                f = e.evaluate([])
-            except IndexError:
-                # free variable
-                return False
-            except Exception as e:
-                eprint("Exception during evaluation:", e)
+        program = EVALUATION_CACHE.programKey(e) if self.cache else None
+        for x, y in self.examples:
+            correct = EVALUATION_CACHE.verdict(program, x, y) if self.cache else None
+            if correct is None:
+                try:
+                    p = self.predict(f, x)
+                except EvaluationTimeout:
+                    raise
+                except BaseException:
+                    p = None
+                if self.cache:
+                    correct = EVALUATION_CACHE.record(program, x, y, p)
+                else:
+                    correct = not (p != y)
+            if not correct:
                 return False
 
-            for x, y in self.examples:
-                if self.cache and (x, e) in EVALUATIONTABLE:
-                    p = EVALUATIONTABLE[(x, e)]
-                else:
-                    try:
-                        p = self.predict(f, x)
-                    except BaseException:
-                        p = None
-                    if self.cache:
-                        EVALUATIONTABLE[(x, e)] = p
-                if p != y:
-                    if timeout is not None:
-                        signal.signal(signal.SIGVTALRM, lambda *_: None)
-                        signal.setitimer(signal.ITIMER_VIRTUAL, 0)
-                    return False
-
-            return True
-        # except e:
-        # eprint(e)
-        # assert(False)
-        except EvaluationTimeout:
-            eprint("Timed out while evaluating", e)
-            return False
-        finally:
-            if timeout is not None:
-                signal.signal(signal.SIGVTALRM, lambda *_: None)
-                signal.setitimer(signal.ITIMER_VIRTUAL, 0)
+        return True
 
     def logLikelihood(self, e, timeout=None):
         if self.check(e, timeout):
@@ -148,6 +137,122 @@ class Task(object):
         }
 
 
+# Stands for the output of a program that ran out of time on an input
+TIMED_OUT = object()
+
+
+class TaskBatch:
+    """Checks programs against many tasks at once.
+
+    A program is evaluated once, on each distinct input among the examples of
+    the tasks, and the tasks it solves are looked up in an index from the
+    outputs they expect to the tasks. Tasks which are checked in their own
+    way, or whose inputs cannot be hashed, are checked one at a time."""
+
+    def __init__(self, tasks):
+        self.tasks = list(tasks)
+        self.inputs = []
+        positions = {}
+        # positions of the inputs of the examples -> expected outputs -> tasks
+        self.index = {}
+        # (positions, task) for tasks whose expected outputs cannot be hashed
+        self.unindexed = []
+        self.fallback = set()
+        for task in self.tasks:
+            keys = [fingerprintValue(xs) for xs, _ in task.examples]
+            if not TaskBatch.batchable(task) or any(k is None for k in keys):
+                self.fallback.add(task)
+                continue
+            for k, (xs, _) in zip(keys, task.examples):
+                if k not in positions:
+                    positions[k] = len(self.inputs)
+                    self.inputs.append(xs)
+            ps = tuple(positions[k] for k in keys)
+            signature = tuple(fingerprintValue(y) for _, y in task.examples)
+            if any(y is None for y in signature):
+                self.unindexed.append((ps, task))
+            else:
+                self.index.setdefault(ps, {}).setdefault(signature, []).append(task)
+
+    @staticmethod
+    def batchable(task):
+        cls = type(task)
+        return (
+            cls.check is Task.check
+            and cls.logLikelihood is Task.logLikelihood
+            and cls.predict is Task.predict
+        )
+
+    def outputs(self, e, timeout=None):
+        """Outputs of the program on each distinct input, or None if it cannot
+        be evaluated. As in Task.check, an input on which the program raises
+        gives None. An input on which it runs out of time gives TIMED_OUT, and
+        each input has its own timeout."""
+        with EVALUATION_DEADLINE.batch(timeout) as deadline:
+            try:
+                deadline.start()
+                f = e.evaluateCompiled()
+            except Exception:
+                return None
+            outputs = []
+            for xs in self.inputs:
+                try:
+                    deadline.start()
+                    y = f
+                    for x in xs:
+                        y = y(x)
+                    deadline.stop()
+                except EvaluationTimeout:
+                    y = TIMED_OUT
+                except Exception:
+                    y = None
+                outputs.append(y)
+            return outputs
+
+    def solved(self, e, timeout=None):
+        """The set of batched tasks which the program solves"""
+        if not self.index and not self.unindexed:
+            return set()
+        return self.solvedBy(self.outputs(e, timeout))
+
+    def solvedBy(self, outputs):
+        """The set of batched tasks solved by a program with these outputs,
+        as given by TaskBatch.outputs"""
+        solved = set()
+        if outputs is None:
+            return solved
+
+        def matches(ps, task):
+            return not any(outputs[p] != y for p, (_, y) in zip(ps, task.examples))
+
+        keys = [fingerprintValue(y) for y in outputs]
+        for ps, tasks in self.index.items():
+            signature = tuple(keys[p] for p in ps)
+            if any(k is None for k in signature):
+                # Outputs which cannot be hashed are compared the slow way
+                for ts in tasks.values():
+                    solved.update(t for t in ts if matches(ps, t))
+            else:
+                solved.update(tasks.get(signature, ()))
+        solved.update(t for ps, t in self.unindexed if matches(ps, t))
+        return solved
+
+    def logLikelihoods(self, e, timeout=None, solved=None):
+        """Log likelihood of the program for each task, as Task.logLikelihood
+        would give it. solved: the batched tasks which the program solves, if
+        they are already known"""
+        if solved is None:
+            solved = self.solved(e, timeout)
+        return [
+            (
+                task.logLikelihood(e, timeout)
+                if task in self.fallback
+                else 0.0 if task in solved else NEGATIVEINFINITY
+            )
+            for task in self.tasks
+        ]
+
+
 class DifferentiableTask(Task):
     def __init__(
         self,
@@ -214,7 +319,8 @@ class DifferentiableTask(Task):
             and len(parameters) > self.actualParameters
         ):
             return NEGATIVEINFINITY
-        f = e.evaluate([])
+        # The placeholders are fresh on every call, so the compiled form is not cached
+        f = e.evaluateCompiled(cache=False)
 
         loss = sum(
             self.loss(self.predict(f, xs), y) for xs, y in self.examples
@@ -257,7 +363,7 @@ class NamedVarsTask(Task):
         specialTask=None,
     ):
         self.name = name
-        self.request = request
+        self.request = TYPE_INTERNER.internFaithfully(request)
         self.examples = examples
         self.features = features
         self.cache = cache
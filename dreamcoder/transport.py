@@ -0,0 +1,378 @@
+"""
+Transports between the frontend and the Julia enumerator service.
+
+The service reads task messages from the "tasks" and "sample" queues and
+commands from "commands". It answers on "results" and "sample_result". DSLs
+are stored under "dsl:<hash>", and each worker keeps the message it is working
+on under "processing:<pid>".
+
+Every transport exposes the subset of the redis API used by the frontend:
+rpush, blpop, llen, set, get and delete. Values are returned as bytes.
+
+- RedisTransport talks to a redis server.
+- UnixSocketTransport talks to a UnixSocketBroker, which the frontend runs on
+  a thread, so single-host runs do not need a redis server.
+- InMemoryTransport keeps everything in this process. It backs the broker and
+  the tests.
+"""
+
+import collections
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+
+QUEUES = ("tasks", "results", "sample", "sample_result", "commands")
+KEY_PREFIXES = ("dsl:", "processing:")
+
+
+def _encode(value):
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode("utf-8")
+    return str(value).encode("utf-8")
+
+
+def _decode(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class Transport:
+    def rpush(self, queue, *messages):
+        raise NotImplementedError()
+
+    def blpop(self, queues, timeout=0):
+        """Returns (queue, message) from the first nonempty queue among
+        `queues`, or None once `timeout` seconds pass. A timeout of 0 waits
+        forever."""
+        raise NotImplementedError()
+
+    def llen(self, queue):
+        raise NotImplementedError()
+
+    def set(self, key, value):
+        raise NotImplementedError()
+
+    def get(self, key):
+        raise NotImplementedError()
+
+    def delete(self, *keys):
+        raise NotImplementedError()
+
+    def keys(self, prefix):
+        raise NotImplementedError()
+
+    def reset(self):
+        """Forgets the state of previous runs of the enumerator service,
+        leaving anything else stored alongside it alone"""
+        stale = list(QUEUES)
+        for prefix in KEY_PREFIXES:
+            stale.extend(self.keys(prefix))
+        if stale:
+            self.delete(*stale)
+
+    def close(self):
+        pass
+
+
+class InMemoryTransport(Transport):
+    """Thread-safe queues and keys living in this process"""
+
+    def __init__(self):
+        self.changed = threading.Condition()
+        self.lists = collections.defaultdict(collections.deque)
+        self.values = {}
+
+    def rpush(self, queue, *messages):
+        with self.changed:
+            q = self.lists[queue]
+            q.extend(_encode(m) for m in messages)
+            self.changed.notify_all()
+            return len(q)
+
+    def lpop(self, queue):
+        with self.changed:
+            q = self.lists.get(queue)
+            return q.popleft() if q else None
+
+    def blpop(self, queues, timeout=0):
+        if isinstance(queues, (str, bytes)):
+            queues = [queues]
+        deadline = None if not timeout else time.monotonic() + timeout
+        with self.changed:
+            while True:
+                for queue in queues:
+                    q = self.lists.get(queue)
+                    if q:
+                        return _encode(queue), q.popleft()
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.changed.wait(remaining)
+
+    def llen(self, queue):
+        with self.changed:
+            return len(self.lists.get(queue, ()))
+
+    def set(self, key, value):
+        with self.changed:
+            self.values[key] = _encode(value)
+            return True
+
+    def get(self, key):
+        with self.changed:
+            return self.values.get(key)
+
+    def delete(self, *keys):
+        with self.changed:
+            deleted = 0
+            for key in keys:
+                deleted += self.lists.pop(key, None) is not None
+                deleted += self.values.pop(key, None) is not None
+            return deleted
+
+    def keys(self, prefix):
+        with self.changed:
+            keys = list(self.lists) + list(self.values)
+            return [k for k in keys if k.startswith(prefix)]
+
+
+class RedisTransport(Transport):
+    def __init__(self, host="localhost", port=6379, db=0):
+        import redis
+
+        self.connection = redis.Redis(host=host, port=port, db=db)
+
+    def rpush(self, queue, *messages):
+        return self.connection.rpush(queue, *messages)
+
+    def blpop(self, queues, timeout=0):
+        return self.connection.blpop(queues, timeout)
+
+    def llen(self, queue):
+        return self.connection.llen(queue)
+
+    def set(self, key, value):
+        return self.connection.set(key, value)
+
+    def get(self, key):
+        return self.connection.get(key)
+
+    def delete(self, *keys):
+        return self.connection.delete(*keys)
+
+    def keys(self, prefix):
+        return [_decode(k) for k in self.connection.scan_iter(match=prefix + "*")]
+
+    def close(self):
+        self.connection.close()
+
+
+# Messages on the socket are lists of byte strings. A list is sent as its
+# length in ASCII and a newline, followed by each element framed the same way
+# as solver messages: its byte length, a newline, and the bytes themselves.
+# Requests are a command followed by its arguments. Replies start with "OK"
+# followed by the results, or with "ERR" followed by a description.
+
+
+def write_message(stream, parts):
+    chunks = [b"%d\n" % len(parts)]
+    for part in parts:
+        part = _encode(part)
+        chunks.append(b"%d\n" % len(part))
+        chunks.append(part)
+    stream.write(b"".join(chunks))
+    stream.flush()
+
+
+def read_message(stream):
+    """Returns None once the other side has hung up"""
+    header = stream.readline()
+    if not header:
+        return None
+    parts = []
+    for _ in range(int(header)):
+        size = int(stream.readline())
+        part = stream.read(size)
+        if len(part) != size:
+            raise EOFError("truncated message")
+        parts.append(part)
+    return parts
+
+
+class UnixSocketBroker:
+    """Serves an InMemoryTransport to the enumerator service over a Unix
+    domain socket, one thread per connection"""
+
+    def __init__(self, path=None):
+        if path is None:
+            self.directory = tempfile.TemporaryDirectory(prefix="enumerator")
+            path = os.path.join(self.directory.name, "broker.sock")
+        else:
+            self.directory = None
+        self.path = path
+        self.store = InMemoryTransport()
+        store = self.store
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                while True:
+                    try:
+                        request = read_message(self.rfile)
+                    except (EOFError, ValueError, OSError):
+                        return
+                    if request is None:
+                        return
+                    try:
+                        reply = [b"OK"] + UnixSocketBroker.execute(store, request)
+                    except Exception as e:
+                        reply = [b"ERR", str(e)]
+                    try:
+                        write_message(self.wfile, reply)
+                    except OSError:
+                        return
+
+        self.server = socketserver.ThreadingUnixStreamServer(path, Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @staticmethod
+    def execute(store, request):
+        command = request[0].decode("utf-8").upper()
+        arguments = request[1:]
+        if command == "RPUSH":
+            return [b"%d" % store.rpush(_decode(arguments[0]), *arguments[1:])]
+        if command == "BLPOP":
+            popped = store.blpop(
+                [_decode(q) for q in arguments[1:]], float(arguments[0])
+            )
+            return [] if popped is None else list(popped)
+        if command == "RPUSHDEL":
+            # Answers a task and forgets that it was being processed, atomically
+            queue, message, key = arguments
+            with store.changed:
+                store.delete(_decode(key))
+                return [b"%d" % store.rpush(_decode(queue), message)]
+        if command == "LLEN":
+            return [b"%d" % store.llen(_decode(arguments[0]))]
+        if command == "SET":
+            store.set(_decode(arguments[0]), arguments[1])
+            return []
+        if command == "GET":
+            value = store.get(_decode(arguments[0]))
+            return [] if value is None else [value]
+        if command == "DEL":
+            return [b"%d" % store.delete(*[_decode(k) for k in arguments])]
+        if command == "KEYS":
+            return [_encode(k) for k in store.keys(_decode(arguments[0]))]
+        raise ValueError("unknown command %s" % command)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.directory is not None:
+            self.directory.cleanup()
+        elif os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class UnixSocketTransport(Transport):
+    """Client of a UnixSocketBroker. Each thread gets its own connection, so
+    a thread blocked in blpop does not hold up the others."""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def _stream(self):
+        stream = getattr(self.local, "stream", None)
+        if stream is None:
+            s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            s.connect(self.path)
+            stream = s.makefile("rwb")
+            self.local.stream = stream
+            with self.lock:
+                self.connections.append((s, stream))
+        return stream
+
+    def call(self, *request):
+        stream = self._stream()
+        write_message(stream, request)
+        reply = read_message(stream)
+        if reply is None:
+            raise ConnectionError("enumerator broker hung up")
+        if reply[0] != b"OK":
+            raise RuntimeError(
+                "enumerator broker error: %s" % b" ".join(reply[1:]).decode("utf-8")
+            )
+        return reply[1:]
+
+    def rpush(self, queue, *messages):
+        return int(self.call("RPUSH", queue, *messages)[0])
+
+    def blpop(self, queues, timeout=0):
+        if isinstance(queues, (str, bytes)):
+            queues = [queues]
+        reply = self.call("BLPOP", str(timeout), *queues)
+        return tuple(reply) if reply else None
+
+    def llen(self, queue):
+        return int(self.call("LLEN", queue)[0])
+
+    def set(self, key, value):
+        self.call("SET", key, value)
+        return True
+
+    def get(self, key):
+        reply = self.call("GET", key)
+        return reply[0] if reply else None
+
+    def delete(self, *keys):
+        return int(self.call("DEL", *keys)[0])
+
+    def keys(self, prefix):
+        return [_decode(k) for k in self.call("KEYS", prefix)]
+
+    def close(self):
+        with self.lock:
+            for s, stream in self.connections:
+                try:
+                    stream.close()
+                    s.close()
+                except OSError:
+                    pass
+            self.connections = []
+        self.local = threading.local()
+
+
+_ACTIVE_TRANSPORT = None
+
+
+def enumerator_transport():
+    """The transport to the running enumerator service, by default redis on
+    localhost"""
+    global _ACTIVE_TRANSPORT
+    if _ACTIVE_TRANSPORT is None:
+        _ACTIVE_TRANSPORT = RedisTransport()
+    return _ACTIVE_TRANSPORT
+
+
+def set_enumerator_transport(transport):
+    global _ACTIVE_TRANSPORT
+    _ACTIVE_TRANSPORT = transport
@@ -1,7 +1,8 @@
 import re
+import weakref
 from typing import Dict
 
-from dreamcoder.utilities import ParseFailure
+from dreamcoder.utilities import BoundedCache, ParseFailure
 
 
 class UnificationFailure(Exception):
@@ -13,12 +14,45 @@ class Occurs(UnificationFailure):
 
 
 class Type(object):
+    __slots__ = ()
+
+    interned = False
+
     def __str__(self):
         return self.show(True)
 
     def __repr__(self):
         return str(self)
 
+    def intern(self):
+        """The hash-consed copy of this type, see TypeInterner"""
+        return TYPE_INTERNER.intern(self)
+
+    # Interned types are never rebuilt, so they remember what they derive.
+    # Their canonicalForm and decomposition slots are set by the interner.
+
+    def internedCanonical(self):
+        form = self.canonicalForm
+        if form is None:
+            form = self.canonicalForm = TYPE_INTERNER.intern(self.canonical({}))
+        return form
+
+    def internedDecomposition(self):
+        """The function arguments and the return type of an interned type"""
+        decomposition = self.decomposition
+        if decomposition is None:
+            arguments = []
+            t = self
+            while t.isArrow():
+                if isinstance(t, TypeNamedArgsConstructor):
+                    arguments.extend(t.arguments.items())
+                    t = t.output
+                else:
+                    arguments.append(t.arguments[0])
+                    t = t.arguments[1]
+            decomposition = self.decomposition = (tuple(arguments), t)
+        return decomposition
+
     @staticmethod
     def fromjson(j):
         if "index" in j:
@@ -102,6 +136,15 @@ class Type(object):
 
     @classmethod
     def fromstring(cls, s):
+        """Types are parsed once per string and interned, see
+        TypeInterner.internFaithfully"""
+        t = TYPE_STRINGS.get(s)
+        if t is None:
+            t = TYPE_STRINGS[s] = TYPE_INTERNER.internFaithfully(cls._parse(s))
+        return t
+
+    @classmethod
+    def _parse(cls, s):
         exp = cls._parse_type_expression(s)
 
         def p(e):
@@ -127,28 +170,55 @@ class Type(object):
 
 
 class TypeConstructor(Type):
+    __slots__ = (
+        "name",
+        "arguments",
+        "isPolymorphic",
+        "hashCode",
+        "interned",
+        "canonicalForm",
+        "decomposition",
+        "__weakref__",
+    )
+
     def __init__(self, name, arguments):
         self.name = name
         self.arguments = arguments
         self.isPolymorphic = any(a.isPolymorphic for a in arguments)
+        self.interned = False
 
     def free_type_variables(self):
         return {fv for t in self.arguments for fv in t.free_type_variables() }
 
     def makeDummyMonomorphic(self, mapping=None):
+        if not self.isPolymorphic:
+            return self
         mapping = mapping if mapping is not None else {}
         return TypeConstructor(self.name, [a.makeDummyMonomorphic(mapping) for a in self.arguments])
 
     def __eq__(self, other):
-        return (
-            isinstance(other, TypeConstructor)
-            and self.name == other.name
-            and all(x == y for x, y in zip(self.arguments, other.arguments))
-        )
+        if self is other:
+            return True
+        if not isinstance(other, TypeConstructor):
+            return False
+        if self.interned and other.interned:
+            return False
+        return self.name == other.name and all(x == y for x, y in zip(self.arguments, other.arguments))
 
     def __hash__(self):
+        if self.interned:
+            return self.hashCode
         return hash((self.name,) + tuple(self.arguments))
 
+    def __getstate__(self):
+        return (self.name, self.arguments)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # backward compatibility
+            state = (state["name"], state["arguments"])
+        TypeConstructor.__init__(self, *state)
+
     def __ne__(self, other):
         return not (self == other)
 
@@ -170,12 +240,16 @@ class TypeConstructor(Type):
         return self.name == ARROW
 
     def functionArguments(self):
+        if self.interned:
+            return list(self.internedDecomposition()[0])
         if self.name == ARROW:
             xs = self.arguments[1].functionArguments()
             return [self.arguments[0]] + xs
         return []
 
     def returns(self):
+        if self.interned:
+            return self.internedDecomposition()[1]
         if self.name == ARROW:
             return self.arguments[1].returns()
         else:
@@ -222,18 +296,35 @@ class TypeConstructor(Type):
         if not self.isPolymorphic:
             return self
         if bindings is None:
+            if self.interned:
+                return self.internedCanonical()
             bindings = {}
         return TypeConstructor(self.name, [x.canonical(bindings) for x in self.arguments])
 
 
 class TypeNamedArgsConstructor(Type):
+    __slots__ = (
+        "name",
+        "arguments",
+        "output",
+        "isPolymorphic",
+        "hashCode",
+        "interned",
+        "canonicalForm",
+        "decomposition",
+        "__weakref__",
+    )
+
     def __init__(self, name, arguments: Dict[str, Type], output: Type):
         self.name = name
         self.arguments = arguments
         self.output = output
         self.isPolymorphic = any(a.isPolymorphic for a in arguments.values()) or output.isPolymorphic
+        self.interned = False
 
     def makeDummyMonomorphic(self, mapping=None):
+        if not self.isPolymorphic:
+            return self
         mapping = mapping if mapping is not None else {}
         return TypeNamedArgsConstructor(
             self.name,
@@ -242,16 +333,32 @@ class TypeNamedArgsConstructor(Type):
         )
 
     def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, TypeNamedArgsConstructor):
+            return False
+        if self.interned and other.interned:
+            return False
         return (
-            isinstance(other, TypeNamedArgsConstructor)
-            and self.name == other.name
+            self.name == other.name
             and all(x == other.arguments[k] for k, x in self.arguments.items())
             and self.output == other.output
         )
 
     def __hash__(self):
+        if self.interned:
+            return self.hashCode
         return hash((self.name,) + tuple(self.arguments.items()) + (self.output,))
 
+    def __getstate__(self):
+        return (self.name, self.arguments, self.output)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # backward compatibility
+            state = (state["name"], state["arguments"], state["output"])
+        TypeNamedArgsConstructor.__init__(self, *state)
+
     def __ne__(self, other):
         return not (self == other)
 
@@ -279,12 +386,16 @@ class TypeNamedArgsConstructor(Type):
         return self.name == ARROW
 
     def functionArguments(self):
+        if self.interned:
+            return list(self.internedDecomposition()[0])
         if self.name == ARROW:
             xs = self.output.functionArguments()
             return list(self.arguments.items()) + xs
         return []
 
     def returns(self):
+        if self.interned:
+            return self.internedDecomposition()[1]
         if self.name == ARROW:
             return self.output.returns()
         else:
@@ -343,6 +454,8 @@ class TypeNamedArgsConstructor(Type):
         if not self.isPolymorphic:
             return self
         if bindings is None:
+            if self.interned:
+                return self.internedCanonical()
             bindings = {}
         return TypeNamedArgsConstructor(
             self.name, {k: x.canonical(bindings) for k, x in self.arguments.items()}, self.output.canonical(bindings)
@@ -350,10 +463,23 @@ class TypeNamedArgsConstructor(Type):
 
 
 class TypeVariable(Type):
+    __slots__ = ("v",)
+
+    isPolymorphic = True
+
     def __init__(self, j):
         assert isinstance(j, int)
         self.v = j
-        self.isPolymorphic = True
+
+    def __getstate__(self):
+        return (self.v,)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # backward compatibility
+            self.v = state["v"]
+        else:
+            (self.v,) = state
 
     def free_type_variables(self):
         return {self.v}
@@ -389,10 +515,7 @@ class TypeVariable(Type):
         return []
 
     def apply(self, context):
-        for v, t in context.substitution:
-            if v == self.v:
-                return t.apply(context)
-        return self
+        return context.resolve(self)
 
     def applyMutable(self, context):
         s = context.substitution[self.v]
@@ -410,9 +533,8 @@ class TypeVariable(Type):
             bindings = {}
         if self.v in bindings:
             return (context, bindings[self.v])
-        new = TypeVariable(context.nextVariable)
+        context, new = context.makeVariable()
         bindings[self.v] = new
-        context = Context(context.nextVariable + 1, context.substitution)
         return (context, new)
 
     def instantiateMutable(self, context, bindings=None):
@@ -437,6 +559,80 @@ class TypeVariable(Type):
         return TypeVariable(-1 - self.v)
 
 
+class TypeInterner(object):
+    """
+    Hash-consing of types. Interned types that are equal are the same object,
+    so two interned constructors compare in O(1) and carry a precomputed hash.
+    Constructors are held weakly and leave the table when no longer used.
+    There is a single interner per process, TYPE_INTERNER: interned types
+    from two different interners would compare unequal.
+    """
+
+    def __init__(self):
+        self.variables = {}
+        self.constructors = weakref.WeakValueDictionary()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.variables) + len(self.constructors)
+
+    def intern(self, t):
+        if t.interned:
+            self.hits += 1
+            return t
+        if isinstance(t, TypeVariable):
+            return self.variables.setdefault(t.v, t)
+        if isinstance(t, TypeConstructor):
+            arguments = [self.intern(a) for a in t.arguments]
+            key = (t.name,) + tuple(id(a) for a in arguments)
+            build = lambda: TypeConstructor(t.name, arguments)
+            same = all(a is b for a, b in zip(arguments, t.arguments))
+        elif isinstance(t, TypeNamedArgsConstructor):
+            # Equality ignores the order of the named arguments
+            arguments = {k: self.intern(a) for k, a in t.arguments.items()}
+            output = self.intern(t.output)
+            key = (t.name, tuple((k, id(arguments[k])) for k in sorted(arguments)), id(output))
+            build = lambda: TypeNamedArgsConstructor(t.name, arguments, output)
+            same = output is t.output and all(a is t.arguments[k] for k, a in arguments.items())
+        else:
+            raise ValueError(f"cannot intern {t}")
+
+        interned = self.constructors.get(key)
+        if interned is not None:
+            self.hits += 1
+            return interned
+        self.misses += 1
+        interned = t if same else build()
+        interned.hashCode = hash(interned)
+        interned.canonicalForm = None
+        interned.decomposition = None
+        interned.interned = True
+        self.constructors[key] = interned
+        return interned
+
+    def internFaithfully(self, t):
+        """The interned copy of t, unless t has several named arguments
+        somewhere: the interned copy of such a type keeps the order of the
+        first one interned, so it may show and list them in another order"""
+        if _namesSeveralArguments(t):
+            return t
+        return self.intern(t)
+
+
+def _namesSeveralArguments(t):
+    if isinstance(t, TypeNamedArgsConstructor):
+        return len(t.arguments) > 1 or any(_namesSeveralArguments(a) for a in _typeArguments(t))
+    if isinstance(t, TypeConstructor):
+        return any(_namesSeveralArguments(a) for a in t.arguments)
+    return False
+
+
+TYPE_INTERNER = TypeInterner()
+# String -> type, for Type.fromstring
+TYPE_STRINGS = BoundedCache(10000)
+
+
 class Context(object):
     def __init__(self, nextVariable=0, substitution=[]):
         self.nextVariable = nextVariable
@@ -448,7 +644,33 @@ class Context(object):
     def makeVariable(self):
         return (Context(self.nextVariable + 1, self.substitution), TypeVariable(self.nextVariable))
 
+    def resolve(self, variable):
+        for v, t in self.substitution:
+            if v == variable.v:
+                return t.apply(self)
+        return variable
+
+    # Contexts are values, so a context is its own snapshot and entering the
+    # context of a candidate is just using it. These make code written for
+    # UnionFindContext work unchanged on Context.
+
+    def mark(self):
+        return self
+
+    def undo(self, mark):
+        return mark
+
+    def extension(self, fresh, substitution):
+        """This context with `fresh` new variables and the bindings in
+        `substitution`, newest first"""
+        return Context(self.nextVariable + fresh, substitution + self.substitution)
+
+    def enter(self, extension):
+        return extension
+
     def unify(self, t1, t2):
+        if t1 is t2:
+            return self
         t1 = t1.apply(self)
         t2 = t2.apply(self)
         if t1 == t2:
@@ -482,6 +704,156 @@ class Context(object):
         return str(self)
 
 
+class UnionFindContext(object):
+    """Type variable bindings in a union-find store which is updated in place.
+
+    Variables bound to variables are followed to their representative with
+    path compression. Every change goes on a trail, so that undo(mark) puts
+    back the bindings as they were when mark() was taken, which is how a
+    search backtracks out of a choice instead of copying contexts.
+
+    It answers the same calls as Context, but unify, extend and makeVariable
+    return this same context after updating it, so the contexts returned by
+    those calls are only meaningful until the next undo. A unification which
+    fails leaves the context as it was."""
+
+    def __init__(self, nextVariable=0):
+        # None for unbound variables
+        self.bindings = [None] * nextVariable
+        # (variable, previous binding), or (None, None) for a new variable
+        self.trail = []
+
+    @property
+    def nextVariable(self):
+        return len(self.bindings)
+
+    def mark(self):
+        return len(self.trail)
+
+    def undo(self, mark):
+        while len(self.trail) > mark:
+            v, t = self.trail.pop()
+            if v is None:
+                self.bindings.pop()
+            else:
+                self.bindings[v] = t
+        return self
+
+    def makeVariable(self):
+        self.bindings.append(None)
+        self.trail.append((None, None))
+        return self, TypeVariable(len(self.bindings) - 1)
+
+    def extend(self, j, t):
+        self.trail.append((j, self.bindings[j]))
+        self.bindings[j] = t
+        return self
+
+    def extension(self, fresh, substitution):
+        """What enter() adds to this context: `fresh` new variables and the
+        bindings in `substitution`, newest first"""
+        return (fresh, substitution)
+
+    def enter(self, extension):
+        fresh, substitution = extension
+        for _ in range(fresh):
+            self.makeVariable()
+        for j, t in reversed(substitution):
+            self.extend(j, t)
+        return self
+
+    def find(self, variable):
+        """The unbound variable or the constructed type which `variable`
+        stands for"""
+        t = self.bindings[variable.v]
+        if t is None:
+            return variable
+        if not isinstance(t, TypeVariable):
+            return t
+        root = self.find(t)
+        if root is not t:
+            self.extend(variable.v, root)
+        return root
+
+    def resolve(self, variable):
+        t = self.find(variable)
+        if isinstance(t, TypeVariable):
+            return t
+        return t.apply(self)
+
+    def occurs(self, v, t):
+        if isinstance(t, TypeVariable):
+            t = self.find(t)
+            if isinstance(t, TypeVariable):
+                return t.v == v
+        if not t.isPolymorphic:
+            return False
+        return any(self.occurs(v, x) for x in _typeArguments(t))
+
+    def unify(self, t1, t2):
+        if t1 is t2:
+            return self
+        mark = self.mark()
+        try:
+            self._unify(t1, t2)
+        except UnificationFailure:
+            self.undo(mark)
+            raise
+        return self
+
+    def _unify(self, t1, t2):
+        if t1 is t2:
+            return
+        if isinstance(t1, TypeVariable):
+            t1 = self.find(t1)
+        if isinstance(t2, TypeVariable):
+            t2 = self.find(t2)
+
+        if isinstance(t1, TypeVariable):
+            if isinstance(t2, TypeVariable) and t1.v == t2.v:
+                return
+            if self.occurs(t1.v, t2):
+                raise Occurs()
+            self.extend(t1.v, t2)
+            return
+        if isinstance(t2, TypeVariable):
+            if self.occurs(t2.v, t1):
+                raise Occurs()
+            self.extend(t2.v, t1)
+            return
+
+        if not t1.isPolymorphic and not t2.isPolymorphic:
+            if t1 == t2:
+                return
+            raise UnificationFailure(t1, t2)
+        if t1.name != t2.name or type(t1) is not type(t2):
+            raise UnificationFailure(t1, t2)
+        if isinstance(t1, TypeNamedArgsConstructor):
+            if t1.arguments.keys() != t2.arguments.keys():
+                raise UnificationFailure(t1, t2)
+        for x, y in zip(_typeArguments(t2), _typeArguments(t1)):
+            self._unify(x, y)
+
+    def __str__(self):
+        return "UnionFindContext(next = %d, {%s})" % (
+            self.nextVariable,
+            ", ".join(
+                "t%d ||> %s" % (v, t.apply(self))
+                for v, t in enumerate(self.bindings)
+                if t is not None
+            ),
+        )
+
+    def __repr__(self):
+        return str(self)
+
+
+def _typeArguments(t):
+    if isinstance(t, TypeNamedArgsConstructor):
+        return [t.arguments[k] for k in sorted(t.arguments)] + [t.output]
+    return t.arguments
+
+
 class MutableContext(object):
     def __init__(self):
         self.substitution = []
@@ -495,6 +867,8 @@ class MutableContext(object):
         return TypeVariable(len(self.substitution) - 1)
 
     def unify(self, t1, t2):
+        if t1 is t2:
+            return
         t1 = t1.applyMutable(self)
         t2 = t2.applyMutable(self)
 
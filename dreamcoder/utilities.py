@@ -10,6 +10,7 @@ import math
 import pickle as pickle
 from itertools import chain
 import heapq
+import collections
 
 import hashlib
 
@@ -692,6 +693,70 @@ class Stopwatch:
         return e
 
 
+class BoundedCache:
+    """Dictionary that forgets its least recently used entries"""
+
+    def __init__(self, maximumSize):
+        self.maximumSize = maximumSize
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maximumSize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+# Stands for an exception in the outputs of an expression
+EVALUATION_ERROR = ("<error>",)
+
+
+def fingerprintValue(v):
+    """Hashable stand-in for a value, or None if it has none"""
+    if isinstance(v, (list, tuple)):
+        vs = tuple(fingerprintValue(x) for x in v)
+        if any(x is None for x in vs):
+            return None
+        return (type(v).__name__, vs)
+    try:
+        hash(v)
+    except TypeError:
+        return None
+    if callable(v):
+        return None
+    return v
+
+
+def cpuTime():
+    """CPU seconds used by this process and by every child it has waited on"""
+    import resource
+
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
 def userName():
     import getpass
 
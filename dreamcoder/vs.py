@@ -884,7 +884,7 @@ class VersionTable():
         g = Grammar.uniform([invention] + g0.primitives, continuationType=g0.continuationType).\
             insideOutside(frontiers,
                           pseudoCounts=pseudoCounts)
-        frontiers = [g.rescoreFrontier(f) for f in frontiers]
+        frontiers = g.rescoreFrontiers(frontiers)
         return g, frontiers
 
 class CloseInventionVisitor():
@@ -915,6 +915,8 @@ class CloseInventionVisitor():
         
         
 class RewriteWithInventionVisitor():
+    """Rewrites frontier programs, which can be deep, so its methods are
+    generators run by trampoline"""
     def __init__(self, p):
         v = CloseInventionVisitor(p)
         self.original = p
@@ -935,13 +937,13 @@ class RewriteWithInventionVisitor():
     def primitive(self, e): return e
     def invented(self, e): return e
     def abstraction(self, e):
-        return self.tryRewrite(e) or Abstraction(e.body.visit(self))
+        return self.tryRewrite(e) or Abstraction((yield e.body.visit(self)))
     def application(self, e):
-        return self.tryRewrite(e) or Application(e.f.visit(self),
-                                                 e.x.visit(self))
+        return self.tryRewrite(e) or Application((yield e.f.visit(self)),
+                                                 (yield e.x.visit(self)))
     def execute(self, e, request=None):
         try:
-            i = e.visit(self)
+            i = trampoline(e.visit(self))
             l = EtaLongVisitor(request=request).execute(i)
             return l
         except (UnificationFailure, EtaExpandFailure):
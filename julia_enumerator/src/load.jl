@@ -1,6 +1,26 @@
 
-function load_problems(message)
-    grammar_payload = message["DSL"]
+# Serialized DSLs by "DSLHash". Messages from the frontend only carry the hash,
+# the DSL itself is fetched once through `run_context["fetch_dsl"]`.
+const DSL_CACHE = Dict{String,Any}()
+const DSL_CACHE_SIZE = 16
+
+function load_dsl_payload(message, run_context)
+    if !haskey(message, "DSLHash")
+        return message["DSL"]
+    end
+    h = message["DSLHash"]
+    if !haskey(DSL_CACHE, h)
+        payload = haskey(message, "DSL") ? message["DSL"] : run_context["fetch_dsl"](h)
+        if length(DSL_CACHE) >= DSL_CACHE_SIZE
+            empty!(DSL_CACHE)
+        end
+        DSL_CACHE[h] = payload
+    end
+    return DSL_CACHE[h]
+end
+
+function load_problems(message, run_context = nothing)
+    grammar_payload = load_dsl_payload(message, run_context)
     # try
     g = deserialize_grammar(grammar_payload)
     grammar = make_dummy_contextual(g)
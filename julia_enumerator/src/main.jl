@@ -3,10 +3,7 @@ using Distributed
 
 @everywhere include("solver.jl")
 
-import Redis
-import Redis: execute_command
-
-function setup_worker(pid, source_path)
+function setup_worker(pid, source_path, socket_path)
     @async begin
         @fetchfrom pid begin
             task_local_storage()[:SOURCE_PATH] = source_path
@@ -16,12 +13,12 @@ function setup_worker(pid, source_path)
         timeout_container = solver.start_timeout_monitor(pid)
         @warn "Created timeout container for new worker $pid"
         # @fetchfrom pid solver.init_logger()
-        @spawnat pid solver.worker_loop(timeout_container)
+        @spawnat pid solver.worker_loop(timeout_container, socket_path)
         @warn "Finished setting up worker $pid"
     end
 end
 
-function add_new_workers(count, source_path)
+function add_new_workers(count, source_path, socket_path)
     @warn "Adding $count new workers"
     if Base.VERSION >= v"1.9.0"
         new_pids = addprocs(count, exeflags = "--heap-size-hint=1G")
@@ -29,7 +26,7 @@ function add_new_workers(count, source_path)
         new_pids = addprocs(count)
     end
     created_pids = []
-    setup_futures = [(pid, setup_worker(pid, source_path)) for pid in new_pids]
+    setup_futures = [(pid, setup_worker(pid, source_path, socket_path)) for pid in new_pids]
     for (pid, f) in setup_futures
         try
             fetch(f)
@@ -43,13 +40,13 @@ function add_new_workers(count, source_path)
     created_pids
 end
 
-function should_stop(conn)
-    has_new_commands = Redis.llen(conn, "commands")
+function should_stop(transport)
+    has_new_commands = solver.transport_length(transport, "commands")
     if has_new_commands > 0
-        _, message = Redis.blpop(conn, ["commands"], 0)
+        _, message = solver.transport_pop(transport, ["commands"], 0)
 
         if message == "stop"
-            Redis.rpush(conn, "commands", message)
+            solver.transport_push(transport, "commands", message)
             @info "Stopping enumeration service"
             return true
         end
@@ -67,10 +64,14 @@ function main()
         help = "number of workers to start"
         arg_type = Int
         default = 1
+        "--socket"
+        help = "Unix socket of the frontend's broker, redis on localhost is used otherwise"
+        arg_type = String
     end
 
     parsed_args = parse_args(ARGS, s)
     num_workers = parsed_args["c"]
+    socket_path = parsed_args["socket"]
 
     @info "Starting enumeration service with $num_workers workers"
     # @everywhere solver.init_logger()
@@ -79,11 +80,11 @@ function main()
 
     sleep(1)
 
-    active_workers = add_new_workers(num_workers, source_path)
+    active_workers = add_new_workers(num_workers, source_path, socket_path)
 
-    conn = Redis.RedisConnection()
+    transport = solver.make_transport(socket_path)
     while true
-        if should_stop(conn)
+        if should_stop(transport)
             break
         end
 
@@ -98,27 +99,24 @@ function main()
                 @warn "Worker $pid is dead"
                 push!(dead_pids, pid)
                 processing_key = "processing:$pid"
-                payload = Redis.get(conn, processing_key)
+                payload = solver.transport_get(transport, processing_key)
                 if !isnothing(payload)
                     @warn "Rescheduling task from worker $pid"
-                    Redis.multi(conn)
                     queue = JSON.parse(payload)["queue"]
-                    Redis.rpush(conn, queue, payload)
-                    Redis.del(conn, processing_key)
-                    Redis.execute_command(conn, ["exec"])
+                    solver.transport_push_and_delete(transport, queue, payload, processing_key)
                 end
             end
         end
 
         active_workers = [pid for pid in active_workers if !in(pid, dead_pids)]
-        if should_stop(conn)
+        if should_stop(transport)
             break
         end
-        new_pids = add_new_workers(num_workers - length(active_workers), source_path)
+        new_pids = add_new_workers(num_workers - length(active_workers), source_path, socket_path)
         append!(active_workers, new_pids)
         sleep(1)
     end
-    Redis.disconnect(conn)
+    solver.disconnect_transport(transport)
 end
 
 if abspath(PROGRAM_FILE) == @__FILE__
@@ -1,6 +1,6 @@
 
-function load_sampling_payload(payload)
-    g = deserialize_grammar(payload["DSL"])
+function load_sampling_payload(payload, run_context = nothing)
+    g = deserialize_grammar(load_dsl_payload(payload, run_context))
     grammar = make_dummy_contextual(g)
     request = parse_type(payload["request"])
     max_depth = payload["max_depth"]
@@ -14,7 +14,7 @@ end
 
 function run_sampling_process(run_context, payload)
     grammar, request, max_depth, max_block_depth, max_attempts, timeout, output_timeout, program_timeout =
-        load_sampling_payload(payload)
+        load_sampling_payload(payload, run_context)
     run_context["timeout"] = program_timeout
     program, examples =
         sample_program(grammar, request, max_depth, max_block_depth, max_attempts, timeout, output_timeout, run_context)
@@ -13,33 +13,21 @@ include("export.jl")
 include("sample.jl")
 include("profiling.jl")
 
-import Redis
-import Redis: execute_command
+include("transport.jl")
 
-mutable struct RedisContext
-    conn::Redis.RedisConnection
-end
-
-function get_conn(ctx::RedisContext)
-    if Redis.is_connected(ctx.conn)
-        ctx.conn
-    else
-        ctx.conn = Redis.RedisConnection()
-        ctx.conn
-    end
-end
-
-function disconnect_redis(ctx::RedisContext)
-    if Redis.is_connected(ctx.conn)
-        Redis.disconnect(ctx.conn)
+function fetch_dsl(transport, h)
+    payload = transport_get(transport, "dsl:$h")
+    if isnothing(payload)
+        error("Unknown DSL $h")
     end
+    return JSON.parse(payload)
 end
 
 function run_solving_process(run_context, message)
     @info "running processing"
     @info message
     task, maximum_frontier, g, type_weights, hyperparameters, _mfp, _nc, timeout, _verbose, program_timeout =
-        load_problems(message)
+        load_problems(message, run_context)
     run_context["program_timeout"] = program_timeout
     run_context["timeout"] = timeout
     solutions, number_enumerated =
@@ -49,27 +37,21 @@ end
 
 using Distributed
 
-function get_new_task(redis)
+function get_new_task(transport)
     while true
         try
-            conn = get_conn(redis)
-            # watch(conn, "tasks")
-            queue, message = Redis.blpop(conn, ["commands", "tasks", "sample"], 0)
+            queue, message = transport_pop(transport, ["commands", "tasks", "sample"], 0)
             if queue == "commands" && message == "stop"
-                # unwatch(conn)
-                Redis.rpush(conn, "commands", message)
+                transport_push(transport, "commands", message)
                 return message
             end
-            Redis.multi(conn)
-            Redis.set(conn, "processing:$(myid())", message)
-            res = Redis.execute_command(conn, ["exec"])
-            if res == ["OK"]
+            if transport_set(transport, "processing:$(myid())", message)
                 return message
             end
         catch e
             bt = catch_backtrace()
             @error "Error while fetching task" exception = (e, bt)
-            disconnect_redis(redis)
+            disconnect_transport(transport)
             rethrow()
         end
     end
@@ -77,12 +59,16 @@ end
 
 using JSON
 
-function process_solving_task(payload, timeout_container, redis, i)
+function process_solving_task(payload, timeout_container, transport, i)
     timeout = payload["timeout"]
     name = payload["name"]
     @info "Running task number $i $name"
     output = @time try
-        run_context = Dict{String,Any}("timeout_container" => timeout_container, "timeout" => timeout)
+        run_context = Dict{String,Any}(
+            "timeout_container" => timeout_container,
+            "timeout" => timeout,
+            "fetch_dsl" => h -> fetch_dsl(transport, h),
+        )
         result = run_solving_process(run_context, payload)
         if isnothing(result)
             result = Dict("number_enumerated" => 0, "solutions" => [])
@@ -99,19 +85,19 @@ function process_solving_task(payload, timeout_container, redis, i)
         @error "Error while running task" exception = (e, bt)
         Dict("status" => "error", "payload" => String(take!(buf)), "name" => name)
     end
-    conn = get_conn(redis)
-    Redis.multi(conn)
-    Redis.rpush(conn, "results", JSON.json(output))
-    Redis.del(conn, "processing:$(myid())")
-    Redis.execute_command(conn, ["exec"])
+    transport_push_and_delete(transport, "results", JSON.json(output), "processing:$(myid())")
 end
 
-function process_sampling_task(payload, timeout_container, redis, i)
+function process_sampling_task(payload, timeout_container, transport, i)
     timeout = payload["timeout"]
     @info "Running sampling number $i"
     @info payload
     output = @time try
-        run_context = Dict{String,Any}("timeout_container" => timeout_container, "timeout" => timeout)
+        run_context = Dict{String,Any}(
+            "timeout_container" => timeout_container,
+            "timeout" => timeout,
+            "fetch_dsl" => h -> fetch_dsl(transport, h),
+        )
         result = run_sampling_process(run_context, payload)
 
         Dict("status" => "success", "payload" => result)
@@ -126,10 +112,8 @@ function process_sampling_task(payload, timeout_container, redis, i)
         @error "Error while running task" exception = (e, bt)
         Dict("status" => "error", "payload" => String(take!(buf)))
     end
-    conn = get_conn(redis)
-    Redis.multi(conn)
-    try
-        Redis.rpush(conn, "sample_result", JSON.json(output))
+    result = try
+        JSON.json(output)
     catch e
         if isa(e, InterruptException)
             @warn "Interrupted"
@@ -138,22 +122,20 @@ function process_sampling_task(payload, timeout_container, redis, i)
         buf = IOBuffer()
         bt = catch_backtrace()
         showerror(buf, e, bt)
-        @error "Error while saving result to redis" exception = (e, bt)
-        output = Dict("status" => "error", "payload" => String(take!(buf)))
-        Redis.rpush(conn, "sample_result", JSON.json(output))
+        @error "Error while serializing result" exception = (e, bt)
+        JSON.json(Dict("status" => "error", "payload" => String(take!(buf))))
     end
-    Redis.del(conn, "processing:$(myid())")
-    Redis.execute_command(conn, ["exec"])
+    transport_push_and_delete(transport, "sample_result", result, "processing:$(myid())")
 end
 
-function worker_loop(timeout_container)
+function worker_loop(timeout_container, socket_path = nothing)
     @info "Starting worker loop"
-    redis = RedisContext(Redis.RedisConnection())
+    transport = make_transport(socket_path)
     i = 0
     j = 0
     while true
         try
-            message = get_new_task(redis)
+            message = get_new_task(transport)
             if message == "stop"
                 @info "Stopping worker"
                 break
@@ -161,20 +143,20 @@ function worker_loop(timeout_container)
             payload = JSON.parse(message)
             if payload["queue"] == "tasks"
                 i += 1
-                process_solving_task(payload, timeout_container, redis, i)
+                process_solving_task(payload, timeout_container, transport, i)
             elseif payload["queue"] == "sample"
                 j += 1
-                process_sampling_task(payload, timeout_container, redis, j)
+                process_sampling_task(payload, timeout_container, transport, j)
             end
 
         catch e
-            disconnect_redis(redis)
+            disconnect_transport(transport)
             bt = catch_backtrace()
             @error "Error while processing a task" exception = (e, bt)
             rethrow()
         end
     end
-    disconnect_redis(redis)
+    disconnect_transport(transport)
 end
 
 end
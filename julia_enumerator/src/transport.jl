@@ -0,0 +1,135 @@
+
+# Transports to the frontend: a redis server, or the frontend's Unix socket broker
+# (see dreamcoder/transport.py for the framing of broker messages)
+
+import Redis
+import Redis: execute_command
+using Sockets
+
+abstract type Transport end
+
+mutable struct RedisTransport <: Transport
+    conn::Redis.RedisConnection
+end
+
+mutable struct SocketTransport <: Transport
+    path::String
+    stream::Union{Nothing,Base.PipeEndpoint}
+end
+
+make_transport(socket_path::Nothing) = RedisTransport(Redis.RedisConnection())
+make_transport(socket_path::AbstractString) = SocketTransport(socket_path, nothing)
+
+function get_conn(t::RedisTransport)
+    if !Redis.is_connected(t.conn)
+        t.conn = Redis.RedisConnection()
+    end
+    t.conn
+end
+
+function disconnect_transport(t::RedisTransport)
+    if Redis.is_connected(t.conn)
+        Redis.disconnect(t.conn)
+    end
+end
+
+transport_push(t::RedisTransport, queue, message) = Redis.rpush(get_conn(t), queue, message)
+
+function transport_pop(t::RedisTransport, queues, timeout = 0)
+    res = Redis.blpop(get_conn(t), queues, timeout)
+    if isnothing(res) || isempty(res)
+        return nothing
+    end
+    queue, message = res
+    return queue, message
+end
+
+transport_length(t::RedisTransport, queue) = Redis.llen(get_conn(t), queue)
+
+transport_get(t::RedisTransport, key) = Redis.get(get_conn(t), key)
+
+function transport_set(t::RedisTransport, key, value)
+    conn = get_conn(t)
+    Redis.multi(conn)
+    Redis.set(conn, key, value)
+    res = Redis.execute_command(conn, ["exec"])
+    return res == ["OK"]
+end
+
+transport_delete(t::RedisTransport, key) = Redis.del(get_conn(t), key)
+
+# Pushes `message` and deletes `key` atomically
+function transport_push_and_delete(t::RedisTransport, queue, message, key)
+    conn = get_conn(t)
+    Redis.multi(conn)
+    Redis.rpush(conn, queue, message)
+    Redis.del(conn, key)
+    Redis.execute_command(conn, ["exec"])
+end
+
+function get_stream(t::SocketTransport)
+    if isnothing(t.stream) || !isopen(t.stream)
+        t.stream = Sockets.connect(t.path)
+    end
+    t.stream
+end
+
+function disconnect_transport(t::SocketTransport)
+    if !isnothing(t.stream)
+        close(t.stream)
+        t.stream = nothing
+    end
+end
+
+function write_message(stream, parts)
+    buf = IOBuffer()
+    write(buf, string(length(parts)), "\n")
+    for part in parts
+        write(buf, string(sizeof(part)), "\n", part)
+    end
+    write(stream, take!(buf))
+    flush(stream)
+end
+
+function read_message(stream)
+    count = parse(Int, readline(stream))
+    [String(read(stream, parse(Int, readline(stream)))) for _ in 1:count]
+end
+
+function call_broker(t::SocketTransport, parts...)
+    stream = get_stream(t)
+    write_message(stream, collect(String, map(string, parts)))
+    reply = read_message(stream)
+    if reply[1] != "OK"
+        error("Enumerator broker error: $(join(reply[2:end], " "))")
+    end
+    reply[2:end]
+end
+
+transport_push(t::SocketTransport, queue, message) = parse(Int, call_broker(t, "RPUSH", queue, message)[1])
+
+function transport_pop(t::SocketTransport, queues, timeout = 0)
+    reply = call_broker(t, "BLPOP", timeout, queues...)
+    if isempty(reply)
+        return nothing
+    end
+    return reply[1], reply[2]
+end
+
+transport_length(t::SocketTransport, queue) = parse(Int, call_broker(t, "LLEN", queue)[1])
+
+function transport_get(t::SocketTransport, key)
+    reply = call_broker(t, "GET", key)
+    isempty(reply) ? nothing : reply[1]
+end
+
+function transport_set(t::SocketTransport, key, value)
+    call_broker(t, "SET", key, value)
+    return true
+end
+
+transport_delete(t::SocketTransport, key) = parse(Int, call_broker(t, "DEL", key)[1])
+
+function transport_push_and_delete(t::SocketTransport, queue, message, key)
+    call_broker(t, "RPUSHDEL", queue, message, key)
+end
@@ -5,7 +5,7 @@ using solver:
     ProgramBlock,
     FreeVar,
     add_new_block,
-    RedisContext,
+    RedisTransport,
     BlockPrototype,
     EnumerationState,
     enumeration_iteration_finished_output,
@@ -14,6 +14,7 @@ mod vs;
 use self::vs::induce_version_spaces;
 
 use polytype::Type;
+use programinduction::lambda::Expression;
 use programinduction::{lambda, ECFrontier, Task};
 use rayon::prelude::*;
 use std::f64;
@@ -43,6 +44,11 @@ struct ExternalCompressionInput {
     variable_logprob: f64,
     params: Params,
     frontiers: Vec<Frontier>,
+    /// For programs sent in their binary encoding: the position of the
+    /// production of each id of the table among the primitives followed by
+    /// the inventions.
+    #[serde(default)]
+    table: Vec<usize>,
 }
 #[derive(Serialize)]
 struct ExternalCompressionOutput {
@@ -93,11 +99,92 @@ struct Frontier {
 
 #[derive(Serialize, Deserialize)]
 struct Solution {
+    #[serde(default)]
     expression: String,
+    /// The binary encoding of the program in base64, in place of expression.
+    #[serde(default, skip_serializing_if = "Option::is_none")]
+    program: Option<String>,
     logprior: f64,
     loglikelihood: f64,
 }
 
+fn decode_base64(s: &str) -> Option<Vec<u8>> {
+    let mut out = Vec::with_capacity(s.len() * 3 / 4);
+    let mut buffer = 0u32;
+    let mut bits = 0;
+    for c in s.bytes() {
+        let v = match c {
+            b'A'..=b'Z' => c - b'A',
+            b'a'..=b'z' => c - b'a' + 26,
+            b'0'..=b'9' => c - b'0' + 52,
+            b'+' => 62,
+            b'/' => 63,
+            b'=' => break,
+            _ => return None,
+        };
+        buffer = ((buffer << 6) | u32::from(v)) & 0xffff;
+        bits += 6;
+        if bits >= 8 {
+            bits -= 8;
+            out.push((buffer >> bits) as u8);
+        }
+    }
+    Some(out)
+}
+
+fn read_varint(data: &[u8], n: &mut usize) -> Option<usize> {
+    let mut value = 0;
+    let mut shift = 0;
+    loop {
+        let b = *data.get(*n)?;
+        *n += 1;
+        value |= ((b & 0x7f) as usize) << shift;
+        if b & 0x80 == 0 {
+            return Some(value);
+        }
+        shift += 7;
+    }
+}
+
+/// Reads a program in the binary encoding of ProgramTable (see
+/// dreamcoder/program.py), given the expression of each id of the table.
+/// Only the opcodes of programs made of the productions of the table are
+/// understood.
+fn decode_program(data: &[u8], table: &[Expression]) -> Option<Expression> {
+    fn node(data: &[u8], n: &mut usize, table: &[Expression]) -> Option<Expression> {
+        let op = *data.get(*n)?;
+        *n += 1;
+        match op {
+            0 => Some(Expression::Abstraction(Box::new(node(data, n, table)?))),
+            5 | 11..=15 => {
+                let arguments = if op == 5 {
+                    read_varint(data, n)?
+                } else {
+                    (op - 10) as usize
+                };
+                let mut expr = node(data, n, table)?;
+                for _ in 0..arguments {
+                    let x = node(data, n, table)?;
+                    expr = Expression::Application(Box::new(expr), Box::new(x));
+                }
+                Some(expr)
+            }
+            6 => Some(Expression::Index(read_varint(data, n)?)),
+            16..=47 => Some(Expression::Index((op - 16) as usize)),
+            7 => table.get(read_varint(data, n)?).cloned(),
+            48..=255 => table.get((op - 48) as usize).cloned(),
+            _ => None,
+        }
+    }
+    let mut n = 0;
+    let expr = node(data, &mut n, table)?;
+    if n == data.len() {
+        Some(expr)
+    } else {
+        None
+    }
+}
+
 fn noop_oracle(_: &lambda::Language, _: &lambda::Expression) -> f64 {
     f64::NEG_INFINITY
 }
@@ -148,6 +235,17 @@ impl From<ExternalCompressionInput> for CompressionInput {
             aic: eci.params.aic.unwrap_or(f64::INFINITY),
             arity: eci.params.arity,
         };
+        let table: Vec<Expression> = eci
+            .table
+            .iter()
+            .map(|&i| {
+                if i < dsl.primitives.len() {
+                    Expression::Primitive(i)
+                } else {
+                    Expression::Invented(i - dsl.primitives.len())
+                }
+            })
+            .collect();
         let (tasks, frontiers) = eci
             .frontiers
             .into_par_iter()
@@ -164,9 +262,14 @@ impl From<ExternalCompressionInput> for CompressionInput {
                     .solutions
                     .into_iter()
                     .map(|s| {
-                        let expr = dsl
-                            .parse(&s.expression)
-                            .expect("invalid expression in frontier");
+                        let expr = match s.program {
+                            Some(ref program) => decode_base64(program)
+                                .and_then(|data| decode_program(&data, &table))
+                                .expect("invalid program in frontier"),
+                            None => dsl
+                                .parse(&s.expression)
+                                .expect("invalid expression in frontier"),
+                        };
                         (expr, s.logprior, s.loglikelihood)
                     })
                     .collect();
@@ -220,6 +323,7 @@ impl From<CompressionInput> for ExternalCompressionOutput {
                         let expression = ci.dsl.display(expr);
                         Solution {
                             expression,
+                            program: None,
                             logprior,
                             loglikelihood,
                         }
@@ -1,3 +1,5 @@
 open Dreamcoder.Solver
 
-let (_ : unit) = run_solver ()
+let (_ : unit) =
+  if Array.exists (fun argument -> argument = "--server") Sys.argv then run_solver_server ()
+  else run_solver ()
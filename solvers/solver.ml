@@ -15,13 +15,30 @@ open Task
 open Grammar
 open FastType [@@warning "-33"]
 
-let load_problems channel =
+(* Deserialized DSLs by "DSLHash", for solvers that answer many requests.
+   Once full, the cache is cleared; the frontend mirrors this rule. *)
+let dsl_cache = Hashtbl.create (module String)
+
+let load_dsl j =
   let open Yojson.Basic.Util in
-  let j = Yojson.Basic.from_channel channel in
-  let g = j |> member "DSL" in
-  let g =
+  let deserialize g =
     try deserialize_grammar g |> make_dummy_contextual with _ -> deserialize_contextual_grammar g
   in
+  match j |> member "DSLHash" with
+  | `String h -> (
+      match Hashtbl.find dsl_cache h with
+      | Some g -> g
+      | None ->
+          let capacity = try j |> member "DSLCacheSize" |> to_int with _ -> 16 in
+          let g = deserialize (j |> member "DSL") in
+          if Hashtbl.length dsl_cache >= capacity then Hashtbl.clear dsl_cache;
+          Hashtbl.set dsl_cache ~key:h ~data:g;
+          g)
+  | _ -> deserialize (j |> member "DSL")
+
+let load_problems_json j =
+  let open Yojson.Basic.Util in
+  let g = load_dsl j in
 
   let unrolled_grammar = try Some (j |> member "PCFG" |> deserialize_PCFG) with _ -> None in
 
@@ -105,6 +122,8 @@ let load_problems channel =
     timeout,
     verbose )
 
+let load_problems channel = Yojson.Basic.from_channel channel |> load_problems_json
+
 let export_frontiers number_enumerated tf solutions : string =
   let open Yojson.Basic in
   let serialization : Yojson.Basic.t =
@@ -125,10 +144,9 @@ let export_frontiers number_enumerated tf solutions : string =
   in
   pretty_to_string serialization
 
-let run_solver () : unit =
-  register_tower_primitives ();
+let solve_problems ?(on_hit = fun _ _ -> ()) j : string =
   let tf, g, unrolled, lowerBound, upperBound, budgetIncrement, mfp, nc, timeout, verbose =
-    load_problems Stdlib.stdin
+    load_problems_json j
   in
   let _quick_tasks =
     tf
@@ -206,8 +224,65 @@ let run_solver () : unit =
   (*   Printf.eprintf "Evaluations per second: %f\n" evaluations_per_second); *)
   let solutions, number_enumerated =
     enumerate_for_tasks backend ~lowerBound ~upperBound ~budgetIncrement ~verbose ~timeout tf ~nc
+      ~on_hit
+  in
+  export_frontiers number_enumerated tf solutions
+
+let run_solver () : unit =
+  register_tower_primitives ();
+  Yojson.Basic.from_channel Stdlib.stdin |> solve_problems |> print_string
+
+(* Server mode: each request and each response is framed as "<length>\n<payload>" *)
+let read_frame channel =
+  match In_channel.input_line channel with
+  | None -> None
+  | Some header ->
+      let size = Int.of_string (String.strip header) in
+      Some (Stdlib.really_input_string channel size)
+
+let write_frame channel payload =
+  Out_channel.output_string channel (Printf.sprintf "%d\n" (String.length payload));
+  Out_channel.output_string channel payload;
+  Out_channel.flush channel
+
+let hit_frame (t : task) s =
+  `Assoc
+    [
+      ( "hit",
+        `Assoc
+          [
+            ("task", `String t.name);
+            ("program", `String s.hit_program);
+            ("time", `Float s.hit_time);
+            ("logLikelihood", `Float s.hit_likelihood);
+            ("logPrior", `Float s.hit_prior);
+          ] );
+    ]
+  |> Yojson.Basic.to_string
+
+(* Hits found by forked enumeration workers share our stdout, so only frames that fit in a
+   single atomic pipe write are streamed. Every hit is still part of the final response. *)
+let stream_hit t s =
+  let frame = hit_frame t s in
+  if String.length frame + 16 <= 4096 then write_frame Stdlib.stdout frame
+
+let run_solver_server () : unit =
+  register_tower_primitives ();
+  let rec loop () =
+    match read_frame Stdlib.stdin with
+    | None -> ()
+    | Some payload ->
+        let response =
+          try
+            let j = Yojson.Basic.from_string payload in
+            let stream = try Yojson.Basic.Util.(j |> member "stream" |> to_bool) with _ -> false in
+            if stream then solve_problems ~on_hit:stream_hit j else solve_problems j
+          with e -> `Assoc [ ("error", `String (Exn.to_string e)) ] |> Yojson.Basic.to_string
+        in
+        write_frame Stdlib.stdout response;
+        loop ()
   in
-  export_frontiers number_enumerated tf solutions |> print_string
+  loop ()
 
 (* let tune_differentiation () = *)
 (*   let (tf,g, *)
@@ -291,7 +291,7 @@ type hit_result = {
 [@@deriving equal]
 
 let enumerate_for_tasks enumeration_backend ?(verbose = true) ?(budgetIncrement = 1.)
-    ?(lowerBound = 0.) ?(upperBound = 99.) ?(nc = 1) ~timeout
+    ?(lowerBound = 0.) ?(upperBound = 99.) ?(nc = 1) ?(on_hit = fun _ _ -> ()) ~timeout
     (* tasks and maximum frontier sizes *)
       (tf : (task * int) list) : hit_result list list * int =
   (* Returns, for each task, (program,logPrior) as well as the total number of enumerated programs *)
@@ -351,13 +351,16 @@ let enumerate_for_tasks enumeration_backend ?(verbose = true) ?(budgetIncrement
                  let logLikelihood = tasks.(j).log_likelihood p in
                  if is_valid logLikelihood then (
                    let dt = Time.abs_diff startTime (Time.now ()) |> Time.Span.to_sec in
-                   Heap.add hits.(j)
+                   let hit =
                      {
                        hit_program = string_of_program p;
                        hit_prior = logPrior;
                        hit_likelihood = logLikelihood;
                        hit_time = dt;
-                     };
+                     }
+                   in
+                   Heap.add hits.(j) hit;
+                   on_hit tasks.(j) hit;
                    while Heap.length hits.(j) > maximumFrontier.(j) do
                      Heap.remove_top hits.(j)
                    done;
@@ -0,0 +1,63 @@
+import json
+import unittest
+
+from dreamcoder.dslRegistry import DSLRegistry, dsl_key, json_with_dsl
+from dreamcoder.enumeration import get_task_message
+from dreamcoder.grammar import Grammar
+from dreamcoder.program import Primitive
+from dreamcoder.task import Task
+from dreamcoder.type import arrow, tint
+
+
+class TestDSLRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = DSLRegistry()
+        self.primitive = Primitive("registry-inc", arrow(tint, tint), lambda x: x + 1)
+
+    def test_grammar_is_serialized_once(self):
+        g = Grammar.uniform([self.primitive])
+        h = self.registry.hash(g)
+        self.assertEqual(self.registry.hash(g), h)
+        self.assertEqual(json.loads(self.registry.payload(g)), g.json())
+        self.assertEqual(self.registry.serializations, 1)
+
+    def test_hash_depends_only_on_content(self):
+        g1 = Grammar.uniform([self.primitive])
+        g2 = Grammar.uniform([self.primitive])
+        g3 = Grammar.uniform([])
+        self.assertEqual(self.registry.hash(g1), self.registry.hash(g2))
+        self.assertNotEqual(self.registry.hash(g1), self.registry.hash(g3))
+
+    def test_upload_stores_each_distinct_grammar_once(self):
+        class Connection(dict):
+            def set(self, key, value):
+                self.writes = getattr(self, "writes", 0) + 1
+                self[key] = value
+
+        g1 = Grammar.uniform([self.primitive])
+        g2 = Grammar.uniform([self.primitive])
+        conn = Connection()
+        hashes = self.registry.upload(conn, [g1, g2])
+        self.assertEqual(conn.writes, 1)
+        self.assertEqual(json.loads(conn[dsl_key(hashes[g1])]), g1.json())
+
+    def test_json_with_dsl(self):
+        message = json_with_dsl({"a": 1}, json.dumps({"b": [2]}))
+        self.assertEqual(json.loads(message), {"DSL": {"b": [2]}, "a": 1})
+        self.assertEqual(json.loads(json_with_dsl({}, "3")), {"DSL": 3})
+
+    def test_task_message_refers_to_dsl_by_hash(self):
+        class TypeWeights:
+            def json(self):
+                return {}
+
+        g = Grammar.uniform([self.primitive])
+        task = Task("add1", arrow(tint, tint), [((1,), 2)])
+        task.test_examples = None
+        message = json.loads(get_task_message(task, g, 1, 1, 5, TypeWeights()))
+        self.assertNotIn("DSL", message)
+        self.assertEqual(len(message["DSLHash"]), 40)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,11 +2,19 @@ import random
 import unittest
 from unittest import mock
 
-from dreamcoder.enumeration import multicoreEnumeration
+from dreamcoder.enumeration import enumerateForTasks, multicoreEnumeration
 from dreamcoder.frontier import Frontier
 from dreamcoder.grammar import Grammar
+from dreamcoder.likelihoodModel import AllOrNothingLikelihoodModel
+from dreamcoder.program import Primitive
 from dreamcoder.task import Task
-from dreamcoder.type import arrow, tint
+from dreamcoder.type import Context, arrow, tint
+
+PRIMITIVES = [
+    Primitive("enumeration-0", tint, 0),
+    Primitive("enumeration-inc", arrow(tint, tint), lambda x: x + 1),
+    Primitive("enumeration-+", arrow(tint, tint, tint), lambda x: lambda y: x + y),
+]
 
 
 def add1():
@@ -116,5 +124,58 @@ class TestEnumerationMain(unittest.TestCase):
                 grammar, tasks, maximumFrontier=1, enumerationTimeout=1)
 
 
+class TestResumedEnumeration(unittest.TestCase):
+    def setUp(self):
+        self.grammar = Grammar.uniform(PRIMITIVES)
+        # No program solves it, so that every window is enumerated
+        self.task = Task("unsolvable", arrow(tint, tint), [((0,), -1), ((1,), -1)])
+        self.enumerators = []
+        original = Grammar.bestFirstEnumeration
+
+        def bestFirstEnumeration(g, *arguments, **keywords):
+            self.enumerators.append(original(g, *arguments, **keywords))
+            return self.enumerators[-1]
+
+        patch = mock.patch.object(Grammar, "bestFirstEnumeration", bestFirstEnumeration)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_windows_build_no_partial_program_twice(self):
+        hits = []
+        _, _, n = enumerateForTasks(
+            self.grammar,
+            [self.task],
+            AllOrNothingLikelihoodModel(timeout=1.0),
+            timeout=60,
+            upperBound=12.0,
+            budgetIncrement=1.5,
+            maximumFrontiers={self.task: 1},
+            onHit=lambda *hit: hits.append(hit),
+        )
+        (enumerator,) = self.enumerators
+        fresh = Grammar.uniform(PRIMITIVES).bestFirstEnumeration(
+            Context.EMPTY, [], self.task.request, maximumDepth=99, upperBound=12.0
+        )
+        self.assertEqual(sum(1 for _ in fresh.enumerate(12.0)), n)
+        self.assertGreater(n, 50)
+        # Eight windows, and as many partial programs built as in a single one
+        self.assertEqual(enumerator.expanded, fresh.expanded)
+        self.assertEqual(hits, [])
+
+    def test_a_job_keeps_its_enumerator(self):
+        self.task.examples = [((0,), 2), ((1,), 3)]
+        multicoreEnumeration(
+            self.grammar,
+            [self.task],
+            solver="python",
+            maximumFrontier=2,
+            enumerationTimeout=1,
+            evaluationTimeout=1.0,
+        )
+        (enumerator,) = self.enumerators
+        # It went well past the first window of 1.5 nats
+        self.assertGreater(enumerator.emitted, 1000)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,130 @@
+import json
+import threading
+import unittest
+
+from dreamcoder.dslRegistry import DSL_REGISTRY, dsl_key
+from dreamcoder.enumeration import WorkerError, multicore_enumeration_with_data
+from dreamcoder.enumeratorClient import EnumeratorClient
+from dreamcoder.grammar import Grammar
+from dreamcoder.task import Task
+from dreamcoder.transport import InMemoryTransport
+from dreamcoder.type import arrow, tint
+
+
+class TypeWeights:
+    def json(self):
+        return {}
+
+
+def fake_service(conn, count, error=None):
+    """Answers `count` task messages like the Julia enumerator service,
+    solving every task with (lambda $0)"""
+
+    def serve():
+        for _ in range(count):
+            message = json.loads(conn.blpop(["tasks"])[1])
+            name = message["name"]
+            if name == error:
+                response = {"name": name, "status": "error", "payload": "boom"}
+            else:
+                solution = {
+                    "program": "(lambda $0)",
+                    "time": 0.25,
+                    "logLikelihood": 0.0,
+                    "logPrior": -1.0,
+                }
+                response = {
+                    "name": name,
+                    "status": "success",
+                    "payload": {"solutions": [solution], "number_enumerated": 7},
+                }
+            conn.rpush("results", json.dumps(response))
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    return thread
+
+
+class TestEnumeratorClient(unittest.TestCase):
+    def setUp(self):
+        self.grammar = Grammar.uniform([])
+        self.tasks = [
+            Task("identity-%d" % i, arrow(tint, tint), [((i,), i)]) for i in range(20)
+        ]
+        self.tasks_by_name = {t.name: t for t in self.tasks}
+        self.task2grammar = {t: self.grammar for t in self.tasks}
+
+    def messages(self):
+        return [json.dumps({"name": t.name}) for t in self.tasks]
+
+    def test_results_are_scored_in_worker_processes(self):
+        conn = InMemoryTransport()
+        service = fake_service(conn, len(self.tasks))
+        results = {}
+        client = EnumeratorClient(
+            conn, self.tasks_by_name, self.task2grammar, scoringWorkers=2, batchSize=8
+        )
+        client.run(
+            self.messages(), lambda t, entries, dt, pc: results.update({t: entries})
+        )
+        service.join(1)
+        self.assertEqual(set(results), set(self.tasks))
+        for t, entries in results.items():
+            self.assertEqual(len(entries), 1)
+            self.assertEqual(str(entries[0].program), "(lambda $0)")
+            self.assertEqual(
+                entries[0].logPrior,
+                self.grammar.logLikelihood(t.request, entries[0].program),
+            )
+        self.assertEqual(client.submissions, 3)
+
+    def test_in_flight_tasks_are_bounded(self):
+        conn = InMemoryTransport()
+        service = fake_service(conn, len(self.tasks))
+        queued = []
+
+        def onResult(*result):
+            queued.append(conn.llen("tasks"))
+
+        client = EnumeratorClient(
+            conn,
+            self.tasks_by_name,
+            self.task2grammar,
+            scoringWorkers=0,
+            maximumInFlight=2,
+        )
+        client.run(self.messages(), onResult)
+        service.join(1)
+        self.assertEqual(len(queued), len(self.tasks))
+        self.assertLessEqual(max(queued), 2)
+
+    def test_worker_errors_are_raised(self):
+        conn = InMemoryTransport()
+        fake_service(conn, len(self.tasks), error="identity-3")
+        client = EnumeratorClient(
+            conn, self.tasks_by_name, self.task2grammar, scoringWorkers=1
+        )
+        with self.assertRaises(WorkerError) as caught:
+            client.run(self.messages(), lambda *result: None)
+        self.assertIn("boom", str(caught.exception))
+
+    def test_multicore_enumeration_with_data(self):
+        conn = InMemoryTransport()
+        fake_service(conn, len(self.tasks))
+        frontiers, searchTimes = multicore_enumeration_with_data(
+            self.grammar,
+            TypeWeights(),
+            self.tasks,
+            enumerationTimeout=1,
+            evaluationTimeout=1,
+            maximumFrontier=1,
+            connection=conn,
+            scoringWorkers=1,
+        )
+        self.assertTrue(all(len(f) == 1 for f in frontiers))
+        self.assertTrue(all(dt == 0.25 for dt in searchTimes.values()))
+        self.assertIsNotNone(conn.get(dsl_key(DSL_REGISTRY.hash(self.grammar))))
+
+
+if __name__ == "__main__":
+    unittest.main()
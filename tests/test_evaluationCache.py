@@ -0,0 +1,106 @@
+import multiprocessing
+
+import pytest
+
+from dreamcoder.evaluationCache import EVALUATION_CACHE, EvaluationCache, SharedVerdicts
+from dreamcoder.grammar import Grammar
+from dreamcoder.program import Primitive, Program
+from dreamcoder.task import Task
+from dreamcoder.type import Context, arrow, tint, tlist
+
+PRIMITIVES = [
+    Primitive("evaluation-0", tint, 0),
+    Primitive("evaluation-inc", arrow(tint, tint), lambda x: x + 1),
+    Primitive("evaluation-+", arrow(tint, tint, tint), lambda x: lambda y: x + y),
+    Primitive("evaluation-range", arrow(tint, tlist(tint)), lambda n: list(range(n))),
+    Primitive("evaluation-length", arrow(tlist(tint), tint), len),
+]
+
+
+def tasks(cache):
+    request = arrow(tint, tint)
+    inputs = [(0,), (1,), (3,)]
+    return [
+        Task("double", request, [(xs, 2 * xs[0]) for xs in inputs], cache=cache),
+        Task("increment", request, [(xs, xs[0] + 1) for xs in inputs], cache=cache),
+        Task("length", request, [(xs, xs[0]) for xs in inputs[1:]], cache=cache),
+    ]
+
+
+@pytest.fixture
+def programs():
+    g = Grammar.uniform(PRIMITIVES)
+    return [p for _, _, p in g.enumeration(Context.EMPTY, [], arrow(tint, tint), upperBound=10.0)]
+
+
+def test_verdicts_agree_with_uncached_checks(programs):
+    assert len(programs) > 50
+    before = EVALUATION_CACHE.statistics()
+    for _ in range(2):
+        for cached, uncached in zip(tasks(True), tasks(False)):
+            for p in programs:
+                assert cached.check(p, 1.0) == uncached.check(p, 1.0), str(p)
+    after = EVALUATION_CACHE.statistics()
+    assert after["hits"] > before["hits"]
+    assert after["misses"] > before["misses"]
+
+
+def test_bytes_are_bounded():
+    cache = EvaluationCache(maximumBytes=20000)
+    program = cache.programKey(Program.parse("(lambda (evaluation-range $0))"))
+    for n in range(200):
+        assert cache.record(program, (n,), list(range(n)), list(range(n)))
+        assert cache.bytes <= cache.maximumBytes
+    stats = cache.statistics()
+    assert stats["evictions"] > 0
+    assert 0 < stats["entries"] < 200
+    # The most recent entries are kept
+    assert cache.verdict(program, (199,), list(range(199)))
+    assert cache.verdict(program, (199,), []) is False
+    assert cache.verdict(program, (0,), []) is None
+
+
+def test_keys_do_not_hold_programs_or_inputs():
+    cache = EvaluationCache()
+    p = Program.parse("(lambda (evaluation-inc $0))")
+    key = cache.programKey(p)
+    assert isinstance(key, bytes) and key == cache.programKey(Program.parse(str(p)))
+    cache.record(key, ([1, 2],), 3, 3)
+    assert cache.verdict(key, ([1, 2],), 3)
+    assert all(isinstance(k, bytes) and isinstance(i, int) for k, i in cache.entries)
+    # Inputs without a fingerprint are not cached
+    assert cache.record(key, (lambda x: x,), 3, 3)
+    assert cache.verdict(key, (lambda x: x,), 3) is None
+
+
+def _recordInChild(cache, key):
+    cache.record(key, (1,), 2, 2)
+    cache.record(key, (2,), 3, 4)
+
+
+def test_shared_verdicts_cross_fork():
+    cache = EvaluationCache()
+    cache.share(slots=64)
+    key = cache.programKey(Program.parse("(lambda (evaluation-inc $0))"))
+    child = multiprocessing.get_context("fork").Process(target=_recordInChild, args=(cache, key))
+    child.start()
+    child.join()
+    assert cache.verdict(key, (1,), 2) is True
+    assert cache.verdict(key, (2,), 3) is False
+    assert cache.verdict(key, (3,), 4) is None
+    assert cache.statistics()["sharedHits"] == 2
+
+
+def test_shared_table_replaces_and_detects_torn_slots():
+    shared = SharedVerdicts(slots=8)
+    keys = [bytes([i]) * 16 for i in range(40)]
+    for i, k in enumerate(keys):
+        shared[k] = i % 2 == 0
+    assert shared.get(keys[-1]) is False
+    found = [shared.get(k) for k in keys]
+    assert all(v is None or v == (i % 2 == 0) for i, v in enumerate(found))
+    # A slot whose halves do not belong together is a miss
+    tag, code = shared.SLOT.unpack_from(shared.memory, 0)
+    if tag:
+        shared.SLOT.pack_into(shared.memory, 0, tag, code ^ 1)
+        assert all(shared.get(k) is None for k in keys if int.from_bytes(k[:8], "little") | 1 == tag)
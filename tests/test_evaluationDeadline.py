@@ -0,0 +1,153 @@
+import signal
+import threading
+import time
+
+import pytest
+
+from dreamcoder.evaluationDeadline import EVALUATION_DEADLINE, EvaluationTimeout
+from dreamcoder.likelihoodModel import ProbabilisticLikelihoodModel
+from dreamcoder.program import Primitive, Program
+from dreamcoder.task import TIMED_OUT, Task, TaskBatch
+from dreamcoder.type import arrow, t0, t1, tint
+
+
+def _iterate(f):
+    def loop(x):
+        while True:
+            x = f(x)
+
+    return loop
+
+
+def _spin(n):
+    while True:
+        n += 1
+
+
+def _sleep(f):
+    def apply(x):
+        time.sleep(0.2)
+        # Enough calls for the compiled lambda to look at the clock
+        for _ in range(3 * EVALUATION_DEADLINE.STEPS):
+            y = f(x)
+        return y
+
+    return apply
+
+
+PRIMITIVES = [
+    Primitive("deadline-0", tint, 0),
+    Primitive("deadline-inc", arrow(tint, tint), lambda x: x + 1),
+    Primitive("deadline-iterate", arrow(arrow(t0, t0), t0, t1), _iterate),
+    Primitive("deadline-spin", arrow(tint, tint), _spin),
+    Primitive("deadline-sleep", arrow(arrow(t0, t0), t0, t0), _sleep),
+]
+
+# Calls back into the program forever
+LOOP = Program.parse("(lambda (deadline-iterate (lambda (deadline-inc $0)) $0))")
+# Never calls back into the program
+SPIN = Program.parse("(lambda (deadline-spin $0))")
+INCREMENT = Program.parse("(lambda (deadline-inc $0))")
+
+
+def task(n=3):
+    return Task("increment", arrow(tint, tint), [((x,), x + 1) for x in range(n)])
+
+
+@pytest.fixture(autouse=True)
+def handlers():
+    handler = signal.getsignal(signal.SIGVTALRM)
+    yield
+    assert signal.getsignal(signal.SIGVTALRM) == handler
+    assert signal.getitimer(signal.ITIMER_VIRTUAL) == (0.0, 0.0)
+    assert EVALUATION_DEADLINE.deadline is None
+
+
+@pytest.mark.parametrize("program", [LOOP, SPIN])
+def test_nonterminating_programs_time_out(program):
+    started = time.perf_counter()
+    assert task().check(INCREMENT, 0.1)
+    assert not task().check(program, 0.1)
+    assert time.perf_counter() - started < 2.0
+
+
+def test_deadlines_are_in_cpu_time():
+    # Sleeping uses no CPU time, in the main thread or in any other
+    sleep = Program.parse("(lambda (deadline-sleep (lambda (deadline-inc $0)) $0))")
+    assert task(1).check(sleep, 0.05)
+    results = []
+    thread = threading.Thread(target=lambda: results.append(task(1).check(sleep, 0.05)))
+    thread.start()
+    thread.join(5.0)
+    assert results == [True]
+
+
+def test_without_timeout():
+    assert task().check(INCREMENT)
+    assert not task().check(Program.parse("(lambda deadline-0)"))
+
+
+def test_each_input_has_its_own_timeout():
+    batch = TaskBatch([task(), task(5)])
+    assert batch.outputs(INCREMENT, 0.05) == [x + 1 for x in range(5)]
+    for program in (LOOP, SPIN):
+        assert batch.outputs(program, 0.05) == [TIMED_OUT] * 5
+
+
+def test_nested_batches_share_the_timer():
+    with EVALUATION_DEADLINE.batch(0.1):
+        period = signal.getitimer(signal.ITIMER_VIRTUAL)[1]
+        assert period > 0
+        for _ in range(3):
+            assert not task().check(LOOP, 0.1)
+            assert task().check(INCREMENT, 0.1)
+            assert signal.getitimer(signal.ITIMER_VIRTUAL)[1] == period
+        # A shorter timeout needs a faster timer, until the batch ends
+        with EVALUATION_DEADLINE.batch(0.02):
+            assert signal.getitimer(signal.ITIMER_VIRTUAL)[1] < period
+        assert signal.getitimer(signal.ITIMER_VIRTUAL)[1] == period
+        assert EVALUATION_DEADLINE.timeout == 0.1
+
+
+def test_deadlines_in_other_threads():
+    results = []
+
+    def check():
+        results.append(
+            (
+                task().check(LOOP, 0.05),
+                task().check(INCREMENT, 0.05),
+                signal.getitimer(signal.ITIMER_VIRTUAL),
+            )
+        )
+
+    thread = threading.Thread(target=check)
+    thread.start()
+    thread.join(5.0)
+    assert results == [(False, True, (0.0, 0.0))]
+
+
+def test_probabilistic_scores_time_out_in_other_threads():
+    # Evaluation calls back into the program forever, and there is no timer
+    # outside of the main thread
+    loop = Program.parse("(deadline-iterate (lambda (deadline-inc $0)) deadline-0)")
+    results = []
+    thread = threading.Thread(
+        target=lambda: results.append(ProbabilisticLikelihoodModel(0.05).score(loop, task())),
+        daemon=True,
+    )
+    thread.start()
+    thread.join(5.0)
+    assert results == [(False, float("-inf"))]
+
+
+def test_steps_are_counted_by_compiled_lambdas():
+    f = INCREMENT.evaluateCompiled()
+    with EVALUATION_DEADLINE.batch(10.0) as deadline:
+        deadline.start()
+        assert [f(x) for x in range(10)] == list(range(1, 11))
+        assert deadline.remaining == deadline.STEPS - 10
+        deadline.deadline = deadline.clock()
+        deadline.remaining = 0
+        with pytest.raises(EvaluationTimeout):
+            f(0)
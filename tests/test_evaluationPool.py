@@ -0,0 +1,162 @@
+import os
+import time
+
+import pytest
+
+from dreamcoder.enumeration import enumerateForTasks
+from dreamcoder.evaluationPool import EvaluationPool
+from dreamcoder.grammar import Grammar
+from dreamcoder.likelihoodModel import AllOrNothingLikelihoodModel
+from dreamcoder.program import Primitive, Program, ProgramTable
+from dreamcoder.task import TIMED_OUT, Task, TaskBatch
+from dreamcoder.type import Context, arrow, tint
+
+
+def _spin(n):
+    while True:
+        n += 1
+
+
+def _addressSpace():
+    with open("/proc/self/statm") as handle:
+        return int(handle.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+
+
+PRIMITIVES = [
+    Primitive("pool-0", tint, 0),
+    Primitive("pool-inc", arrow(tint, tint), lambda x: x + 1),
+    Primitive("pool-+", arrow(tint, tint, tint), lambda x: lambda y: x + y),
+    Primitive("pool-exit", arrow(tint, tint), lambda x: os._exit(3)),
+    Primitive("pool-spin", arrow(tint, tint), _spin),
+    Primitive("pool-huge", arrow(tint, tint), lambda x: len(bytearray(2**34))),
+    # Loops in C, where no signal handler gets to run
+    Primitive("pool-sum", arrow(tint, tint), lambda x: sum(range(2**62))),
+    Primitive("pool-sleep", arrow(tint, tint), lambda x: time.sleep(60) or x),
+    Primitive("pool-function", arrow(tint, tint), lambda x: (lambda: x)),
+]
+
+INCREMENT = Program.parse("(lambda (pool-inc $0))")
+
+
+def tasks():
+    request = arrow(tint, tint)
+    inputs = [(0,), (1,), (2,)]
+    return [
+        Task("identity", request, [(xs, xs[0]) for xs in inputs]),
+        Task("increment", request, [(xs, xs[0] + 1) for xs in inputs]),
+        Task("double", request, [(xs, 2 * xs[0]) for xs in inputs]),
+    ]
+
+
+@pytest.fixture
+def programs():
+    g = Grammar.uniform(PRIMITIVES[:3])
+    return [p for _, _, p in g.enumeration(Context.EMPTY, [], arrow(tint, tint), upperBound=12.0)]
+
+
+def test_agrees_with_task_batch(programs):
+    batch = TaskBatch(tasks())
+    expected = [batch.logLikelihoods(p, 1.0) for p in programs]
+    table = ProgramTable(PRIMITIVES)
+    with EvaluationPool(workers=2, chunkSize=16) as pool:
+        assert pool.logLikelihoods(batch, programs, 1.0) == expected
+        assert pool.logLikelihoods(batch, programs, 1.0, table=table) == expected
+        for (ls, ys), p in zip(pool.evaluate(batch, programs, 1.0, outputs=True), programs):
+            assert ys == batch.outputs(p, 1.0)
+        assert pool.restarts == 0
+
+
+def test_submissions_are_answered_while_polling(programs):
+    batch = TaskBatch(tasks())
+    expected = [batch.logLikelihoods(p, 1.0) for p in programs]
+    with EvaluationPool(workers=2, chunkSize=16) as pool:
+        evaluations = [pool.submit(batch, programs[i : i + 40], 1.0) for i in range(0, len(programs), 40)]
+        # Answers are only collected by polling
+        assert pool.inFlight == sum(-(-len(e.programs) // 16) for e in evaluations)
+        assert not any(e.done for e in evaluations)
+        while pool.inFlight:
+            pool.poll(None)
+        assert [ls for e in evaluations for ls, _ in e.results()] == expected
+
+
+def test_outputs():
+    batch = TaskBatch(tasks())
+    with EvaluationPool(stallTimeout=None) as pool:
+        spin, function = pool.evaluate(
+            batch,
+            [Program.parse("(lambda (pool-spin $0))"), Program.parse("(lambda (pool-function $0))")],
+            0.05,
+            outputs=True,
+        )
+    assert spin[1] == [TIMED_OUT] * 3
+    # Functions cannot be sent back
+    assert function[1] == [None] * 3
+
+
+@pytest.mark.parametrize(
+    "source, options",
+    [
+        ("(lambda (pool-exit $0))", {}),
+        ("(lambda (pool-sum $0))", {"maximumCPU": 1, "stallTimeout": None}),
+        ("(lambda (pool-sleep $0))", {"stallTimeout": 0.5}),
+    ],
+)
+def test_a_runaway_program_only_loses_itself(source, options):
+    batch = TaskBatch(tasks())
+    programs = [INCREMENT] * 5 + [Program.parse(source)] + [INCREMENT] * 5
+    with EvaluationPool(chunkSize=4, **options) as pool:
+        likelihoods = pool.logLikelihoods(batch, programs, 0.1)
+        assert pool.restarts == 1
+        assert likelihoods[5] == [float("-inf")] * 3
+        assert all(ls == [float("-inf"), 0.0, float("-inf")] for ls in likelihoods[:5] + likelihoods[6:])
+        # The replacement serves later requests
+        assert pool.logLikelihoods(batch, [INCREMENT], 0.1) == [likelihoods[0]]
+
+
+def test_memory_limit():
+    batch = TaskBatch(tasks())
+    with EvaluationPool(maximumMemory=_addressSpace() + 2**30) as pool:
+        likelihoods = pool.logLikelihoods(batch, [Program.parse("(lambda (pool-huge $0))"), INCREMENT], 0.1)
+        assert likelihoods == [[float("-inf")] * 3, [float("-inf"), 0.0, float("-inf")]]
+        # Running out of memory is an exception in the worker, which survives it
+        assert pool.restarts == 0
+
+
+def search(primitives, sandbox):
+    ts = tasks()
+    frontiers, _, n = enumerateForTasks(
+        Grammar.uniform(primitives),
+        ts,
+        AllOrNothingLikelihoodModel(timeout=0.1),
+        timeout=60,
+        upperBound=9.0,
+        budgetIncrement=3.0,
+        maximumFrontiers={t: 5 for t in ts},
+        sandboxedEvaluation=sandbox,
+    )
+    return [[str(e.program) for e in frontiers[t]] for t in ts], n
+
+
+def test_enumeration_in_a_sandbox():
+    assert search(PRIMITIVES[:3], False) == search(PRIMITIVES[:3], {"chunkSize": 8})
+    # Programs which exit would take the search down with them
+    frontiers, _ = search(PRIMITIVES[:4], True)
+    assert "(lambda (pool-inc $0))" in frontiers[1]
+
+
+def test_a_search_stops_at_its_timeout():
+    ts = tasks()
+    # Sleeping takes no CPU time, so only the end of the search stops it
+    g = Grammar.uniform(PRIMITIVES[:2] + [PRIMITIVES[7]])
+    started = time.monotonic()
+    enumerateForTasks(
+        g,
+        ts,
+        AllOrNothingLikelihoodModel(timeout=0.1),
+        timeout=1,
+        upperBound=20.0,
+        budgetIncrement=3.0,
+        maximumFrontiers={t: 5 for t in ts},
+        sandboxedEvaluation={"chunkSize": 1},
+    )
+    assert time.monotonic() - started < 5.0
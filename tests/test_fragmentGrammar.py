@@ -1,3 +1,4 @@
+import math
 import unittest
 
 
@@ -9,6 +10,35 @@ class TestFragmentGrammar(unittest.TestCase):
         except Exception:
             self.fail('Unable to import from fragmentGrammar module')
 
+    def test_inside_outside(self):
+        from dreamcoder.fragmentGrammar import FragmentGrammar
+        from dreamcoder.frontier import Frontier, FrontierEntry
+        from dreamcoder.program import Primitive, Program
+        from dreamcoder.task import Task
+        from dreamcoder.type import arrow, tint
+
+        primitives = [Primitive("fragment-0", tint, 0),
+                      Primitive("fragment-1", tint, 1),
+                      Primitive("fragment-+", arrow(tint, tint, tint), None)]
+        g = FragmentGrammar.uniform(primitives)
+        task = Task("fragment", arrow(tint, tint), [])
+        frontiers = [Frontier([FrontierEntry(Program.parse(s), logPrior=0., logLikelihood=l)
+                               for s, l in programs], task)
+                     for programs in [[("(lambda (fragment-+ $0 fragment-1))", 0.),
+                                       ("(lambda (fragment-+ fragment-1 $0))", -1.)],
+                                      [("(lambda $0)", 0.)],
+                                      []]]
+
+        uses = g.expectedUses(frontiers[:2])
+        expected = FragmentGrammar(
+            math.log(uses.actualVariables + 1.) - math.log(max(uses.possibleVariables, 1.)),
+            [(math.log(uses.actualUses.get(p, 0.) + 1.) - math.log(uses.possibleUses.get(p, 0.) + 1.), t, p)
+             for _, t, p in g.productions])
+        actual = g.insideOutside(frontiers, 1.)
+        self.assertAlmostEqual(actual.logVariable, expected.logVariable, places=9)
+        for (l, _, _), (m, _, _) in zip(actual.productions, expected.productions):
+            self.assertAlmostEqual(l, m, places=9)
+
 
 if __name__ == '__main__':
     unittest.main()
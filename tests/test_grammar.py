@@ -1,4 +1,5 @@
 import math
+import random
 import pytest
 from dreamcoder.domains.list.listPrimitives import bootstrapTarget_extra, julia
 from dreamcoder.domains.arc.primitives import (
@@ -8,10 +9,19 @@ from dreamcoder.domains.arc.primitives import (
     tset,
     ttuple2,
 )
-from dreamcoder.grammar import Grammar
+from dreamcoder.grammar import ContextualGrammar, Grammar, NoCandidates
 from dreamcoder.program import Program
 from dreamcoder.task import NamedVarsTask, Task
-from dreamcoder.type import ARROW, Type, TypeNamedArgsConstructor, tlist, tint, arrow
+from dreamcoder.type import (
+    ARROW,
+    Context,
+    UnionFindContext,
+    Type,
+    TypeNamedArgsConstructor,
+    tlist,
+    tint,
+    arrow,
+)
 
 
 @pytest.fixture(scope="module")
@@ -163,6 +173,58 @@ def test_program_likelihood2(julia_grammar):
     assert math.isclose(likelihood, -30.091729134650784)
 
 
+def test_best_first_enumeration(base_grammar):
+    request = arrow(tlist(tint), tlist(tint))
+    expected = {
+        str(p): -l
+        for l, _, p in base_grammar.enumeration(
+            Context.EMPTY, [], request, upperBound=10.0, maximumDepth=99
+        )
+    }
+    enumerator = base_grammar.bestFirstEnumeration(
+        Context.EMPTY, [], request, maximumDepth=99, upperBound=100.0
+    )
+    found = []
+    for budget in range(1, 11):
+        window = [(str(p), -l) for l, _, p in enumerator.enumerate(float(budget))]
+        assert all(budget - 1 <= mdl < budget for _, mdl in window)
+        found.extend(window)
+
+    assert len(found) == len(expected) > 100
+    assert all(math.isclose(mdl, expected[p]) for p, mdl in found)
+    assert all(a[1] <= b[1] for a, b in zip(found, found[1:]))
+    assert enumerator.emitted == len(found)
+
+
+def test_candidates_are_cached_up_to_renaming():
+    prims = bootstrapTarget_extra()
+    g = Grammar.uniform(prims)
+
+    def candidates(g, variables):
+        # A context in which the request and environment mention `variables`
+        context = Context.EMPTY
+        for _ in range(max(variables) + 1):
+            context, _ = context.makeVariable()
+        a, b = [Type.fromstring("t%d" % v) for v in variables]
+        request = tlist(a)
+        environment = [tlist(b), arrow(a, b)]
+        return [
+            (l, str(p), str(t.apply(k)), k.nextVariable)
+            for l, t, p, k in g.buildCandidates(request, context, environment)
+        ]
+
+    first = candidates(g, [0, 1])
+    renamed = candidates(g, [7, 3])
+    assert (g.candidateCache.misses, g.candidateCache.hits) == (1, 1)
+    assert renamed == candidates(Grammar.uniform(prims), [7, 3])
+    assert len(first) == len(renamed)
+
+    g.candidateCache.maximumSize = 1
+    candidates(g, [1, 1])
+    assert len(g.candidateCache) == 1
+    assert "candidateCache" not in g.__getstate__()
+
+
 def sample_wrapper_programs():
     programs = [
         {
@@ -488,3 +550,44 @@ def test_parsing_invented_functions(arc_ext_grammar, solution):
     )
     print(likelihood)
     assert math.isclose(likelihood, solution["logLikelihood"])
+
+
+@pytest.mark.parametrize("contextual", [False, True])
+def test_union_find_context_agrees_with_context(base_grammar, contextual):
+    g = ContextualGrammar.fromGrammar(base_grammar) if contextual else base_grammar
+    request = arrow(tlist(tint), tlist(tint))
+
+    def enumerate(context):
+        return [(l, str(p)) for l, _, p in g.enumeration(context, [], request, upperBound=9.5, maximumDepth=99)]
+
+    if not contextual:
+        # Lambda wrappers have no library entry in a contextual grammar, which
+        # fails to enumerate whatever its context
+        programs = enumerate(Context.EMPTY)
+        assert len(programs) > 100
+        assert enumerate(UnionFindContext()) == programs
+
+    for seed in range(20):
+        samples = []
+        for context in [Context.EMPTY, UnionFindContext()]:
+            random.seed(seed)
+            arguments = (None, None, context, [], request) if contextual else (request, context, [])
+            try:
+                samples.append(g._sample(*arguments, 6)[1])
+            except NoCandidates:
+                samples.append(None)
+        assert str(samples[0]) == str(samples[1])
+        if samples[0] is None:
+            continue
+
+        summaries = []
+        for context in [Context.EMPTY, UnionFindContext()]:
+            if contextual:
+                arguments = (None, None, context, [], request, samples[0])
+            else:
+                arguments = (context, [], {}, request, samples[0])
+            summaries.append(g.likelihoodSummary(*arguments))
+        # The union-find store is updated in place
+        assert summaries[1][0] is arguments[2 if contextual else 0]
+        assert summaries[1][-1] is not None
+        assert summaries[1][-1].logLikelihood(g) == summaries[0][-1].logLikelihood(g)
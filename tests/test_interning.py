@@ -0,0 +1,104 @@
+import pickle
+import unittest
+
+from dreamcoder.program import PROGRAM_INTERNER, Primitive, Program
+from dreamcoder.task import Task
+from dreamcoder.type import TYPE_INTERNER, Context, Type, UnionFindContext, arrow, tint, tlist
+
+PRIMITIVES = [
+    Primitive("intern-0", tint, 0),
+    Primitive("intern-+", arrow(tint, tint, tint), lambda x: lambda y: x + y),
+]
+
+
+class TestProgramInterning(unittest.TestCase):
+    def test_equal_programs_are_identical(self):
+        s = "(lambda (intern-+ (intern-+ $0 intern-0) #(lambda (intern-+ $0 $0))))"
+        p = Program.parse(s).intern()
+        q = Program.parse(s).intern()
+        self.assertIs(p, q)
+        self.assertIs(p.body.f.x, Program.parse("(intern-+ $0 intern-0)").intern())
+        self.assertEqual(p, Program.parse(s))
+        self.assertEqual(hash(p), hash(Program.parse(s)))
+        self.assertEqual(p.size(), Program.parse(s).size())
+
+    def test_interned_programs_compare_by_identity(self):
+        p = Program.parse("(lambda (intern-+ $0 intern-0))").intern()
+        q = Program.parse("(lambda (intern-+ intern-0 $0))").intern()
+        self.assertNotEqual(p, q)
+        self.assertTrue(p.interned and q.interned)
+        self.assertEqual(len({p, q, Program.parse(str(p))}), 2)
+
+    def test_unused_programs_leave_the_table(self):
+        before = len(PROGRAM_INTERNER.compounds)
+        Program.parse("(lambda (intern-+ $0 (intern-+ $0 (intern-+ $0 $0))))").intern()
+        self.assertEqual(len(PROGRAM_INTERNER.compounds), before)
+
+    def test_unpickled_programs_are_not_interned(self):
+        p = Program.parse("(lambda (lambda ($1 ($1 $0))))").intern()
+        q = pickle.loads(pickle.dumps(p))
+        self.assertFalse(q.interned)
+        self.assertEqual(p, q)
+        self.assertIs(q.intern(), p)
+
+
+class TestTypeInterning(unittest.TestCase):
+    def test_equal_types_are_identical(self):
+        t = Type.fromstring("list(int) -> t0 -> list(t0)").intern()
+        self.assertIs(t, arrow(tlist(tint), Type.fromstring("t0 -> list(t0)")).intern())
+        self.assertIs(t.arguments[0], tlist(tint).intern())
+        self.assertEqual(hash(t), hash(Type.fromstring(str(t))))
+        self.assertNotEqual(t, tlist(tint).intern())
+
+    def test_named_arguments_ignore_order(self):
+        t = Type.fromstring("inp0:int -> inp1:list(int) -> int").intern()
+        u = Type.fromstring("inp1:list(int) -> inp0:int -> int").intern()
+        self.assertIs(t, u)
+
+    def test_unpickled_types_are_not_interned(self):
+        t = tlist(tlist(tint)).intern()
+        u = pickle.loads(pickle.dumps(t))
+        self.assertFalse(u.interned)
+        self.assertEqual(t, u)
+        self.assertIs(TYPE_INTERNER.intern(u), t)
+
+    def test_parsed_types_are_interned(self):
+        t = Type.fromstring("list(t1) -> (t1 -> int) -> list(int)")
+        self.assertTrue(t.interned)
+        self.assertIs(t, Type.fromstring("list(t1) -> (t1 -> int) -> list(int)"))
+        self.assertIs(t, Type._parse(str(t)).intern())
+        # The interned copy could list named arguments in another order
+        for s in ["inp0:int -> inp1:list(int) -> int", "inp1:list(int) -> inp0:int -> int"]:
+            u = Type.fromstring(s)
+            self.assertFalse(u.interned)
+            self.assertEqual(str(u), s)
+            self.assertIs(u, Type.fromstring(s))
+        self.assertTrue(Type.fromstring("inp0:list(int) -> list(int)").interned)
+
+    def test_derived_types_are_remembered(self):
+        t = Type.fromstring("t3 -> (t3 -> t5) -> list(t5)")
+        self.assertIs(t.canonical(), t.canonical())
+        self.assertIs(t.canonical(), Type.fromstring("t0 -> (t0 -> t1) -> list(t1)"))
+        self.assertEqual(t.canonical({}), t.canonical())
+        self.assertEqual(t.functionArguments(), Type._parse(str(t)).functionArguments())
+        self.assertIs(t.returns(), tlist(Type.fromstring("t5")).intern())
+        t.functionArguments().pop()
+        self.assertEqual(len(t.functionArguments()), 2)
+        u = Type.fromstring("inp0:list(int) -> t0 -> int")
+        self.assertEqual(u.functionArguments(), [("inp0", tlist(tint)), Type.fromstring("t0")])
+        self.assertIs(u.returns(), tint.intern())
+
+    def test_identical_types_unify_at_once(self):
+        t = Type.fromstring("list(t0) -> list(t0)")
+        self.assertIs(Context.EMPTY.unify(t, t), Context.EMPTY)
+        context = UnionFindContext(1)
+        context.unify(t, t)
+        self.assertEqual(context.trail, [])
+
+    def test_task_requests_are_interned(self):
+        task = Task("intern", arrow(tlist(tint), tlist(tint)), [])
+        self.assertIs(task.request, Type.fromstring("list(int) -> list(int)"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import itertools
+import unittest
+
+from dreamcoder.enumeration import bottom_up_parallel_worker
+from dreamcoder.grammar import PCFG, Grammar, ObservationalEquivalence
+from dreamcoder.program import Primitive
+from dreamcoder.task import Task
+from dreamcoder.type import arrow, tint
+
+PRIMITIVES = [
+    Primitive("oe-0", tint, 0),
+    Primitive("oe-1", tint, 1),
+    Primitive("oe-+", arrow(tint, tint, tint), lambda x: lambda y: x + y),
+    Primitive("oe-*", arrow(tint, tint, tint), lambda x: lambda y: x * y),
+]
+
+INPUTS = [(0,), (1,), (2,), (5,)]
+
+
+def behaviour(p):
+    f = p.evaluate([])
+    return tuple(f(*xs) for xs in INPUTS)
+
+
+class TestObservationalEquivalence(unittest.TestCase):
+    def setUp(self):
+        self.request = arrow(tint, tint)
+        self.pcfg = PCFG.from_grammar(
+            Grammar.uniform(PRIMITIVES), self.request
+        ).number_rules()
+
+    def enumerate(self, equivalence, n=200):
+        return list(
+            itertools.islice(self.pcfg.quantized_enumeration(equivalence=equivalence), n)
+        )
+
+    def test_programs_have_distinct_behaviours(self):
+        equivalence = ObservationalEquivalence(INPUTS, self.pcfg.number_of_arguments)
+        programs = self.enumerate(equivalence)
+        behaviours = [behaviour(p) for p in programs]
+        self.assertEqual(len(set(behaviours)), len(behaviours))
+        self.assertGreater(equivalence.pruned, 0)
+        self.assertGreater(equivalence.hitRate, 0.0)
+
+        plain = {behaviour(p) for p in self.enumerate(None)}
+        self.assertGreater(len(set(behaviours)), len(plain))
+
+    def test_cheapest_equivalent_is_kept(self):
+        equivalence = ObservationalEquivalence(INPUTS, self.pcfg.number_of_arguments)
+        programs = [str(p) for p in self.enumerate(equivalence, 20)]
+        self.assertIn("(lambda $0)", programs)
+        self.assertNotIn("(lambda (oe-+ $0 oe-0))", programs)
+        self.assertNotIn("(lambda (oe-* $0 oe-1))", programs)
+
+    def test_inputs_are_deduplicated(self):
+        equivalence = ObservationalEquivalence(INPUTS + INPUTS, 1)
+        self.assertEqual(equivalence.inputs, INPUTS)
+
+    def test_fingerprint_table_is_bounded(self):
+        equivalence = ObservationalEquivalence(
+            INPUTS, self.pcfg.number_of_arguments, maximumFingerprints=5
+        )
+        self.enumerate(equivalence, 50)
+        self.assertLessEqual(len(equivalence.table), 5)
+
+    def test_bottom_up_worker_finds_solution(self):
+        task = Task("double", self.request, [(xs, 2 * xs[0]) for xs in INPUTS])
+        g = Grammar.uniform(PRIMITIVES)
+        frontiers, numberOfPrograms = bottom_up_parallel_worker(
+            g,
+            self.pcfg,
+            [self.pcfg.split(1)[0][0]],
+            [task],
+            1.0,
+            {task: 1},
+            evaluationTimeout=1.0,
+            observationalEquivalence=True,
+        )
+        self.assertEqual(len(frontiers[task]), 1)
+        self.assertEqual(behaviour(frontiers[task].entries[0].program), (0, 2, 4, 10))
+
+
+if __name__ == "__main__":
+    unittest.main()
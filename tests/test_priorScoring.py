@@ -0,0 +1,74 @@
+import unittest
+from unittest import mock
+
+from dreamcoder.grammar import Grammar
+from dreamcoder.priorScoring import PriorScorer
+from dreamcoder.program import Primitive, Program
+from dreamcoder.type import arrow, tint
+from dreamcoder.utilities import BoundedCache
+
+INC = Primitive("prior-inc", arrow(tint, tint), lambda x: x + 1)
+
+
+class TestPriorScorer(unittest.TestCase):
+    def setUp(self):
+        self.grammar = Grammar.uniform([INC])
+        self.request = arrow(tint, tint)
+        self.programs = ["(lambda $0)", "(lambda (prior-inc $0))"]
+
+    def test_priors_match_grammar(self):
+        scorer = PriorScorer()
+        priors = scorer.score(self.grammar, [(self.request, s) for s in self.programs])
+        for s in self.programs:
+            p, logPrior = priors[(self.request, s)]
+            self.assertEqual(str(p), s)
+            self.assertAlmostEqual(logPrior, self.grammar.logLikelihood(self.request, p))
+
+    def test_each_program_is_parsed_and_scored_once(self):
+        scorer = PriorScorer()
+        jobs = [(self.request, s) for s in self.programs] * 3
+        with mock.patch.object(
+            Program, "parse", wraps=Program.parse
+        ) as parse, mock.patch.object(
+            Grammar, "logLikelihood", autospec=True, side_effect=Grammar.logLikelihood
+        ) as logLikelihood:
+            scorer.score(self.grammar, jobs)
+            scorer.score(self.grammar, jobs)
+            # A grammar with the same content shares the cached priors
+            scorer.score(Grammar.uniform([INC]), jobs)
+        self.assertEqual(parse.call_count, 2)
+        self.assertEqual(logLikelihood.call_count, 2)
+
+    def test_grammars_do_not_share_priors(self):
+        scorer = PriorScorer()
+        job = (self.request, self.programs[1])
+        uniform = scorer.score(self.grammar, [job])[job][1]
+        skewed = Grammar(
+            0.0,
+            [(-5.0, t, p) for _, t, p in self.grammar.productions],
+            continuationType=None,
+        )
+        self.assertNotAlmostEqual(uniform, scorer.score(skewed, [job])[job][1])
+
+    def test_failures_are_reported(self):
+        scorer = PriorScorer()
+        failures = []
+        job = (arrow(tint, tint, tint), "(lambda (prior-inc $0))")
+        with self.assertRaises(Exception):
+            scorer.score(self.grammar, [job], onFailure=lambda *f: failures.append(f))
+        self.assertEqual(len(failures), 1)
+
+    def test_bounded_cache_evicts_least_recently_used(self):
+        cache = BoundedCache(2)
+        cache["a"] = 1
+        cache["b"] = 2
+        cache.get("a")
+        cache["c"] = 3
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
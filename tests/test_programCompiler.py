@@ -0,0 +1,136 @@
+import unittest
+
+from dreamcoder.grammar import Grammar
+from dreamcoder.program import (
+    Abstraction,
+    Application,
+    Index,
+    Invented,
+    Primitive,
+    Program,
+    ProgramCompiler,
+)
+from dreamcoder.type import Context, arrow, t0, tbool, tint, tlist
+from dreamcoder.utilities import NEGATIVEINFINITY
+
+BOOM = []
+
+
+def _boom(x):
+    BOOM.append(x)
+    raise ValueError(x)
+
+
+def _fold(xs):
+    def folder(z):
+        def f(g):
+            y = z
+            for x in xs:
+                y = g(x)(y)
+            return y
+
+        return f
+
+    return folder
+
+
+PRIMITIVES = [
+    Primitive("compiler-0", tint, 0),
+    Primitive("compiler-1", tint, 1),
+    Primitive("compiler-+", arrow(tint, tint, tint), lambda x: lambda y: x + y),
+    Primitive("compiler-zero?", arrow(tint, tbool), lambda x: x == 0),
+    Primitive("compiler-boom", arrow(tint, tint), _boom),
+    Primitive("compiler-fold", arrow(tlist(t0), t0, arrow(t0, t0, t0), t0), _fold),
+]
+
+# The compiler recognizes conditionals by name. This one is not registered, so
+# that parsing "if" elsewhere still finds the domain's primitive.
+IF = Primitive("if", arrow(tbool, t0, t0, t0), lambda c: lambda t: lambda f: t if c else f)
+if Primitive.GLOBALS.get("if") is IF:
+    del Primitive.GLOBALS["if"]
+
+ZERO, ONE, PLUS, ISZERO, BOOM_, FOLD = PRIMITIVES
+
+
+def apply(f, *xs):
+    for x in xs:
+        f = Application(f, x)
+    return f
+
+
+def run(p, xs, compiled):
+    try:
+        f = p.evaluateCompiled(cache=False) if compiled else p.evaluate([])
+        for x in xs:
+            f = f(x)
+        return f
+    except Exception as e:
+        return type(e)
+
+
+class TestProgramCompiler(unittest.TestCase):
+    def test_agrees_with_evaluate(self):
+        g = Grammar(
+            0.0,
+            [(0.0, p.infer(), p) for p in PRIMITIVES + [IF] if p is not BOOM_],
+            logFreeVariable=NEGATIVEINFINITY,
+        )
+        inputs = {
+            arrow(tint, tint): [(0,), (1,), (5,)],
+            arrow(tlist(tint), tint, tint): [([], 2), ([1, 2, 3], 0)],
+        }
+        for request, examples in inputs.items():
+            programs = [
+                p
+                for _, _, p in g.enumeration(Context.EMPTY, [], request, upperBound=11.0)
+                if "<HOLE>" not in str(p)
+            ]
+            self.assertGreater(len(programs), 90)
+            for p in programs:
+                for xs in examples:
+                    self.assertEqual(run(p, xs, True), run(p, xs, False), str(p))
+
+    def test_conditionals_are_lazy(self):
+        # (lambda (if (zero? $0) 1 (boom $0)))
+        p = Abstraction(apply(IF, Application(ISZERO, Index(0)), ONE, Application(BOOM_, Index(0))))
+        del BOOM[:]
+        self.assertEqual(p.evaluateCompiled()(0), 1)
+        self.assertEqual(BOOM, [])
+        with self.assertRaises(ValueError):
+            p.evaluateCompiled()(3)
+        self.assertEqual(BOOM, [3])
+
+        # Partially applied, `if` is an ordinary function
+        p = Abstraction(apply(IF, Application(ISZERO, Index(0)), ONE))
+        self.assertEqual(p.evaluateCompiled()(0)(2), 1)
+        self.assertEqual(p.evaluateCompiled()(4)(2), 2)
+
+        # Applied to more than three arguments, the branch taken is applied to the rest
+        p = Abstraction(apply(IF, Application(ISZERO, Index(0)), Application(PLUS, ONE), BOOM_, Index(0)))
+        self.assertEqual(p.evaluateCompiled()(0), 1)
+
+    def test_environment_and_inventions(self):
+        double = Invented(Abstraction(apply(PLUS, Index(0), Index(0))))
+        p = apply(double, Index(1))
+        self.assertEqual(p.evaluateCompiled([5, 7]), 14)
+        self.assertEqual(p.evaluateCompiled([5, 7]), p.evaluate([5, 7]))
+        with self.assertRaises(IndexError):
+            p.evaluateCompiled([5])
+
+    def test_compiled_forms_are_cached(self):
+        compiler = ProgramCompiler(maximumPrograms=2)
+        p = Program.parse("(lambda (compiler-+ $0 compiler-1))")
+        code = compiler.compile(p)
+        self.assertIs(compiler.compile(Program.parse("(lambda (compiler-+ $0 compiler-1))")), code)
+        self.assertIsNot(compiler.compile(p, cache=False), code)
+        self.assertEqual(code(())(2), 3)
+
+        # Uncached programs do not take the place of cached ones
+        other = Primitive("compiler-+", PLUS.tp, lambda x: lambda y: x * y)
+        q = Abstraction(apply(other, Index(0), ONE))
+        self.assertEqual(compiler.compile(q, cache=False)(())(2), 2)
+        self.assertIs(compiler.compile(p), code)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import base64
+import pickle
+
+import pytest
+
+from dreamcoder.compression import rustCompressionMessage
+from dreamcoder.frontier import Frontier, FrontierEntry, binaryPrograms
+from dreamcoder.grammar import Grammar
+from dreamcoder.program import (
+    Abstraction,
+    Application,
+    FragmentVariable,
+    FreeVariable,
+    Hole,
+    Index,
+    Invented,
+    Primitive,
+    Program,
+    ProgramTable,
+)
+from dreamcoder.task import Task
+from dreamcoder.type import Context, arrow, t0, tint, tlist
+
+PRIMITIVES = [
+    Primitive("encoding-0", tint, 0),
+    Primitive("encoding-1", tint, 1),
+    Primitive("encoding-+", arrow(tint, tint, tint), None),
+    Primitive("encoding-empty", tlist(t0), []),
+    Primitive("encoding-cons", arrow(t0, tlist(t0), tlist(t0)), None),
+    Primitive("encoding-fold", arrow(tlist(t0), t0, arrow(t0, t0, t0), t0), None),
+]
+# Not part of the table
+OUTSIDE = Primitive("encoding-outside", tint, 2)
+
+INVENTION = Invented(Program.parse("(lambda (lambda (encoding-cons $1 $0)))"))
+
+PROGRAMS = [
+    "(lambda (encoding-cons (encoding-+ $0 encoding-1) encoding-empty))",
+    "(lambda (encoding-fold $0 encoding-0 (lambda (lambda (encoding-+ $0 $1)))))",
+    "(lambda (#(lambda (lambda (encoding-cons $1 $0))) encoding-1 $0))",
+    "(lambda (#(lambda (encoding-+ $0 $0)) encoding-outside))",
+    "let $v1::list(int) = Const(list(int), Any[1, 2]) in (encoding-cons $inp0 $v1)",
+    "let $v1 = rev($inp0 = (encoding-cons encoding-1 $v1)) in (encoding-+ $v1 encoding-1)",
+]
+
+
+@pytest.fixture
+def table():
+    return ProgramTable(PRIMITIVES + [INVENTION])
+
+
+@pytest.mark.parametrize("s", PROGRAMS)
+def test_round_trips(table, s):
+    p = Program.parse(s)
+    data = table.encode(p)
+    assert isinstance(data, bytes)
+    assert table.decode(data) == p
+    assert ProgramTable(table.productions).decode(data) == p
+
+
+def test_unusual_nodes_round_trip(table):
+    body = Index(40)
+    for _ in range(41):
+        body = Abstraction(body)
+    wide = PRIMITIVES[2]
+    for i in range(9):
+        wide = Application(wide, Index(i))
+    programs = [
+        body,
+        wide,
+        Abstraction(Application(OUTSIDE, Hole.single)),
+        Application(FragmentVariable.single, FreeVariable(None)),
+        Application(FreeVariable("inp0"), FreeVariable(None)),
+    ]
+    for p in programs:
+        assert table.decode(table.encode(p)) == p, str(p)
+
+
+def test_enumerated_programs_are_compact():
+    g = Grammar.uniform(PRIMITIVES + [INVENTION])
+    table = ProgramTable.fromGrammar(g)
+    assert ProgramTable.fromGrammar(g) is table
+    programs = [
+        p for _, _, p in g.enumeration(Context.EMPTY, [], arrow(tlist(tint), tint), upperBound=12.0)
+    ]
+    assert len(programs) > 100
+    encodings = [table.encode(p) for p in programs]
+    assert [table.decode(data) for data in encodings] == programs
+    assert 4 * sum(map(len, encodings)) < sum(len(str(p)) for p in programs)
+
+
+def test_table_is_pickled_by_name(table):
+    payload = pickle.dumps(table)
+    assert b"encoding-cons" in payload
+    assert pickle.loads(payload).hash == table.hash
+    assert pickle.loads(payload) is pickle.loads(payload)
+
+
+def test_malformed_encodings_are_rejected(table):
+    data = table.encode(Program.parse(PROGRAMS[1]))
+    with pytest.raises(ValueError):
+        table._decode(data[:-1])
+    with pytest.raises(ValueError):
+        table._decode(data + data)
+
+
+def test_frontier_entries_pickle_in_either_format(table):
+    entries = [
+        FrontierEntry(Program.parse(s), logPrior=-float(i), logLikelihood=0.0)
+        for i, s in enumerate(PROGRAMS)
+    ]
+    plain = pickle.dumps(entries)
+    with binaryPrograms(table):
+        binary = pickle.dumps(entries)
+    assert FrontierEntry.programTable is None
+    assert len(binary) < len(plain)
+    for payload in (plain, binary):
+        loaded = pickle.loads(payload)
+        assert [e.program for e in loaded] == [e.program for e in entries]
+        assert [e.logPrior for e in loaded] == [e.logPrior for e in entries]
+
+
+def test_rust_compressor_messages_carry_binary_programs():
+    g = Grammar.uniform(PRIMITIVES[:3] + [INVENTION] + PRIMITIVES[3:])
+    programs = [Program.parse(s) for s in PROGRAMS]
+    frontier = Frontier(
+        [FrontierEntry(p, logPrior=-1.0, logLikelihood=0.0) for p in programs],
+        Task("encoding", arrow(tlist(tint), tint), []),
+    )
+    plain = rustCompressionMessage(g, [frontier])
+    assert "table" not in plain
+    assert [s["expression"] for s in plain["frontiers"][0]["solutions"]] == PROGRAMS
+
+    message = rustCompressionMessage(g, [frontier], binaryPrograms=True)
+    table = ProgramTable.fromGrammar(g)
+    order = [p["name"] for p in message["primitives"]] + [
+        i["expression"] for i in message["inventions"]
+    ]
+    assert [order[i] for i in message["table"]] == [
+        p.name if p.isPrimitive else str(p.body) for p in table.productions
+    ]
+    solutions = message["frontiers"][0]["solutions"]
+    # Only the first three programs are made of the productions of the table
+    assert [s.get("expression") for s in solutions[3:]] == PROGRAMS[3:]
+    for s, p in zip(solutions[:3], programs):
+        assert "expression" not in s
+        assert table.decode(base64.b64decode(s["program"])) == p
+        assert s["logprior"] == -1.0
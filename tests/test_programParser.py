@@ -0,0 +1,83 @@
+import pytest
+
+from dreamcoder.program import (
+    Abstraction,
+    Constant,
+    FreeVariable,
+    Index,
+    LetClause,
+    LetRevClause,
+    Primitive,
+    ProgramParser,
+)
+from dreamcoder.type import Type, arrow, t0, tbool, tint, tlist
+from dreamcoder.utilities import ParseFailure
+
+PRIMITIVES = [
+    Primitive("parser-1", tint, 1),
+    Primitive("parser-empty", tlist(t0), []),
+    Primitive("parser-+", arrow(tint, tint, tint), None),
+    Primitive("parser-cons", arrow(t0, tlist(t0), tlist(t0)), None),
+    Primitive("parser-eq?", arrow(t0, t0, tbool), None),
+    Primitive("parser-if", arrow(tbool, t0, t0, t0), None),
+]
+
+PROGRAMS = [
+    "(lambda (parser-cons (parser-+ $0 parser-1) parser-empty))",
+    "#(lambda (lambda (parser-cons $1 $0)))",
+    "(lambda (#(lambda (lambda (parser-cons $1 $0))) parser-1 $0))",
+    "let $v1::bool = (parser-eq? $inp0 $inp0) in let $v2, $v3 = rev($inp0 = (parser-cons $v2 $v3)) in (parser-if $v1 $v3 parser-empty)",
+    "let $v1 = rev($inp0 = (parser-cons parser-1 $v1)) in (parser-+ $v1 parser-1)",
+    "let $v1::list(int) = Const(list(int), Any[1, 2]) in (parser-cons $inp0 $v1)",
+]
+
+
+@pytest.mark.parametrize("s", PROGRAMS)
+def test_parse_round_trips(s):
+    p = ProgramParser().parse(s)
+    assert str(p) == s
+    assert ProgramParser().parse(str(p)) == p
+
+
+def test_let_forms():
+    p = ProgramParser().parse(PROGRAMS[3])
+    assert isinstance(p, LetClause)
+    assert (p.var_name, p.var_type) == ("v1", Type.fromstring("bool"))
+    assert isinstance(p.body, LetRevClause)
+    assert (p.body.var_names, p.body.inp_var_name) == (["v2", "v3"], "inp0")
+    assert p.body.body.f.x == FreeVariable("v3")
+
+    p = ProgramParser().parse(PROGRAMS[4])
+    assert (p.var_names, p.vars_def.f.x) == (["v1"], PRIMITIVES[0])
+
+    p = ProgramParser().parse(PROGRAMS[5])
+    assert p.var_type == tlist(tint)
+    assert p.var_def == Constant(tlist(tint), "Any[1, 2]")
+
+
+def test_deep_programs_parse():
+    depth = 5000
+    p = ProgramParser().parse("(lambda " + "(parser-+ parser-1 " * depth + "$0" + ")" * (depth + 1))
+    for _ in range(depth + 1):
+        p = p.body if isinstance(p, Abstraction) else p.x
+    assert p == Index(0)
+
+
+def test_parses_are_cached():
+    parser = ProgramParser()
+    programs = parser.parse_many(PROGRAMS[:3] * 3)
+    assert [str(p) for p in programs] == PROGRAMS[:3] * 3
+    assert programs[0] is programs[3] is parser.parse(PROGRAMS[0])
+    assert len(parser.programs) == 3
+    # The invention is parsed once even though two programs contain it
+    assert programs[2].body.f.f is programs[1]
+
+
+@pytest.mark.parametrize(
+    "s",
+    ["", "()", "(lambda)", "(lambda $0 $0)", "(parser-+ $0", "(parser-+ $0))", "$0 $1", "(not-a-primitive $0)",
+     "let $v1 = (parser-+ $0 $0) in $v1", "let $v1::int = $0", "(parser-cons $0 lambda)"],
+)
+def test_malformed_programs_fail(s):
+    with pytest.raises(ParseFailure):
+        ProgramParser().parse(s)
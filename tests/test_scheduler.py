@@ -0,0 +1,96 @@
+import math
+import unittest
+
+from dreamcoder.grammar import Grammar
+from dreamcoder.program import Primitive
+from dreamcoder.scheduler import EnumerationScheduler, grammarEntropy
+from dreamcoder.type import arrow, tint, tlist
+
+
+def make_scheduler(jobs, CPUs, **kwargs):
+    return EnumerationScheduler(jobs, CPUs, 10.0, lambda lb: 1.5, **kwargs)
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.grammar = Grammar.uniform(
+            [Primitive("scheduler-inc", arrow(tint, tint), lambda x: x + 1)]
+        )
+
+    def test_free_jobs_get_cpus_round_robin(self):
+        jobs = {(self.grammar, tint): ["a"], (self.grammar, tlist(tint)): ["b"]}
+        scheduler = make_scheduler(jobs, 3, stealing=False)
+        slices = scheduler.schedule()
+        self.assertEqual(sorted(s.CPUs for s in slices), [1, 2])
+        self.assertEqual(scheduler.activeCPUs, 3)
+        self.assertTrue(all(not s.stolen for s in slices))
+
+    def test_idle_cpus_steal_next_budget_slice(self):
+        scheduler = make_scheduler({(self.grammar, tint): ["a"]}, 3, testing=True)
+        slices = scheduler.schedule()
+        self.assertEqual(len(slices), 3)
+        self.assertEqual(
+            [(s.lowerBound, s.upperBound) for s in slices],
+            [(0.0, 1.5), (1.5, 3.0), (3.0, 4.5)],
+        )
+        self.assertEqual([s.stolen for s in slices], [False, True, True])
+        job = slices[0].job
+        self.assertEqual(job.runningSlices, 3)
+
+        scheduler.finished(slices[0].ID, 2.0)
+        self.assertTrue(job.stopwatch.running)
+        scheduler.finished(slices[1].ID, 1.0)
+        scheduler.finished(slices[2].ID, 1.0)
+        self.assertFalse(job.stopwatch.running)
+        self.assertFalse(scheduler.running)
+        self.assertEqual(job.cpuSeconds, 4.0)
+
+    def test_resumable_jobs_are_launched_once(self):
+        jobs = {(self.grammar, tint): ["a"], (self.grammar, tlist(tint)): ["b"]}
+        scheduler = make_scheduler(jobs, 3, resumable=True)
+        slices = scheduler.schedule()
+        self.assertEqual(sorted(s.CPUs for s in slices), [1, 2])
+        self.assertTrue(all(s.upperBound == math.inf for s in slices))
+        self.assertTrue(all(s.budgetIncrement == 1.5 for s in slices))
+        # Their windows are not stolen, nor launched again once they stop
+        scheduler.finished(slices[0].ID)
+        self.assertEqual(scheduler.schedule(), [])
+        scheduler.finished(slices[1].ID)
+        self.assertEqual(scheduler.schedule(), [])
+        self.assertFalse(scheduler.running)
+
+    def test_solved_jobs_are_dropped(self):
+        hits = {"a": 0, "b": 1}
+        jobs = {(self.grammar, tint): ["a"], (self.grammar, tlist(tint)): ["b"]}
+        scheduler = make_scheduler(
+            jobs, 2, numberOfHits=hits.get, maximumFrontier=1, stealing=False
+        )
+        slices = scheduler.schedule()
+        self.assertEqual([s.job.tasks for s in slices], [["a"]])
+
+    def test_fewest_hits_policy(self):
+        hits = {"a": 3, "b": 0}
+        jobs = {(self.grammar, tint): ["a"], (self.grammar, tlist(tint)): ["b"]}
+        scheduler = make_scheduler(
+            jobs, 1, numberOfHits=hits.get, policy="hits", stealing=False
+        )
+        self.assertEqual(scheduler.schedule()[0].job.tasks, ["b"])
+
+    def test_entropy_policy_prefers_confident_grammar(self):
+        confident = Grammar(
+            0.0,
+            [(5.0, t, p) for _, t, p in self.grammar.productions],
+            logLambda=0.0,
+            logFreeVariable=0.0,
+        )
+        jobs = {(self.grammar, tint): ["a"], (confident, tint): ["b"]}
+        scheduler = make_scheduler(jobs, 1, policy="entropy", stealing=False)
+        self.assertEqual(scheduler.schedule()[0].job.tasks, ["b"])
+
+    def test_grammar_entropy(self):
+        flat = Grammar(0.0, self.grammar.productions, logLambda=0.0, logFreeVariable=0.0)
+        self.assertAlmostEqual(grammarEntropy(flat), math.log(4))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import pickle
+import unittest
+
+from dreamcoder.frontier import Frontier, FrontierEntry
+from dreamcoder.grammar import LikelihoodSummary
+from dreamcoder.program import Abstraction, Application, FreeVariable, Index, Program
+from dreamcoder.task import Task
+from dreamcoder.type import Type, TypeConstructor, TypeVariable, arrow, tint
+
+
+def legacy(cls, state):
+    """An object restored from a checkpoint written when cls had a __dict__"""
+    o = cls.__new__(cls)
+    o.__setstate__(state)
+    return o
+
+
+class TestSlots(unittest.TestCase):
+    def test_core_objects_have_no_dict(self):
+        p = Program.parse("(lambda (lambda ($1 ($0 $$x))))")
+        entry = FrontierEntry(p, logPrior=-1.0, logLikelihood=0.0)
+        objects = [
+            p,
+            p.body,
+            p.body.body.x.x,
+            p.body.body.x.f,
+            entry,
+            Frontier([entry], Task("slots", arrow(tint, tint), [])),
+            LikelihoodSummary(),
+            arrow(tint, tint),
+            TypeVariable(0),
+        ]
+        for o in objects:
+            self.assertFalse(hasattr(o, "__dict__"), type(o).__name__)
+
+    def test_round_trip(self):
+        p = Program.parse("(lambda (lambda ($1 ($0 $$x))))")
+        self.assertEqual(pickle.loads(pickle.dumps(p)), p)
+        t = Type.fromstring("inp0:list(t0) -> t1 -> int")
+        self.assertEqual(pickle.loads(pickle.dumps(t)), t)
+        entry = pickle.loads(pickle.dumps(FrontierEntry(p, logPrior=-1.0, logLikelihood=-2.0)))
+        self.assertEqual((entry.program, entry.logPosterior, entry.search_time), (p, -3.0, None))
+
+    def test_legacy_state(self):
+        f = Application(Index(1), Index(0))
+        self.assertEqual(legacy(Application, {"f": Index(1), "x": Index(0)}), f)
+        self.assertEqual(legacy(Application, (Index(1), Index(0), False, None, None, None)), f)
+        self.assertFalse(legacy(Application, {"f": Index(1), "x": Index(0)}).isConditional)
+        self.assertEqual(legacy(Index, {"i": 3}), Index(3))
+        self.assertEqual(legacy(FreeVariable, {"name": "x"}), FreeVariable("x"))
+        self.assertEqual(legacy(Abstraction, Index(0)), Abstraction(Index(0)))
+
+        self.assertEqual(legacy(TypeVariable, {"v": 2, "isPolymorphic": True}), TypeVariable(2))
+        t = legacy(TypeConstructor, {"name": "list", "arguments": [TypeVariable(0)], "isPolymorphic": True})
+        self.assertEqual(t, Type.fromstring("list(t0)"))
+        self.assertTrue(t.isPolymorphic)
+
+        entry = legacy(
+            FrontierEntry,
+            {"program": f, "logPrior": -1.0, "logLikelihood": 0.0, "logPosterior": -1.0},
+        )
+        self.assertEqual((entry.program, entry.logPosterior, entry.search_time), (f, -1.0, None))
+        summary = legacy(LikelihoodSummary, {"uses": {f: 1}, "normalizers": {}, "constant": 0.5})
+        self.assertEqual((summary.uses, summary.constant), ({f: 1}, 0.5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,204 @@
+import os
+import sys
+import tempfile
+import json
+import unittest
+from unittest import mock
+
+from dreamcoder.dslRegistry import DSL_REGISTRY
+from dreamcoder.enumeration import multicoreEnumeration, solveForTask_ocaml
+from dreamcoder.grammar import Grammar
+from dreamcoder.solverPool import (
+    SolverPool,
+    SolverWorkerError,
+    set_active_solver_pool,
+)
+from dreamcoder.task import Task
+from dreamcoder.type import arrow, tint
+
+# Stand-in for `solver --server`: reports its own pid as the number of
+# enumerated programs and exits on a task named "crash". Tasks named "identity"
+# are solved by (lambda $0), and that hit is streamed first if requested.
+FAKE_SOLVER = """
+import json, os, sys, time
+
+def write(response):
+    payload = json.dumps(response).encode("utf-8")
+    sys.stdout.buffer.write(b"%d\\n" % len(payload) + payload)
+    sys.stdout.buffer.flush()
+
+while True:
+    header = sys.stdin.buffer.readline()
+    if not header:
+        break
+    message = json.loads(sys.stdin.buffer.read(int(header)))
+    names = [t["name"] for t in message["tasks"]]
+    if "crash" in names:
+        sys.exit(3)
+    hit = {"program": "(lambda $0)", "time": 0.5, "logLikelihood": 0.0, "logPrior": -1.0}
+    response = {name: [hit] if name == "identity" else [] for name in names}
+    response["number_enumerated"] = os.getpid()
+    if message.get("stream") and "identity" in names:
+        write({"hit": dict(hit, task="identity")})
+        time.sleep(0.2)
+    write(response)
+"""
+
+
+def message(name):
+    return '{"tasks": [{"name": "%s"}]}' % name
+
+
+class TestSolverPool(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        script = os.path.join(self.directory.name, "fake_solver.py")
+        with open(script, "w") as handle:
+            handle.write(FAKE_SOLVER)
+        self.command = [sys.executable, script]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_worker_is_reused(self):
+        with SolverPool(maximumWorkers=1, command=self.command) as pool:
+            worker = pool.lease()
+            first = worker.request(message("a"))["number_enumerated"]
+            pool.release(worker)
+            worker = pool.lease()
+            second = worker.request(message("b"))["number_enumerated"]
+            pool.release(worker)
+            self.assertEqual(first, second)
+            self.assertEqual(pool.recycled, 0)
+
+    def test_crashed_worker_is_recycled(self):
+        with SolverPool(maximumWorkers=1, command=self.command) as pool:
+            worker = pool.lease()
+            with self.assertRaises(SolverWorkerError):
+                worker.request(message("crash"))
+            pool.release(worker)
+            self.assertEqual(pool.recycled, 1)
+            worker = pool.lease()
+            self.assertIn("a", worker.request(message("a")))
+            pool.release(worker)
+
+    def test_worker_is_recycled_after_maximum_requests(self):
+        with SolverPool(
+            maximumWorkers=1, maximumRequests=2, command=self.command
+        ) as pool:
+            pids = []
+            for name in "abc":
+                worker = pool.lease()
+                pids.append(worker.request(message(name))["number_enumerated"])
+                pool.release(worker)
+            self.assertEqual(pids[0], pids[1])
+            self.assertNotEqual(pids[1], pids[2])
+
+    def test_solve_for_task_uses_worker(self):
+        task = Task("add1", arrow(tint, tint), [((1,), 2)])
+        with SolverPool(maximumWorkers=1, command=self.command) as pool:
+            worker = pool.lease()
+            frontiers, searchTimes, pc = solveForTask_ocaml(
+                g=Grammar.uniform([]),
+                tasks=[task],
+                lowerBound=0.0,
+                upperBound=1.5,
+                budgetIncrement=1.5,
+                timeout=1,
+                evaluationTimeout=1,
+                maximumFrontiers={task: 1},
+                solverWorker=worker,
+            )
+            self.assertEqual(pc, worker.pid)
+            self.assertTrue(frontiers[task].empty)
+            self.assertIsNone(searchTimes[task])
+            pool.release(worker)
+
+    def test_dsl_is_sent_to_a_worker_once(self):
+        task = Task("add1", arrow(tint, tint), [((1,), 2)])
+        grammar = Grammar.uniform([])
+        requests = []
+        with SolverPool(maximumWorkers=1, command=self.command) as pool:
+            for _ in range(2):
+                worker = pool.lease()
+                with mock.patch.object(worker, "request", wraps=worker.request) as spy:
+                    solveForTask_ocaml(
+                        g=grammar,
+                        tasks=[task],
+                        timeout=1,
+                        evaluationTimeout=1,
+                        maximumFrontiers={task: 1},
+                        solverWorker=worker,
+                    )
+                requests.append(json.loads(spy.call_args[0][0]))
+                pool.release(worker, dslHash=DSL_REGISTRY.hash(grammar))
+        self.assertEqual(requests[0]["DSL"], grammar.json())
+        self.assertNotIn("DSL", requests[1])
+        self.assertEqual(requests[0]["DSLHash"], requests[1]["DSLHash"])
+
+    def solve_identity(self, worker, onHit):
+        task = Task("identity", arrow(tint, tint), [((1,), 1)])
+        return solveForTask_ocaml(
+            g=Grammar.uniform([]),
+            tasks=[task],
+            elapsedTime=2.0,
+            lowerBound=0.0,
+            upperBound=1.5,
+            budgetIncrement=1.5,
+            timeout=1,
+            evaluationTimeout=1,
+            maximumFrontiers={task: 1},
+            solverWorker=worker,
+            onHit=onHit,
+        )
+
+    def test_hits_are_streamed(self):
+        hits = []
+        with SolverPool(maximumWorkers=1, command=self.command) as pool:
+            worker = pool.lease()
+            frontiers, searchTimes, _ = self.solve_identity(
+                worker, lambda *hit: hits.append(hit)
+            )
+            pool.release(worker)
+        self.assertEqual(len(hits), 1)
+        name, entry, dt = hits[0]
+        self.assertEqual(name, "identity")
+        self.assertEqual(str(entry.program), "(lambda $0)")
+        self.assertEqual(dt, 2.5)
+        self.assertEqual(len(frontiers[list(frontiers)[0]]), 1)
+
+    def test_cancelled_request_returns_after_streamed_hits(self):
+        hits = []
+        with SolverPool(maximumWorkers=1, command=self.command) as pool:
+            worker = pool.lease()
+
+            def onHit(*hit):
+                hits.append(hit)
+                worker.cancel()
+
+            frontiers, searchTimes, pc = self.solve_identity(worker, onHit)
+            pool.release(worker)
+            self.assertEqual(pool.recycled, 1)
+        self.assertEqual(len(hits), 1)
+        self.assertTrue(all(f.empty for f in frontiers.values()))
+        self.assertEqual(pc, 0)
+
+    def test_multicore_enumeration_streams_through_active_pool(self):
+        task = Task("identity", arrow(tint, tint), [((1,), 1)])
+        with SolverPool(maximumWorkers=1, command=self.command) as pool:
+            set_active_solver_pool(pool)
+            try:
+                frontiers, bestSearchTime = multicoreEnumeration(
+                    Grammar.uniform([]),
+                    [task],
+                    maximumFrontier=1,
+                    enumerationTimeout=1,
+                )
+            finally:
+                set_active_solver_pool(None)
+        self.assertEqual(len(frontiers[0]), 1)
+        self.assertGreaterEqual(bestSearchTime[task], 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
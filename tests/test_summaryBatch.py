@@ -0,0 +1,139 @@
+import math
+import random
+import unittest
+
+from dreamcoder.frontier import Frontier, FrontierEntry
+from dreamcoder.grammar import Grammar, ProductionIndex, SummaryBatch, Uses
+from dreamcoder.program import Primitive
+from dreamcoder.task import Task
+from dreamcoder.type import Context, arrow, t0, tint, tlist
+
+PRIMITIVES = [
+    Primitive("summary-0", tint, 0),
+    Primitive("summary-1", tint, 1),
+    Primitive("summary-+", arrow(tint, tint, tint), None),
+    Primitive("summary-empty", tlist(t0), []),
+    Primitive("summary-cons", arrow(t0, tlist(t0), tlist(t0)), None),
+    Primitive("summary-fold", arrow(tlist(t0), t0, arrow(t0, t0, t0), t0), None),
+]
+
+REQUEST = arrow(tlist(tint), tint)
+
+
+def referenceInsideOutside(g0, frontiers, pseudoCounts, iterations):
+    g = g0
+    for _ in range(iterations):
+        u = Uses()
+        for f in frontiers:
+            for e in g.rescoreFrontier(f).normalize():
+                u += math.exp(e.logPosterior) * g0.closedLikelihoodSummary(f.task.request, e.program).toUses()
+        g = Grammar(
+            math.log(u.actualVariables + pseudoCounts) - math.log(u.possibleVariables + pseudoCounts),
+            [
+                (
+                    math.log(u.actualUses.get(p, 0.0) + pseudoCounts)
+                    - math.log(u.possibleUses.get(p, 0.0) + pseudoCounts),
+                    t,
+                    p,
+                )
+                for _, t, p in g.productions
+            ],
+        )
+    return g
+
+
+def randomGrammar(seed):
+    g = Grammar.uniform(PRIMITIVES)
+    r = random.Random(seed)
+    return Grammar(
+        r.gauss(0, 1),
+        [(r.gauss(0, 1), t, p) for _, t, p in g.productions],
+        logFreeVariable=r.gauss(0, 1),
+    )
+
+
+class TestSummaryBatch(unittest.TestCase):
+    def setUp(self):
+        g = Grammar.uniform(PRIMITIVES)
+        self.programs = [
+            p
+            for _, _, p in g.enumeration(Context.EMPTY, [], REQUEST, upperBound=11.0)
+            if "<HOLE>" not in str(p)
+        ]
+        self.summaries = [g.closedLikelihoodSummary(REQUEST, p) for p in self.programs]
+
+    def test_agrees_with_summaries(self):
+        self.assertGreater(len(self.summaries), 50)
+        batch = SummaryBatch(self.summaries, ProductionIndex.ofGrammar(Grammar.uniform(PRIMITIVES)))
+        for seed in range(3):
+            g = randomGrammar(seed)
+            for summary, l in zip(self.summaries, batch.logLikelihood(g)):
+                self.assertAlmostEqual(summary.logLikelihood(g), l, places=9)
+
+    def test_dense_matrices(self):
+        index = ProductionIndex(PRIMITIVES)
+        batch = SummaryBatch(self.summaries, index)
+        uses = batch.useMatrix()
+        counts, masks = batch.normalizerMatrix()
+        for b, summary in enumerate(self.summaries):
+            self.assertEqual(list(uses[b]), list(index.useVector(summary)))
+            self.assertEqual(sum(uses[b]), sum(summary.uses.values()))
+            self.assertEqual(sum(counts[b]), sum(summary.normalizers.values()))
+        for mask in masks:
+            self.assertIn(
+                {p for p, used in zip(index.productions, mask) if used},
+                [set(ps) for s in self.summaries for ps in s.normalizers],
+            )
+
+    def test_normalizers_are_interned(self):
+        index = ProductionIndex(PRIMITIVES)
+        a = frozenset(PRIMITIVES[:3])
+        self.assertEqual(index.normalizer(a), index.normalizer(frozenset(reversed(PRIMITIVES[:3]))))
+        self.assertNotEqual(index.normalizer(a), index.normalizer(frozenset(PRIMITIVES[:2])))
+        self.assertEqual(index.masks().shape, (2, len(PRIMITIVES) + 3))
+
+    def test_rescoring_frontiers(self):
+        g = randomGrammar(0)
+        task = Task("summary", REQUEST, [])
+        frontiers = [
+            Frontier(
+                [FrontierEntry(p, logPrior=0.0, logLikelihood=-float(i)) for p in self.programs[i : i + 7]],
+                task,
+            )
+            for i in range(0, len(self.programs), 7)
+        ]
+        rescored = g.rescoreFrontiers(frontiers)
+        self.assertEqual(len(rescored), len(frontiers))
+        for f, r in zip(frontiers, rescored):
+            self.assertEqual([e.logPrior for e in g.rescoreFrontier(f)], [e.logPrior for e in r])
+            for e, s in zip(f, r):
+                self.assertEqual(e.program, s.program)
+                self.assertEqual(e.logLikelihood, s.logLikelihood)
+                self.assertAlmostEqual(s.logPrior, g.logLikelihood(REQUEST, e.program), places=9)
+
+        uses = g.productionUses(frontiers)
+        self.assertEqual(set(uses), set(PRIMITIVES))
+        self.assertGreater(uses[PRIMITIVES[5]], 0.0)
+
+    def test_inside_outside(self):
+        task = Task("summary", REQUEST, [])
+        r = random.Random(0)
+        frontiers = [
+            Frontier(
+                [FrontierEntry(p, logPrior=0.0, logLikelihood=-3 * r.random()) for p in self.programs[i : i + 5]],
+                task,
+            )
+            for i in range(0, len(self.programs), 5)
+        ] + [Frontier([], task)]
+        g = randomGrammar(1)
+        for iterations in (1, 3):
+            expected = referenceInsideOutside(g, frontiers[:-1], 1.0, iterations)
+            actual = g.insideOutside(frontiers, 1.0, iterations=iterations)
+            self.assertAlmostEqual(actual.logVariable, expected.logVariable, places=9)
+            for (l, _, p), (m, _, q) in zip(actual.productions, expected.productions):
+                self.assertEqual(p, q)
+                self.assertAlmostEqual(l, m, places=9)
+
+
+if __name__ == "__main__":
+    unittest.main()
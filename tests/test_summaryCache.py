@@ -0,0 +1,97 @@
+import unittest
+
+from dreamcoder.grammar import Grammar, batchLikelihood
+from dreamcoder.program import Invented, Primitive, Program
+from dreamcoder.type import Context, arrow, t0, t1, tbool, tint, tlist
+
+PRIMITIVES = [
+    Primitive("memo-0", tint, 0),
+    Primitive("memo-+", arrow(tint, tint, tint), None),
+    Primitive("memo-not", arrow(tbool, tbool), None),
+    Primitive("memo-empty", tlist(t0), []),
+    Primitive("memo-cons", arrow(t0, tlist(t0), tlist(t0)), None),
+    Primitive("memo-map", arrow(arrow(t0, t1), tlist(t0), tlist(t1)), None),
+    Primitive("memo-fold", arrow(tlist(t0), t1, arrow(t0, t1, t1), t1), None),
+]
+
+REQUESTS = [
+    arrow(tlist(tint), tlist(tint)),
+    arrow(tlist(tbool), tlist(tbool)),
+    arrow(tint, tlist(tint), tint),
+]
+
+
+def summaryOf(s):
+    return (
+        s.constant,
+        sorted((str(p), n) for p, n in s.uses.items()),
+        sorted((sorted(map(str, ps)), n) for ps, n in s.normalizers.items()),
+    )
+
+
+class TestSummaryCache(unittest.TestCase):
+    def setUp(self):
+        Grammar.SUMMARY_CACHES.clear()
+        self.grammar = Grammar.uniform(PRIMITIVES)
+        self.jobs = [
+            (r, p)
+            for r in REQUESTS
+            for _, _, p in self.grammar.enumeration(Context.EMPTY, [], r, upperBound=10.0)
+            if "<HOLE>" not in str(p)
+        ]
+
+    def cold(self, request, program):
+        Grammar.SUMMARY_CACHES.clear()
+        return Grammar.uniform(PRIMITIVES).closedLikelihoodSummary(request, program)
+
+    def test_agrees_with_cold_cache(self):
+        self.assertGreater(len(self.jobs), 100)
+        warm = [summaryOf(self.grammar.closedLikelihoodSummary(r, p)) for r, p in self.jobs]
+        self.assertGreater(len(self.grammar.summaryCache), 0)
+        for (r, p), s in zip(self.jobs, warm):
+            self.assertEqual(summaryOf(self.cold(r, p)), s, str(p))
+
+    def test_shared_subprograms_across_types(self):
+        # The same subtree at different types, and under a binder
+        body = "(memo-map (lambda $0) (memo-fold $0 $0 (lambda (lambda (memo-cons $1 $0)))))"
+        requests = [arrow(tlist(tint), tlist(tint)), arrow(tlist(tbool), tlist(tbool))]
+        programs = [Program.parse(f"(lambda {body})"), Program.parse(f"(lambda (memo-map (lambda $0) {body}))")]
+        for r in requests:
+            for p in programs:
+                self.assertEqual(
+                    summaryOf(self.grammar.closedLikelihoodSummary(r, p)),
+                    summaryOf(self.cold(r, p)),
+                )
+
+    def test_shared_by_grammars_with_the_same_productions(self):
+        reweighted = self.grammar.randomWeights(lambda l: l - 1.0)
+        self.assertIs(reweighted.summaryCache, self.grammar.summaryCache)
+        invention = Invented(Program.parse("(lambda (memo-+ $0 $0))"))
+        extended = Grammar.uniform(PRIMITIVES + [invention])
+        self.assertIsNot(extended.summaryCache, self.grammar.summaryCache)
+
+        r, p = self.jobs[-1]
+        # An extended grammar offers more choices, so it has different normalizers
+        a = extended.closedLikelihoodSummary(r, p)
+        b = self.grammar.closedLikelihoodSummary(r, p)
+        self.assertNotEqual(summaryOf(a), summaryOf(b))
+        self.assertIn(invention, set().union(*a.normalizers))
+
+    def test_summaries_are_not_shared_with_callers(self):
+        r, p = self.jobs[-1]
+        s = self.grammar.closedLikelihoodSummary(r, p)
+        expected = summaryOf(s)
+        s.constant += 1.0
+        s.uses.clear()
+        self.assertEqual(summaryOf(self.grammar.closedLikelihoodSummary(r, p)), expected)
+
+    def test_batch_likelihood(self):
+        reweighted = self.grammar.randomWeights(lambda l: l - 1.0)
+        jobs = {(p, r, g) for r, p in self.jobs[:50] for g in (self.grammar, reweighted)}
+        likelihoods = batchLikelihood(jobs)
+        for p, r, g in jobs:
+            self.assertAlmostEqual(likelihoods[(p, r, g)], g.logLikelihood(r, p), places=9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+
+from dreamcoder.enumeration import enumerateForTasks
+from dreamcoder.grammar import Grammar
+from dreamcoder.likelihoodModel import AllOrNothingLikelihoodModel
+from dreamcoder.program import Primitive
+from dreamcoder.task import Task, TaskBatch
+from dreamcoder.type import Context, arrow, tint, tlist
+
+CALLS = []
+
+
+def _traced_inc(x):
+    CALLS.append(x)
+    return x + 1
+
+
+PRIMITIVES = [
+    Primitive("batch-0", tint, 0),
+    Primitive("batch-inc", arrow(tint, tint), _traced_inc),
+    Primitive("batch-+", arrow(tint, tint, tint), lambda x: lambda y: x + y),
+    Primitive("batch-nil", tlist(tint), []),
+    Primitive("batch-div", arrow(tint, tint, tint), lambda x: lambda y: x // y),
+]
+
+
+class OverridingTask(Task):
+    """Checked by its own logLikelihood, so it cannot be batched"""
+
+    def logLikelihood(self, e, timeout=None):
+        return super().logLikelihood(e, timeout)
+
+
+def tasks():
+    request = arrow(tint, tint)
+    inputs = [(0,), (1,), (2,), (3,)]
+    return [
+        Task("identity", request, [(xs, xs[0]) for xs in inputs]),
+        Task("increment", request, [(xs, xs[0] + 1) for xs in inputs]),
+        Task("increment again", request, [(xs, xs[0] + 1) for xs in inputs[:2]]),
+        Task("double", request, [(xs, 2 * xs[0]) for xs in inputs]),
+        Task("crash", request, [((0,), None), ((1,), None)]),
+        Task("set", request, [((1,), {2})]),
+        OverridingTask("override", request, [(xs, xs[0] + 2) for xs in inputs]),
+    ]
+
+
+class TestTaskBatch(unittest.TestCase):
+    def setUp(self):
+        self.grammar = Grammar.uniform(PRIMITIVES)
+        self.tasks = tasks()
+        self.programs = [
+            p
+            for _, _, p in self.grammar.enumeration(
+                Context.EMPTY, [], arrow(tint, tint), upperBound=11.0
+            )
+        ]
+
+    def test_agrees_with_tasks(self):
+        batch = TaskBatch(self.tasks)
+        self.assertGreater(len(self.programs), 50)
+        for p in self.programs:
+            self.assertEqual(
+                batch.logLikelihoods(p, 1.0),
+                [t.logLikelihood(p, 1.0) for t in self.tasks],
+                str(p),
+            )
+
+    def test_inputs_are_shared(self):
+        batch = TaskBatch(self.tasks)
+        self.assertEqual(batch.inputs, [(0,), (1,), (2,), (3,)])
+        self.assertEqual(batch.fallback, {self.tasks[-1]})
+
+        p = next(p for p in self.programs if str(p) == "(lambda (batch-inc $0))")
+        del CALLS[:]
+        solved = batch.solved(p, 1.0)
+        self.assertEqual(sorted(CALLS), [0, 1, 2, 3])
+        self.assertEqual({t.name for t in solved}, {"increment", "increment again"})
+
+    def test_enumeration_uses_batch(self):
+        frontiers, _, _ = enumerateForTasks(
+            self.grammar,
+            self.tasks,
+            AllOrNothingLikelihoodModel(timeout=1.0),
+            timeout=10,
+            upperBound=11.0,
+            maximumFrontiers={t: 2 for t in self.tasks},
+        )
+        for t in self.tasks:
+            for entry in frontiers[t].entries:
+                self.assertEqual(t.logLikelihood(entry.program, 1.0), 0.0)
+        self.assertFalse(frontiers[self.tasks[3]].empty)
+
+
+if __name__ == "__main__":
+    unittest.main()
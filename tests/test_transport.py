@@ -0,0 +1,115 @@
+import json
+import threading
+import unittest
+
+from dreamcoder.enumeratorClient import EnumeratorClient
+from dreamcoder.grammar import Grammar
+from dreamcoder.task import Task
+from dreamcoder.transport import (
+    InMemoryTransport,
+    UnixSocketBroker,
+    UnixSocketTransport,
+)
+from dreamcoder.type import arrow, tint
+
+
+class TransportTests:
+    """Shared by every transport that can run without external services"""
+
+    def test_queues(self):
+        t = self.transport
+        self.assertEqual(t.rpush("tasks", "a", b"b"), 2)
+        self.assertEqual(t.llen("tasks"), 2)
+        self.assertEqual(t.blpop(["commands", "tasks"]), (b"tasks", b"a"))
+        self.assertEqual(t.blpop("tasks", 1), (b"tasks", b"b"))
+        self.assertIsNone(t.blpop(["tasks"], 0.05))
+
+    def test_keys(self):
+        t = self.transport
+        t.set("dsl:abc", '{"productions": []}')
+        self.assertEqual(t.get("dsl:abc"), b'{"productions": []}')
+        self.assertIsNone(t.get("dsl:missing"))
+        self.assertEqual(t.delete("dsl:abc"), 1)
+        self.assertIsNone(t.get("dsl:abc"))
+
+    def test_blpop_waits_for_push(self):
+        t = self.transport
+        pusher = threading.Timer(0.05, lambda: t.rpush("results", "done"))
+        pusher.start()
+        self.assertEqual(t.blpop(["results"], 5), (b"results", b"done"))
+        pusher.join()
+
+    def test_reset_only_clears_service_state(self):
+        t = self.transport
+        t.rpush("tasks", "stale")
+        t.set("dsl:abc", "{}")
+        t.set("processing:2", "{}")
+        t.set("unrelated", "kept")
+        t.reset()
+        self.assertEqual(t.llen("tasks"), 0)
+        self.assertIsNone(t.get("dsl:abc"))
+        self.assertIsNone(t.get("processing:2"))
+        self.assertEqual(t.get("unrelated"), b"kept")
+
+
+class TestInMemoryTransport(TransportTests, unittest.TestCase):
+    def setUp(self):
+        self.transport = InMemoryTransport()
+
+
+class TestUnixSocketTransport(TransportTests, unittest.TestCase):
+    def setUp(self):
+        self.broker = UnixSocketBroker().start()
+        self.transport = UnixSocketTransport(self.broker.path)
+
+    def tearDown(self):
+        self.transport.close()
+        self.broker.close()
+
+    def test_answer_and_forget_is_atomic(self):
+        self.transport.set("processing:2", "task")
+        self.transport.call("RPUSHDEL", "results", "answer", "processing:2")
+        self.assertIsNone(self.transport.get("processing:2"))
+        self.assertEqual(self.broker.store.lpop("results"), b"answer")
+
+    def test_errors_are_reported(self):
+        with self.assertRaises(RuntimeError):
+            self.transport.call("FLUSHALL")
+        # The connection is still usable afterwards
+        self.assertEqual(self.transport.llen("tasks"), 0)
+
+    def test_enumerator_client(self):
+        grammar = Grammar.uniform([])
+        tasks = [Task("t%d" % i, arrow(tint, tint), [((i,), i)]) for i in range(5)]
+        service = UnixSocketTransport(self.broker.path)
+
+        def serve():
+            for _ in tasks:
+                name = json.loads(service.blpop(["tasks"])[1])["name"]
+                response = {
+                    "name": name,
+                    "status": "success",
+                    "payload": {"solutions": [], "number_enumerated": 3},
+                }
+                service.rpush("results", json.dumps(response))
+
+        thread = threading.Thread(target=serve, daemon=True)
+        thread.start()
+        counts = {}
+        client = EnumeratorClient(
+            self.transport,
+            {t.name: t for t in tasks},
+            {t: grammar for t in tasks},
+            scoringWorkers=0,
+        )
+        client.run(
+            [json.dumps({"name": t.name}) for t in tasks],
+            lambda t, entries, dt, pc: counts.update({t: pc}),
+        )
+        thread.join(1)
+        service.close()
+        self.assertEqual(counts, {t: 3 for t in tasks})
+
+
+if __name__ == "__main__":
+    unittest.main()
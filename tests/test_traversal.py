@@ -0,0 +1,215 @@
+import random
+
+import pytest
+
+from dreamcoder.program import (
+    Abstraction,
+    Application,
+    EtaLongVisitor,
+    Index,
+    Invented,
+    Primitive,
+    Program,
+    ProgramParser,
+    ShiftFailure,
+    strip_primitive_values,
+    trampoline,
+    unstrip_primitive_values,
+)
+from dreamcoder.vs import RewriteWithInventionVisitor
+from dreamcoder.type import UnificationFailure, arrow, tint, tlist
+
+PRIMITIVES = [
+    Primitive("traversal-0", tint, 0),
+    Primitive("traversal-+", arrow(tint, tint, tint), lambda x: lambda y: x + y),
+    Primitive("traversal-empty", tlist(tint), []),
+    Primitive("traversal-cons", arrow(tint, tlist(tint), tlist(tint)), lambda x: lambda y: [x] + y),
+]
+ZERO, PLUS, EMPTY, CONS = PRIMITIVES
+INCREMENT = Invented(Program.parse("(lambda (lambda (traversal-cons (traversal-+ $1 traversal-0) $0)))"))
+
+# Deeper than the recursion limit lets recursive traversals go
+DEPTH = 20000
+
+
+def randomPrograms(n, seed=0):
+    rng = random.Random(seed)
+
+    def sample(depth):
+        r = rng.random()
+        if depth == 0 or r < 0.25:
+            return rng.choice([Index(rng.randrange(4)), rng.choice(PRIMITIVES), INCREMENT])
+        if r < 0.45:
+            return Abstraction(sample(depth - 1))
+        return Application(sample(depth - 1), sample(depth - 1))
+
+    programs = [sample(7) for _ in range(n)]
+    # Redexes, some of them under abstractions
+    programs += [Application(Abstraction(p), Index(i % 3)) for i, p in enumerate(programs[: n // 2])]
+    programs += [Abstraction(Application(Abstraction(Abstraction(Application(Index(1), Index(0)))), p)) for p in programs[:20]]
+    return programs
+
+
+def fresh(e):
+    return ProgramParser()._parse(str(e))
+
+
+def literal(n):
+    e = EMPTY
+    for _ in range(n):
+        e = Application(Application(CONS, ZERO), e)
+    return Abstraction(e)
+
+
+def calls(n):
+    e = Index(0)
+    for _ in range(n):
+        e = Application(Application(INCREMENT, ZERO), e)
+    return Abstraction(e)
+
+
+def deeply(e, method, *arguments):
+    """What the generator version of `method` answers, which takes over from
+    the method on programs deeper than the stack"""
+    return trampoline(getattr(e, "_%sDeep" % method.strip("_"))(*arguments))
+
+
+@pytest.mark.parametrize("e", randomPrograms(100))
+def test_generator_versions_agree_with_methods(e):
+    assert deeply(e, "show", False) == e.show(False)
+    assert deeply(e, "show", True) == e.show(True)
+    assert deeply(e, "size") == e.size()
+    assert deeply(e, "freeVariables") == e.freeVariables()
+    assert deeply(e, "shift", 2, 1) == e.shift(2, 1)
+    try:
+        assert deeply(e, "shift", -1) == e.shift(-1)
+    except ShiftFailure:
+        with pytest.raises(ShiftFailure):
+            e.shift(-1)
+    for old, new in [(Index(0), Application(Index(1), ZERO)), (Application(Index(0), Index(0)), Index(5))]:
+        assert deeply(e, "substitute", old, new) == e.substitute(old, new)
+    assert deeply(e, "betaReduce") == e.betaReduce()
+    assert deeply(e, "betaNormalForm") == e.betaNormalForm()
+    copy = fresh(e)
+    assert deeply(e, "__eq__", copy) and e == copy
+    assert not deeply(e, "__eq__", Application(e, ZERO))
+    assert deeply(copy, "__hash__") == hash(e)
+
+
+@pytest.mark.parametrize("e", randomPrograms(100, seed=1))
+def test_normal_form_is_repeated_beta_reduction(e):
+    n = e
+    while True:
+        reduced = n.betaReduce()
+        if reduced is None:
+            break
+        n = reduced
+    assert e.betaNormalForm() == n
+
+
+def test_unchanged_subprograms_are_shared():
+    e = Program.parse("(lambda (traversal-cons (traversal-+ traversal-0 traversal-0) $1))")
+    shifted = e.shift(1)
+    assert str(shifted) == "(lambda (traversal-cons (traversal-+ traversal-0 traversal-0) $2))"
+    assert shifted.body.f.x is e.body.f.x
+    assert e.shift(1, 2) is e
+    assert e.substitute(Index(3), ZERO) is e
+
+
+def test_walks():
+    e = Program.parse("(lambda (traversal-cons (#(lambda $0) $0) traversal-empty))")
+    assert [(d, str(c)) for d, c in e.walk()] == [
+        (0, str(e)),
+        (1, "(traversal-cons (#(lambda $0) $0) traversal-empty)"),
+        (1, "(traversal-cons (#(lambda $0) $0))"),
+        (1, "traversal-cons"),
+        (1, "(#(lambda $0) $0)"),
+        (1, "#(lambda $0)"),
+        (1, "$0"),
+        (1, "traversal-empty"),
+    ]
+    assert [(d, str(c)) for d, c in e.walkUncurried()] == [
+        (0, str(e)),
+        (1, "(traversal-cons (#(lambda $0) $0) traversal-empty)"),
+        (1, "traversal-cons"),
+        (1, "(#(lambda $0) $0)"),
+        (1, "#(lambda $0)"),
+        (1, "$0"),
+        (1, "traversal-empty"),
+    ]
+    f, xs = e.body.applicationParse()
+    assert f == CONS and [str(x) for x in xs] == ["(#(lambda $0) $0)", "traversal-empty"]
+
+
+@pytest.mark.parametrize("build", [literal, calls])
+def test_deep_programs(build):
+    e = build(DEPTH)
+    assert e.size() == 2 * DEPTH + 1
+    assert sum(1 for _ in e.walk()) == 4 * DEPTH + 2
+    assert e.freeVariables() == set()
+    assert e.closed
+    s = str(e)
+    copy = fresh(e)
+    assert copy == e and copy is not e
+    assert hash(copy) == hash(e)
+    assert e != build(DEPTH - 1)
+    assert str(e.shift(1)) == s
+    assert e.body.shift(1).size() == e.size()
+    assert e.body.substitute(Index(0), EMPTY) == build(DEPTH).body.substitute(Index(0), EMPTY)
+
+    normal = e.betaNormalForm()
+    expected = s.replace(str(INCREMENT), "(lambda (lambda (traversal-cons (traversal-+ $1 traversal-0) $0)))")
+    if build is calls:
+        assert str(normal).count("traversal-cons") == DEPTH
+        assert e.betaReduce() is not None
+    else:
+        assert s == "(lambda " + "(traversal-cons traversal-0 " * DEPTH + "traversal-empty" + ")" * (DEPTH + 1)
+        assert normal is e and str(normal) == expected
+    request = arrow(tlist(tint), tlist(tint))
+    assert EtaLongVisitor(request).execute(normal) == normal
+
+
+@pytest.mark.parametrize("build", [literal, calls])
+def test_deep_visitors(build):
+    e = build(DEPTH)
+    assert unstrip_primitive_values(strip_primitive_values(e)) == e
+    request = arrow(tlist(tint), tlist(tint))
+    rewritten = RewriteWithInventionVisitor(Application(CONS, ZERO)).execute(e, request)
+    assert str(rewritten).count("#(traversal-cons traversal-0)") == (DEPTH if build is literal else 0)
+
+
+def test_deep_beta_reduction():
+    # ((lambda (traversal-+ $0 traversal-0)) ((lambda ...) ... traversal-0))
+    e = ZERO
+    for _ in range(DEPTH):
+        e = Application(Abstraction(Application(Application(PLUS, Index(0)), ZERO)), e)
+    normal = e.betaNormalForm()
+    assert normal.size() == 2 * DEPTH + 1
+    assert str(normal).startswith("(traversal-+ (traversal-+ (traversal-+ ")
+    assert e.betaReduce().size() == e.size() - 1
+
+
+def test_eta_long_failures_propagate():
+    e = literal(DEPTH)
+    with pytest.raises(UnificationFailure):
+        EtaLongVisitor(arrow(tint, tint)).execute(e)
+
+
+def test_trampoline():
+    def count(n):
+        if n == 0:
+            return 0
+        return 1 + (yield count(n - 1))
+
+    def fail(n):
+        if n == 0:
+            raise ValueError(n)
+        try:
+            yield fail(n - 1)
+        except ValueError as e:
+            raise ValueError(n) from e
+
+    assert trampoline(count(10 * DEPTH)) == 10 * DEPTH
+    with pytest.raises(ValueError) as error:
+        trampoline(fail(DEPTH))
+    assert error.value.args == (DEPTH,)
@@ -1,5 +1,17 @@
 import pytest
-from dreamcoder.type import Type
+from dreamcoder.type import (
+    Context,
+    Occurs,
+    Type,
+    TypeVariable,
+    UnificationFailure,
+    UnionFindContext,
+    arrow,
+    tbool,
+    tint,
+    tlist,
+    tpair,
+)
 
 types = [
     "t0",
@@ -26,3 +38,68 @@ types = [
 def test_type_parsing(type_str):
     t = Type.fromstring(type_str)
     assert t.show(True) == type_str
+
+
+def test_union_find_context_undo():
+    context = UnionFindContext()
+    _, a = context.makeVariable()
+    _, b = context.makeVariable()
+    mark = context.mark()
+
+    context.unify(arrow(a, tint), arrow(tlist(b), b))
+    assert a.apply(context) == tlist(tint)
+    _, c = context.makeVariable()
+    assert context.nextVariable == 3
+
+    context.undo(mark)
+    assert context.nextVariable == 2
+    assert a.apply(context) == a
+    assert b.apply(context) == b
+
+
+def test_union_find_context_path_compression():
+    context = UnionFindContext(4)
+    v = [TypeVariable(j) for j in range(4)]
+    for x, y in zip(v, v[1:]):
+        context.unify(x, y)
+    mark = context.mark()
+    context.unify(v[0], tint)
+    assert all(x.apply(context) == tint for x in v)
+
+    # Compressed paths are undone along with the binding they lead to
+    context.undo(mark)
+    assert all(context.find(x) == context.find(v[3]) for x in v)
+    assert context.find(v[3]).isPolymorphic
+
+
+def test_union_find_context_failed_unification_changes_nothing():
+    context = UnionFindContext(2)
+    a, b = TypeVariable(0), TypeVariable(1)
+    with pytest.raises(UnificationFailure):
+        context.unify(tpair(a, tint), tpair(tbool, tbool))
+    assert context.trail == []
+    with pytest.raises(Occurs):
+        context.unify(a, tlist(a))
+    assert a.apply(context) == a
+
+
+def test_union_find_context_agrees_with_context():
+    pairs = [
+        ("t0 -> list(t1)", "int -> t2"),
+        ("tuple(t0, t1)", "tuple(t1, list(int))"),
+    ]
+    for x, y in pairs:
+        x, y = Type.fromstring(x), Type.fromstring(y)
+        immutable = Context(3, []).unify(x, y)
+        mutable = UnionFindContext(3).unify(x, y)
+        assert x.apply(immutable) == x.apply(mutable)
+        assert y.apply(immutable) == y.apply(mutable)
+
+
+def test_union_find_context_named_arguments():
+    context = UnionFindContext(2)
+    x = Type.fromstring("inp0:t0 -> t1")
+    context.unify(x, Type.fromstring("inp0:int -> bool"))
+    assert x.apply(context) == Type.fromstring("inp0:int -> bool")
+    with pytest.raises(UnificationFailure):
+        context.unify(x, Type.fromstring("inp1:int -> bool"))